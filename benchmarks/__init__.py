@@ -0,0 +1,6 @@
+"""
+Performance benchmarks for *daktylos*.  These are not part of the test suite;  run each module directly from the
+root of the repository, e.g.::
+
+    PYTHONPATH=src python -m benchmarks.bench_rules_parallel
+"""
@@ -0,0 +1,23 @@
+"""
+Benchmarks of converting composite metrics to and from their flattened and dataclass forms, and of the metadata of
+the host system posted with them
+"""
+from benchmarks import generator
+from benchmarks.harness import Suite
+from daktylos.data import BasicMetric, CompositeMetric, Metadata
+
+
+def run(suite: Suite, config: generator.SyntheticConfig) -> None:
+    metric = generator.composite(config)
+    flattened = metric.flatten()
+    typ = generator.dataclass_type(config)
+    data = metric.to_dataclass(typ)
+    count = 100
+    suite.bench("model.flatten", lambda: [metric.flatten() for _ in range(count)], operations=count)
+    suite.bench("model.from_flattened", lambda: [BasicMetric.from_flattened(flattened) for _ in range(count)],
+                operations=count)
+    suite.bench("model.to_dataclass", lambda: [metric.to_dataclass(typ) for _ in range(count)], operations=count)
+    suite.bench("model.from_dataclass",
+                lambda: [CompositeMetric.from_dataclass(generator.METRIC_NAME, data) for _ in range(count)],
+                operations=count)
+    suite.bench("model.system_info", lambda: [Metadata.system_info() for _ in range(count)], operations=count)
@@ -0,0 +1,30 @@
+"""
+Benchmarks of validating composite metrics against a rules engine
+"""
+from benchmarks import generator
+from benchmarks.harness import Suite
+from daktylos.rules.engine import Rule, RulesEngine
+
+
+def make_engine() -> RulesEngine:
+    engine = RulesEngine()
+    ruleset = RulesEngine.RuleSet()
+    ruleset.add_alert(Rule("*", Rule.Evaluation.LESS_THAN, 90.0))
+    ruleset.add_validation(Rule(f"/{generator.METRIC_NAME}/node0/*", Rule.Evaluation.LESS_THAN, 99.0))
+    ruleset.add_validation(Rule("*", Rule.Evaluation.LESS_THAN_OR_EQUAL, 10.0, is_relative=True))
+    ruleset.add_exclusion(f"/{generator.METRIC_NAME}/*#value1")
+    engine.add_ruleset(ruleset)
+    return engine
+
+
+def run(suite: Suite, config: generator.SyntheticConfig) -> None:
+    engine = make_engine()
+    current = generator.composite(config, seed=1)
+    previous = generator.composite(config, seed=2)
+    count = 20
+    suite.bench("rules.process", lambda: [list(engine.process(current, previous)) for _ in range(count)],
+                operations=count)
+    suite.bench("rules.process_fail_fast",
+                lambda: [list(engine.process(current, previous, fail_fast=True, failures_only=True))
+                         for _ in range(count)],
+                operations=count)
@@ -0,0 +1,67 @@
+"""
+Startup benchmark of loading a large rules file: parsing with the pure-Python and libyaml loaders, loading
+the compiled rules, and a fresh process loading the rules end to end
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import yaml
+
+import daktylos.rules.engine as engine_module
+from benchmarks.harness import measure
+from daktylos.rules.engine import RulesEngine
+
+
+def write_rules_file(path: Path, count: int) -> None:
+    operations = ['<', '>', '<=', '>=']
+    with open(path, 'w') as stream:
+        stream.write("content:\n")
+        for ruleset in range(max(1, count // 100)):
+            stream.write(f"  - ruleset:\n      description: ruleset {ruleset}\n      rules:\n")
+            for index in range(100):
+                pattern = f"/Metric{ruleset}/by_file#file{index}.py"
+                if index % 3 == 0:
+                    pattern = f"delta({pattern})"
+                stream.write(f"        - action: {'validate' if index % 2 else 'confirm'}\n"
+                             f"          rule: {pattern} {operations[index % 4]} {index * 1.5}\n")
+
+
+def startup(path: Path, cache_dir: Path) -> float:
+    code = ("from pathlib import Path; from daktylos.rules.engine import RulesEngine; "
+            f"RulesEngine.from_yaml_file(Path({str(path)!r}), cache_dir=Path({str(cache_dir)!r}))")
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], check=True, env=env)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=5000, help="number of rules in the file")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / "rules.yaml"
+        cache_dir = Path(tmpdir) / "compiled"
+        write_rules_file(path, args.count)
+        loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+        try:
+            engine_module._YamlLoader = yaml.SafeLoader
+            print(f"parse, pure-Python loader: {measure(lambda: RulesEngine.from_yaml_file(path))['best']:.3f}s")
+        finally:
+            engine_module._YamlLoader = loader
+        print(f"parse, {loader.__name__}: {measure(lambda: RulesEngine.from_yaml_file(path))['best']:.3f}s")
+        RulesEngine.from_yaml_file(path, cache_dir=cache_dir)
+        timing = measure(lambda: RulesEngine.from_yaml_file(path, cache_dir=cache_dir))
+        print(f"load compiled rules: {timing['best']:.3f}s")
+        for directory in [Path(tmpdir) / "cold", cache_dir]:
+            print(f"process startup ({'cached' if directory == cache_dir else 'cold'}): "
+                  f"{startup(path, directory):.3f}s")
+
+
+if __name__ == "__main__":
+    main()
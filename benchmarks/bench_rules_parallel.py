@@ -0,0 +1,53 @@
+"""
+Benchmark of `RulesEngine.process` run serially against `RulesEngine.process_many` across worker processes
+"""
+import argparse
+import multiprocessing
+
+from benchmarks.harness import measure
+from daktylos.data import CompositeMetric
+from daktylos.rules.engine import Rule, RulesEngine
+
+
+def make_pairs(count: int, width: int):
+    pairs = []
+    for index in range(count):
+        current = CompositeMetric(name=f"Metric{index}")
+        previous = CompositeMetric(name=f"Metric{index}")
+        for key in range(width):
+            current.add_key_value(f"key{key}", float(index + key))
+            previous.add_key_value(f"key{key}", float(index + key) - (key % 7))
+        pairs.append((current, previous))
+    return pairs
+
+
+def make_engine() -> RulesEngine:
+    engine = RulesEngine()
+    ruleset = RulesEngine.RuleSet()
+    ruleset.add_validation(Rule("*", Rule.Evaluation.LESS_THAN, 1.0e6))
+    ruleset.add_validation(Rule("/Metric*#key1*", Rule.Evaluation.GREATER_THAN_OR_EQUAL, 0.0))
+    ruleset.add_alert(Rule("*", Rule.Evaluation.LESS_THAN, 5.0, is_relative=True))
+    ruleset.add_exclusion("/Metric*#key9")
+    engine.add_ruleset(ruleset)
+    return engine
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=400, help="number of metric pairs to validate")
+    parser.add_argument("--width", type=int, default=200, help="number of keys per composite metric")
+    args = parser.parse_args()
+    pairs = make_pairs(args.count, args.width)
+    engine = make_engine()
+    serial = measure(lambda: [list(engine.process(current, previous)) for current, previous in pairs])
+    print(f"serial: {serial['best']:.3f}s")
+    workers = 1
+    while workers <= multiprocessing.cpu_count():
+        timing = measure(lambda: engine.process_many(pairs, max_workers=workers))
+        print(f"process_many, {workers} workers: {timing['best']:.3f}s "
+              f"(speedup {serial['best'] / timing['best']:.2f}x)")
+        workers *= 2
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+Benchmarks of posting, querying, bulk transfer and purging of metrics in a `SQLMetricStore` on SQLite ("store.*"),
+a `SQLBlockMetricStore` on SQLite ("store.blocks.*"), an `InMemoryMetricStore` ("store.memory.*") and a
+`FileMetricStore` ("store.file.*"), and of posting from several producers at once ("store.producers.*")
+"""
+import datetime
+import importlib.util
+import io
+import os
+import tempfile
+import threading
+from typing import Callable, List, Optional
+
+import sqlalchemy
+
+from benchmarks import generator
+from benchmarks.harness import Suite
+from daktylos.data import CompositeMetric, Metric, MetricStore
+from daktylos.data_stores.blocks import SQLBlockMetricStore
+from daktylos.data_stores.file import FileMetricStore
+from daktylos.data_stores.ingest import IngestionClient, IngestionDaemon
+from daktylos.data_stores.memory import InMemoryMetricStore
+from daktylos.data_stores.sql import SQLMetricStore
+
+
+def _post_history(store: MetricStore, config: generator.SyntheticConfig, end: datetime.datetime) -> None:
+    for timestamp, metadata, metric in generator.history(config, end):
+        store.post(metric, timestamp=timestamp, metadata=metadata)
+    store.commit()
+
+
+def _post_dashboard(store: MetricStore, names: List[str], count: int, end: datetime.datetime) -> None:
+    """
+    Post a short history of each of the given names, as shown on a dashboard page
+    """
+    for name in names:
+        for index in range(count):
+            metric = CompositeMetric(name)
+            for key in range(5):
+                metric.add(Metric(f"value{key}", float(index * key)))
+            store.post(metric, timestamp=end - datetime.timedelta(minutes=index))
+    store.commit()
+
+
+def _database_size(engine: sqlalchemy.engine.Engine, path: str) -> int:
+    """
+    :return: size of the given SQLite database file once vacuumed
+    """
+    with engine.connect() as connection:
+        connection.execute(sqlalchemy.text("VACUUM"))
+    return os.path.getsize(path)
+
+
+def run(suite: Suite, config: generator.SyntheticConfig) -> None:
+    for store_type, prefix in [(SQLMetricStore, "store"), (SQLBlockMetricStore, "store.blocks")]:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'bench.db')
+            engine = sqlalchemy.create_engine(f"sqlite:///{path}")
+            with store_type(engine, create=True) as store:
+                run_store(suite, config, store, prefix=prefix, database_size=lambda: _database_size(engine, path))
+    run_producers(suite, config)
+    with InMemoryMetricStore() as store:
+        run_store(suite, config, store, prefix="store.memory")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        store = FileMetricStore(tmpdir)
+        with store:
+            run_store(suite, config, store, prefix="store.file")
+        store.close()
+
+
+def run_producers(suite: Suite, config: generator.SyntheticConfig, producers: int = 4, commit_every: int = 10) \
+        -> None:
+    """
+    Post the history from several threads at once, as from test workers committing after every few metrics, each
+    through a `SQLMetricStore` of its own ("store.producers.direct") or an `IngestionClient` to a daemon writing to
+    a single store ("store.producers.ingest").  Producers failing (such as on conflicting writes of their stores) stop,
+    and their number is recorded with the result.
+    """
+    history = list(generator.history(config, datetime.datetime.utcnow()))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        engine = sqlalchemy.create_engine(f"sqlite:///{os.path.join(tmpdir, 'bench.db')}",
+                                          connect_args={'timeout': 60})
+        SQLMetricStore(engine, create=True)
+        failures: List[Exception] = []
+
+        def post_all(connect):
+            def produce(index: int):
+                try:
+                    with connect() as store:
+                        for count, (timestamp, metadata, metric) in enumerate(history[index::producers]):
+                            store.post(metric, timestamp=timestamp, metadata=metadata)
+                            if count % commit_every == commit_every - 1:
+                                store.commit()
+                except Exception as e:
+                    failures.append(e)
+
+            failures.clear()
+            threads = [threading.Thread(target=produce, args=(index,)) for index in range(producers)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        result = suite.bench("store.producers.direct", lambda: post_all(lambda: SQLMetricStore(engine)),
+                             operations=len(history), repeat=1, producers=producers)
+        result['failed_producers'] = len(failures)
+        with IngestionDaemon(SQLMetricStore(engine), os.path.join(tmpdir, 'ingest.sock')) as daemon:
+            result = suite.bench("store.producers.ingest",
+                                 lambda: post_all(lambda: IngestionClient(daemon.address)),
+                                 operations=len(history), repeat=1, producers=producers)
+            result['failed_producers'] = len(failures)
+
+
+def run_store(suite: Suite, config: generator.SyntheticConfig, store: MetricStore, prefix: str,
+              database_size: Optional[Callable[[], int]] = None) -> None:
+    """
+    Run the benchmarks against the given (empty) store, naming results "<prefix>.<operation>"
+
+    :param database_size: if specified, function returning the size in bytes of the store's database, recorded
+       with the result of posting the history
+    """
+    name = generator.METRIC_NAME
+    end = datetime.datetime.utcnow()
+    oldest = end - datetime.timedelta(minutes=config.history_length // 2)
+    typ = generator.dataclass_type(config)
+    metadata_filter = generator.metadata(config, 0).values
+    count = min(50, config.history_length)
+    result = suite.bench(f"{prefix}.post_commit", lambda: _post_history(store, config, end),
+                         operations=config.history_length, repeat=1)
+    if database_size is not None:
+        result['database_bytes'] = database_size()
+    queries = {
+        "composite_by_volume": lambda: store.composite_metrics_by_volume(name, count=count),
+        "composite_by_volume_filtered":
+            lambda: store.composite_metrics_by_volume(name, count=count, metadata_filter=metadata_filter),
+        "composite_by_date": lambda: store.composite_metrics_by_date(name, oldest=oldest, newest=end),
+        "dataclass_by_volume": lambda: store.dataclass_metrics_by_volume(name, typ, count=count),
+        "dataclass_by_date": lambda: store.dataclass_metrics_by_date(name, typ, oldest=oldest, newest=end),
+        "fields_by_volume": lambda: store.metric_fields_by_volume(name, count=count),
+        "fields_by_volume_filtered":
+            lambda: store.metric_fields_by_volume(name, count=count, metadata_filter=metadata_filter),
+        "fields_by_date": lambda: store.metric_fields_by_date(name, oldest=oldest, newest=end),
+        "fields_by_date_subset":
+            lambda: store.metric_fields_by_date(name, oldest=oldest, newest=end, fields=['%value1']),
+        "composite_by_volume_1_filtered":
+            lambda: store.composite_metrics_by_volume(name, count=1, metadata_filter=metadata_filter),
+        "latest_filtered": lambda: store.latest(name, metadata_filter=metadata_filter),
+    }
+    for query_name, query in queries.items():
+        suite.bench(f"{prefix}.query.{query_name}", query)
+
+    # small queries repeated at a high rate, as from dashboards, where the cost of a query is mostly its overhead in
+    # Python; the share of it spent outside the database is recorded along with the timing
+    small_queries = {
+        "small_composite": lambda: store.start_query(name, max_results=1),
+        "small_composite_filtered":
+            lambda: store.start_query(name, max_results=1).filter_on_metadata(**metadata_filter),
+        "small_fields": lambda: store.start_field_query(name, fields=['%value1'], max_results=1),
+    }
+    for query_name, start in small_queries.items():
+        result = suite.bench(f"{prefix}.query.{query_name}", lambda: [start().execute() for _ in range(100)],
+                             operations=100)
+        stats = [start().collect_statistics().execute().stats for _ in range(100)]
+        if all(stat is not None for stat in stats):
+            result['python_secs_per_query'] = sum(stat.decode_time for stat in stats) / len(stats)
+
+    # a dashboard page of 20 metrics, queried name by name or all at once
+    dashboard = [f"Dashboard{index}" for index in range(20)]
+    _post_dashboard(store, dashboard, count, end)
+    suite.bench(f"{prefix}.query.dashboard_by_name",
+                lambda: {name: store.composite_metrics_by_volume(name, count=count) for name in dashboard})
+    suite.bench(f"{prefix}.query.dashboard_multi",
+                lambda: store.start_multi_query(dashboard, max_results=count).execute())
+
+    batches = list(store.field_batches(name))
+    suite.bench(f"{prefix}.field_batches", lambda: sum(len(batch) for batch in store.field_batches(name)),
+                operations=config.history_length)
+    if importlib.util.find_spec("pyarrow") is not None:
+        from daktylos.arrow import export_metric
+        suite.bench(f"{prefix}.export_parquet", lambda: export_metric(store, name, io.BytesIO()),
+                    operations=config.history_length)
+
+    def post_batches():
+        for batch in batches:
+            store.post_batch(name, batch)
+        store.commit()
+
+    suite.bench(f"{prefix}.post_batch_commit", post_batches,
+                setup=lambda: store.purge_by_date(before=end + datetime.timedelta(days=1), name=name),
+                operations=config.history_length, repeat=1)
+
+    def repopulate():
+        store.purge_by_date(before=end + datetime.timedelta(days=1), name=name)
+        _post_history(store, config, end)
+
+    suite.bench(f"{prefix}.purge_by_date", lambda: store.purge_by_date(before=oldest, name=name),
+                setup=repopulate, operations=config.history_length // 2)
+    suite.bench(f"{prefix}.purge_by_volume",
+                lambda: store.purge_by_volume(count_=config.history_length // 2, name=name),
+                setup=repopulate, operations=config.history_length // 2)
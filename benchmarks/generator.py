@@ -0,0 +1,104 @@
+"""
+Parameterized generator of synthetic composite metrics, metadata and history for benchmarks
+"""
+import datetime
+import random
+from dataclasses import dataclass, make_dataclass, asdict
+from typing import Dict, Iterator, Tuple, Type
+
+from daktylos.data import CompositeMetric, Metadata, Metric
+
+METRIC_NAME = "SyntheticMetric"
+
+
+@dataclass
+class SyntheticConfig:
+    """
+    Shape of the synthetic data to generate
+
+    :param width: number of core metrics in each composite at the bottom of the hierarchy
+    :param depth: number of levels of composite metrics below the root
+    :param fanout: number of composite children of each composite above the bottom of the hierarchy
+    :param metadata_cardinality: number of distinct sets of metadata across the history
+    :param history_length: number of composite metrics in the history of the metric
+    """
+    width: int = 20
+    depth: int = 2
+    fanout: int = 4
+    metadata_cardinality: int = 8
+    history_length: int = 200
+
+    @property
+    def leaf_count(self) -> int:
+        return self.width * self.fanout ** self.depth
+
+    def as_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+
+SCALES = {
+    'small': SyntheticConfig(width=5, depth=1, fanout=2, metadata_cardinality=2, history_length=50),
+    'medium': SyntheticConfig(),
+    'large': SyntheticConfig(width=50, depth=3, fanout=4, metadata_cardinality=64, history_length=1000),
+}
+
+
+def _populate(composite: CompositeMetric, config: SyntheticConfig, level: int, rand: random.Random) -> None:
+    if level == config.depth:
+        for index in range(config.width):
+            composite.add(Metric(f"value{index}", rand.uniform(0.0, 100.0)))
+    else:
+        for index in range(config.fanout):
+            _populate(composite.add(CompositeMetric(f"node{index}")), config, level + 1, rand)
+
+
+def composite(config: SyntheticConfig, seed: int = 0, name: str = METRIC_NAME) -> CompositeMetric:
+    """
+    :param config: shape of the metric
+    :param seed: seed for the (reproducible) random values
+    :param name: name of the root metric
+    :return: a composite metric of the given shape
+    """
+    root = CompositeMetric(name)
+    _populate(root, config, 0, random.Random(seed))
+    return root
+
+
+def metadata(config: SyntheticConfig, index: int) -> Metadata:
+    """
+    :param config: shape of the data
+    :param index: index into the history
+    :return: one of `config.metadata_cardinality` distinct sets of metadata
+    """
+    variant = index % config.metadata_cardinality
+    return Metadata({'host': f"host{variant}",
+                     'platform': f"platform{variant % 4}",
+                     'branch': "main" if variant % 2 else f"feature{variant}",
+                     'num_cores': 8})
+
+
+def history(config: SyntheticConfig, end: datetime.datetime, name: str = METRIC_NAME) \
+        -> Iterator[Tuple[datetime.datetime, Metadata, CompositeMetric]]:
+    """
+    :param config: shape of the data
+    :param end: timestamp of the latest metric
+    :param name: name of the root metric
+    :return: iterator over (timestamp, metadata, metric) of `config.history_length` metrics, oldest first,
+       one minute apart
+    """
+    for index in range(config.history_length):
+        timestamp = end - datetime.timedelta(minutes=config.history_length - 1 - index)
+        yield timestamp, metadata(config, index), composite(config, seed=index, name=name)
+
+
+def dataclass_type(config: SyntheticConfig) -> Type:
+    """
+    :param config: shape of the data
+    :return: a dataclass type that a composite metric of the given shape converts to
+    """
+    field_type = Dict[str, float]
+    for _ in range(config.depth - 1):
+        field_type = Dict[str, field_type]
+    if config.depth == 0:
+        return make_dataclass("SyntheticData", [(f"value{index}", float) for index in range(config.width)])
+    return make_dataclass("SyntheticData", [(f"node{index}", field_type) for index in range(config.fanout)])
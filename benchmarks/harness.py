@@ -0,0 +1,85 @@
+"""
+Timing harness shared by the benchmarks, recording results to a machine-readable file so that regressions can be
+tracked between releases
+"""
+import datetime
+import json
+import platform
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+
+def measure(func: Callable[[], object], repeat: int = 3, setup: Optional[Callable[[], object]] = None) \
+        -> Dict[str, float]:
+    """
+    Time the given function, taking the best of several runs
+
+    :param func: function to time
+    :param repeat: number of times to run the function
+    :param setup: if specified, function to run (untimed) before each run
+    :return: dict with best and mean elapsed time in seconds
+    """
+    elapsed = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        elapsed.append(time.perf_counter() - start)
+    return {'best': min(elapsed), 'mean': sum(elapsed) / len(elapsed)}
+
+
+class Suite:
+    """
+    Collection of benchmark results
+
+    :param params: parameters common to all results (e.g. the shape of the synthetic data)
+    """
+
+    def __init__(self, params: Optional[Dict[str, Any]] = None):
+        self._params = params or {}
+        self._results: List[Dict[str, Any]] = []
+
+    @property
+    def results(self) -> List[Dict[str, Any]]:
+        return self._results
+
+    def bench(self, name: str, func: Callable[[], object], operations: int = 1, repeat: int = 3,
+              setup: Optional[Callable[[], object]] = None, **params) -> Dict[str, Any]:
+        """
+        Time the given function and record the result
+
+        :param name: name of the benchmark, as "<area>.<operation>"
+        :param func: function to time
+        :param operations: number of operations performed by each call of func, for throughput
+        :param repeat: number of times to run the function
+        :param setup: if specified, function to run (untimed) before each run
+        :param params: additional parameters to record with the result
+        :return: the result recorded
+        """
+        timing = measure(func, repeat=repeat, setup=setup)
+        result = {'name': name,
+                  'params': dict(self._params, **params),
+                  'best_secs': timing['best'],
+                  'mean_secs': timing['mean'],
+                  'repeat': repeat,
+                  'operations': operations,
+                  'ops_per_sec': operations / timing['best'] if timing['best'] else None}
+        self._results.append(result)
+        print(f"{name:<48} {timing['best'] * 1000.0:>10.2f} ms  {result['ops_per_sec'] or 0.0:>12.1f} ops/s",
+              flush=True)
+        return result
+
+    def write(self, path: str) -> None:
+        """
+        Write all results as json to the given path
+
+        :param path: path of the file to write
+        """
+        document = {'created': datetime.datetime.utcnow().isoformat(),
+                    'python': sys.version.split()[0],
+                    'platform': platform.platform(),
+                    'results': self._results}
+        with open(path, 'w') as stream:
+            json.dump(document, stream, indent=2)
@@ -0,0 +1,38 @@
+"""
+Run the benchmark suite over synthetic data, writing results as json so that regressions can be tracked between
+releases::
+
+    PYTHONPATH=src python -m benchmarks.run --scale medium --output benchmark-results.json
+"""
+import argparse
+import importlib
+
+from benchmarks import generator
+from benchmarks.harness import Suite
+
+MODULES = ["bench_model", "bench_rules", "bench_store"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=sorted(generator.SCALES), default="medium",
+                        help="preset shape of the synthetic data")
+    for name, value in generator.SyntheticConfig().as_dict().items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=int, default=None,
+                            help=f"override {name} of the preset (medium preset: {value})")
+    parser.add_argument("--only", action="append", choices=MODULES, help="run only the given module(s)")
+    parser.add_argument("--output", default="benchmark-results.json", help="file to write results to")
+    args = parser.parse_args()
+    config = generator.SyntheticConfig(**generator.SCALES[args.scale].as_dict())
+    for name in config.as_dict():
+        if getattr(args, name) is not None:
+            setattr(config, name, getattr(args, name))
+    suite = Suite(params=dict(config.as_dict(), scale=args.scale))
+    for module_name in args.only or MODULES:
+        importlib.import_module(f"benchmarks.{module_name}").run(suite, config)
+    suite.write(args.output)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
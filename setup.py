@@ -11,6 +11,7 @@ setuptools.setup(
     package_dir={'': 'src'},
     packages=setuptools.find_packages('src'),
     entry_points={
+        'console_scripts': ['daktylos = daktylos.cli:main'],
     },
     classifiers=[
                  "License :: OSI Approved :: BSD License"],
@@ -21,5 +22,9 @@ setuptools.setup(
     install_requires=[
         'sqlalchemy',
         'pyyaml'
-    ]
+    ],
+    extras_require={
+        'arrow': ['pyarrow'],
+        'pandas': ['pandas'],
+    }
 )
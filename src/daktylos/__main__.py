@@ -0,0 +1,5 @@
+import sys
+
+from daktylos.cli import main
+
+sys.exit(main())
@@ -0,0 +1,202 @@
+"""
+The *daktylos.arrow* module provides bulk export of the history of a metric from a
+:class:`daktylos.data.MetricStore` to Apache Arrow IPC or Parquet files, and the matching bulk import.  Histories are
+streamed in record batches through `MetricStore.field_batches` and `MetricStore.post_batch`, so that they are moved
+column by column rather than as per-metric Python objects, in memory bounded by the batch size.
+
+Exported files hold one row per metric, with columns:
+
+* *timestamp*: timestamp of the metric (microsecond precision)
+* *metadata.<name>*: value of each metadata field (null where a metric has no such field), as int64 for fields
+  holding integers, and as (dictionary-encoded) text otherwise
+* one float64 column per (flattened) key-path, named by the key-path (null where a metric has no value for it)
+
+The name of the metric is recorded in the metadata of the schema, under *daktylos.metric*.
+
+This module requires the optional *pyarrow* package (``pip install daktylos[arrow]``)::
+
+    with store:
+        export_metric(store, "TestMetric", "history.parquet")
+    with other_store:
+        import_metric(other_store, "history.parquet")
+"""
+import datetime
+import itertools
+import math
+from typing import BinaryIO, Dict, Iterable, Iterator, Optional, Tuple, Union
+
+from daktylos.data import FieldBatch, Metadata, MetricStore
+
+__all__ = ["export_metric", "import_metric"]
+
+TIMESTAMP_COLUMN = "timestamp"
+METADATA_PREFIX = "metadata."
+METRIC_NAME_KEY = b"daktylos.metric"
+FORMATS = ("parquet", "ipc")
+
+Destination = Union[str, BinaryIO]
+
+
+def _pyarrow():
+    """
+    :return: the pyarrow module, imported on first use only as it is an optional dependency
+    """
+    try:
+        import pyarrow
+    except ImportError as e:
+        raise ImportError("Bulk export and import of metrics require pyarrow; "
+                          "install with 'pip install daktylos[arrow]'") from e
+    return pyarrow
+
+
+def _check_format(format_: str) -> None:
+    if format_ not in FORMATS:
+        raise ValueError(f"Unsupported format {format_}; must be one of {', '.join(FORMATS)}")
+
+
+def _metadata_column(batch: FieldBatch, name: str) -> list:
+    """
+    :return: the values of the given metadata field of each metric of the batch, None where it has no such field
+    """
+    return [metadata.values.get(name) if metadata else None for metadata in batch.metadata]
+
+
+def _record_batch(pa, batch: FieldBatch, schema):
+    """
+    :return: the given batch converted to a record batch of the given schema
+    :raises ValueError: if a metadata field exported as integers holds text
+    """
+    arrays = [pa.array(batch.timestamps, type=pa.timestamp('us'))]
+    for name in batch.metadata_names:
+        column = _metadata_column(batch, name)
+        if pa.types.is_integer(schema.field(METADATA_PREFIX + name).type):
+            if any(value is not None and not isinstance(value, int) for value in column):
+                raise ValueError(f"Metadata field {name} holds both integers and text; export it from a store "
+                                 "holding either")
+            arrays.append(pa.array(column, type=pa.int64()))
+        else:
+            arrays.append(pa.array([str(value) if value is not None else None for value in column],
+                                   type=pa.dictionary(pa.int32(), pa.string())))
+    for column in batch.values.values():
+        # NaN marks a missing value in a batch, and maps to null
+        arrays.append(pa.array(column, type=pa.float64(), from_pandas=True))
+    return pa.record_batch(arrays, schema=schema)
+
+
+def _schema(pa, metric_name: str, batch: Optional[FieldBatch]):
+    """
+    :return: the schema of the export of a metric, with metadata fields typed by their values in its first batch
+    """
+    fields = [pa.field(TIMESTAMP_COLUMN, pa.timestamp('us'), nullable=False)]
+    if batch is not None:
+        for name in batch.metadata_names:
+            values = [value for value in _metadata_column(batch, name) if value is not None]
+            integers = values and all(isinstance(value, int) for value in values)
+            fields.append(pa.field(METADATA_PREFIX + name,
+                                   pa.int64() if integers else pa.dictionary(pa.int32(), pa.string())))
+        fields.extend(pa.field(key, pa.float64()) for key in batch.values)
+    return pa.schema(fields, metadata={METRIC_NAME_KEY: metric_name.encode('utf-8')})
+
+
+def export_metric(store: MetricStore, metric_name: str, destination: Destination, format: str = "parquet",
+                  fields: Optional[Iterable[str]] = None,
+                  oldest: Optional[datetime.datetime] = None, newest: Optional[datetime.datetime] = None,
+                  batch_size: int = 65536, compression: Optional[str] = "zstd") -> int:
+    """
+    Export the history of a metric, from oldest to newest, streamed in record batches
+
+    :param store: store to export from, in context
+    :param metric_name: name of metric to export
+    :param destination: path or binary file object to write to
+    :param format: "parquet" or "ipc" (the Arrow IPC file format)
+    :param fields: (wildcard) list of field names to export, or None for all
+    :param oldest: if specified, only export metrics from this date
+    :param newest: if specified, only export metrics up to this date
+    :param batch_size: maximum number of metrics per record batch (and Parquet row group)
+    :param compression: compression codec of the file, or None for none
+    :return: number of metrics exported
+    """
+    _check_format(format)
+    pa = _pyarrow()
+    batches: Iterator[FieldBatch] = store.field_batches(metric_name, fields=fields, oldest=oldest, newest=newest,
+                                                        batch_size=batch_size)
+    first = next(batches, None)
+    schema = _schema(pa, metric_name, first)
+    if format == "parquet":
+        import pyarrow.parquet
+        writer = pyarrow.parquet.ParquetWriter(destination, schema, compression=compression or "none")
+    else:
+        options = pa.ipc.IpcWriteOptions(compression=compression)
+        writer = pa.ipc.new_file(destination, schema, options=options)
+    count = 0
+    with writer:
+        if first is not None:
+            for batch in itertools.chain([first], batches):
+                writer.write_batch(_record_batch(pa, batch, schema))
+                count += len(batch)
+    return count
+
+
+def _field_batches(pa, record_batches, schema) -> Iterator[FieldBatch]:
+    """
+    :return: the given record batches converted to field batches
+    """
+    names = schema.names
+    if TIMESTAMP_COLUMN not in names:
+        raise ValueError(f"No '{TIMESTAMP_COLUMN}' column found")
+    metadata_names = [name[len(METADATA_PREFIX):] for name in names if name.startswith(METADATA_PREFIX)]
+    keys = [name for name in names if name != TIMESTAMP_COLUMN and not name.startswith(METADATA_PREFIX)]
+    for record_batch in record_batches:
+        metadata_columns = [record_batch.column(METADATA_PREFIX + name).to_pylist() for name in metadata_names]
+        # rows of the same metadata share one Metadata instance, so that stores process each set once
+        interned: Dict[Tuple, Optional[Metadata]] = {}
+        metadata = []
+        for values in zip(*metadata_columns) if metadata_columns else ((),) * record_batch.num_rows:
+            if values not in interned:
+                fields = {name: value for name, value in zip(metadata_names, values) if value is not None}
+                interned[values] = Metadata(fields) if fields else None
+            metadata.append(interned[values])
+        yield FieldBatch(timestamps=record_batch.column(TIMESTAMP_COLUMN).to_pylist(),
+                         metadata=metadata,
+                         values={key: record_batch.column(key).cast(pa.float64()).fill_null(math.nan).to_pylist()
+                                 for key in keys},
+                         metadata_names=metadata_names)
+
+
+def import_metric(store: MetricStore, source: Destination, metric_name: Optional[str] = None,
+                  format: str = "parquet", batch_size: int = 65536, project_name: Optional[str] = None) -> int:
+    """
+    Import a history of a metric, as exported by `export_metric`, through the batched insert path of the store.
+    The store is committed after each batch
+
+    :param store: store to import into, in context
+    :param source: path or binary file object to read from
+    :param metric_name: name of the metric, or None to take it from the metadata of the file
+    :param format: "parquet" or "ipc" (the Arrow IPC file format)
+    :param batch_size: maximum number of metrics per batch read from a Parquet file (IPC files are read in the
+       batches they were written in)
+    :param project_name: if specified, the project name to associate with the metrics
+    :return: number of metrics read
+    :raises ValueError: if the file is not of the expected layout
+    """
+    _check_format(format)
+    pa = _pyarrow()
+    if format == "parquet":
+        import pyarrow.parquet
+        parquet_file = pyarrow.parquet.ParquetFile(source)
+        schema = parquet_file.schema_arrow
+        record_batches = parquet_file.iter_batches(batch_size=batch_size)
+    else:
+        reader = pa.ipc.open_file(source)
+        schema = reader.schema
+        record_batches = (reader.get_batch(index) for index in range(reader.num_record_batches))
+    if metric_name is None:
+        if not schema.metadata or METRIC_NAME_KEY not in schema.metadata:
+            raise ValueError("No metric name recorded in file; please specify one")
+        metric_name = schema.metadata[METRIC_NAME_KEY].decode('utf-8')
+    count = 0
+    for batch in _field_batches(pa, record_batches, schema):
+        store.post_batch(metric_name, batch, project_name=project_name)
+        store.commit()
+        count += len(batch)
+    return count
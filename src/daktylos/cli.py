@@ -0,0 +1,232 @@
+"""
+The `daktylos` command-line tool, querying, exporting, purging, validating and summarizing the metrics of a SQL
+database.  Modules are imported by the subcommand that needs them, rather than up front, so that `daktylos --help`
+and simple commands start quickly.
+"""
+import argparse
+import sys
+from typing import Optional, Sequence, Tuple, Union
+
+__all__ = ['main']
+
+
+def _date(text: str):
+    import datetime
+    try:
+        return datetime.datetime.fromisoformat(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date (expected ISO format, e.g. 2024-01-31T12:00): {text}")
+
+
+def _metadata_item(text: str) -> Tuple[str, Union[str, int]]:
+    """
+    :param text: "name=value" filter, with a value that is the text of an integer taken to be an integer
+    :return: the name and value of the filter
+    """
+    name, equals, value = text.partition("=")
+    if not name or not equals:
+        raise argparse.ArgumentTypeError(f"invalid metadata filter (expected NAME=VALUE): {text}")
+    return name, int(value) if value.lstrip("-").isdigit() else value
+
+
+def _open_store(args: argparse.Namespace):
+    """
+    :return: a SQL store of the database of the given arguments, in the layout given
+    """
+    import sqlalchemy
+    engine = sqlalchemy.create_engine(args.url)
+    if args.blocks:
+        from daktylos.data_stores.blocks import SQLBlockMetricStore
+        return SQLBlockMetricStore(engine)
+    from daktylos.data_stores.sql import SQLMetricStore
+    return SQLMetricStore(engine, partitions=args.partitions)
+
+
+def _query(args: argparse.Namespace) -> int:
+    import csv
+    import json
+    with _open_store(args) as store:
+        query = store.start_query(args.name, max_results=args.count)
+        if args.oldest is not None or args.newest is not None:
+            import datetime
+            query.filter_on_date(oldest=args.oldest or datetime.datetime.min,
+                                 newest=args.newest or datetime.datetime.max)
+        if args.filter:
+            query.filter_on_metadata(**dict(args.filter))
+        result = query.execute()
+    rows = [metric.flatten() for metric in result.metric_data]
+    if args.fields:
+        from daktylos.data import field_matcher
+        matches = field_matcher(args.fields)
+        rows = [{key: value for key, value in row.items() if matches(key)} for row in rows]
+    if args.format == "json":
+        json.dump([{'timestamp': timestamp.isoformat(),
+                    'metadata': metadata.values if metadata is not None else None,
+                    'values': row}
+                   for timestamp, metadata, row in zip(result.timestamps, result.metadata, rows)], sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        return 0
+    keys = sorted({key for row in rows for key in row})
+    writer = csv.writer(sys.stdout)
+    writer.writerow(["timestamp"] + keys)
+    for timestamp, row in zip(result.timestamps, rows):
+        writer.writerow([timestamp.isoformat()] + [row.get(key, "") for key in keys])
+    return 0
+
+
+def _export(args: argparse.Namespace) -> int:
+    from daktylos.arrow import export_metric
+    with _open_store(args) as store:
+        count = export_metric(store, args.name, args.output, format=args.format, fields=args.fields,
+                              oldest=args.oldest, newest=args.newest)
+    print(f"Exported {count} metrics of {args.name} to {args.output}", file=sys.stderr)
+    return 0
+
+
+def _purge(args: argparse.Namespace) -> int:
+    with _open_store(args) as store:
+        if args.before is not None:
+            store.purge_by_date(before=args.before, name=args.name)
+        else:
+            store.purge_by_volume(args.oldest, name=args.name)
+    return 0
+
+
+def _baseline(store, metric_name: str, metadata, window: int):
+    """
+    :param store: store holding the metric validated, the latest of its name and metadata
+    :param metric_name: name of the metric
+    :param metadata: metadata of the metric validated, as each metadata set (e.g. platform) has its own baseline
+    :param window: number of values of each key in the baseline
+    :return: the baseline of the metrics of the given name and metadata posted before the metric validated, which is
+       left out so that it is not compared against itself
+    """
+    from daktylos.data import RollingWindow
+    query = store.start_query(metric_name, max_results=window + 1)
+    if metadata is not None and metadata.values:
+        query.filter_on_metadata(**metadata.values)
+    result = query.execute()
+    history = {}
+    for item, metric in zip(result.metadata[:-1], result.metric_data[:-1]):
+        # (the filter also matches metadata with further fields)
+        if item == metadata:
+            for key, value in metric.flatten().items():
+                history.setdefault(key, []).append(value)
+    return {key: RollingWindow(window, values) for key, values in history.items()}
+
+
+def _validate(args: argparse.Namespace) -> int:
+    from pathlib import Path
+    from daktylos.rules.engine import RulesEngine
+    from daktylos.rules.status import ValidationStatus
+    rules_engine = RulesEngine.from_yaml_file(Path(args.rules))
+    with _open_store(args) as store:
+        query = store.start_query(args.name, max_results=2)
+        if args.filter:
+            query.filter_on_metadata(**dict(args.filter))
+        result = query.execute()
+        baseline = _baseline(store, args.name, result.metadata[-1], args.baseline) \
+            if args.baseline is not None and result.metric_data else None
+    if not result.metric_data:
+        print(f"No metrics of {args.name} to validate", file=sys.stderr)
+        return 2
+    previous = result.metric_data[-2] if len(result.metric_data) > 1 else None
+    failures = 0
+    for status in rules_engine.process(result.metric_data[-1], previous_metric=previous, baseline=baseline):
+        print(status.text)
+        failures += status.level == ValidationStatus.Level.FAILURE
+    return 1 if failures else 0
+
+
+def _stats(args: argparse.Namespace) -> int:
+    with _open_store(args) as store:
+        summary = store.summary()
+    names = args.names or list(summary)
+    width = max([len("metric")] + [len(name) for name in names])
+    print(f"{'metric':<{width}}  {'count':>10}  {'oldest':<26}  {'newest':<26}")
+    for name in names:
+        if name in summary:
+            count, oldest, newest = summary[name]
+            print(f"{name:<{width}}  {count:>10}  {oldest.isoformat():<26}  {newest.isoformat():<26}")
+        else:
+            print(f"{name:<{width}}  {0:>10}")
+    return 0
+
+
+def _parser() -> argparse.ArgumentParser:
+    database = argparse.ArgumentParser(add_help=False)
+    database.add_argument("url", help="sqlalchemy URL of the database, e.g. sqlite:///metrics.db")
+    layout = database.add_mutually_exclusive_group()
+    layout.add_argument("--partitions", choices=["day", "month"],
+                        help="the database is partitioned by time (see SQLMetricStore)")
+    layout.add_argument("--blocks", action="store_true",
+                        help="the database holds metrics in compressed blocks (see SQLBlockMetricStore)")
+    dates = argparse.ArgumentParser(add_help=False)
+    dates.add_argument("--oldest", type=_date, help="only metrics from this date")
+    dates.add_argument("--newest", type=_date, help="only metrics up to this date")
+    fields = argparse.ArgumentParser(add_help=False)
+    fields.add_argument("--fields", nargs="+", metavar="PATTERN",
+                        help="only the key-paths matching any of these (wildcard) patterns")
+    metadata = argparse.ArgumentParser(add_help=False)
+    metadata.add_argument("--filter", action="append", type=_metadata_item, metavar="NAME=VALUE",
+                          help="only metrics with this metadata (may be repeated)")
+
+    parser = argparse.ArgumentParser(prog="daktylos", description="Query and maintain metrics held in a database")
+    commands = parser.add_subparsers(dest="command", metavar="command", required=True)
+
+    query = commands.add_parser("query", parents=[database, dates, fields, metadata],
+                                help="print the latest metrics of a name")
+    query.add_argument("name", help="name of the metric")
+    query.add_argument("--count", type=int, default=None, help="maximum number of (latest) metrics")
+    query.add_argument("--format", choices=["csv", "json"], default="csv", help="output format (default csv)")
+    query.set_defaults(handler=_query)
+
+    export = commands.add_parser("export", parents=[database, dates, fields],
+                                 help="export the history of a metric to Parquet or Arrow IPC (requires pyarrow)")
+    export.add_argument("name", help="name of the metric")
+    export.add_argument("output", help="path of the file to write")
+    export.add_argument("--format", choices=["parquet", "ipc"], default="parquet", help="file format")
+    export.set_defaults(handler=_export)
+
+    purge = commands.add_parser("purge", parents=[database], help="remove old metrics")
+    purge.add_argument("--name", help="only purge metrics of this name")
+    amount = purge.add_mutually_exclusive_group(required=True)
+    amount.add_argument("--before", type=_date, help="remove metrics older than this date")
+    amount.add_argument("--oldest", type=int, metavar="COUNT", help="remove this many of the oldest metrics of --name")
+    purge.set_defaults(handler=_purge)
+
+    validate = commands.add_parser("validate", parents=[database, metadata],
+                                   help="validate the latest metric of a name against a rules file, exiting with 1 "
+                                        "on failure")
+    validate.add_argument("name", help="name of the metric")
+    validate.add_argument("rules", help="path of the (yaml) rules file")
+    validate.add_argument("--baseline", type=int, metavar="WINDOW",
+                          help="number of metrics (of the metadata of the metric validated) preceding it in the "
+                               "baseline, for rules relative to the baseline")
+    validate.set_defaults(handler=_validate)
+
+    stats = commands.add_parser("stats", parents=[database],
+                                help="print the number of metrics of each name and the dates they span")
+    stats.add_argument("names", nargs="*", help="names of the metrics (by default, all)")
+    stats.set_defaults(handler=_stats)
+    return parser
+
+
+def main(args: Optional[Sequence[str]] = None) -> int:
+    """
+    Entry point of the `daktylos` command
+
+    :param args: command-line arguments, by default those of the process
+    :return: exit code
+    """
+    parser = _parser()
+    args = parser.parse_args(args)
+    if args.command == "purge" and args.oldest is not None and args.name is None:
+        parser.error("purge --oldest requires --name")
+    if args.command == "validate" and args.baseline is not None and args.baseline < 1:
+        parser.error("validate --baseline must be at least 1")
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,21 +7,29 @@ This module also provides the data abstraction for storing, retrieiving and purg
 data store. A SQL implmementation can be found in :mod:`daktylos.data_stores.sql`.
 """
 
+import bisect
 import datetime
-import multiprocessing
-import platform
-import socket
+import math
+import os
+import re
+import threading
 from abc import abstractmethod, ABC
+from collections import deque
 from contextlib import AbstractContextManager
 from dataclasses import dataclass, field
 from enum import Enum
-from typing import (List, Dict, Optional, Iterable, Union, Set, TypeVar, Type, Generic)
+from typing import (List, Dict, Optional, Iterable, Iterator, Union, Set, Tuple, TypeVar, Type, Generic,
+                    Callable, ContextManager, Pattern, Sequence)
+
+from daktylos.instrumentation import NULL_MEASUREMENT, Measurement, OperationSink
 try:
     from typing import Protocol
 except ImportError:
     from typing_extensions import Protocol
 
-__all__ = ["Metadata", "Metric", "CompositeMetric", "MetricStore", "MetricDataClass", "MDC", "Query", "QueryResult"]
+__all__ = ["Metadata", "Metric", "CompositeMetric", "MetricStore", "MetricDataClass", "MDC", "Query", "QueryResult",
+           "QueryStatistics", "MultiQuery", "RollingWindow", "BaselineCache", "FieldBatch", "like_to_regex",
+           "field_matcher"]
 
 # define convenience types for type hints and such:
 number = Union[float, int]
@@ -82,24 +90,91 @@ class Metadata:
     The metadata key/value pairs
     """
 
-    # noinspection PyBroadException
+    SYSTEM_INFO_FIELDS = ('machine', 'platform', 'system', 'processor', 'num_cores', 'ip_address')
+    """
+    Fields of the metadata describing the host system, as returned by `system_info`
+    """
+
     @staticmethod
-    def system_info() -> "Metadata":
+    def system_info(fields: Optional[Iterable[str]] = None, timeout: float = 0.5) -> "Metadata":
         """
+        Return a standard set of metadata describing the host system.  Values are computed once per process, on first
+        request, and cached; the IP address is resolved in a background thread, and taken to be "<<indeterminate>>"
+        (for the lifetime of the process) if not resolved by the first call to request it, within the given timeout.
+
+        :param fields: if specified, the fields (of `SYSTEM_INFO_FIELDS`) to include; by default all are included
+        :param timeout: maximum time in seconds to wait for the IP address to be resolved
         :return: a standard set of metadata describing the host system
+        :raises ValueError: if any field given is not of `SYSTEM_INFO_FIELDS`
         """
+        fields = Metadata.SYSTEM_INFO_FIELDS if fields is None else tuple(fields)
+        unknown = [name for name in fields if name not in Metadata.SYSTEM_INFO_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown system info fields: {unknown}")
+        return Metadata({name: _system_info.value(name, timeout) for name in fields})
+
+
+class _SystemInfo:
+    """
+    Per-process cache of the values of `Metadata.system_info`
+    """
+
+    INDETERMINATE = "<<indeterminate>>"
+
+    def __init__(self):
+        self._values: Dict[str, Union[str, int]] = {}
+        self._lock = threading.Lock()
+        self._resolved = threading.Event()
+        self._resolver: Optional[threading.Thread] = None
+        self._ip_address = self.INDETERMINATE
+
+    def value(self, name: str, timeout: float) -> Union[str, int]:
+        """
+        :return: the value of the given field, computed if not yet cached
+        """
+        value = self._values.get(name)
+        if value is not None:
+            return value
+        if name == 'ip_address':
+            return self._resolve_ip_address(timeout)
+        # (imported here rather than up front, as most processes using this module never ask for system info)
+        import platform
+        with self._lock:
+            if name not in self._values:
+                self._values[name] = {'machine': platform.machine,
+                                      'platform': platform.platform,
+                                      'system': platform.system,
+                                      'processor': platform.processor,
+                                      'num_cores': lambda: os.cpu_count() or 1}[name]()
+            return self._values[name]
+
+    # noinspection PyBroadException
+    def _resolve(self) -> None:
+        import socket
         try:
-            ip_address = socket.gethostbyname(socket.getfqdn())
+            self._ip_address = socket.gethostbyname(socket.getfqdn())
         except Exception:
-            ip_address = "<<indeterminate>>"
-        return Metadata({
-            'machine': platform.machine(),
-            'platform': platform.platform(),
-            'system': platform.system(),
-            'processor': platform.processor(),
-            'num_cores': multiprocessing.cpu_count(),
-            'ip_address': ip_address
-        })
+            pass
+        self._resolved.set()
+
+    def _resolve_ip_address(self, timeout: float) -> str:
+        """
+        :return: the IP address of the host, resolved (once) in a background thread, as resolved once waited for
+        """
+        with self._lock:
+            if self._resolver is None:
+                # a daemon thread, so that a lookup that never returns does not keep the process alive
+                self._resolver = threading.Thread(target=self._resolve, name="daktylos-resolve-ip", daemon=True)
+                self._resolver.start()
+        self._resolved.wait(timeout)
+        with self._lock:
+            # the value is fixed once waited for, so that metadata of the process does not change once posted
+            if 'ip_address' not in self._values:
+                self._values['ip_address'] = self._ip_address if self._resolved.is_set() else self.INDETERMINATE
+            return self._values['ip_address']
+
+
+_system_info = _SystemInfo()
 
 
 @dataclass
@@ -163,8 +238,9 @@ class BasicMetric(ABC):
         """
         if len(values) == 0:
             raise ValueError("Empty value set when constructing Metric")
-        # if only one element, make a single simple metric
-        if len(values.values()) == 1 and type(list(values.values())[0]) in [float, int]:
+        # if only one element not pathed as part of a composite, make a single simple metric
+        if len(values.values()) == 1 and type(list(values.values())[0]) in [float, int] and \
+                not list(values.keys())[0].startswith('/'):
             name = list(values.keys())[0]
             if '#' in name:
                 raise ValueError("Metric names must not contain a '#'")
@@ -399,8 +475,10 @@ class CompositeMetric(BasicMetric):
         :return:  the metric instance sought
         :raises: AttributeError if this metric does not contain a metric with the name provided
         """
+        # look up through __dict__ so that probing attributes before "value" is set (as during unpickling)
+        # does not recurse infinitely
         try:
-            return self.value[item]
+            return self.__dict__['value'][item]
         except KeyError:
             raise AttributeError(f"No such attribute: {item}")
 
@@ -446,6 +524,20 @@ class CompositeMetric(BasicMetric):
         """
         return self._keys(core_metrics_only)
 
+    def leaves(self, root: str = "") -> Iterator[Tuple[str, "Metric"]]:
+        """
+        :param root: only to be used internally
+        :return: iterator over (key-path, `Metric`) pairs of all core metrics in the hierarchy, in the order
+           they were added, with key-paths as returned by `keys(core_metrics_only=True)`
+        """
+        for key, value in self.value.items():
+            if isinstance(value, Metric):
+                yield '#'.join([root, key]), value
+            elif isinstance(value, CompositeMetric):
+                yield from value.leaves(root=key if not root else '/'.join([root, key]))
+            else:
+                raise TypeError("Child not of expected type of Metric or CompositeMetric")
+
     def element(self, key_path: str) -> BasicMetric:
         """
         :param key_path: a path-like key to a sub-metric of this composite.  The path is relative
@@ -554,14 +646,265 @@ class CompositeMetric(BasicMetric):
         return result
 
 
+class RollingWindow:
+    """
+    Running statistics over the most recent values of a single metric key, updated incrementally as values are
+    added (O(1) for the mean, O(log N) search plus an O(N) list shift for the median)
+
+    :param size: maximum number of values held, older values being evicted as new ones are added
+    :param values: initial values, oldest first
+    """
+
+    def __init__(self, size: int, values: Iterable[float] = ()):
+        if size < 1:
+            raise ValueError("Rolling window size must be at least 1")
+        self._size = size
+        self._values: "deque[float]" = deque(maxlen=size)
+        self._sorted: List[float] = []
+        self._sum = 0.0
+        for value in values:
+            self.add(value)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    @property
+    def size(self) -> int:
+        """
+        :return: maximum number of values held in this window
+        """
+        return self._size
+
+    @property
+    def values(self) -> List[float]:
+        """
+        :return: values currently in the window, oldest first
+        """
+        return list(self._values)
+
+    def add(self, value: float) -> None:
+        """
+        Add a value to the window, evicting the oldest if full
+
+        :param value: value to add
+        """
+        value = float(value)
+        if len(self._values) == self._size:
+            oldest = self._values[0]
+            self._sum -= oldest
+            del self._sorted[bisect.bisect_left(self._sorted, oldest)]
+        self._values.append(value)
+        self._sum += value
+        bisect.insort(self._sorted, value)
+
+    def mean(self, count: Optional[int] = None) -> Optional[float]:
+        """
+        :param count: if specified, only consider the latest count values
+        :return: mean of the values in the window, or None if empty
+        """
+        if not self._values:
+            return None
+        if count is None or count >= len(self._values):
+            return self._sum / len(self._values)
+        return sum(self._values[-index] for index in range(1, count + 1)) / count
+
+    def median(self, count: Optional[int] = None) -> Optional[float]:
+        """
+        :param count: if specified, only consider the latest count values
+        :return: median of the values in the window, or None if empty
+        """
+        if not self._values:
+            return None
+        if count is None or count >= len(self._values):
+            ordered = self._sorted
+        else:
+            ordered = sorted(self._values[-index] for index in range(1, count + 1))
+        middle = len(ordered) // 2
+        if len(ordered) % 2:
+            return ordered[middle]
+        return (ordered[middle - 1] + ordered[middle]) / 2.0
+
+
+class BaselineCache:
+    """
+    Cache of a `RollingWindow` for each key of each (top-level) metric name and metadata set posted to a data store,
+    so that validations relative to a baseline (the rolling mean or median of the latest values) need no query of
+    history.  Metrics of one name posted with different metadata (e.g. from different platforms) have baselines of
+    their own
+
+    :param window: number of latest values to keep per key
+    """
+
+    def __init__(self, window: int):
+        self._window = window
+        self._baselines: Dict[Tuple[str, str], Dict[str, RollingWindow]] = {}
+
+    @property
+    def window(self) -> int:
+        """
+        :return: number of values held per key
+        """
+        return self._window
+
+    @staticmethod
+    def metadata_key(metadata: Optional[Metadata]) -> str:
+        """
+        :param metadata: metadata of metrics
+        :return: key identifying the baselines of metrics posted with the given metadata, independent of the order of
+           its fields (empty for metrics posted without metadata)
+        """
+        if metadata is None:
+            return ""
+        import hashlib
+        import json
+        return hashlib.sha256(json.dumps(sorted(metadata.values.items())).encode('utf-8')).hexdigest()
+
+    def __contains__(self, metric_name: str) -> bool:
+        return any(name == metric_name for name, _ in self._baselines)
+
+    def cached(self, metric_name: str, metadata: Optional[Metadata] = None) -> bool:
+        """
+        :param metric_name: name of the metric
+        :param metadata: metadata of the metrics of the baseline
+        :return: whether the baseline of the given metric name and metadata is cached
+        """
+        return (metric_name, self.metadata_key(metadata)) in self._baselines
+
+    def load(self, metric_name: str, values: Dict[str, Iterable[float]],
+             metadata: Optional[Metadata] = None) -> Dict[str, RollingWindow]:
+        """
+        (Re)initialize the baseline of a metric name and metadata from previously stored values
+
+        :param metric_name: name of the metric
+        :param values: per-key (flattened key-path) values, oldest first
+        :param metadata: metadata of the metrics of the baseline
+        :return: the baseline of the metric
+        """
+        baseline = self._baselines[(metric_name, self.metadata_key(metadata))] = \
+            {key: RollingWindow(self._window, series) for key, series in values.items()}
+        return baseline
+
+    def update(self, metric: BasicMetric, metadata: Optional[Metadata] = None) -> Set[str]:
+        """
+        Add the values of the given metric to its baseline
+
+        :param metric: metric whose (flattened) values are to be added
+        :param metadata: metadata the metric is posted with
+        :return: the keys updated
+        """
+        baseline = self._baselines.setdefault((metric.name, self.metadata_key(metadata)), {})
+        key_values = metric.flatten()
+        for key, value in key_values.items():
+            window = baseline.get(key)
+            if window is None:
+                window = baseline[key] = RollingWindow(self._window)
+            window.add(value)
+        return set(key_values)
+
+    def baseline(self, metric_name: str, metadata: Optional[Metadata] = None) -> Dict[str, RollingWindow]:
+        """
+        :param metric_name: name of the metric
+        :param metadata: metadata of the metrics of the baseline
+        :return: the per-key (flattened key-path) rolling windows for the metric (empty if none cached)
+        """
+        return self._baselines.get((metric_name, self.metadata_key(metadata)), {})
+
+
+def like_to_regex(pattern: str) -> Pattern:
+    """
+    Translate a SQL LIKE pattern into an equivalent (case-insensitive, as SQLite's LIKE) regular expression
+
+    :param pattern: pattern where '%' matches any sequence of characters and '_' any single character
+    :return: compiled regular expression matching the whole of a string against the pattern
+    """
+    translated = "".join('.*' if c == '%' else '.' if c == '_' else re.escape(c) for c in pattern)
+    return re.compile(translated + r'\Z', re.IGNORECASE | re.DOTALL)
+
+
+def field_matcher(fields: Iterable[str]) -> Callable[[str], bool]:
+    """
+    :param fields: field names or patterns, interpreted as in the SQL store: names holding wildcard characters are
+       LIKE patterns, negated when prefixed with '!'; others must match exactly
+    :return: predicate on field name, true if matching any of the given fields
+    """
+    names: Set[str] = set()
+    conditions: List[Callable[[str], bool]] = []
+    for field in fields:
+        if any(['*' in field, '_' in field, '%' in field, '[' in field and ']' in field, '^' in field]):
+            if field.startswith('!'):
+                regex = like_to_regex(field[1:])
+                conditions.append(lambda name, regex=regex: regex.match(name) is None)
+            else:
+                conditions.append(like_to_regex(field).match)
+        else:
+            names.add(field)
+    return lambda name: name in names or any(condition(name) for condition in conditions)
+
+
+@dataclass
+class QueryStatistics:
+    """
+    Data class to hold statistics of the execution of a query (see `Query.collect_statistics`)
+    """
+    #: number of statements issued to the database
+    statements: int = 0
+    #: number of rows fetched by the query's own statements
+    rows: int = 0
+    #: time spent executing statements in the database, in seconds
+    database_time: float = 0.0
+    #: remaining time of the query, spent fetching and decoding results in Python, in seconds
+    decode_time: float = 0.0
+    #: number of objects materialized from rows (e.g. ORM instances)
+    objects: int = 0
+
+
 @dataclass
 class QueryResult(Generic[MDC]):
     """
-    Data class to hold list of timestamps, metadtaa and metric data
+    Data class to hold list of timestamps, metadtaa and metric data.  Metrics of the same metadata set share its
+    metadata (object) in results of the data stores
     """
     metadata: List[Optional[Metadata]] = field(default_factory=list)
     timestamps: List[datetime.datetime] = field(default_factory=list)
     metric_data: MDC = field(default_factory=list)
+    #: statistics of execution of the query, if requested
+    stats: Optional[QueryStatistics] = None
+
+    def to_frame(self):
+        """
+        Convert the result of a query of composite metrics, or of a field query, to a pandas DataFrame indexed by
+        timestamp, with a categorical column per metadata field and a float column per key-path (requires pandas;
+        see `daktylos.frames`)
+
+        :return: the wide frame of the metrics of the result
+        """
+        from daktylos.frames import result_frame
+        return result_frame(self)
+
+
+@dataclass
+class FieldBatch:
+    """
+    Data class holding a batch of consecutive metrics of one name in columnar form, for bulk transfer of metric
+    histories (see `MetricStore.field_batches` and `MetricStore.post_batch`).  All columns are aligned with
+    the timestamps, and metrics of the same metadata set share its metadata (object) in batches of the data stores
+    """
+    timestamps: List[datetime.datetime] = field(default_factory=list)
+    metadata: List[Optional[Metadata]] = field(default_factory=list)
+    #: values per (flattened) key-path, NaN where a metric has no value for the key-path
+    values: Dict[str, Sequence[float]] = field(default_factory=dict)
+    #: names of metadata fields found across all batches of a stream
+    metadata_names: List[str] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def to_frame(self):
+        """
+        :return: the metrics of this batch as a pandas DataFrame (requires pandas; see `daktylos.frames`)
+        """
+        from daktylos.frames import batch_frame
+        return batch_frame(self)
 
 
 class Query(Generic[MDC]):
@@ -575,11 +918,30 @@ class Query(Generic[MDC]):
     def __init__(self, metric_name: str, max_count: Optional[int] = None):
         self._metric_name = metric_name
         self._count = max_count
+        self._collect_statistics = False
 
     @property
     def count(self) -> Optional[int]:
         return self._count
 
+    def collect_statistics(self, collect: bool = True) -> "Query[MDC]":
+        """
+        Request statistics of the execution of this query, returned as the `stats` of the `QueryResult`.
+        Data stores that cannot collect statistics leave `stats` as None
+
+        :param collect: whether to collect statistics
+        :return: self
+        """
+        self._collect_statistics = collect
+        return self
+
+    def explain(self) -> str:
+        """
+        :return: the plan of the main statement of this query, as reported by the backend
+        :raises NotImplementedError: if the data store has no notion of a query plan
+        """
+        raise NotImplementedError(f"{self.__class__.__name__} does not provide query plans")
+
     @abstractmethod
     def execute(self) -> "Union[QueryResult[List[MDC]], QueryResult[Dict[str, List[float]]]]":
         """
@@ -616,6 +978,91 @@ class Query(Generic[MDC]):
         """
 
 
+class MultiQuery:
+    """
+    Query of the composite metrics of several names at once, with the filters of `Query` applying to every name.
+    This implementation executes one query per name; data stores able to fetch all names in one set of statements
+    provide their own (see `MetricStore.start_multi_query`)
+
+    :param store: data store to query
+    :param metric_names: names of the composite metrics to query
+    :param max_count: max number of entries to query per name
+    """
+
+    def __init__(self, store: "MetricStore", metric_names: Iterable[str], max_count: Optional[int] = None):
+        self._store = store
+        # each name is queried (and reported) once
+        self._metric_names = list(dict.fromkeys(metric_names))
+        self._count = max_count
+        self._collect_statistics = False
+        self._filters: List[Callable[[Query], Query]] = []
+
+    @property
+    def count(self) -> Optional[int]:
+        return self._count
+
+    @property
+    def metric_names(self) -> List[str]:
+        return list(self._metric_names)
+
+    def collect_statistics(self, collect: bool = True) -> "MultiQuery":
+        """
+        Request statistics of the execution of this query, returned as the `stats` of each `QueryResult`.
+        Data stores that cannot collect statistics leave `stats` as None
+
+        :param collect: whether to collect statistics
+        :return: self
+        """
+        self._collect_statistics = collect
+        return self
+
+    def execute(self) -> Dict[str, QueryResult[List[CompositeMetric]]]:
+        """
+        Execute the query
+        :return: result of each name queried, with timestamps ordered from oldest to newest
+        """
+        results: Dict[str, QueryResult[List[CompositeMetric]]] = {}
+        for metric_name in self._metric_names:
+            query = self._store.start_query(metric_name, self._count).collect_statistics(self._collect_statistics)
+            for apply in self._filters:
+                apply(query)
+            results[metric_name] = query.execute()
+        return results
+
+    def filter_on_date(self, oldest: datetime.datetime, newest: datetime.datetime) -> "MultiQuery":
+        """
+        Filter results on date range
+        :param oldest: oldest date
+        :param newest: newest date
+        :return: self
+        """
+        self._filters.append(lambda query: query.filter_on_date(oldest=oldest, newest=newest))
+        return self
+
+    def filter_on_metadata(self, **kwds) -> "MultiQuery":
+        """
+        filter on metadata fields matching given keyword/value pairs
+        :param kwds: keywords and values to filter on
+        :return:  self
+        """
+        self._filters.append(lambda query: query.filter_on_metadata(**kwds))
+        return self
+
+    def filter_on_metadata_field(self, name: str, value: Union[str, int],
+                                 op: "MetricStore.Comparison") -> "MultiQuery":
+        """
+        filter query on metadata field with given name against provided value
+        :param name: name of metadata field
+        :param value: value to compare against
+        :param op: type of comparison operation to perform
+        :return: self
+        """
+        if not isinstance(op, MetricStore.Comparison):
+            raise ValueError(f"Invalid operations: {op}")
+        self._filters.append(lambda query: query.filter_on_metadata_field(name, value, op))
+        return self
+
+
 class MetricStore(AbstractContextManager):
     """
     Context manager class defining interface for storing, retrieving and purging values
@@ -633,6 +1080,37 @@ class MetricStore(AbstractContextManager):
         LESS_THAN_OR_EQUAL = "<="
         GREATER_THAN_OR_EQUAL = ">="
 
+    _sink: Optional[OperationSink] = None
+
+    @property
+    def sink(self) -> Optional[OperationSink]:
+        return self._sink
+
+    def instrument(self, sink: Optional[OperationSink]) -> None:
+        """
+        Attach a sink to receive timing, row counts and (where supported) statement counts of the operations of this
+        store, such as posting, committing, querying and purging
+
+        :param sink: sink to attach, or None to detach any sink and turn off instrumentation
+        """
+        self._sink = sink
+
+    def _statement_count(self) -> Optional[int]:
+        """
+        :return: running count of statements issued to the underlying database, or None if not counted
+        """
+        return None
+
+    def _measure(self, operation: str) -> ContextManager[Measurement]:
+        """
+        :param operation: name of operation to measure
+        :return: context manager measuring the operation, reporting it to the sink of this store if attached
+        """
+        if self._sink is None:
+            return NULL_MEASUREMENT
+        return Measurement(self._sink, operation,
+                           self._statement_count if self._statement_count() is not None else None)
+
     @abstractmethod
     def __enter__(self) -> "MetricStore":
         """
@@ -732,6 +1210,15 @@ class MetricStore(AbstractContextManager):
         :return: a Query[Dict[str, List[flost]]] object to embelish/execute
         """
 
+    def start_multi_query(self, metric_names: Iterable[str], max_results: Optional[int] = None) -> MultiQuery:
+        """
+        :param metric_names: names of metrics to query for
+        :param max_results: optional max number of results to return for each name
+        :return: a MultiQuery object used to construct a query of the composite metrics of all given names and
+           execute it
+        """
+        return MultiQuery(self, metric_names, max_results)
+
     def composite_metrics_by_date(self, metric_name: str, oldest: datetime.datetime,
                                   newest: Optional[datetime.datetime] = None,
                                   metadata_filter: Optional[Dict[str, str]] = None) \
@@ -842,8 +1329,122 @@ class MetricStore(AbstractContextManager):
             query.filter_on_metadata(**metadata_filter)
         return query.execute()
 
+    def latest(self, metric_name: str, metadata_filter: Optional[Dict[str, Union[str, int]]] = None) \
+            -> "QueryResult[List[CompositeMetric]]":
+        """
+        Return the latest composite metric of the given name, such as the previous value to validate a new metric
+        against (see `RulesEngine.process`)
+
+        :param metric_name: name of metric to retrieve
+        :param metadata_filter: filter on key/value pairs that match associated metadata of the metric (optional)
+        :return: the latest value of the metric, or an empty result if there is none
+        """
+        return self.composite_metrics_by_volume(metric_name, count=1, metadata_filter=metadata_filter)
+
+    def rolling_baseline(self, metric_name: str, metadata: Optional[Metadata] = None) -> Dict[str, RollingWindow]:
+        """
+        Return the baseline of the latest values posted under the given metric name and metadata, maintained
+        incrementally on each post so that no query of history is needed.  Metrics posted with different metadata
+        (e.g. from different platforms) have baselines of their own, so validate a metric against the baseline of the
+        metadata it is posted with.  Validate a metric against its baseline before posting it, otherwise the baseline
+        includes the metric itself.
+
+        :param metric_name: name of the metric
+        :param metadata: metadata of the metrics of the baseline, None for metrics posted without metadata
+        :return: rolling window of the latest values for each (flattened) key-path of the metric
+        :raises NotImplementedError: if this data store does not maintain baselines
+        """
+        raise NotImplementedError(f"{self.__class__.__name__} does not maintain rolling baselines")
+
+    def _baseline_history(self, metric_name: str, metadata: Optional[Metadata], window: int) \
+            -> Dict[str, List[float]]:
+        """
+        :param metric_name: name of the metric
+        :param metadata: metadata of the metrics
+        :param window: number of latest values of each key to return
+        :return: the latest values of each key of metrics of the given name posted with exactly the given metadata,
+           oldest first, to seed a rolling baseline from history
+        """
+        query = self.start_query(metric_name, max_results=window)
+        if metadata is not None and metadata.values:
+            query.filter_on_metadata(**metadata.values)
+        result = query.execute()
+        history: Dict[str, List[float]] = {}
+        for item, metric in zip(result.metadata, result.metric_data):
+            # (the filter also matches metadata with further fields)
+            if item == metadata:
+                for key, value in metric.flatten().items():
+                    history.setdefault(key, []).append(value)
+        return history
+
+    def field_batches(self, metric_name: str, fields: Optional[Iterable[str]] = None,
+                      oldest: Optional[datetime.datetime] = None, newest: Optional[datetime.datetime] = None,
+                      batch_size: int = 10000) -> Iterator[FieldBatch]:
+        """
+        Stream the history of a metric in columnar batches, from oldest to newest, for bulk export.  All batches
+        share the same key-paths and metadata names (those of the whole selection), and metrics without a value
+        for any of the selected key-paths are omitted, as in a field query.
+
+        The default implementation queries the whole selection at once before batching it; data stores override
+        this to stream from storage
+
+        :param metric_name: name of metric
+        :param fields: (wildcard) list of field names to select, or None for all
+        :param oldest: if specified, only select metrics from this date
+        :param newest: if specified, only select metrics up to this date
+        :param batch_size: maximum number of metrics per batch
+        :return: iterator over the batches
+        """
+        if batch_size <= 0:
+            raise ValueError("Batch size must be positive")
+        query = self.start_query(metric_name)
+        if oldest is not None or newest is not None:
+            query.filter_on_date(oldest=oldest or datetime.datetime.min, newest=newest or datetime.datetime.utcnow())
+        result = query.execute()
+        matches = field_matcher(fields) if fields else None
+        rows = []
+        for timestamp, metadata, metric in sorted(zip(result.timestamps, result.metadata, result.metric_data),
+                                                  key=lambda row: row[0]):
+            values = {key: value for key, value in metric.flatten().items() if matches is None or matches(key)}
+            if values:
+                rows.append((timestamp, metadata, values))
+        keys = sorted({key for _, _, values in rows for key in values})
+        metadata_names = sorted({name for _, metadata, _ in rows if metadata for name in metadata.values})
+        for start in range(0, len(rows), batch_size):
+            chunk = rows[start: start + batch_size]
+            yield FieldBatch(timestamps=[timestamp for timestamp, _, _ in chunk],
+                             metadata=[metadata for _, metadata, _ in chunk],
+                             values={key: [values.get(key, math.nan) for _, _, values in chunk] for key in keys},
+                             metadata_names=metadata_names)
+
+    def post_batch(self, metric_name: str, batch: FieldBatch, project_name: Optional[str] = None) -> None:
+        """
+        Post a batch of metrics of the given name, as if posted one by one (see `post`).  Metrics without a value
+        for any key-path in the batch are skipped.
+
+        The default implementation posts the metrics one by one; data stores override this with a bulk insert
+
+        :param metric_name: name of the metrics, which must be the root of the key-paths of the batch
+        :param batch: the metrics to post
+        :param project_name: if specified, the project name associated with the metrics
+        """
+        for index, timestamp in enumerate(batch.timestamps):
+            values = {key: column[index] for key, column in batch.values.items() if not math.isnan(column[index])}
+            if not values:
+                continue
+            metric = BasicMetric.from_flattened(values)
+            if metric.name != metric_name:
+                raise ValueError(f"Key-paths of batch are not of metric {metric_name}")
+            self.post(metric, timestamp=timestamp, metadata=batch.metadata[index], project_name=project_name)
+
     @abstractmethod
     def commit(self) -> None:
         """
         Explicit commit of all buffered changes
         """
+
+    def rollback(self) -> None:
+        """
+        Discard all changes buffered since last commit, such as after a failed commit, so that later changes can be
+        committed.  By default nothing is discarded; stores committing changes in a transaction override this
+        """
@@ -0,0 +1,34 @@
+"""
+Implementations of :class:`daktylos.data.MetricStore`.  The stores are imported on first use, as in
+`from daktylos.data_stores import SQLMetricStore`, so that importing this package does not import the dependencies of
+stores that are not used (such as sqlalchemy).
+"""
+import importlib
+
+__all__ = ['CachingMetricStore', 'FileMetricStore', 'InMemoryMetricStore', 'IngestionClient', 'IngestionDaemon',
+           'SQLBlockMetricStore', 'SQLMetricStore', 'ShardedMetricStore']
+
+# module of each store, by name
+_MODULES = {
+    'CachingMetricStore': 'caching',
+    'FileMetricStore': 'file',
+    'InMemoryMetricStore': 'memory',
+    'IngestionClient': 'ingest',
+    'IngestionDaemon': 'ingest',
+    'SQLBlockMetricStore': 'blocks',
+    'SQLMetricStore': 'sql',
+    'ShardedMetricStore': 'sharded',
+}
+
+
+def __getattr__(name: str):
+    module = _MODULES.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f"{__name__}.{module}"), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,898 @@
+"""
+SQL implementation of :class:`daktylos.data.MetricStore` holding the history of each metric in compressed blocks,
+rather than in a row per value as `SQLMetricStore` does.  Consecutive composite metrics of one name, up to the block
+size, are packed into a block holding their timestamps as delta-of-deltas, and the values of each key-path XOR-ed
+with the previous value of the key-path, both coded in a variable number of bits as in Facebook's Gorilla time
+series database.  Metadata is held in the tables (and index) of `SQLMetricStore`.
+
+Tables, besides those of `SQLMetricStore`::
+
+    series_blocks          one row per block: metric name, oldest and newest timestamp, number of composite metrics,
+                           coded timestamps, uuids of the metadata sets of the block and the position of each
+                           composite metric's set among them
+    series_block_sets      the metadata sets of each block, by position
+    series_block_values    the coded values of each key-path of each block
+
+Queries select the blocks of a metric overlapping their dates (and holding metadata sets matching their metadata
+filters), from newest, and only decode the values of the key-paths they return.
+"""
+import array
+import collections
+import datetime
+import json
+import math
+from abc import ABC, abstractmethod
+from typing import (
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Type,
+    Union,
+)
+
+from sqlalchemy import (
+    Column,
+    ForeignKey,
+    Index,
+    Integer,
+    LargeBinary,
+    String,
+    TIMESTAMP,
+    Text,
+    delete,
+    desc,
+    exists,
+    func,
+    select,
+)
+
+from daktylos.data import (
+    CompositeMetric,
+    FieldBatch,
+    MDC,
+    Metadata,
+    Metric,
+    MetricDataClass,
+    MetricDataClassT,
+    MetricStore,
+    MultiQuery,
+    Query,
+    QueryResult,
+    QueryStatistics,
+    field_matcher,
+)
+from daktylos.data_stores.sql import (
+    Base,
+    MetricSummary,
+    SQLMetadataSet,
+    SQLMetricStore,
+    _Filters,
+    _StatisticsCollector,
+    _matching_sets,
+    _plan,
+)
+
+__all__ = ['SQLBlockMetricStore']
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+_MICROSECOND = datetime.timedelta(microseconds=1)
+_MASK = (1 << 64) - 1
+#: prefix codes of delta-of-deltas of timestamps, with the number of bits following each
+_DELTA_CODES = (('10', 7), ('110', 9), ('1110', 12), ('11110', 32), ('11111', 64))
+#: number of bits following the prefix code of a delta-of-delta, by number of leading ones of the code
+_DELTA_WIDTHS = (0, 7, 9, 12, 32, 64)
+
+
+class SQLSeriesBlock(Base):
+    """
+    Class representing SQL table of blocks of consecutive composite metrics of one name
+    """
+    __tablename__ = "series_blocks"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(127), nullable=False)
+    oldest = Column(TIMESTAMP, nullable=False)
+    newest = Column(TIMESTAMP, nullable=False)
+    count = Column(Integer, nullable=False)
+    timestamps = Column(LargeBinary, nullable=False)
+    #: JSON-encoded list of the uuids of the metadata sets of the block, at positions 1 onwards
+    set_uuids = Column(Text, nullable=False)
+    #: position of the metadata set of each composite metric, 0 for none
+    set_positions = Column(LargeBinary, nullable=False)
+    # blocks are selected by name from newest (and oldest, for purges):
+    __table_args__ = (Index('series_blocks_by_newest', 'name', 'newest'),
+                      Index('series_blocks_by_oldest', 'name', 'oldest'))
+
+
+class SQLSeriesBlockSet(Base):
+    """
+    Class representing SQL table of the metadata sets of each block, referencing them so that metadata filters select
+    blocks through the metadata index, and so that sets in use are not purged
+    """
+    __tablename__ = "series_block_sets"
+
+    block_id = Column(Integer, ForeignKey(SQLSeriesBlock.id), primary_key=True)
+    position = Column(Integer, primary_key=True)
+    set_uuid = Column(String(255), ForeignKey(SQLMetadataSet.uuid), nullable=False)
+    __table_args__ = (Index('series_block_sets_by_set', 'set_uuid', 'block_id'),)
+
+
+class SQLSeriesBlockValues(Base):
+    """
+    Class representing SQL table of the coded values of each key-path of each block
+    """
+    __tablename__ = "series_block_values"
+
+    block_id = Column(Integer, ForeignKey(SQLSeriesBlock.id), primary_key=True)
+    name = Column(String(255), primary_key=True)
+    data = Column(LargeBinary, nullable=False)
+
+
+def _to_micros(timestamp: datetime.datetime) -> int:
+    """
+    :return: microseconds since the epoch of a timestamp, taken as UTC if naive
+    """
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return (timestamp - _EPOCH) // _MICROSECOND
+
+
+def _from_micros(micros: int) -> datetime.datetime:
+    return _EPOCH + datetime.timedelta(microseconds=micros)
+
+
+def _pack(bits: List[str]) -> bytes:
+    """
+    :param bits: strings of binary digits
+    :return: the bits, concatenated and padded with zeros to whole bytes
+    """
+    text = "".join(bits)
+    text += "0" * (-len(text) % 8)
+    return int(text, 2).to_bytes(len(text) // 8, 'big')
+
+
+def _unpack(data: bytes) -> str:
+    """
+    :return: the bits of the given bytes, as a string of binary digits
+    """
+    return format(int.from_bytes(data, 'big'), f'0{len(data) * 8}b')
+
+
+def _signed(value: int, width: int) -> int:
+    """
+    :return: the given two's complement of the given number of bits, as a signed integer
+    """
+    return value - (1 << width) if value >> (width - 1) else value
+
+
+def _encode_timestamps(timestamps: Sequence[int]) -> bytes:
+    """
+    :param timestamps: timestamps in microseconds, ascending
+    :return: the first timestamp in 64 bits, followed by the delta-of-delta of each other: '0' for none, else a prefix
+       code of the number of bits of its two's complement (see `_DELTA_CODES`) followed by those bits
+    """
+    bits = [format(timestamps[0] & _MASK, '064b')]
+    delta = 0
+    for index in range(1, len(timestamps)):
+        new_delta = timestamps[index] - timestamps[index - 1]
+        delta_of_delta, delta = new_delta - delta, new_delta
+        if not delta_of_delta:
+            bits.append('0')
+            continue
+        for prefix, width in _DELTA_CODES:
+            if -(1 << (width - 1)) <= delta_of_delta < 1 << (width - 1) or width == 64:
+                bits.append(prefix + format(delta_of_delta & ((1 << width) - 1), f'0{width}b'))
+                break
+    return _pack(bits)
+
+
+def _decode_timestamps(data: bytes, count: int) -> List[int]:
+    """
+    :param data: timestamps coded by `_encode_timestamps`
+    :param count: number of timestamps coded
+    :return: the timestamps, in microseconds
+    """
+    bits = _unpack(data)
+    timestamp = _signed(int(bits[:64], 2), 64)
+    timestamps = [timestamp]
+    position, delta = 64, 0
+    for _ in range(count - 1):
+        ones = 0
+        while ones < 5 and bits[position + ones] == '1':
+            ones += 1
+        position += ones + (ones < 5)
+        if ones:
+            width = _DELTA_WIDTHS[ones]
+            delta += _signed(int(bits[position: position + width], 2), width)
+            position += width
+        timestamp += delta
+        timestamps.append(timestamp)
+    return timestamps
+
+
+def _encode_values(values: Sequence[float]) -> bytes:
+    """
+    :param values: values of a key-path, NaN where missing
+    :return: the first value in 64 bits, followed by each other XOR-ed with the previous: '0' if equal, '10' followed
+       by the meaningful bits of the XOR if they fall within those of the previous, else '11' followed by the number of
+       leading zeros (5 bits), the number of meaningful bits less one (6 bits) and the meaningful bits
+    """
+    words = array.array('Q', array.array('d', values).tobytes())
+    bits = [format(words[0], '064b')]
+    previous, leading, trailing = words[0], 65, 0
+    for index in range(1, len(words)):
+        word = words[index]
+        xor, previous = word ^ previous, word
+        if not xor:
+            bits.append('0')
+            continue
+        lead = min(64 - xor.bit_length(), 31)
+        trail = (xor & -xor).bit_length() - 1
+        if lead >= leading and trail >= trailing:
+            bits.append('10' + format(xor >> trailing, f'0{64 - leading - trailing}b'))
+        else:
+            leading, trailing = lead, trail
+            significant = 64 - lead - trail
+            bits.append(f"11{lead:05b}{significant - 1:06b}" + format(xor >> trail, f'0{significant}b'))
+    return _pack(bits)
+
+
+def _decode_values(data: bytes, count: int) -> List[float]:
+    """
+    :param data: values coded by `_encode_values`
+    :param count: number of values coded
+    :return: the values
+    """
+    bits = _unpack(data)
+    word = int(bits[:64], 2)
+    words = array.array('Q', [word])
+    position, leading, trailing = 64, 0, 0
+    for _ in range(count - 1):
+        if bits[position] == '0':
+            position += 1
+        else:
+            if bits[position + 1] == '1':
+                leading = int(bits[position + 2: position + 7], 2)
+                trailing = 64 - leading - int(bits[position + 7: position + 13], 2) - 1
+                position += 13
+            else:
+                position += 2
+            significant = 64 - leading - trailing
+            word ^= int(bits[position: position + significant], 2) << trailing
+            position += significant
+        words.append(word)
+    return array.array('d', words.tobytes()).tolist()
+
+
+def _encode_positions(positions: Sequence[int]) -> bytes:
+    """
+    :param positions: position of the metadata set of each composite metric of a block
+    :return: the positions, each coded as '0' if the same as the previous (or 0 for the first), else as '1' followed
+       by the position in 16 bits
+    """
+    bits = []
+    previous = 0
+    for position in positions:
+        if position == previous:
+            bits.append('0')
+        else:
+            bits.append(f"1{position:016b}")
+            previous = position
+    return _pack(bits)
+
+
+def _decode_positions(data: bytes, count: int) -> List[int]:
+    bits = _unpack(data)
+    positions = []
+    offset = previous = 0
+    for _ in range(count):
+        if bits[offset] == '1':
+            previous = int(bits[offset + 1: offset + 17], 2)
+            offset += 17
+        else:
+            offset += 1
+        positions.append(previous)
+    return positions
+
+
+class _Block:
+    """
+    Consecutive composite metrics of one name in columnar form: their timestamps (in microseconds since the epoch),
+    the uuids of their metadata sets and, per key-path, their values (NaN where a metric has no value for the
+    key-path)
+    """
+
+    def __init__(self):
+        self.timestamps: List[int] = []
+        self.set_uuids: List[Optional[str]] = []
+        self.columns: Dict[str, List[float]] = {}
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def extend(self, timestamps: Sequence[int], set_uuids: Sequence[Optional[str]],
+               columns: Dict[str, Sequence[float]]) -> None:
+        """
+        add composite metrics given as columns of the same length as the timestamps
+        """
+        for key in columns.keys() - self.columns.keys():
+            self.columns[key] = [math.nan] * len(self.timestamps)
+        for key, column in self.columns.items():
+            values = columns.get(key)
+            column.extend(values if values is not None else [math.nan] * len(timestamps))
+        self.timestamps.extend(timestamps)
+        self.set_uuids.extend(set_uuids)
+
+    def select(self, indexes: Sequence[int]) -> "_Block":
+        """
+        :param indexes: indexes of composite metrics
+        :return: a block of the composite metrics of the given indexes, without the key-paths none of them has
+        """
+        block = _Block()
+        block.timestamps = [self.timestamps[index] for index in indexes]
+        block.set_uuids = [self.set_uuids[index] for index in indexes]
+        for key, column in self.columns.items():
+            values = [column[index] for index in indexes]
+            if not all(map(math.isnan, values)):
+                block.columns[key] = values
+        return block
+
+
+# noinspection PyProtectedMember
+class SQLBlockMetricStore(SQLMetricStore):
+    """
+    Concrete data store class for metrics storage and retrieval in a SQL database, holding the history of each metric
+    in compressed blocks of composite metrics (see the description of this module).  Posted metrics are buffered and
+    packed into blocks on commit, appended to the latest block of their name where it is not yet full and no newer
+    than them, so commit in batches for best results.  Project names and uuids of metrics are not held.  A database
+    holds metrics either in blocks or as rows of `SQLMetricStore`, not both.
+
+    :param engine: SQLAlchemy engine to connect to the database
+    :param create: whether to create tables if the do not exist in SQL database
+    :param baseline_window: if specified, maintain a rolling baseline of this many latest values per key
+       of each metric posted (see `MetricStore.rolling_baseline`)
+    :param block_size: maximum number of composite metrics per block
+    """
+
+    #: largest block size allowed (positions of metadata sets of a block are coded in 16 bits)
+    MAX_BLOCK_SIZE = 65535
+
+    def __init__(self, engine, create: bool = False, baseline_window: Optional[int] = None,
+                 block_size: int = 1024):
+        if not 0 < block_size <= self.MAX_BLOCK_SIZE:
+            raise ValueError(f"Block size must be from 1 to {self.MAX_BLOCK_SIZE}")
+        super().__init__(engine, create=create, baseline_window=baseline_window)
+        self._block_size = block_size
+        # composite metrics posted since last commit, per name:
+        self._pending_blocks: Dict[str, _Block] = {}
+
+    class _BaseQuery(Query[MDC], ABC):
+        """
+        Concrete implementation of a query of the blocks of a metric, decoding the composite metrics selected from
+        the blocks overlapping its dates
+        """
+
+        #: name of the operation reported to any instrumentation sink of the store
+        operation = "query"
+
+        def __init__(self, store: "SQLBlockMetricStore", metric_name: str, max_count: Optional[int] = None):
+            super().__init__(metric_name=metric_name, max_count=max_count)
+            self._store = store
+            self._filters = _Filters()
+            self._statistics: Optional[QueryStatistics] = None
+
+        def filter_on_date(self, oldest: datetime.datetime, newest: datetime.datetime) -> Query[MDC]:
+            self._filters.on_date(oldest, newest)
+            return self
+
+        def filter_on_metadata(self, **kwds) -> Query[MDC]:
+            for name, value in kwds.items():
+                self.filter_on_metadata_field(name, value, MetricStore.Comparison.EQUAL)
+            return self
+
+        def filter_on_metadata_field(self, name: str, value: Union[str, int], op: MetricStore.Comparison) \
+                -> Query[MDC]:
+            self._filters.on_metadata(name, value, op)
+            return self
+
+        def _matching_sets(self):
+            """
+            :return: statement selecting the uuids of the metadata sets matching all metadata filters of this query
+            """
+            parameters = self._filters.parameters
+            return select(SQLMetadataSet.uuid).where(*[
+                SQLMetadataSet.uuid.in_(_matching_sets(parameters[f"name_{index}"], parameters[f"value_{index}"],
+                                                       op, numeric))
+                for index, (op, numeric) in enumerate(self._filters.metadata)])
+
+        def _blocks(self):
+            """
+            :return: statement selecting the blocks that may hold composite metrics of this query, from newest
+            """
+            statement = select(SQLSeriesBlock.id, SQLSeriesBlock.newest, SQLSeriesBlock.count,
+                               SQLSeriesBlock.timestamps, SQLSeriesBlock.set_uuids, SQLSeriesBlock.set_positions).\
+                where(SQLSeriesBlock.name == self._metric_name)
+            if self._filters.oldest is not None:
+                statement = statement.where(SQLSeriesBlock.newest >= self._filters.oldest)
+            if self._filters.newest is not None:
+                statement = statement.where(SQLSeriesBlock.oldest <= self._filters.newest)
+            if self._filters.metadata:
+                statement = statement.where(exists().where(SQLSeriesBlockSet.block_id == SQLSeriesBlock.id,
+                                                           SQLSeriesBlockSet.set_uuid.in_(self._matching_sets())))
+            return statement.order_by(desc(SQLSeriesBlock.newest), desc(SQLSeriesBlock.id))
+
+        def explain(self) -> str:
+            return "\n".join(_plan(self._store._session, self._blocks()))
+
+        def execute(self) -> QueryResult[MDC]:
+            if not self._store._session:
+                raise RuntimeError("Not in context of data store.  please use 'with' statement")
+            with self._store._measure(self.operation) as measurement:
+                if self._collect_statistics:
+                    with _StatisticsCollector(self._store._engine, self._store._session) as statistics:
+                        self._statistics = statistics.statistics
+                        try:
+                            result = self._execute()
+                        finally:
+                            self._statistics = None
+                    result.stats = statistics.statistics
+                else:
+                    result = self._execute()
+                measurement.rows = len(result.timestamps)
+            return result
+
+        def _selection(self) -> Tuple[List[Tuple[int, int, int]], Dict[int, Tuple[int, List[Optional[str]]]]]:
+            """
+            :return: (timestamp, block id, index in block) of each composite metric selected, from oldest to newest,
+               and the number of composite metrics and the uuids of their metadata sets of each block selected from
+            """
+            session = self._store._session
+            matching: Optional[Set[str]] = None
+            if self._filters.metadata:
+                matching = set(session.execute(self._matching_sets()).scalars())
+                if not matching:
+                    return [], {}
+            oldest = _to_micros(self._filters.oldest) if self._filters.oldest is not None else None
+            newest = _to_micros(self._filters.newest) if self._filters.newest is not None else None
+            selected: List[Tuple[int, int, int]] = []
+            blocks: Dict[int, Tuple[int, List[Optional[str]]]] = {}
+            for block_id, block_newest, count, timestamps, set_uuids, set_positions in session.execute(self._blocks()):
+                if self._count and len(selected) >= self._count:
+                    # blocks may overlap in time (as metrics were not posted in order), so blocks are read until
+                    # older than the oldest of the latest composite metrics selected
+                    selected.sort()
+                    del selected[:-self._count]
+                    if _to_micros(block_newest) < selected[0][0]:
+                        break
+                if self._statistics is not None:
+                    self._statistics.rows += 1
+                uuids = [None] + json.loads(set_uuids)
+                row_uuids = [uuids[position] for position in _decode_positions(set_positions, count)]
+                rows = [(timestamp, block_id, index) for index, timestamp in
+                        enumerate(_decode_timestamps(timestamps, count))
+                        if (oldest is None or timestamp >= oldest) and (newest is None or timestamp <= newest)
+                        and (matching is None or row_uuids[index] in matching)]
+                if rows:
+                    selected += rows
+                    blocks[block_id] = count, row_uuids
+            selected.sort()
+            if self._count:
+                del selected[:-self._count]
+            return selected, blocks
+
+        def _columns(self, blocks: Dict[int, Tuple[int, List[Optional[str]]]], keys: Optional[List[str]] = None) \
+                -> Dict[int, Dict[str, List[float]]]:
+            """
+            :param blocks: number of composite metrics of each block to decode, by id
+            :param keys: if specified, the key-paths to decode
+            :return: the decoded values of each key-path of the given blocks
+            """
+            columns: Dict[int, Dict[str, List[float]]] = {block_id: {} for block_id in blocks}
+            block_ids = list(blocks)
+            for start in range(0, len(block_ids), self._store.MAX_PARAMETERS):
+                statement = select(SQLSeriesBlockValues.block_id, SQLSeriesBlockValues.name,
+                                   SQLSeriesBlockValues.data).\
+                    where(SQLSeriesBlockValues.block_id.in_(block_ids[start: start + self._store.MAX_PARAMETERS]))
+                if keys is not None:
+                    statement = statement.where(SQLSeriesBlockValues.name.in_(keys))
+                for block_id, key, data in self._store._session.execute(statement):
+                    columns[block_id][key] = _decode_values(data, blocks[block_id][0])
+                    if self._statistics is not None:
+                        self._statistics.rows += 1
+            return columns
+
+        def _keys(self, block_ids: Iterable[int]) -> List[str]:
+            """
+            :return: the key-paths held in any of the given blocks
+            """
+            block_ids = list(block_ids)
+            keys: Set[str] = set()
+            for start in range(0, len(block_ids), self._store.MAX_PARAMETERS):
+                keys.update(self._store._session.execute(
+                    select(SQLSeriesBlockValues.name).distinct().
+                    where(SQLSeriesBlockValues.block_id.in_(block_ids[start: start + self._store.MAX_PARAMETERS]))).
+                    scalars())
+            return sorted(keys)
+
+        def _metadata_sets(self, uuids: Iterable[Optional[str]]) -> Dict[Optional[str], Optional[Metadata]]:
+            """
+            :param uuids: uuids of metadata sets of the metrics of a result (None for metrics without metadata)
+            :return: metadata set of each of the given uuids, loaded in bulk
+            """
+            uuids = set(uuids)
+            metadata_sets = self._store._load_metadata_sets(uuid for uuid in uuids if uuid is not None)
+            # an empty set of metadata has no entries in the metadata index
+            return {uuid: metadata_sets.get(uuid, Metadata({})) if uuid is not None else None for uuid in uuids}
+
+        def _composites(self, keys: Optional[List[str]] = None) \
+                -> Iterator[Tuple[datetime.datetime, Optional[Metadata], Dict[str, float]]]:
+            """
+            :param keys: if specified, the key-paths to decode
+            :return: timestamp, metadata and flattened values of each composite metric selected with any value,
+               from oldest to newest
+            """
+            selected, blocks = self._selection()
+            if not selected:
+                return
+            columns = self._columns({block_id: blocks[block_id] for block_id in {row[1] for row in selected}}, keys)
+            metadata_sets = self._metadata_sets(blocks[block_id][1][index] for _, block_id, index in selected)
+            for timestamp, block_id, index in selected:
+                flattened = {key: column[index] for key, column in columns[block_id].items()
+                             if not math.isnan(column[index])}
+                # metadata sets are loaded afresh by each query, so are shared by its metrics of the same set
+                if flattened:
+                    yield _from_micros(timestamp), metadata_sets[blocks[block_id][1][index]], flattened
+
+        @abstractmethod
+        def _execute(self) -> QueryResult[MDC]:
+            """
+            Execute the query (see `execute`)
+            """
+
+    class _MetricQuery(_BaseQuery[MDC], ABC):
+        """
+        Query returning a value per composite metric decoded, rather than columns of values
+        """
+
+        def _execute(self) -> QueryResult[MDC]:
+            result: QueryResult[MDC] = QueryResult()
+            for timestamp, metadata, flattened in self._composites():
+                result.timestamps.append(timestamp)
+                result.metadata.append(metadata)
+                result.metric_data.append(self._convert(flattened))
+            return result
+
+        @abstractmethod
+        def _convert(self, values: Dict[str, float]) -> MDC:
+            """
+            :return: the flattened values of a composite metric as returned by this query
+            """
+
+    class _CompositeQuery(_MetricQuery[CompositeMetric]):
+        operation = "query.composite"
+
+        def _convert(self, values: Dict[str, float]) -> CompositeMetric:
+            return CompositeMetric.from_flattened(values)
+
+    class _DataclassQuery(_MetricQuery[MetricDataClassT]):
+        operation = "query.dataclass"
+
+        def __init__(self, store: "SQLBlockMetricStore", typ: Type[MetricDataClass], metric_name: str,
+                     max_count: Optional[int] = None):
+            super().__init__(store=store, metric_name=metric_name, max_count=max_count)
+            self._type = typ
+
+        def _convert(self, values: Dict[str, float]) -> MetricDataClassT:
+            return CompositeMetric.from_flattened(values).to_dataclass(self._type)
+
+    class _FieldQuery(_BaseQuery[Dict[str, List[float]]]):
+        operation = "query.fields"
+
+        def __init__(self, store: "SQLBlockMetricStore", metric_name: str, fields: Optional[Iterable[str]] = None,
+                     max_count: Optional[int] = None):
+            super().__init__(store=store, metric_name=metric_name, max_count=max_count)
+            self._matches = field_matcher(fields) if fields else None
+
+        def _execute(self) -> QueryResult[Dict[str, List[float]]]:
+            result: QueryResult[Dict[str, List[float]]] = QueryResult()
+            result.metric_data = {}  # correction on default type/value
+            for timestamp, metadata, values in self._composites(keys=self._matching_keys()):
+                result.timestamps.append(timestamp)
+                result.metadata.append(metadata)
+                for name, value in values.items():
+                    result.metric_data.setdefault(name, []).append(value)
+            return result
+
+        def _matching_keys(self) -> Optional[List[str]]:
+            """
+            :return: the key-paths of the metric matching the fields of this query, or None for all
+            """
+            if self._matches is None:
+                return None
+            statement = select(SQLSeriesBlockValues.name).distinct().\
+                join(SQLSeriesBlock, SQLSeriesBlock.id == SQLSeriesBlockValues.block_id).\
+                where(SQLSeriesBlock.name == self._metric_name)
+            return [key for key in self._store._session.execute(statement).scalars() if self._matches(key)]
+
+    def start_query(self, metric_name: str, max_results: Optional[int] = None) -> _CompositeQuery:
+        return SQLBlockMetricStore._CompositeQuery(store=self, metric_name=metric_name, max_count=max_results)
+
+    def start_dataclass_query(self, typ: Type[MetricDataClass], metric_name: str, max_results: Optional[int])\
+            -> _DataclassQuery:
+        return SQLBlockMetricStore._DataclassQuery(store=self, typ=typ, metric_name=metric_name,
+                                                   max_count=max_results)
+
+    def start_field_query(self, metric_name: str, fields: Optional[List[str]], max_results: Optional[int] = None)\
+            -> _FieldQuery:
+        return SQLBlockMetricStore._FieldQuery(store=self, metric_name=metric_name, fields=fields,
+                                               max_count=max_results)
+
+    def start_multi_query(self, metric_names: Iterable[str], max_results: Optional[int] = None) -> MultiQuery:
+        # one query per name, as the blocks of each name are selected and decoded on their own
+        return MultiQuery(self, metric_names, max_results)
+
+    def latest(self, metric_name: str, metadata_filter: Optional[Dict[str, Union[str, int]]] = None) \
+            -> QueryResult[List[CompositeMetric]]:
+        """
+        Return the latest composite metric (see `MetricStore.latest`), decoded from the newest block holding it
+        """
+        if not self._session:
+            raise RuntimeError("Not in context of data store.  please use 'with' statement")
+        with self._measure("latest"):
+            return MetricStore.latest(self, metric_name, metadata_filter=metadata_filter)
+
+    def _pending_block(self, metric_name: str) -> _Block:
+        block = self._pending_blocks.get(metric_name)
+        if block is None:
+            block = self._pending_blocks[metric_name] = _Block()
+        return block
+
+    def post(self,
+             metric: Union[Metric, CompositeMetric],
+             timestamp: Optional[datetime.datetime] = None,
+             metadata: Optional[Metadata] = None,
+             project_name: Optional[str] = None,
+             uuid: Optional[str] = None):
+        timestamp = timestamp or datetime.datetime.utcnow()
+        if not self._session:
+            raise RuntimeError("Not in context of data store.  please use 'with' statement")
+        with self._measure("post") as measurement:
+            set_uuid = self._post_metadata(metadata).uuid if metadata else None
+            values = {key: [float(value)] for key, value in metric.flatten().items()}
+            self._pending_block(metric.name).extend([_to_micros(timestamp)], [set_uuid], values)
+            measurement.rows = len(values)
+            if self._baselines is not None:
+                self._update_baseline(metric, metadata)
+
+    def post_batch(self, metric_name: str, batch: FieldBatch, project_name: Optional[str] = None) -> None:
+        """
+        Post a batch of metrics, appended column by column to those to be packed into blocks on the next commit.
+        With rolling baselines maintained, metrics are posted one by one
+        """
+        if not self._session:
+            raise RuntimeError("Not in context of data store.  please use 'with' statement")
+        if self._baselines is not None:
+            MetricStore.post_batch(self, metric_name, batch, project_name=project_name)
+            return
+        with self._measure("post_batch") as measurement:
+            for key in batch.values:
+                if key != metric_name and not key.startswith(f"/{metric_name}#") \
+                        and not key.startswith(f"/{metric_name}/"):
+                    raise ValueError(f"Key-path {key} of batch is not of metric {metric_name}")
+            # metrics without any value are skipped, as they could not be restored on query:
+            present = [index for index in range(len(batch))
+                       if any(not math.isnan(column[index]) for column in batch.values.values())]
+            uuids: Dict[Tuple, str] = {}
+            set_uuids: List[Optional[str]] = []
+            for index in present:
+                metadata = batch.metadata[index]
+                if metadata:
+                    identity = tuple(sorted(metadata.values.items()))
+                    if identity not in uuids:
+                        uuids[identity] = self._post_metadata(metadata).uuid
+                    set_uuids.append(uuids[identity])
+                else:
+                    set_uuids.append(None)
+            if present:
+                self._pending_block(metric_name).extend(
+                    [_to_micros(batch.timestamps[index]) for index in present], set_uuids,
+                    {key: [column[index] for index in present] for key, column in batch.values.items()})
+            measurement.rows = len(present)
+
+    def _write_block(self, metric_name: str, block: _Block) -> None:
+        """
+        Insert a block of composite metrics, ordered by timestamp
+        """
+        set_uuids = list(dict.fromkeys(uuid for uuid in block.set_uuids if uuid is not None))
+        positions = {uuid: position for position, uuid in enumerate(set_uuids, 1)}
+        block_id = self._session.execute(SQLSeriesBlock.__table__.insert().values(
+            name=metric_name, oldest=_from_micros(block.timestamps[0]), newest=_from_micros(block.timestamps[-1]),
+            count=len(block), timestamps=_encode_timestamps(block.timestamps), set_uuids=json.dumps(set_uuids),
+            set_positions=_encode_positions([positions.get(uuid, 0) for uuid in block.set_uuids]))).\
+            inserted_primary_key[0]
+        if set_uuids:
+            self._session.execute(SQLSeriesBlockSet.__table__.insert(),
+                                  [{'block_id': block_id, 'position': position, 'set_uuid': uuid}
+                                   for uuid, position in positions.items()])
+        # composite metrics without any value (such as empty ones) have no values to insert
+        if block.columns:
+            self._session.execute(SQLSeriesBlockValues.__table__.insert(),
+                                  [{'block_id': block_id, 'name': key, 'data': _encode_values(column)}
+                                   for key, column in block.columns.items()])
+
+    def _delete_blocks(self, block_ids: List[int]) -> None:
+        for start in range(0, len(block_ids), self.MAX_PARAMETERS):
+            chunk = block_ids[start: start + self.MAX_PARAMETERS]
+            self._session.execute(delete(SQLSeriesBlockValues).where(SQLSeriesBlockValues.block_id.in_(chunk)))
+            self._session.execute(delete(SQLSeriesBlockSet).where(SQLSeriesBlockSet.block_id.in_(chunk)))
+            self._session.execute(delete(SQLSeriesBlock).where(SQLSeriesBlock.id.in_(chunk)))
+
+    def _load_block(self, block: SQLSeriesBlock) -> _Block:
+        """
+        :return: all composite metrics of the given block, decoded
+        """
+        loaded = _Block()
+        uuids = [None] + json.loads(block.set_uuids)
+        loaded.timestamps = _decode_timestamps(block.timestamps, block.count)
+        loaded.set_uuids = [uuids[position] for position in _decode_positions(block.set_positions, block.count)]
+        loaded.columns = {key: _decode_values(data, block.count) for key, data in self._session.execute(
+            select(SQLSeriesBlockValues.name, SQLSeriesBlockValues.data).
+            where(SQLSeriesBlockValues.block_id == block.id))}
+        return loaded
+
+    def _save_rows(self) -> None:
+        """
+        Pack the composite metrics posted since last commit into blocks, appended to the latest block of their name
+        if not yet full and no newer than any of them
+        """
+        for metric_name, pending in self._pending_blocks.items():
+            last = self._session.execute(
+                select(SQLSeriesBlock.__table__).where(SQLSeriesBlock.name == metric_name).
+                order_by(desc(SQLSeriesBlock.newest), desc(SQLSeriesBlock.id)).limit(1)).first()
+            rows = pending
+            if last is not None and last.count < self._block_size and \
+                    _to_micros(last.newest) <= min(pending.timestamps):
+                rows = self._load_block(last)
+                rows.extend(pending.timestamps, pending.set_uuids, pending.columns)
+                self._delete_blocks([last.id])
+            order = sorted(range(len(rows)), key=rows.timestamps.__getitem__)
+            for start in range(0, len(order), self._block_size):
+                self._write_block(metric_name, rows.select(order[start: start + self._block_size]))
+        self._pending_blocks.clear()
+
+    def _discard_pending(self) -> None:
+        super()._discard_pending()
+        self._pending_blocks.clear()
+
+    def field_batches(self, metric_name: str, fields: Optional[Iterable[str]] = None,
+                      oldest: Optional[datetime.datetime] = None, newest: Optional[datetime.datetime] = None,
+                      batch_size: int = 10000) -> Iterator[FieldBatch]:
+        """
+        Stream the history of a metric in columnar batches (see `MetricStore.field_batches`), decoding its blocks
+        one after the other
+        """
+        if not self._session:
+            raise RuntimeError("Not in context of data store.  please use 'with' statement")
+        if batch_size <= 0:
+            raise ValueError("Batch size must be positive")
+        query = SQLBlockMetricStore._FieldQuery(store=self, metric_name=metric_name, fields=fields)
+        if oldest is not None or newest is not None:
+            query.filter_on_date(oldest or datetime.datetime.min, newest or datetime.datetime.max)
+        selected, blocks = query._selection()
+        keys = query._matching_keys()
+        keys = sorted(set(keys) & set(query._keys(blocks))) if keys is not None else query._keys(blocks)
+        if not keys:
+            return
+        metadata_sets = query._metadata_sets(uuid for _, row_uuids in blocks.values() for uuid in row_uuids)
+        metadata_names = sorted({name for metadata in metadata_sets.values() if metadata for name in metadata.values})
+        batch = FieldBatch(values={key: [] for key in keys}, metadata_names=metadata_names)
+        # blocks are decoded as reached, and released once all their metrics selected are batched
+        remaining = collections.Counter(block_id for _, block_id, _ in selected)
+        columns: Dict[int, Dict[str, List[float]]] = {}
+        for timestamp, block_id, index in selected:
+            if block_id not in columns:
+                columns.update(query._columns({block_id: blocks[block_id]}, keys))
+            values = [(key, column[index]) for key, column in columns[block_id].items()]
+            remaining[block_id] -= 1
+            if not remaining[block_id]:
+                del columns[block_id]
+            # as in a field query, metrics without any value for the selected keys are omitted
+            if all(math.isnan(value) for _, value in values):
+                continue
+            row = dict(values)
+            for key, column in batch.values.items():
+                column.append(row.get(key, math.nan))
+            batch.timestamps.append(_from_micros(timestamp))
+            batch.metadata.append(metadata_sets[blocks[block_id][1][index]])
+            if len(batch) == batch_size:
+                yield batch
+                batch = FieldBatch(values={key: [] for key in keys}, metadata_names=metadata_names)
+        if len(batch):
+            yield batch
+
+    def _purge_orphaned_metadatsets(self) -> None:
+        """
+        purge any metadata sets not referenced by a block
+        """
+        orphaned = self._session.query(SQLMetadataSet).filter(~ exists().where(
+            SQLMetadataSet.uuid == SQLSeriesBlockSet.set_uuid
+        )).all()
+        for orphan in orphaned:
+            self._session.delete(orphan)
+        self._purge_orphaned_metadata()
+
+    def _purge_before(self, before: datetime.datetime, name: Optional[str], inclusive: bool = False) -> int:
+        """
+        Purge composite metrics older than the given date: blocks wholly older are deleted, and those holding the
+        date are rewritten with the composite metrics kept
+
+        :param before: date before which to purge metrics
+        :param name: if specified, only purge the metrics of this name
+        :param inclusive: whether to also purge metrics of the given date
+        :return: number of composite metrics purged
+        """
+        statement = select(SQLSeriesBlock.__table__).where(
+            SQLSeriesBlock.oldest <= before if inclusive else SQLSeriesBlock.oldest < before)
+        if name is not None:
+            statement = statement.where(SQLSeriesBlock.name == name)
+        cutoff = _to_micros(before)
+        purged = 0
+        for block in self._session.execute(statement).all():
+            if block.newest < before or (inclusive and block.newest == before):
+                purged += block.count
+            else:
+                rows = self._load_block(block)
+                kept = [index for index, timestamp in enumerate(rows.timestamps)
+                        if timestamp > cutoff or (not inclusive and timestamp == cutoff)]
+                purged += block.count - len(kept)
+                self._write_block(block.name, rows.select(kept))
+            self._delete_blocks([block.id])
+        return purged
+
+    def purge_by_date(self, before: datetime.datetime, name: Optional[str] = None) -> None:
+        if not self._session:
+            raise RuntimeError("Not in context of data store.  please use 'with' statement")
+        # metrics posted since last commit are committed along with the purge:
+        self._save_rows()
+        with self._measure("purge_by_date") as measurement:
+            measurement.rows = self._purge_before(before, name)
+            self._purge_orphaned_metadatsets()
+            self._session.commit()
+
+    def purge_by_volume(self, count_: int, name: str) -> None:
+        if not self._session:
+            raise RuntimeError("Not in context of data store.  please use 'with' statement")
+        self._save_rows()
+        with self._measure("purge_by_volume") as measurement:
+            if count_ <= 0:
+                return
+            # the date of the oldest metrics to keep is found from the oldest blocks, read until newer than the
+            # newest of the oldest metrics found
+            timestamps: List[int] = []
+            for oldest, count, data in self._session.execute(
+                    select(SQLSeriesBlock.oldest, SQLSeriesBlock.count, SQLSeriesBlock.timestamps).
+                    where(SQLSeriesBlock.name == name).order_by(SQLSeriesBlock.oldest, SQLSeriesBlock.id)):
+                if len(timestamps) >= count_:
+                    timestamps = sorted(timestamps)[:count_]
+                    if _to_micros(oldest) > timestamps[-1]:
+                        break
+                timestamps += _decode_timestamps(data, count)
+            if not timestamps:
+                return
+            measurement.rows = self._purge_before(_from_micros(sorted(timestamps)[:count_][-1]), name,
+                                                  inclusive=True)
+            self._purge_orphaned_metadatsets()
+            self._session.commit()
+
+    def summary(self) -> Dict[str, MetricSummary]:
+        if not self._session:
+            raise RuntimeError("Not in context of data store.  please use 'with' statement")
+        self._save_rows()
+        return {name: MetricSummary(int(count), oldest, newest) for name, count, oldest, newest in self._session.execute(
+            select(SQLSeriesBlock.name, func.sum(SQLSeriesBlock.count), func.min(SQLSeriesBlock.oldest),
+                   func.max(SQLSeriesBlock.newest)).group_by(SQLSeriesBlock.name).order_by(SQLSeriesBlock.name))}
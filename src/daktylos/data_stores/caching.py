@@ -0,0 +1,365 @@
+"""
+Read-through caching wrapper around another :class:`daktylos.data.MetricStore`, for dashboards and other clients
+that issue the same queries over and over.  Query results are cached in a size-bounded LRU cache, and invalidated
+per metric name as metrics of that name are posted or purged through the wrapper.
+
+Changes made to the underlying store other than through the wrapper (e.g. by other processes) are not seen until
+the cached results are evicted or the cache is cleared.
+"""
+import datetime
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import (
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+    Union,
+)
+
+from daktylos.data import (
+    CompositeMetric,
+    FieldBatch,
+    MDC,
+    Metadata,
+    Metric,
+    MetricDataClass,
+    MetricStore,
+    Query,
+    QueryResult,
+    RollingWindow,
+)
+from daktylos.instrumentation import OperationSink
+
+__all__ = ['CachingMetricStore', 'CacheStatistics']
+
+
+@dataclass
+class CacheStatistics:
+    """
+    Data class holding counts of cache activity
+    """
+    hits: int = 0
+    misses: int = 0
+    #: number of results evicted to keep within size bounds
+    evictions: int = 0
+    #: number of results dropped as metrics of their name were posted or purged
+    invalidations: int = 0
+
+    @property
+    def hit_ratio(self) -> Optional[float]:
+        """
+        :return: fraction of lookups that were hits, or None if no lookups made
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else None
+
+
+def _copy(result: QueryResult) -> QueryResult:
+    """
+    :return: copy of the containers of a result, so that clients can modify them without affecting the cache
+       (metric values themselves are shared, and must be treated as read-only)
+    """
+    if isinstance(result.metric_data, dict):
+        metric_data = {name: list(values) for name, values in result.metric_data.items()}
+    else:
+        metric_data = list(result.metric_data)
+    # each metadata set is copied once, and shared by the metrics of the set as in the result
+    copies: Dict[int, Optional[Metadata]] = {id(None): None}
+    for metadata in result.metadata:
+        if id(metadata) not in copies:
+            copies[id(metadata)] = Metadata(dict(metadata.values))
+    return QueryResult(metadata=[copies[id(metadata)] for metadata in result.metadata],
+                       timestamps=list(result.timestamps),
+                       metric_data=metric_data,
+                       stats=result.stats)
+
+
+# noinspection PyProtectedMember
+class CachingMetricStore(MetricStore):
+    """
+    Data store wrapping another, caching results of its queries
+
+    :param store: the store to wrap
+    :param max_entries: maximum number of query results to cache
+    :param max_rows: if specified, maximum total number of rows (composite metrics) across all cached results
+    """
+
+    def __init__(self, store: MetricStore, max_entries: int = 256, max_rows: Optional[int] = None):
+        if max_entries <= 0:
+            raise ValueError("Maximum number of cache entries must be positive")
+        self._store = store
+        self._max_entries = max_entries
+        self._max_rows = max_rows
+        self._lock = threading.RLock()
+        self._cache: "OrderedDict[Tuple, QueryResult]" = OrderedDict()
+        self._rows = 0
+        self._keys_by_name: Dict[str, Set[Tuple]] = {}
+        # names of metrics posted since last commit, whose results must be invalidated again once committed:
+        self._pending: Set[str] = set()
+        self._stats = CacheStatistics()
+
+    @property
+    def store(self) -> MetricStore:
+        return self._store
+
+    @property
+    def stats(self) -> CacheStatistics:
+        return self._stats
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def clear(self) -> None:
+        """
+        Drop all cached results
+        """
+        with self._lock:
+            self._cache.clear()
+            self._keys_by_name.clear()
+            self._rows = 0
+
+    def invalidate(self, metric_name: Optional[str] = None) -> None:
+        """
+        Drop cached results of queries on the given metric name
+
+        :param metric_name: name of metric, or None for all
+        """
+        with self._lock:
+            names = list(self._keys_by_name) if metric_name is None else [metric_name]
+            for name in names:
+                for key in self._keys_by_name.pop(name, ()):
+                    result = self._cache.pop(key, None)
+                    if result is not None:
+                        self._rows -= len(result.timestamps)
+                        self._stats.invalidations += 1
+
+    def _lookup(self, key: Tuple) -> Optional[QueryResult]:
+        with self._lock:
+            result = self._cache.get(key)
+            if result is None:
+                self._stats.misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self._stats.hits += 1
+            return _copy(result)
+
+    def _insert(self, key: Tuple, result: QueryResult) -> None:
+        metric_name = key[1]
+        rows = len(result.timestamps)
+        if self._max_rows is not None and rows > self._max_rows:
+            return
+        with self._lock:
+            if key in self._cache:
+                return
+            self._cache[key] = result
+            self._rows += rows
+            self._keys_by_name.setdefault(metric_name, set()).add(key)
+            while len(self._cache) > self._max_entries or (self._max_rows is not None and self._rows > self._max_rows):
+                evicted_key, evicted = self._cache.popitem(last=False)
+                self._rows -= len(evicted.timestamps)
+                self._keys_by_name[evicted_key[1]].discard(evicted_key)
+                if not self._keys_by_name[evicted_key[1]]:
+                    del self._keys_by_name[evicted_key[1]]
+                self._stats.evictions += 1
+
+    class _Query(Query[MDC]):
+        """
+        Query recording its filters to form a cache key, executed against the wrapped store only on a cache miss
+
+        :param store: the caching store
+        :param kind: kind of query as part of the cache key, (e.g. "composite", or the dataclass type)
+        :param factory: creates the query on the wrapped store
+        :param metric_name: name of metric to query
+        :param max_count: max number of entries to query
+        :param fields: fields of a field query
+        """
+
+        def __init__(self, store: "CachingMetricStore", kind: Hashable, factory: Callable[[], Query[MDC]],
+                     metric_name: str, max_count: Optional[int] = None, fields: Optional[List[str]] = None):
+            super().__init__(metric_name=metric_name, max_count=max_count)
+            self._store = store
+            self._kind = kind
+            self._factory = factory
+            self._fields = tuple(fields) if fields else None
+            self._oldest: Optional[datetime.datetime] = None
+            self._newest: Optional[datetime.datetime] = None
+            self._dated = False
+            self._filters: List[Tuple[str, Union[str, int], Optional[MetricStore.Comparison]]] = []
+
+        def filter_on_date(self, oldest: datetime.datetime, newest: Optional[datetime.datetime]) -> Query[MDC]:
+            """
+            As per `Query.filter_on_date`, except that newest may be None for an open-ended range, taken as the time
+            of execution on a cache miss.  Cached results stay valid until a metric of the name is posted or purged
+            """
+            self._oldest = oldest
+            self._newest = newest
+            self._dated = True
+            return self
+
+        def filter_on_metadata(self, **kwds) -> Query[MDC]:
+            self._filters.extend((name, value, None) for name, value in kwds.items())
+            return self
+
+        def filter_on_metadata_field(self, name: str, value: Union[str, int], op: MetricStore.Comparison) \
+                -> Query[MDC]:
+            self._filters.append((name, value, op))
+            return self
+
+        def _key(self) -> Tuple:
+            filters = tuple(sorted(self._filters, key=repr))
+            return (self._kind, self._metric_name, self._fields, filters, self._oldest, self._newest, self._count)
+
+        def _build(self) -> Query[MDC]:
+            """
+            :return: the equivalent query on the wrapped store
+            """
+            query = self._factory()
+            if self._dated:
+                query.filter_on_date(oldest=self._oldest, newest=self._newest or datetime.datetime.utcnow())
+            for name, value, op in self._filters:
+                if op is None:
+                    query.filter_on_metadata(**{name: value})
+                else:
+                    query.filter_on_metadata_field(name, value, op)
+            return query.collect_statistics(self._collect_statistics)
+
+        def execute(self) -> QueryResult[MDC]:
+            if self._collect_statistics:
+                # statistics describe execution against the wrapped store, so are never served from cache
+                return self._build().execute()
+            key = self._key()
+            result = self._store._lookup(key)
+            if result is None:
+                result = self._build().execute()
+                self._store._insert(key, result)
+                result = _copy(result)
+            return result
+
+        def explain(self) -> str:
+            return self._build().explain()
+
+    def start_query(self, metric_name: str, max_results: Optional[int] = None) -> Query[CompositeMetric]:
+        return CachingMetricStore._Query(self, "composite", lambda: self._store.start_query(metric_name, max_results),
+                                         metric_name=metric_name, max_count=max_results)
+
+    def start_dataclass_query(self, typ: Type[MetricDataClass], metric_name: str, max_results: Optional[int])\
+            -> Query[MetricDataClass]:
+        return CachingMetricStore._Query(self, typ,
+                                         lambda: self._store.start_dataclass_query(typ, metric_name, max_results),
+                                         metric_name=metric_name, max_count=max_results)
+
+    def start_field_query(self, metric_name: str, fields: Optional[List[str]], max_results: Optional[int] = None)\
+            -> Query[Dict[str, List[float]]]:
+        return CachingMetricStore._Query(self, "fields",
+                                         lambda: self._store.start_field_query(metric_name, fields, max_results),
+                                         metric_name=metric_name, max_count=max_results, fields=fields)
+
+    def composite_metrics_by_date(self, metric_name: str, oldest: datetime.datetime,
+                                  newest: Optional[datetime.datetime] = None,
+                                  metadata_filter: Optional[Dict[str, str]] = None) \
+            -> "QueryResult[List[Union[CompositeMetric, Metric]]]":
+        # an open-ended range is kept open (rather than ending now) so that repeated queries share a cache entry
+        query = self.start_query(metric_name)
+        query.filter_on_date(oldest=oldest, newest=newest)
+        if metadata_filter:
+            query.filter_on_metadata(**metadata_filter)
+        return query.execute()
+
+    def metric_fields_by_date(self, metric_name: str,
+                              oldest: datetime.datetime, newest: Optional[datetime.datetime] = None,
+                              fields: Optional[List[str]] = None,
+                              metadata_filter: Optional[Dict[str, str]] = None)\
+            -> QueryResult[Dict[str, List[float]]]:
+        # an open-ended range is kept open (rather than ending now) so that repeated queries share a cache entry
+        query = self.start_field_query(metric_name=metric_name, fields=fields)
+        query.filter_on_date(oldest=oldest, newest=newest)
+        if metadata_filter:
+            query.filter_on_metadata(**metadata_filter)
+        return query.execute()
+
+    def dataclass_metrics_by_date(self, name: str, typ: Type[MetricDataClass], oldest: datetime.datetime,
+                                  newest: Optional[datetime.datetime] = None,
+                                  metadata_filter: Optional[Dict[str, str]] = None) \
+            -> "QueryResult[List[MetricDataClass]]":
+        query = self.start_dataclass_query(typ, name, None)
+        query.filter_on_date(oldest=oldest, newest=newest)
+        if metadata_filter:
+            query.filter_on_metadata(**metadata_filter)
+        return query.execute()
+
+    def dataclass_metrics_by_volume(self, name: str, typ: Type[MetricDataClass], count: int,
+                                    metadata_filter: Optional[Dict[str, str]] = None) \
+            -> "QueryResult[List[MetricDataClass]]":
+        query = self.start_dataclass_query(typ, name, count)
+        if metadata_filter:
+            query.filter_on_metadata(**metadata_filter)
+        return query.execute()
+
+    def __enter__(self) -> "CachingMetricStore":
+        self._store.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            return self._store.__exit__(exc_type, exc_val, exc_tb)
+        finally:
+            self._invalidate_pending()
+
+    def _invalidate_pending(self) -> None:
+        with self._lock:
+            for name in self._pending:
+                self.invalidate(name)
+            self._pending.clear()
+
+    def instrument(self, sink: Optional[OperationSink]) -> None:
+        super().instrument(sink)
+        self._store.instrument(sink)
+
+    def post(self, metric: Union[Metric, CompositeMetric], timestamp: Optional[datetime.datetime] = None,
+             metadata: Optional[Metadata] = None,
+             project_name: Optional[str] = None,
+             uuid: Optional[str] = None):
+        self._store.post(metric, timestamp=timestamp, metadata=metadata, project_name=project_name, uuid=uuid)
+        with self._lock:
+            self.invalidate(metric.name)
+            self._pending.add(metric.name)
+
+    def post_batch(self, metric_name: str, batch: FieldBatch, project_name: Optional[str] = None) -> None:
+        self._store.post_batch(metric_name, batch, project_name=project_name)
+        with self._lock:
+            self.invalidate(metric_name)
+            self._pending.add(metric_name)
+
+    def field_batches(self, metric_name: str, fields: Optional[Iterable[str]] = None,
+                      oldest: Optional[datetime.datetime] = None, newest: Optional[datetime.datetime] = None,
+                      batch_size: int = 10000) -> Iterator[FieldBatch]:
+        # bulk exports are streamed from the wrapped store rather than cached
+        return self._store.field_batches(metric_name, fields=fields, oldest=oldest, newest=newest,
+                                         batch_size=batch_size)
+
+    def purge_by_date(self, before: datetime.datetime, name: Optional[str] = None) -> None:
+        self._store.purge_by_date(before=before, name=name)
+        self.invalidate(name)
+
+    def purge_by_volume(self, count_: int, name: str) -> None:
+        self._store.purge_by_volume(count_, name=name)
+        self.invalidate(name)
+
+    def rolling_baseline(self, metric_name: str, metadata: Optional[Metadata] = None) -> Dict[str, RollingWindow]:
+        return self._store.rolling_baseline(metric_name, metadata)
+
+    def commit(self) -> None:
+        self._store.commit()
+        self._invalidate_pending()
+
+    def rollback(self) -> None:
+        self._store.rollback()
+        self._invalidate_pending()
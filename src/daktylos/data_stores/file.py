@@ -0,0 +1,883 @@
+"""
+Embedded, append-only columnar file implementation of a :class:`daktylos.data.MetricStore`, for local and CI use
+with no SQL engine.  Each commit appends one immutable segment file per metric name posted, holding its values in
+columnar blocks of float64 that readers memory-map, so that field series are read without copying.
+
+Layout of a store's directory::
+
+    metadata.jsonl          distinct metadata sets, one JSON-encoded [id, values] per line
+    <metric name>/keys      key-path dictionary: one JSON-encoded key-path per line, the line number being its column id
+    <metric name>/<n>.seg   segments, numbered in order of writing
+    <metric name>/<n>c.seg  segment compacted from all segments numbered below it, which are ignored (and removed) once
+                            it is in place, so that a compaction interrupted before removing them loses nothing
+
+Layout of a segment (native, little-endian byte order)::
+
+    header          magic, row count, column count, reserved (uint32 each), oldest and newest timestamp (int64 each)
+    column ids      uint32 per column, padded to a multiple of 8 bytes
+    timestamps      int64 per row: microseconds since the epoch (UTC), ascending
+    metadata ids    int64 per row: id of the row's metadata set, or -1 if none
+    values          float64 per column per row, column by column; NaN where a row has no value for the column
+
+A store directory supports a single writer at a time.  Other processes may read it concurrently, as segments are
+written in full under a temporary name before being moved into place.
+"""
+import array
+import bisect
+import datetime
+import itertools
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+import time
+import urllib.parse
+from abc import ABC, abstractmethod
+from typing import (
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Type,
+    Union,
+)
+
+from daktylos.data import (
+    CompositeMetric,
+    FieldBatch,
+    MDC,
+    Metadata,
+    Metric,
+    MetricDataClass,
+    MetricDataClassT,
+    MetricStore,
+    Query,
+    QueryResult,
+    QueryStatistics,
+    field_matcher,
+)
+from daktylos.data_stores.memory import MetadataIndex
+
+__all__ = ['FileMetricStore']
+
+_MAGIC = 0x31534b44  # "DKS1"
+_HEADER = struct.Struct("<IIIIqq")
+_EPOCH = datetime.datetime(1970, 1, 1)
+_MICROSECOND = datetime.timedelta(microseconds=1)
+_NO_METADATA = -1
+
+
+def _segment_number(name: str) -> Tuple[int, bool]:
+    """
+    :param name: file name of a segment
+    :return: number of the segment, and whether it is compacted from all segments numbered below it
+    """
+    stem = name[:-len(".seg")]
+    return int(stem.rstrip("c")), stem.endswith("c")
+
+
+def _to_micros(timestamp: datetime.datetime) -> int:
+    """
+    :return: microseconds since the epoch of a timestamp, taken as UTC if naive
+    """
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return (timestamp - _EPOCH) // _MICROSECOND
+
+
+def _from_micros(micros: int) -> datetime.datetime:
+    return _EPOCH + datetime.timedelta(microseconds=micros)
+
+
+def _padded(size: int) -> int:
+    return (size + 7) & ~7
+
+
+def _nans(count: int) -> array.array:
+    return array.array('d', [math.nan]) * count
+
+
+def _extend(target: array.array, values: Sequence) -> None:
+    """
+    extend an array with the given values, copied as a block where they are held in a buffer of the same type
+    """
+    if isinstance(values, memoryview):
+        target.frombytes(values.cast('B'))
+    elif isinstance(values, array.array) and values.typecode == target.typecode:
+        target.frombytes(values)
+    else:
+        target.extend(values)
+
+
+def _present(columns: List[Sequence[float]], rows: int) -> Optional[List[bool]]:
+    """
+    :return: for each row, whether it has a value in any of the given columns, or None if all rows do
+    """
+    if not columns or any(not any(map(math.isnan, column)) for column in columns):
+        return None
+    return [not all(math.isnan(column[index]) for column in columns) for index in range(rows)]
+
+
+class _ColumnBuffer:
+    """
+    Rows accumulated column by column, to be written as a segment.  Columns are keyed by key-path while pending,
+    and by column id when written.  Columns may be shorter than the timestamps, short of trailing missing values
+    """
+
+    def __init__(self):
+        self.timestamps = array.array('q')
+        self.metadata_ids = array.array('q')
+        self.columns: Dict[Union[str, int], array.array] = {}
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def _column(self, key: Union[str, int]) -> array.array:
+        """
+        :return: column of the given key, padded with missing values up to the current row
+        """
+        column = self.columns.get(key)
+        if column is None:
+            column = self.columns[key] = array.array('d')
+        if len(column) < len(self.timestamps):
+            column.extend(_nans(len(self.timestamps) - len(column)))
+        return column
+
+    def append(self, timestamp: int, metadata_id: int, values: Dict[Union[str, int], float]) -> None:
+        """
+        add one row of values by key
+        """
+        for key, value in values.items():
+            self._column(key).append(value)
+        self.timestamps.append(timestamp)
+        self.metadata_ids.append(metadata_id)
+
+    def extend(self, timestamps: Sequence[int], metadata_ids: Sequence[int],
+               columns: Dict[Union[str, int], Sequence[float]]) -> None:
+        """
+        add rows given as columns of the same length as the timestamps
+        """
+        for key, values in columns.items():
+            _extend(self._column(key), values)
+        _extend(self.timestamps, timestamps)
+        _extend(self.metadata_ids, metadata_ids)
+
+    def write(self, path: str) -> None:
+        """
+        Write the rows to a segment in order of timestamp, atomically replacing any file at the path
+
+        :param path: path of segment
+        """
+        rows = len(self.timestamps)
+        timestamps, metadata_ids = self.timestamps, self.metadata_ids
+        columns = {column_id: self._column(column_id) for column_id in sorted(self.columns)}
+        if any(timestamps[index] < timestamps[index - 1] for index in range(1, rows)):
+            order = sorted(range(rows), key=timestamps.__getitem__)
+            timestamps = array.array('q', [timestamps[index] for index in order])
+            metadata_ids = array.array('q', [metadata_ids[index] for index in order])
+            columns = {column_id: array.array('d', [column[index] for index in order])
+                       for column_id, column in columns.items()}
+        with open(path + ".tmp", 'wb') as stream:
+            stream.write(_HEADER.pack(_MAGIC, rows, len(columns), 0, timestamps[0], timestamps[-1]))
+            stream.write(array.array('I', columns).tobytes())
+            stream.write(b'\0' * (_padded(4 * len(columns)) - 4 * len(columns)))
+            stream.write(timestamps.tobytes())
+            stream.write(metadata_ids.tobytes())
+            for column in columns.values():
+                stream.write(column.tobytes())
+        os.replace(path + ".tmp", path)
+
+
+class _Segment:
+    """
+    Read-only, memory-mapped view of a segment file
+
+    :param path: path of segment
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as stream:
+            self._mmap = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        magic, self.rows, column_count, _, self.oldest, self.newest = _HEADER.unpack_from(view)
+        if magic != _MAGIC:
+            raise ValueError(f"{path} is not a segment file")
+        offset = _HEADER.size
+        column_ids = view[offset: offset + 4 * column_count].cast('I').tolist()
+        offset += _padded(4 * column_count)
+        self.timestamps: Sequence[int] = view[offset: offset + 8 * self.rows].cast('q')
+        offset += 8 * self.rows
+        self.metadata_ids: Sequence[int] = view[offset: offset + 8 * self.rows].cast('q')
+        offset += 8 * self.rows
+        values = view[offset: offset + 8 * self.rows * column_count].cast('d')
+        self.columns: Dict[int, memoryview] = {
+            column_id: values[index * self.rows: (index + 1) * self.rows] for index, column_id in enumerate(column_ids)
+        }
+
+    def buffer(self, start: int = 0) -> _ColumnBuffer:
+        """
+        :param start: index of first row to include
+        :return: copy of the rows of the segment from the given index
+        """
+        buffer = _ColumnBuffer()
+        buffer.extend(self.timestamps[start:], self.metadata_ids[start:],
+                      {column_id: column[start:] for column_id, column in self.columns.items()})
+        return buffer
+
+    def close(self) -> None:
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass  # views of the segment are still held by clients, and the mapping is released with them
+
+
+class _Series:
+    """
+    The segments and key-path dictionary of one metric name
+
+    :param path: directory of the metric
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.keys: List[str] = []
+        self.column_ids: Dict[str, int] = {}
+        self.segments: Dict[Tuple[str, int], _Segment] = {}
+        self._keys_size = 0
+
+    @property
+    def ordered_segments(self) -> List[_Segment]:
+        return sorted(self.segments.values(), key=lambda segment: (segment.oldest, segment.path))
+
+    def next_segment_path(self, compacted: bool = False) -> str:
+        """
+        :param compacted: whether the segment is to be compacted from all current segments
+        :return: path of the next segment to write
+        """
+        numbers = [_segment_number(name)[0] for name, _ in self.segments]
+        return os.path.join(self.path, f"{max(numbers, default=0) + 1:010d}{'c' if compacted else ''}.seg")
+
+    def refresh(self) -> None:
+        """
+        Pick up changes to the directory of the metric (e.g. from another process)
+        """
+        keys_path = os.path.join(self.path, "keys")
+        size = os.path.getsize(keys_path) if os.path.exists(keys_path) else 0
+        if size != self._keys_size:
+            with open(keys_path, 'r', encoding='utf-8') as stream:
+                stream.seek(self._keys_size)
+                for line in stream.read().splitlines():
+                    key = json.loads(line)
+                    self.column_ids[key] = len(self.keys)
+                    self.keys.append(key)
+            self._keys_size = size
+        found: Set[Tuple[str, int]] = set()
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                if entry.name.endswith(".seg"):
+                    found.add((entry.name, entry.inode()))
+        # segments replaced by a compacted one are only left behind if the compaction was interrupted
+        compacted = max((number for number, is_compacted in (_segment_number(name) for name, _ in found)
+                         if is_compacted), default=0)
+        for identity in [identity for identity in found if _segment_number(identity[0])[0] < compacted]:
+            found.discard(identity)
+            try:
+                os.remove(os.path.join(self.path, identity[0]))
+            except OSError:
+                pass  # (already removed, e.g. by the writer)
+        for identity in set(self.segments) - found:
+            self.segments.pop(identity).close()
+        for identity in found - set(self.segments):
+            self.segments[identity] = _Segment(os.path.join(self.path, identity[0]))
+
+    def column_id(self, key: str, new_keys: List[str]) -> int:
+        """
+        :param key: key-path
+        :param new_keys: list to add the key to if not yet in the dictionary
+        :return: column id of the key-path, added to the dictionary if needed
+        """
+        column_id = self.column_ids.get(key)
+        if column_id is None:
+            column_id = self.column_ids[key] = len(self.keys)
+            self.keys.append(key)
+            new_keys.append(key)
+        return column_id
+
+    def add_keys(self, keys: List[str]) -> None:
+        """
+        persist the given keys, newly added to the dictionary
+        """
+        if keys:
+            with open(os.path.join(self.path, "keys"), 'a', encoding='utf-8') as stream:
+                stream.write("".join(json.dumps(key) + "\n" for key in keys))
+            self._keys_size = os.path.getsize(os.path.join(self.path, "keys"))
+
+    def rewrite(self, segment: _Segment, rows: _ColumnBuffer) -> None:
+        """
+        replace the content of a segment with the given rows, removing the segment if none
+        """
+        identity = next(identity for identity, existing in self.segments.items() if existing is segment)
+        if rows:
+            rows.write(segment.path)
+        else:
+            os.remove(segment.path)
+        self.segments.pop(identity).close()
+        if rows:
+            self.segments[(identity[0], os.stat(segment.path).st_ino)] = _Segment(segment.path)
+
+    def close(self) -> None:
+        for segment in self.segments.values():
+            segment.close()
+        self.segments.clear()
+
+
+# noinspection PyProtectedMember
+class FileMetricStore(MetricStore):
+    """
+    Concrete data store class for metrics storage and retrieval in append-only columnar files within a directory.
+    Posted metrics are buffered in memory and written as one segment per metric name on commit, so commit in
+    batches for best results; once a metric name has more than the given number of segments, they are compacted
+    into one.
+
+    :param path: directory of the store, created if it does not exist
+    :param max_segments: number of segments of a metric name above which they are compacted on commit
+    """
+
+    def __init__(self, path: str, max_segments: int = 32):
+        if sys.byteorder != 'little' or array.array('I').itemsize != 4:
+            raise RuntimeError("FileMetricStore requires a little-endian platform with 32-bit unsigned ints")
+        self._path = path
+        self._max_segments = max_segments
+        self._in_context = False
+        self._series: Dict[str, _Series] = {}
+        self._metadata = MetadataIndex()
+        self._metadata_size = 0
+        self._pending_metadata: List[int] = []
+        self._pending: Dict[str, _ColumnBuffer] = {}
+
+    def __enter__(self) -> "FileMetricStore":
+        os.makedirs(self._path, exist_ok=True)
+        self._in_context = True
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            super().__exit__(exc_type, exc_val, exc_tb)
+        finally:
+            self._in_context = False
+
+    def close(self) -> None:
+        """
+        Release the memory maps of all segments (those still referenced by views returned from `field_series` are
+        released once the views are)
+        """
+        for series in self._series.values():
+            series.close()
+        self._series.clear()
+
+    def _check_context(self) -> None:
+        if not self._in_context:
+            raise RuntimeError("Not in context of data store.  please use 'with' statement")
+
+    def _refresh_metadata(self) -> None:
+        path = os.path.join(self._path, "metadata.jsonl")
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if size != self._metadata_size:
+            with open(path, 'r', encoding='utf-8') as stream:
+                stream.seek(self._metadata_size)
+                for line in stream.read().splitlines():
+                    metadata_id, values = json.loads(line)
+                    self._metadata.add(metadata_id, Metadata(values))
+            self._metadata_size = size
+
+    def _load_series(self, metric_name: str, create: bool = False) -> Optional[_Series]:
+        """
+        :param metric_name: name of metric
+        :param create: whether to create the directory of the metric if it does not exist
+        :return: the up-to-date series of the metric name, or None if no such metric
+        """
+        series = self._series.get(metric_name)
+        if series is None:
+            path = os.path.join(self._path, urllib.parse.quote(metric_name, safe=''))
+            if not os.path.isdir(path):
+                if not create:
+                    return None
+                os.makedirs(path)
+            series = self._series[metric_name] = _Series(path)
+        series.refresh()
+        return series
+
+    def _metric_names(self) -> List[str]:
+        with os.scandir(self._path) as entries:
+            return [urllib.parse.unquote(entry.name) for entry in entries if entry.is_dir()]
+
+    class _BaseQuery(Query[MDC], ABC):
+        """
+        Concrete implementation of a query against segment files
+        """
+
+        #: name of the operation reported to any instrumentation sink of the store
+        operation = "query"
+
+        def __init__(self, store: "FileMetricStore", metric_name: str, max_count: Optional[int] = None):
+            super().__init__(metric_name=metric_name, max_count=max_count)
+            self._store = store
+            self._oldest: Optional[int] = None
+            self._newest: Optional[int] = None
+            # ids of metadata sets allowed, or None if not filtered on metadata
+            self._metadata_ids: Optional[Set[int]] = None
+            # copies of the metadata sets of the metrics of a result, shared by the metrics of each set
+            self._copies: Dict[int, Metadata] = {}
+
+        def filter_on_date(self, oldest: datetime.datetime, newest: datetime.datetime) -> Query[MDC]:
+            oldest, newest = _to_micros(oldest), _to_micros(newest)
+            self._oldest = oldest if self._oldest is None else max(oldest, self._oldest)
+            self._newest = newest if self._newest is None else min(newest, self._newest)
+            return self
+
+        def filter_on_metadata(self, **kwds) -> Query[MDC]:
+            for name, value in kwds.items():
+                self.filter_on_metadata_field(name, value, MetricStore.Comparison.EQUAL)
+            return self
+
+        def filter_on_metadata_field(self, name: str, value: Union[str, int], op: MetricStore.Comparison) \
+                -> Query[MDC]:
+            self._store._refresh_metadata()
+            ids = self._store._metadata.select(name, value, op)
+            self._metadata_ids = ids if self._metadata_ids is None else self._metadata_ids & ids
+            return self
+
+        def _selection(self, series: _Series) -> List[Tuple[_Segment, Sequence[int]]]:
+            """
+            :return: (segment, indices of rows) of rows matching the filters of this query, from oldest to newest
+            """
+            parts: List[Tuple[_Segment, Sequence[int]]] = []
+            for segment in series.ordered_segments:
+                if (self._oldest is not None and segment.newest < self._oldest) or \
+                        (self._newest is not None and segment.oldest > self._newest):
+                    continue
+                start = bisect.bisect_left(segment.timestamps, self._oldest) if self._oldest is not None else 0
+                end = bisect.bisect_right(segment.timestamps, self._newest) if self._newest is not None \
+                    else segment.rows
+                rows: Sequence[int] = range(start, end)
+                if self._metadata_ids is not None:
+                    rows = [index for index in rows if segment.metadata_ids[index] in self._metadata_ids]
+                if rows:
+                    parts.append((segment, rows))
+            if any(parts[index][0].oldest < parts[index - 1][0].newest for index in range(1, len(parts))):
+                # segments overlap in time (as metrics were not posted in order), so merge row by row
+                merged = sorted((segment.timestamps[index], order, segment, index)
+                                for order, (segment, rows) in enumerate(parts) for index in rows)
+                parts = [(segment, [index]) for _, _, segment, index in merged]
+            if self._count:
+                remaining = self._count
+                for position in range(len(parts) - 1, -1, -1):
+                    segment, rows = parts[position]
+                    if len(rows) >= remaining:
+                        parts = [(segment, rows[len(rows) - remaining:])] + parts[position + 1:]
+                        break
+                    remaining -= len(rows)
+            return parts
+
+        def _metadata(self, metadata_id: int) -> Optional[Metadata]:
+            if metadata_id == _NO_METADATA:
+                return None
+            metadata = self._copies.get(metadata_id)
+            if metadata is None:
+                metadata = self._copies[metadata_id] = Metadata(dict(self._store._metadata[metadata_id].values))
+            return metadata
+
+        def execute(self) -> QueryResult[MDC]:
+            self._store._check_context()
+            with self._store._measure(self.operation) as measurement:
+                start = time.perf_counter()
+                self._copies = {}
+                series = self._store._load_series(self._metric_name)
+                parts = self._selection(series) if series is not None else []
+                self._store._refresh_metadata()
+                result = self._execute(series, parts)
+                if self._collect_statistics:
+                    result.stats = QueryStatistics(rows=sum(len(rows) for _, rows in parts),
+                                                   objects=len(result.timestamps),
+                                                   decode_time=time.perf_counter() - start)
+                measurement.rows = len(result.timestamps)
+            return result
+
+        @abstractmethod
+        def _execute(self, series: _Series, parts: List[Tuple[_Segment, Sequence[int]]]) -> QueryResult[MDC]:
+            """
+            :param series: series of the metric queried
+            :param parts: rows selected of each segment of the series, from oldest to newest
+            :return: the result of this query from the given rows
+            """
+
+    class _MetricQuery(_BaseQuery[MDC], ABC):
+        """
+        Query returning a value per row selected, rather than columns of values
+        """
+
+        def _execute(self, series: _Series, parts: List[Tuple[_Segment, Sequence[int]]]) -> QueryResult[MDC]:
+            result: QueryResult[MDC] = QueryResult()
+            for segment, rows in parts:
+                columns = [(series.keys[column_id], column) for column_id, column in segment.columns.items()]
+                for index in rows:
+                    result.metadata.append(self._metadata(segment.metadata_ids[index]))
+                    result.timestamps.append(_from_micros(segment.timestamps[index]))
+                    result.metric_data.append(self._convert({key: column[index] for key, column in columns
+                                                             if not math.isnan(column[index])}))
+            return result
+
+        @abstractmethod
+        def _convert(self, values: Dict[str, float]) -> MDC:
+            """
+            :return: the flattened values of a row as returned by this query
+            """
+
+    class _CompositeQuery(_MetricQuery[CompositeMetric]):
+        operation = "query.composite"
+
+        def _convert(self, values: Dict[str, float]) -> CompositeMetric:
+            return CompositeMetric.from_flattened(values)
+
+    class _DataclassQuery(_MetricQuery[MetricDataClassT]):
+        operation = "query.dataclass"
+
+        def __init__(self, store: "FileMetricStore", typ: Type[MetricDataClass], metric_name: str,
+                     max_count: Optional[int] = None):
+            super().__init__(store=store, metric_name=metric_name, max_count=max_count)
+            self._type = typ
+
+        def _convert(self, values: Dict[str, float]) -> MetricDataClassT:
+            return CompositeMetric.from_flattened(values).to_dataclass(self._type)
+
+    class _FieldQuery(_BaseQuery[Dict[str, List[float]]]):
+        operation = "query.fields"
+
+        def __init__(self, store: "FileMetricStore", metric_name: str, fields: Optional[List[str]] = None,
+                     max_count: Optional[int] = None):
+            super().__init__(store=store, metric_name=metric_name, max_count=max_count)
+            self._matches = field_matcher(fields) if fields else None
+
+        def _execute(self, series: _Series, parts: List[Tuple[_Segment, Sequence[int]]]) \
+                -> QueryResult[Dict[str, List[float]]]:
+            result: QueryResult[Dict[str, List[float]]] = QueryResult()
+            result.metric_data = {}  # correction on default type/value
+            if not parts:
+                return result
+            keys = [(key, column_id) for column_id, key in enumerate(series.keys)
+                    if self._matches is None or self._matches(key)]
+            for segment, rows in parts:
+                if isinstance(rows, range):
+                    # contiguous rows are sliced from the mapped columns without copying before conversion
+                    columns = {key: segment.columns[column_id][rows.start:rows.stop].tolist()
+                               for key, column_id in keys if column_id in segment.columns}
+                    timestamps = segment.timestamps[rows.start:rows.stop].tolist()
+                    metadata_ids = segment.metadata_ids[rows.start:rows.stop].tolist()
+                else:
+                    columns = {key: [segment.columns[column_id][index] for index in rows]
+                               for key, column_id in keys if column_id in segment.columns}
+                    timestamps = [segment.timestamps[index] for index in rows]
+                    metadata_ids = [segment.metadata_ids[index] for index in rows]
+                present = None
+                if any(math.isnan(value) for values in columns.values() for value in values):
+                    # as with the SQL store, missing values are skipped and rows without any value are not reported
+                    present = [any(not math.isnan(values[position]) for values in columns.values())
+                               for position in range(len(timestamps))]
+                    columns = {key: [value for value in values if not math.isnan(value)]
+                               for key, values in columns.items()}
+                    timestamps = [timestamp for timestamp, keep in zip(timestamps, present) if keep]
+                    metadata_ids = [metadata_id for metadata_id, keep in zip(metadata_ids, present) if keep]
+                if not columns:
+                    continue
+                result.timestamps.extend(_from_micros(timestamp) for timestamp in timestamps)
+                result.metadata.extend(self._metadata(metadata_id) for metadata_id in metadata_ids)
+                for key, values in columns.items():
+                    if values:
+                        result.metric_data.setdefault(key, []).extend(values)
+            return result
+
+    def start_query(self, metric_name: str, max_results: Optional[int] = None) -> _CompositeQuery:
+        return FileMetricStore._CompositeQuery(store=self, metric_name=metric_name, max_count=max_results)
+
+    def start_dataclass_query(self, typ: Type[MetricDataClass], metric_name: str, max_results: Optional[int])\
+            -> _DataclassQuery:
+        return FileMetricStore._DataclassQuery(store=self, typ=typ, metric_name=metric_name, max_count=max_results)
+
+    def start_field_query(self, metric_name: str, fields: Optional[List[str]], max_results: Optional[int] = None)\
+            -> _FieldQuery:
+        return FileMetricStore._FieldQuery(store=self, metric_name=metric_name, max_count=max_results,
+                                           fields=fields)
+
+    def field_series(self, metric_name: str, key: str) -> List[Tuple[memoryview, memoryview]]:
+        """
+        Zero-copy access to the committed values of one field: views onto the memory-mapped segments holding it,
+        valid until the segments are purged, compacted or the store is closed.  Values are NaN for metrics posted
+        without the field.
+
+        :param metric_name: name of metric
+        :param key: (flattened) key-path of the field
+        :return: per segment, from oldest to newest, views of the timestamps (int64 microseconds since the epoch)
+           and values (float64) of the field
+        """
+        self._check_context()
+        series = self._load_series(metric_name)
+        if series is None or key not in series.column_ids:
+            return []
+        column_id = series.column_ids[key]
+        return [(segment.timestamps, segment.columns[column_id]) for segment in series.ordered_segments
+                if column_id in segment.columns]
+
+    def post(self,
+             metric: Union[Metric, CompositeMetric],
+             timestamp: Optional[datetime.datetime] = None,
+             metadata: Optional[Metadata] = None,
+             project_name: Optional[str] = None,
+             uuid: Optional[str] = None):
+        timestamp = timestamp or datetime.datetime.utcnow()
+        self._check_context()
+        with self._measure("post") as measurement:
+            metadata_id = self._metadata_id(metadata)
+            values = {key: float(value) for key, value in metric.flatten().items()}
+            self._pending_buffer(metric.name).append(_to_micros(timestamp), metadata_id, values)
+            measurement.rows = len(values)
+
+    def _metadata_id(self, metadata: Optional[Metadata]) -> int:
+        """
+        :return: id of the given metadata set, interned (to be written on commit) if new
+        """
+        if not metadata:
+            return _NO_METADATA
+        with self._measure("post_metadata") as measurement:
+            measurement.rows = len(metadata.values)
+            self._refresh_metadata()
+            metadata_id, created = self._metadata.intern(metadata)
+            if created:
+                self._pending_metadata.append(metadata_id)
+            return metadata_id
+
+    def _pending_buffer(self, metric_name: str) -> _ColumnBuffer:
+        rows = self._pending.get(metric_name)
+        if rows is None:
+            rows = self._pending[metric_name] = _ColumnBuffer()
+        return rows
+
+    def post_batch(self, metric_name: str, batch: FieldBatch, project_name: Optional[str] = None) -> None:
+        """
+        Post a batch of metrics, appended column by column to those to be written on the next commit
+        """
+        self._check_context()
+        with self._measure("post_batch") as measurement:
+            for key in batch.values:
+                if key != metric_name and not key.startswith(f"/{metric_name}#") \
+                        and not key.startswith(f"/{metric_name}/"):
+                    raise ValueError(f"Key-path {key} of batch is not of metric {metric_name}")
+            timestamps = [_to_micros(timestamp) for timestamp in batch.timestamps]
+            # metadata sets are typically shared by many metrics of a batch, so are interned once per object:
+            metadata_ids: Dict[int, int] = {}
+            for metadata in batch.metadata:
+                if id(metadata) not in metadata_ids:
+                    metadata_ids[id(metadata)] = self._metadata_id(metadata)
+            metadata_column = [metadata_ids[id(metadata)] for metadata in batch.metadata]
+            columns = batch.values
+            # metrics without any value are skipped, as they could not be restored on query:
+            present = _present(list(columns.values()), len(timestamps))
+            if present is not None:
+                timestamps = list(itertools.compress(timestamps, present))
+                metadata_column = list(itertools.compress(metadata_column, present))
+                columns = {key: list(itertools.compress(column, present)) for key, column in columns.items()}
+            if timestamps:
+                self._pending_buffer(metric_name).extend(timestamps, metadata_column, columns)
+            measurement.rows = len(timestamps)
+
+    def field_batches(self, metric_name: str, fields: Optional[Iterable[str]] = None,
+                      oldest: Optional[datetime.datetime] = None, newest: Optional[datetime.datetime] = None,
+                      batch_size: int = 10000) -> Iterator[FieldBatch]:
+        """
+        Stream the committed history of a metric in columnar batches (see `MetricStore.field_batches`), sliced from
+        the memory-mapped segments
+        """
+        self._check_context()
+        if batch_size <= 0:
+            raise ValueError("Batch size must be positive")
+        series = self._load_series(metric_name)
+        if series is None:
+            return
+        query = FileMetricStore._FieldQuery(store=self, metric_name=metric_name, fields=fields)
+        if oldest is not None or newest is not None:
+            query.filter_on_date(oldest or datetime.datetime.min, newest or datetime.datetime.max)
+        parts = query._selection(series)
+        self._refresh_metadata()
+        keys = [(key, column_id) for column_id, key in enumerate(series.keys)
+                if (query._matches is None or query._matches(key))
+                and any(column_id in segment.columns for segment, _ in parts)]
+        if not keys:
+            return
+        metadata_ids: Set[int] = set()
+        for segment, rows in parts:
+            if isinstance(rows, range):
+                metadata_ids.update(segment.metadata_ids[rows.start:rows.stop])
+            else:
+                metadata_ids.update(segment.metadata_ids[index] for index in rows)
+        metadata_names = sorted({name for metadata_id in metadata_ids if metadata_id != _NO_METADATA
+                                 for name in self._metadata[metadata_id].values})
+
+        def complete(batch: FieldBatch) -> FieldBatch:
+            # as in a field query, rows without any value for the selected keys are omitted
+            present = _present(list(batch.values.values()), len(batch))
+            if present is not None:
+                batch.timestamps = list(itertools.compress(batch.timestamps, present))
+                batch.metadata = list(itertools.compress(batch.metadata, present))
+                batch.values = {key: list(itertools.compress(column, present)) for key, column in batch.values.items()}
+            return batch
+
+        batch = FieldBatch(values={key: [] for key, _ in keys}, metadata_names=metadata_names)
+        for segment, rows in parts:
+            position = 0
+            while position < len(rows):
+                chunk = rows[position: position + batch_size - len(batch)]
+                if isinstance(chunk, range):
+                    timestamps = segment.timestamps[chunk.start:chunk.stop].tolist()
+                    chunk_metadata_ids = segment.metadata_ids[chunk.start:chunk.stop].tolist()
+                else:
+                    timestamps = [segment.timestamps[index] for index in chunk]
+                    chunk_metadata_ids = [segment.metadata_ids[index] for index in chunk]
+                for key, column_id in keys:
+                    column = segment.columns.get(column_id)
+                    if column is None:
+                        batch.values[key].extend([math.nan] * len(chunk))
+                    elif isinstance(chunk, range):
+                        batch.values[key].extend(column[chunk.start:chunk.stop].tolist())
+                    else:
+                        batch.values[key].extend(column[index] for index in chunk)
+                batch.timestamps.extend(_from_micros(timestamp) for timestamp in timestamps)
+                batch.metadata.extend(query._metadata(metadata_id) for metadata_id in chunk_metadata_ids)
+                position += len(chunk)
+                if len(batch) == batch_size:
+                    yield complete(batch)
+                    batch = FieldBatch(values={key: [] for key, _ in keys}, metadata_names=metadata_names)
+        if len(batch):
+            yield complete(batch)
+
+    def commit(self) -> None:
+        """
+        Write all metrics posted since the last commit, as one segment per metric name
+        """
+        self._check_context()
+        with self._measure("commit") as measurement:
+            if self._pending_metadata:
+                with open(os.path.join(self._path, "metadata.jsonl"), 'a', encoding='utf-8') as stream:
+                    stream.write("".join(json.dumps([metadata_id, self._metadata[metadata_id].values]) + "\n"
+                                         for metadata_id in self._pending_metadata))
+                self._metadata_size = os.path.getsize(os.path.join(self._path, "metadata.jsonl"))
+                self._pending_metadata.clear()
+            rows_written = 0
+            # names are dropped from those pending as their segments are written, so that should the commit fail,
+            # those written are not written again by the next commit
+            for metric_name, rows in list(self._pending.items()):
+                series = self._load_series(metric_name, create=True)
+                new_keys: List[str] = []
+                # written keyed by column id, keeping the pending rows keyed by key-path should the write fail
+                segment = _ColumnBuffer()
+                segment.timestamps, segment.metadata_ids = rows.timestamps, rows.metadata_ids
+                segment.columns = {series.column_id(key, new_keys): column for key, column in rows.columns.items()}
+                # keys are persisted before any segment referring to them:
+                series.add_keys(new_keys)
+                segment.write(series.next_segment_path())
+                del self._pending[metric_name]
+                series.refresh()
+                if len(series.segments) > self._max_segments:
+                    self._compact(series)
+                rows_written += len(rows)
+            measurement.rows = rows_written
+
+    def rollback(self) -> None:
+        """
+        Discard the metrics posted since the last commit, and the metadata sets interned for them but not written
+        """
+        self._check_context()
+        with self._measure("rollback"):
+            self._pending.clear()
+            if self._pending_metadata:
+                # the sets written are loaded anew on next use
+                self._pending_metadata.clear()
+                self._metadata = MetadataIndex()
+                self._metadata_size = 0
+
+    def compact(self, metric_name: Optional[str] = None) -> None:
+        """
+        Merge all segments of a metric name into one
+
+        :param metric_name: name of metric, or None for all metrics
+        """
+        self._check_context()
+        for name in [metric_name] if metric_name is not None else self._metric_names():
+            series = self._load_series(name)
+            if series is not None and len(series.segments) > 1:
+                self._compact(series)
+
+    @staticmethod
+    def _compact(series: _Series) -> None:
+        segments = series.ordered_segments
+        rows = _ColumnBuffer()
+        for segment in segments:
+            rows.extend(segment.timestamps, segment.metadata_ids, segment.columns)
+        # the compacted segment replaces the others as soon as it is in place, so that they are never read along with
+        # it, even if not removed below
+        rows.write(series.next_segment_path(compacted=True))
+        for segment in segments:
+            try:
+                os.remove(segment.path)
+            except FileNotFoundError:
+                pass  # (removed by a reader that refreshed in between)
+        series.refresh()
+
+    def _purge_before(self, before: int, names: Iterable[str]) -> int:
+        """
+        :param before: timestamp (in microseconds) before which to purge metrics
+        :param names: names of metrics to purge
+        :return: number of metrics purged
+        """
+        purged = 0
+        for name in names:
+            series = self._load_series(name)
+            if series is None:
+                continue
+            for segment in series.ordered_segments:
+                if segment.oldest >= before:
+                    continue
+                keep = bisect.bisect_left(segment.timestamps, before)
+                purged += keep
+                series.rewrite(segment, segment.buffer(keep))
+        return purged
+
+    def purge_by_date(self, before: datetime.datetime, name: Optional[str] = None) -> None:
+        self._check_context()
+        self.commit()
+        with self._measure("purge_by_date") as measurement:
+            measurement.rows = self._purge_before(_to_micros(before),
+                                                  [name] if name is not None else self._metric_names())
+
+    def purge_by_volume(self, count_: int, name: str) -> None:
+        """
+        Remove (at least) the given number of the oldest metrics with the given name, along with any others sharing
+        the timestamp of the newest of them, as the SQL store does
+        """
+        self._check_context()
+        self.commit()
+        with self._measure("purge_by_volume") as measurement:
+            series = self._load_series(name)
+            if series is None or count_ <= 0:
+                measurement.rows = 0
+                return
+            timestamps = sorted(timestamp for segment in series.segments.values() for timestamp in segment.timestamps)
+            if not timestamps:
+                measurement.rows = 0
+                return
+            measurement.rows = self._purge_before(timestamps[min(count_, len(timestamps)) - 1] + 1, [name])
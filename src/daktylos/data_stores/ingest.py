@@ -0,0 +1,647 @@
+"""
+Ingestion daemon accepting metrics posted by many producers (such as pytest-xdist workers and CI agents) over a local
+Unix socket or TCP port, and storing them through a single :class:`daktylos.data.MetricStore` that it commits in large
+batches, so that producers neither open a database connection of their own nor contend for its locks.  Producers post
+through an :class:`IngestionClient`, itself a `MetricStore` (for posting only).
+
+Messages are exchanged as frames of a 4-byte (big-endian) length followed by the message: a byte giving its type and
+its fields.  Integers are encoded as (zigzag, where signed) varints, and values as 8-byte floats.  Strings (names,
+key-paths and metadata) are sent once per connection: a string is referred to by its index in the strings sent so far
+on the connection, with 0 referring to None, and the index next to be assigned followed by its (length-prefixed) UTF-8
+encoding to send a new one.  The messages are:
+
+* POST: name, timestamp (microseconds since the epoch), metadata (count + 1, or 0 for None, followed by each key and
+  either 0 and a string or 1 and an integer), project name, uuid, and the count of values followed by each key-path
+  and value
+* COMMIT: no fields; answered by the daemon once all metrics posted before it on the connection have been committed,
+  with ACK, or ERROR and a message if any of them could not be stored
+
+The daemon can be run with `python -m daktylos.data_stores.ingest sqlite:///metrics.db --socket /tmp/daktylos.sock`
+"""
+import argparse
+import datetime
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from typing import (
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Type,
+    Union,
+)
+
+from daktylos.data import (
+    BasicMetric,
+    CompositeMetric,
+    MetricDataClass,
+    Metadata,
+    MetricStore,
+    Query,
+)
+
+__all__ = ['IngestionClient', 'IngestionDaemon']
+
+Address = Union[str, Tuple[str, int]]
+
+POST = 0x50
+COMMIT = 0x43
+ACK = 0x41
+ERROR = 0x45
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+_FRAME = struct.Struct('>I')
+_VALUE = struct.Struct('<d')
+
+
+def _to_micros(timestamp: datetime.datetime) -> int:
+    """
+    :return: microseconds since the epoch of a timestamp, taken as UTC if naive
+    """
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return (timestamp - _EPOCH) // datetime.timedelta(microseconds=1)
+
+
+def _write_varint(out: bytearray, value: int) -> None:
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _write_signed(out: bytearray, value: int) -> None:
+    _write_varint(out, value * 2 if value >= 0 else -value * 2 - 1)
+
+
+class _Encoder:
+    """
+    Encoder of the messages sent on one connection to the daemon
+    """
+
+    def __init__(self):
+        self._strings: Dict[str, int] = {}
+
+    def _string(self, out: bytearray, value: Optional[str]) -> None:
+        if value is None:
+            out.append(0)
+            return
+        index = self._strings.get(value)
+        if index is not None:
+            _write_varint(out, index)
+            return
+        index = len(self._strings) + 1
+        self._strings[value] = index
+        _write_varint(out, index)
+        encoded = value.encode('utf-8')
+        _write_varint(out, len(encoded))
+        out += encoded
+
+    def post(self, out: bytearray, metric: CompositeMetric, timestamp: datetime.datetime,
+             metadata: Optional[Metadata], project_name: Optional[str], uuid: Optional[str]) -> None:
+        """
+        Append the frame of a POST message of the given metric to the given buffer; should the metric fail to
+        encode, neither the buffer nor the strings of the connection are changed
+        """
+        for key, value in (metadata.values.items() if metadata is not None else ()):
+            if not isinstance(value, (str, int)) or isinstance(value, bool):
+                raise ValueError(f"Metadata value of {key} is neither a str nor an int: {value!r}")
+        start = len(out)
+        assigned = len(self._strings)
+        try:
+            self._post(out, start, metric, timestamp, metadata, project_name, uuid)
+        except BaseException:
+            # strings newly assigned were not sent, so would not be known to the daemon
+            del out[start:]
+            for value in list(self._strings)[assigned:]:
+                del self._strings[value]
+            raise
+
+    def _post(self, out: bytearray, start: int, metric: CompositeMetric, timestamp: datetime.datetime,
+              metadata: Optional[Metadata], project_name: Optional[str], uuid: Optional[str]) -> None:
+        out += bytes(_FRAME.size)
+        out.append(POST)
+        self._string(out, metric.name)
+        _write_signed(out, _to_micros(timestamp))
+        if metadata is None:
+            out.append(0)
+        else:
+            _write_varint(out, len(metadata.values) + 1)
+            for key, value in metadata.values.items():
+                self._string(out, key)
+                if isinstance(value, str):
+                    out.append(0)
+                    self._string(out, value)
+                else:
+                    out.append(1)
+                    _write_signed(out, value)
+        self._string(out, project_name)
+        self._string(out, uuid)
+        values = metric.flatten()
+        _write_varint(out, len(values))
+        for key, value in values.items():
+            self._string(out, key)
+            out += _VALUE.pack(value)
+        _FRAME.pack_into(out, start, len(out) - start - _FRAME.size)
+
+
+class _Decoder:
+    """
+    Decoder of the messages received on one connection to the daemon
+    """
+
+    def __init__(self):
+        self._strings: List[Optional[str]] = [None]
+        self._data = b''
+        self._offset = 0
+
+    def _varint(self) -> int:
+        value = 0
+        shift = 0
+        while True:
+            byte = self._data[self._offset]
+            self._offset += 1
+            value |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return value
+            shift += 7
+
+    def _signed(self) -> int:
+        value = self._varint()
+        return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+    def _string(self) -> Optional[str]:
+        index = self._varint()
+        if index < len(self._strings):
+            return self._strings[index]
+        if index != len(self._strings):
+            raise ValueError(f"Reference to unknown string {index}")
+        length = self._varint()
+        value = self._data[self._offset: self._offset + length].decode('utf-8')
+        self._offset += length
+        self._strings.append(value)
+        return value
+
+    def post(self, data: bytes) -> Tuple[CompositeMetric, datetime.datetime, Optional[Metadata],
+                                         Optional[str], Optional[str]]:
+        """
+        :param data: a POST message
+        :return: the metric, timestamp, metadata, project name and uuid posted
+        """
+        self._data = data
+        self._offset = 1
+        name = self._string()
+        timestamp = _EPOCH + datetime.timedelta(microseconds=self._signed())
+        count = self._varint()
+        metadata = None
+        if count:
+            metadata = Metadata({})
+            for _ in range(count - 1):
+                key = self._string()
+                kind = self._data[self._offset]
+                self._offset += 1
+                if kind == 0:
+                    value = self._string()
+                    if value is None:
+                        raise ValueError(f"Missing value of metadata {key}")
+                elif kind == 1:
+                    value = self._signed()
+                else:
+                    raise ValueError(f"Unknown type of metadata {key}")
+                metadata.values[key] = value
+        project_name = self._string()
+        uuid = self._string()
+        values = {}
+        for _ in range(self._varint()):
+            key = self._string()
+            values[key] = _VALUE.unpack_from(self._data, self._offset)[0]
+            self._offset += _VALUE.size
+        if self._offset != len(data):
+            raise ValueError("Malformed message")
+        metric = BasicMetric.from_flattened(values) if values else CompositeMetric(name)
+        if metric.name != name:
+            raise ValueError(f"Key-paths posted are not of metric {name}")
+        return metric, timestamp, metadata, project_name, uuid
+
+
+def _read_frame(stream) -> Optional[bytes]:
+    """
+    :param stream: binary file of a connection
+    :return: the next message read from the given stream, or None once it is closed
+    """
+    header = stream.read(_FRAME.size)
+    if len(header) < _FRAME.size:
+        return None
+    (length,) = _FRAME.unpack(header)
+    data = stream.read(length)
+    if len(data) < length or not length:
+        return None
+    return data
+
+
+class _Producer:
+    """
+    State, held by the daemon, of a connection of a producer
+    """
+
+    def __init__(self):
+        self.error: Optional[str] = None
+
+
+class _Flush:
+    """
+    Request of a producer to be answered once the metrics it posted before are committed
+    """
+
+    def __init__(self, producer: _Producer):
+        self.producer = producer
+        self.done = threading.Event()
+        self.error: Optional[str] = None
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """
+    Handler of the connection of a producer, served in a thread of its own
+    """
+
+    server: "_TCPServer"
+
+    def handle(self) -> None:
+        daemon: IngestionDaemon = self.server.ingestion_daemon
+        decoder = _Decoder()
+        producer = _Producer()
+        while True:
+            data = _read_frame(self.rfile)
+            if data is None:
+                return
+            if data[0] == POST:
+                try:
+                    message = decoder.post(data)
+                except (ValueError, IndexError, UnicodeDecodeError, struct.error) as e:
+                    # the strings of the connection can no longer be followed, so it is closed
+                    self._reply(ERROR, f"Malformed message: {e}")
+                    return
+                # once the writer has stopped, metrics are dropped, as the next commit reports
+                if daemon._failure is None:
+                    daemon._queue.put((producer, message))
+            elif data[0] == COMMIT:
+                flush = _Flush(producer)
+                daemon._request_flush(flush)
+                flush.done.wait()
+                if flush.error is None:
+                    self._reply(ACK)
+                else:
+                    self._reply(ERROR, flush.error)
+            else:
+                self._reply(ERROR, f"Unknown message type {data[0]}")
+                return
+
+    def _reply(self, kind: int, message: str = "") -> None:
+        data = bytes([kind]) + message.encode('utf-8')
+        self.wfile.write(_FRAME.pack(len(data)) + data)
+        self.wfile.flush()
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+    ingestion_daemon: "IngestionDaemon"
+
+
+if hasattr(socketserver, 'ThreadingUnixStreamServer'):
+    class _UnixServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+        ingestion_daemon: "IngestionDaemon"
+else:
+    _UnixServer = None
+
+
+class IngestionDaemon:
+    """
+    Daemon accepting metrics from any number of :class:`IngestionClient` producers, and storing them through a single
+    writer thread that posts them to the given store and commits them in batches
+
+    :param store: store to post metrics to, entered by (and only used from) the writer thread; should the writer fail
+       (such as on entering the store), commits of producers are answered with an error from then on
+    :param address: path of a Unix socket, or (host, port) of a TCP socket, to listen on; a port of 0 picks a free
+       port, given by `address` once started
+    :param batch_size: number of metrics posted after which they are committed
+    :param interval: maximum time in seconds metrics posted are held before they are committed
+    """
+
+    def __init__(self, store: MetricStore, address: Address, batch_size: int = 1000, interval: float = 1.0):
+        if batch_size <= 0:
+            raise ValueError("Batch size must be positive")
+        if interval < 0:
+            raise ValueError("Interval must not be negative")
+        if isinstance(address, str) and _UnixServer is None:
+            raise ValueError("Unix sockets are not supported on this platform")
+        self._store = store
+        self._address = address
+        self._batch_size = batch_size
+        self._interval = interval
+        self._queue: "queue.Queue[Union[None, _Flush, Tuple[_Producer, tuple]]]" = queue.Queue()
+        self._server: Optional[socketserver.BaseServer] = None
+        self._threads: List[threading.Thread] = []
+        # set once the writer thread has entered the store (or failed to)
+        self._started = threading.Event()
+        # reason the writer thread stopped, if it has, after which no more flushes are queued:
+        self._failure: Optional[str] = None
+        self._failure_lock = threading.Lock()
+
+    @property
+    def address(self) -> Address:
+        """
+        :return: the address listened on
+        """
+        return self._server.server_address if self._server is not None else self._address
+
+    def start(self) -> "IngestionDaemon":
+        """
+        Start listening, serving connections and writing metrics in background threads
+
+        :return: self
+        :raises RuntimeError: if the writer thread fails to enter the store
+        """
+        if self._server is not None:
+            raise RuntimeError("Daemon already started")
+        self._failure = None
+        self._started.clear()
+        writer = threading.Thread(target=self._write, name="daktylos-ingest-writer")
+        writer.start()
+        self._started.wait()
+        if self._failure is not None:
+            writer.join()
+            raise RuntimeError(f"Ingestion daemon failed to start: {self._failure}")
+        server_type = _UnixServer if isinstance(self._address, str) else _TCPServer
+        try:
+            self._server = server_type(self._address, _Handler)
+        except BaseException:
+            self._queue.put(None)
+            writer.join()
+            raise
+        self._server.ingestion_daemon = self
+        self._threads = [writer, threading.Thread(target=self._server.serve_forever, name="daktylos-ingest-server")]
+        self._threads[1].start()
+        return self
+
+    def shutdown(self) -> None:
+        """
+        Stop accepting connections and commit all metrics received
+        """
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        if isinstance(self._address, str) and os.path.exists(self._address):
+            os.unlink(self._address)
+        self._server = None
+        self._threads = []
+
+    def __enter__(self) -> "IngestionDaemon":
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+    def _request_flush(self, flush: _Flush) -> None:
+        """
+        Queue a flush for the writer thread, or answer it with the reason the writer stopped if it has
+        """
+        with self._failure_lock:
+            if self._failure is None:
+                self._queue.put(flush)
+                return
+        flush.error = self._failure
+        flush.done.set()
+
+    def _write(self) -> None:
+        """
+        Post metrics received to the store and commit them, until shut down.  However the writer stops, flushes
+        not yet answered are answered with the reason it stopped
+        """
+        flushes: List[_Flush] = []
+        failure = "Ingestion daemon shut down"
+        try:
+            with self._store:
+                self._started.set()
+                self._write_batches(flushes)
+        except Exception as e:
+            failure = f"Writer failed: {e}"
+        finally:
+            with self._failure_lock:
+                self._failure = failure
+            self._started.set()
+            # no more flushes are queued, so all those left are answered here
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if isinstance(item, _Flush):
+                    flushes.append(item)
+            for flush in flushes:
+                flush.error = flush.error or failure
+                flush.done.set()
+
+    def _write_batches(self, flushes: List[_Flush]) -> None:
+        """
+        Post metrics received to the entered store and commit them, until shut down
+
+        :param flushes: list holding the flushes received and not yet answered
+        """
+        pending: Set[_Producer] = set()
+        count = 0
+        deadline: Optional[float] = None
+        stopped = False
+        while not stopped:
+            try:
+                item = self._queue.get(timeout=None if deadline is None else max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                item = ()
+            # take all items already received, so that the commits requested at once by many producers are
+            # served by a single commit
+            while True:
+                if item is None:
+                    stopped = True
+                elif isinstance(item, _Flush):
+                    flushes.append(item)
+                elif item:
+                    producer, (metric, timestamp, metadata, project_name, uuid) = item
+                    try:
+                        self._store.post(metric, timestamp=timestamp, metadata=metadata,
+                                         project_name=project_name, uuid=uuid)
+                    except Exception as e:
+                        producer.error = producer.error or f"Failed to post {metric.name}: {e}"
+                    pending.add(producer)
+                    count += 1
+                    if deadline is None:
+                        deadline = time.monotonic() + self._interval
+                if count >= self._batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if count and (stopped or flushes or count >= self._batch_size or time.monotonic() >= deadline):
+                try:
+                    self._store.commit()
+                except Exception as e:
+                    # the metrics of the failed commit are discarded, so that later ones can be committed
+                    self._store.rollback()
+                    for producer in pending:
+                        producer.error = producer.error or f"Failed to commit: {e}"
+                pending = set()
+                count = 0
+                deadline = None
+            for flush in flushes:
+                flush.error = flush.producer.error
+                flush.producer.error = None
+                flush.done.set()
+            flushes.clear()
+
+    def serve_forever(self) -> None:
+        """
+        Serve producers until interrupted (with SIGINT), then commit all metrics received
+        """
+        self.start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.shutdown()
+
+
+# noinspection PyProtectedMember
+class IngestionClient(MetricStore):
+    """
+    Store posting metrics to an :class:`IngestionDaemon`, to be queried from the store of the daemon.  Metrics posted
+    are sent in buffers of the given size, and `commit` returns once the daemon has committed all metrics posted
+    before it.
+
+    :param address: path of the Unix socket, or (host, port) of the TCP socket, of the daemon
+    :param buffer_size: size in bytes of the messages buffered before they are sent
+    :param timeout: if specified, timeout in seconds of connecting, sending and waiting for commits
+    """
+
+    def __init__(self, address: Address, buffer_size: int = 65536, timeout: Optional[float] = None):
+        self._address = address
+        self._buffer_size = buffer_size
+        self._timeout = timeout
+        self._socket: Optional[socket.socket] = None
+        self._stream = None
+        self._encoder = _Encoder()
+        self._buffer = bytearray()
+
+    def __enter__(self) -> "IngestionClient":
+        if isinstance(self._address, str):
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._socket.settimeout(self._timeout)
+            try:
+                self._socket.connect(self._address)
+            except OSError:
+                self._socket.close()
+                self._socket = None
+                raise
+        else:
+            self._socket = socket.create_connection(self._address, timeout=self._timeout)
+        self._stream = self._socket.makefile('rb')
+        self._encoder = _Encoder()
+        self._buffer = bytearray()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            super().__exit__(exc_type, exc_val, exc_tb)
+        finally:
+            self._stream.close()
+            self._socket.close()
+            self._stream = None
+            self._socket = None
+
+    def _check_context(self) -> None:
+        if self._socket is None:
+            raise RuntimeError("Not in context of data store.  please use 'with' statement")
+
+    def post(self, metric: CompositeMetric, timestamp: Optional[datetime.datetime] = None,
+             metadata: Optional[Metadata] = None,
+             project_name: Optional[str] = None,
+             uuid: Optional[str] = None):
+        self._check_context()
+        with self._measure("post") as measurement:
+            self._encoder.post(self._buffer, metric, timestamp or datetime.datetime.utcnow(), metadata,
+                               project_name, uuid)
+            measurement.rows = 1
+            if len(self._buffer) >= self._buffer_size:
+                self._send()
+
+    def _send(self) -> None:
+        self._socket.sendall(self._buffer)
+        self._buffer = bytearray()
+
+    def commit(self) -> None:
+        self._check_context()
+        with self._measure("commit"):
+            self._buffer += _FRAME.pack(1) + bytes([COMMIT])
+            self._send()
+            reply = _read_frame(self._stream)
+            if reply is None:
+                raise ConnectionError("Connection to ingestion daemon closed")
+            if reply[0] != ACK:
+                raise RuntimeError(f"Ingestion daemon failed to store metrics: {reply[1:].decode('utf-8')}")
+
+    @staticmethod
+    def _not_supported():
+        return NotImplementedError("Metrics posted to an ingestion daemon are queried and purged through its store")
+
+    def purge_by_date(self, before: datetime.datetime, name: Optional[str] = None):
+        raise self._not_supported()
+
+    def purge_by_volume(self, count: int, name: str):
+        raise self._not_supported()
+
+    def start_query(self, metric_name: str, max_results: Optional[int] = None) -> Query[CompositeMetric]:
+        raise self._not_supported()
+
+    def start_dataclass_query(self, typ: Type[MetricDataClass], metric_name: str, max_results: Optional[int]) \
+            -> Query[MetricDataClass]:
+        raise self._not_supported()
+
+    def start_field_query(self, metric_name: str, fields: Optional[List[str]], max_results: Optional[int] = None) \
+            -> Query[Dict[str, List[float]]]:
+        raise self._not_supported()
+
+
+def main(args: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Serve an ingestion daemon storing metrics to a SQL database")
+    parser.add_argument("url", help="sqlalchemy URL of the database")
+    listen = parser.add_mutually_exclusive_group(required=True)
+    listen.add_argument("--socket", help="path of the Unix socket to listen on")
+    listen.add_argument("--port", type=int, help="TCP port to listen on")
+    parser.add_argument("--host", default="127.0.0.1", help="host to listen on with --port")
+    parser.add_argument("--batch-size", type=int, default=1000, help="number of metrics committed at once")
+    parser.add_argument("--interval", type=float, default=1.0,
+                        help="maximum time in seconds metrics are held before they are committed")
+    parser.add_argument("--create", action="store_true", help="create the tables of the database")
+    args = parser.parse_args(args)
+    import sqlalchemy
+    from daktylos.data_stores.sql import SQLMetricStore
+    store = SQLMetricStore(sqlalchemy.create_engine(args.url), create=args.create)
+    address = args.socket if args.socket is not None else (args.host, args.port)
+    IngestionDaemon(store, address, batch_size=args.batch_size, interval=args.interval).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,494 @@
+"""
+Pure in-memory implementation of a :class:`daktylos.data.MetricStore`, for unit tests, short-lived tools and as
+a fast cache tier in front of a persistent store.  Data lives for the lifetime of the store instance (across
+multiple entries into its context), and is not shared between instances.
+"""
+import bisect
+import datetime
+import operator
+import time
+from abc import ABC, abstractmethod
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+    Union,
+)
+
+from daktylos.data import (
+    BaselineCache,
+    CompositeMetric,
+    MDC,
+    Metadata,
+    Metric,
+    MetricDataClass,
+    MetricDataClassT,
+    MetricStore,
+    Query,
+    QueryResult,
+    QueryStatistics,
+    RollingWindow,
+    field_matcher,
+)
+
+__all__ = ['InMemoryMetricStore', 'MetadataIndex']
+
+
+_COMPARISONS: Dict[MetricStore.Comparison, Callable[[object, object], bool]] = {
+    MetricStore.Comparison.EQUAL: operator.eq,
+    MetricStore.Comparison.NOT_EQUAL: operator.ne,
+    MetricStore.Comparison.LESS_THAN: operator.lt,
+    MetricStore.Comparison.GREATER_THAN: operator.gt,
+    MetricStore.Comparison.LESS_THAN_OR_EQUAL: operator.le,
+    MetricStore.Comparison.GREATER_THAN_OR_EQUAL: operator.ge,
+}
+
+
+def _equivalents(value: Union[str, int]) -> List[Union[str, int]]:
+    """
+    :return: the given metadata value and any value of the other allowed type with the same text
+    """
+    if isinstance(value, int):
+        return [value, str(value)]
+    try:
+        number = int(value)
+    except ValueError:
+        return [value]
+    return [value, number] if str(number) == value else [value]
+
+
+class MetadataIndex:
+    """
+    Distinct metadata sets, each identified by an integer id, with an inverted index from name/value pair to the
+    ids of sets holding that pair, so that metadata filters resolve to a set of ids without scanning entries
+    """
+
+    def __init__(self):
+        self._sets: Dict[int, Metadata] = {}
+        self._ids: Dict[Tuple[Tuple[str, Union[str, int]], ...], int] = {}
+        self._refcounts: Dict[int, int] = {}
+        self._next_id = 0
+        # name -> value -> ids of sets holding that name/value pair:
+        self._index: Dict[str, Dict[Union[str, int], Set[int]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._sets)
+
+    def __getitem__(self, metadata_id: int) -> Metadata:
+        return self._sets[metadata_id]
+
+    def intern(self, metadata: Metadata) -> Tuple[int, bool]:
+        """
+        :param metadata: set of metadata to intern
+        :return: id of the set, and whether it was newly added
+        """
+        metadata_id = self._ids.get(tuple(metadata.values.items()))
+        if metadata_id is not None:
+            return metadata_id, False
+        for name, value in metadata.values.items():
+            if type(value) not in [str, int]:
+                raise ValueError(f"Invalid type for metadata named {name} with type {type(value).__name__}")
+        metadata_id = self._next_id
+        self.add(metadata_id, metadata)
+        return metadata_id, True
+
+    def add(self, metadata_id: int, metadata: Metadata) -> None:
+        """
+        Add a set of metadata under a given id (e.g. when loading a persisted index)
+        """
+        self._ids[tuple(metadata.values.items())] = metadata_id
+        self._sets[metadata_id] = Metadata(dict(metadata.values))
+        self._refcounts[metadata_id] = 0
+        self._next_id = max(self._next_id, metadata_id + 1)
+        for name, value in metadata.values.items():
+            self._index.setdefault(name, {}).setdefault(value, set()).add(metadata_id)
+
+    def acquire(self, metadata_id: int) -> None:
+        """
+        Count a reference to the set of the given id
+        """
+        self._refcounts[metadata_id] += 1
+
+    def release(self, metadata_id: int) -> None:
+        """
+        Release a reference to the set of the given id, dropping the set once no longer referenced
+        """
+        self._refcounts[metadata_id] -= 1
+        if self._refcounts[metadata_id]:
+            return
+        del self._refcounts[metadata_id]
+        metadata = self._sets.pop(metadata_id)
+        del self._ids[tuple(metadata.values.items())]
+        for name, value in metadata.values.items():
+            by_value = self._index[name]
+            by_value[value].discard(metadata_id)
+            if not by_value[value]:
+                del by_value[value]
+                if not by_value:
+                    del self._index[name]
+
+    def select(self, name: str, value: Union[str, int], op: "MetricStore.Comparison") -> Set[int]:
+        """
+        :param name: name of metadata field
+        :param value: value to compare against
+        :param op: type of comparison to perform
+        :return: ids of the sets whose field of the given name compares as requested against the value
+        """
+        try:
+            compare = _COMPARISONS[op]
+        except KeyError:
+            raise ValueError(f"Invalid operations: {op}")
+        by_value = self._index.get(name, {})
+        ids: Set[int] = set()
+        if op == MetricStore.Comparison.EQUAL:
+            # direct lookup, for either type of value (as values are compared as text in the SQL store)
+            for candidate in _equivalents(value):
+                ids |= by_value.get(candidate, set())
+        else:
+            numeric = type(value) == int and op != MetricStore.Comparison.NOT_EQUAL
+            for stored, metadata_ids in by_value.items():
+                if numeric:
+                    # integers are ordered numerically, against integer metadata only (as in the SQL store)
+                    if type(stored) == int and compare(stored, value):
+                        ids |= metadata_ids
+                elif compare(str(stored), str(value)):
+                    # inequality, and comparisons against strings, are by text
+                    ids |= metadata_ids
+        return ids
+
+
+class _Entry:
+    """
+    A posted composite metric, as stored
+    """
+
+    __slots__ = ("timestamp", "values", "metadata_id", "project", "uuid")
+
+    def __init__(self, timestamp: datetime.datetime, values: Dict[str, float], metadata_id: Optional[int],
+                 project: Optional[str], uuid: Optional[str]):
+        self.timestamp = timestamp
+        self.values = values
+        self.metadata_id = metadata_id
+        self.project = project
+        self.uuid = uuid
+
+
+class _Series:
+    """
+    All entries posted under one metric name, held in parallel lists sorted by timestamp
+    """
+
+    __slots__ = ("timestamps", "entries")
+
+    def __init__(self):
+        self.timestamps: List[datetime.datetime] = []
+        self.entries: List[_Entry] = []
+
+    def insert(self, entry: _Entry) -> None:
+        if not self.timestamps or entry.timestamp >= self.timestamps[-1]:
+            self.timestamps.append(entry.timestamp)
+            self.entries.append(entry)
+        else:
+            index = bisect.bisect_right(self.timestamps, entry.timestamp)
+            self.timestamps.insert(index, entry.timestamp)
+            self.entries.insert(index, entry)
+
+    def remove_through(self, index: int) -> List[_Entry]:
+        """
+        remove the oldest entries, up to (excluding) the given index
+
+        :return: entries removed
+        """
+        removed = self.entries[:index]
+        del self.timestamps[:index]
+        del self.entries[:index]
+        return removed
+
+
+# noinspection PyProtectedMember
+class InMemoryMetricStore(MetricStore):
+    """
+    Concrete data store class for metrics storage and retrieval held in memory.  Entries of each metric name are
+    held sorted by timestamp so that date ranges are resolved by bisection, and distinct metadata sets are indexed
+    by name/value pair so that metadata filters resolve to a set of metadata sets without scanning entries.
+
+    :param baseline_window: if specified, maintain a rolling baseline of this many latest values per key
+       of each metric posted (see `MetricStore.rolling_baseline`)
+    """
+
+    def __init__(self, baseline_window: Optional[int] = None):
+        self._in_context = False
+        self._series: Dict[str, _Series] = {}
+        self._metadata = MetadataIndex()
+        self._baselines: Optional[BaselineCache] = BaselineCache(baseline_window) if baseline_window else None
+
+    def __enter__(self) -> "InMemoryMetricStore":
+        self._in_context = True
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            super().__exit__(exc_type, exc_val, exc_tb)
+        finally:
+            self._in_context = False
+
+    def _check_context(self) -> None:
+        if not self._in_context:
+            raise RuntimeError("Not in context of data store.  please use 'with' statement")
+
+    class _BaseQuery(Query[MDC], ABC):
+        """
+        Concrete implementation of an in-memory query interface
+        """
+
+        #: name of the operation reported to any instrumentation sink of the store
+        operation = "query"
+
+        def __init__(self, store: "InMemoryMetricStore", metric_name: str, max_count: Optional[int] = None):
+            super().__init__(metric_name=metric_name, max_count=max_count)
+            self._store = store
+            self._oldest: Optional[datetime.datetime] = None
+            self._newest: Optional[datetime.datetime] = None
+            # ids of metadata sets allowed, or None if not filtered on metadata
+            self._metadata_ids: Optional[Set[int]] = None
+            # copies of the metadata sets of the metrics of a result, shared by the metrics of each set
+            self._copies: Dict[int, Metadata] = {}
+
+        def filter_on_date(self, oldest: datetime.datetime, newest: datetime.datetime) -> Query[MDC]:
+            self._oldest = oldest if self._oldest is None else max(oldest, self._oldest)
+            self._newest = newest if self._newest is None else min(newest, self._newest)
+            return self
+
+        def filter_on_metadata(self, **kwds) -> Query[MDC]:
+            for name, value in kwds.items():
+                self.filter_on_metadata_field(name, value, MetricStore.Comparison.EQUAL)
+            return self
+
+        def filter_on_metadata_field(self, name: str, value: Union[str, int], op: MetricStore.Comparison) \
+                -> Query[MDC]:
+            ids = self._store._metadata.select(name, value, op)
+            self._metadata_ids = ids if self._metadata_ids is None else self._metadata_ids & ids
+            return self
+
+        def _entries(self) -> List[_Entry]:
+            """
+            :return: entries matching the filters of this query, from oldest to newest
+            """
+            series = self._store._series.get(self._metric_name)
+            if series is None:
+                return []
+            start = bisect.bisect_left(series.timestamps, self._oldest) if self._oldest is not None else 0
+            end = bisect.bisect_right(series.timestamps, self._newest) if self._newest is not None \
+                else len(series.timestamps)
+            entries = series.entries[start:end]
+            if self._metadata_ids is not None:
+                entries = [entry for entry in entries if entry.metadata_id in self._metadata_ids]
+            if self._count:
+                entries = entries[-self._count:]
+            return entries
+
+        def _metadata(self, entry: _Entry) -> Optional[Metadata]:
+            if entry.metadata_id is None:
+                return None
+            metadata = self._copies.get(entry.metadata_id)
+            if metadata is None:
+                metadata = self._copies[entry.metadata_id] = Metadata(dict(self._store._metadata[entry.metadata_id].values))
+            return metadata
+
+        def execute(self) -> QueryResult[MDC]:
+            with self._store._measure(self.operation) as measurement:
+                start = time.perf_counter()
+                self._copies = {}
+                entries = self._entries()
+                result = self._execute(entries)
+                if self._collect_statistics:
+                    result.stats = QueryStatistics(rows=len(entries), objects=len(result.timestamps),
+                                                   decode_time=time.perf_counter() - start)
+                measurement.rows = len(result.timestamps)
+            return result
+
+        @abstractmethod
+        def _execute(self, entries: List[_Entry]) -> QueryResult[MDC]:
+            """
+            :param entries: entries matching the filters of this query, from oldest to newest
+            :return: the result of this query from the given entries
+            """
+
+    class _MetricQuery(_BaseQuery[MDC], ABC):
+        """
+        Query returning a value per entry selected, rather than columns of values
+        """
+
+        def _execute(self, entries: List[_Entry]) -> QueryResult[MDC]:
+            result: QueryResult[MDC] = QueryResult()
+            for entry in entries:
+                result.metadata.append(self._metadata(entry))
+                result.timestamps.append(entry.timestamp)
+                result.metric_data.append(self._convert(entry))
+            return result
+
+        @abstractmethod
+        def _convert(self, entry: _Entry) -> MDC:
+            """
+            :return: the value of an entry as returned by this query
+            """
+
+    class _CompositeQuery(_MetricQuery[CompositeMetric]):
+        operation = "query.composite"
+
+        def _convert(self, entry: _Entry) -> CompositeMetric:
+            return CompositeMetric.from_flattened(entry.values)
+
+    class _DataclassQuery(_MetricQuery[MetricDataClassT]):
+        operation = "query.dataclass"
+
+        def __init__(self, store: "InMemoryMetricStore", typ: Type[MetricDataClass], metric_name: str,
+                     max_count: Optional[int] = None):
+            super().__init__(store=store, metric_name=metric_name, max_count=max_count)
+            self._type = typ
+
+        def _convert(self, entry: _Entry) -> MetricDataClassT:
+            return CompositeMetric.from_flattened(entry.values).to_dataclass(self._type)
+
+    class _FieldQuery(_BaseQuery[Dict[str, List[float]]]):
+        operation = "query.fields"
+
+        def __init__(self, store: "InMemoryMetricStore", metric_name: str, fields: Optional[List[str]] = None,
+                     max_count: Optional[int] = None):
+            super().__init__(store=store, metric_name=metric_name, max_count=max_count)
+            self._matches = field_matcher(fields) if fields else None
+
+        def _execute(self, entries: List[_Entry]) -> QueryResult[Dict[str, List[float]]]:
+            result: QueryResult[Dict[str, List[float]]] = QueryResult()
+            result.metric_data = {}  # correction on default type/value
+            for entry in entries:
+                values = entry.values if self._matches is None else \
+                    {name: value for name, value in entry.values.items() if self._matches(name)}
+                if not values:
+                    # as with the SQL store, entries without any matching field are not reported
+                    continue
+                result.metadata.append(self._metadata(entry))
+                result.timestamps.append(entry.timestamp)
+                for name, value in values.items():
+                    result.metric_data.setdefault(name, []).append(value)
+            return result
+
+    def start_query(self, metric_name: str, max_results: Optional[int] = None) -> _CompositeQuery:
+        return InMemoryMetricStore._CompositeQuery(store=self, metric_name=metric_name, max_count=max_results)
+
+    def start_dataclass_query(self, typ: Type[MetricDataClass], metric_name: str, max_results: Optional[int])\
+            -> _DataclassQuery:
+        return InMemoryMetricStore._DataclassQuery(store=self, typ=typ, metric_name=metric_name,
+                                                   max_count=max_results)
+
+    def start_field_query(self, metric_name: str, fields: Optional[List[str]], max_results: Optional[int] = None)\
+            -> _FieldQuery:
+        return InMemoryMetricStore._FieldQuery(store=self, metric_name=metric_name, max_count=max_results,
+                                               fields=fields)
+
+    def _release(self, entries: Iterable[_Entry]) -> None:
+        """
+        release the metadata of removed entries, dropping any metadata set no longer referenced
+        """
+        for entry in entries:
+            if entry.metadata_id is not None:
+                self._metadata.release(entry.metadata_id)
+
+    def purge_by_date(self, before: datetime.datetime, name: Optional[str] = None) -> None:
+        self._check_context()
+        with self._measure("purge_by_date") as measurement:
+            names = list(self._series) if name is None else [name] if name in self._series else []
+            removed = 0
+            for series_name in names:
+                series = self._series[series_name]
+                entries = series.remove_through(bisect.bisect_left(series.timestamps, before))
+                self._release(entries)
+                removed += len(entries)
+                if not series.entries:
+                    del self._series[series_name]
+            measurement.rows = removed
+
+    def purge_by_volume(self, count_: int, name: str) -> None:
+        """
+        Remove (at least) the given number of the oldest metrics with the given name, along with any others sharing
+        the timestamp of the newest of them, as the SQL store does
+        """
+        self._check_context()
+        with self._measure("purge_by_volume") as measurement:
+            series = self._series.get(name)
+            if series is None or count_ <= 0:
+                measurement.rows = 0
+                return
+            purge_date = series.timestamps[min(count_, len(series.timestamps)) - 1]
+            entries = series.remove_through(bisect.bisect_right(series.timestamps, purge_date))
+            self._release(entries)
+            if not series.entries:
+                del self._series[name]
+            measurement.rows = len(entries)
+
+    def post(self,
+             metric: Union[Metric, CompositeMetric],
+             timestamp: Optional[datetime.datetime] = None,
+             metadata: Optional[Metadata] = None,
+             project_name: Optional[str] = None,
+             uuid: Optional[str] = None):
+        timestamp = timestamp or datetime.datetime.utcnow()
+        self._check_context()
+        with self._measure("post") as measurement:
+            metadata_id: Optional[int] = None
+            if metadata:
+                with self._measure("post_metadata") as metadata_measurement:
+                    metadata_measurement.rows = len(metadata.values)
+                    metadata_id, _ = self._metadata.intern(metadata)
+                self._metadata.acquire(metadata_id)
+            values = {key: float(value) for key, value in metric.flatten().items()}
+            if self._baselines is not None:
+                self._load_baseline(metric.name, metadata)
+                self._baselines.update(metric, metadata)
+            self._series.setdefault(metric.name, _Series()).insert(
+                _Entry(timestamp, values, metadata_id, project_name, uuid))
+            measurement.rows = len(values)
+
+    def _load_baseline(self, metric_name: str, metadata: Optional[Metadata]) -> Dict[str, RollingWindow]:
+        """
+        Load the rolling baseline of the given metric and metadata into the cache if not already there, seeded (once)
+        from the latest values in the store
+
+        :param metric_name: name of metric
+        :param metadata: metadata of the metrics of the baseline
+        :return: the baseline of the metric
+        """
+        if self._baselines.cached(metric_name, metadata):
+            return self._baselines.baseline(metric_name, metadata)
+        return self._baselines.load(metric_name, self._baseline_history(metric_name, metadata, self._baselines.window),
+                                    metadata)
+
+    def rolling_baseline(self, metric_name: str, metadata: Optional[Metadata] = None) -> Dict[str, RollingWindow]:
+        self._check_context()
+        if self._baselines is None:
+            raise RuntimeError("Rolling baselines are not maintained by this store; specify a baseline_window"
+                               " on creation")
+        return self._load_baseline(metric_name, metadata)
+
+    def commit(self) -> None:
+        """
+        Commit all changes accumulated thus far; changes to an in-memory store take effect immediately
+        """
+        self._check_context()
+        with self._measure("commit"):
+            pass
+
+    def count(self, metric_name: Optional[str] = None) -> int:
+        """
+        :param metric_name: name of metric, or None for all metrics
+        :return: number of composite metrics held under the given name
+        """
+        if metric_name is not None:
+            series = self._series.get(metric_name)
+            return len(series.entries) if series is not None else 0
+        return sum(len(series.entries) for series in self._series.values())
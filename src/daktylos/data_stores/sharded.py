@@ -0,0 +1,389 @@
+"""
+Data store spreading metrics across several other :class:`daktylos.data.MetricStore` instances ("shards"), typically
+`SQLMetricStore` instances on separate databases, to scale ingestion beyond a single database.  Metrics are routed
+to a shard by a hash of their name, or of a key computed from their name and metadata.  Queries are fanned out in
+parallel to the shards that may hold the metric, and their results merged by timestamp.
+
+Each shard is served by a worker thread of its own, through which all calls to the shard are made, as stores (and
+their database sessions) are not safe to use from several threads.
+"""
+import datetime
+import hashlib
+import heapq
+import itertools
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import fields
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Type,
+    TypeVar,
+    Union,
+)
+
+from daktylos.data import (
+    CompositeMetric,
+    FieldBatch,
+    MDC,
+    Metadata,
+    Metric,
+    MetricDataClass,
+    MetricStore,
+    MultiQuery,
+    Query,
+    QueryResult,
+    QueryStatistics,
+    RollingWindow,
+    field_matcher,
+)
+from daktylos.instrumentation import OperationSink
+
+__all__ = ['ShardedMetricStore']
+
+R = TypeVar('R')
+
+
+def _merge(results: List[QueryResult], count: Optional[int]) -> QueryResult:
+    """
+    :param results: results of a query of composite metrics (or dataclasses) from each shard, from oldest to newest
+    :param count: if specified, maximum number of (latest) metrics to return
+    :return: the results merged by timestamp, from oldest to newest, with statistics summed across shards
+    """
+    if len(results) == 1:
+        return results[0]
+    # k-way merge from newest, so that no more than the latest metrics of the count are merged
+    newest_first = heapq.merge(*[zip(reversed(result.timestamps), reversed(result.metadata),
+                                     reversed(result.metric_data)) for result in results],
+                               key=lambda row: row[0], reverse=True)
+    rows = list(itertools.islice(newest_first, count or None))
+    rows.reverse()
+    merged = QueryResult(timestamps=[timestamp for timestamp, _, _ in rows],
+                         metadata=[metadata for _, metadata, _ in rows],
+                         metric_data=[metric for _, _, metric in rows])
+    if all(result.stats is not None for result in results):
+        merged.stats = QueryStatistics(**{item.name: sum(getattr(result.stats, item.name) for result in results)
+                                          for item in fields(QueryStatistics)})
+    return merged
+
+
+def _select(batch: FieldBatch, indexes: List[int]) -> FieldBatch:
+    """
+    :return: batch of the metrics of the given batch at the given indexes
+    """
+    return FieldBatch(timestamps=[batch.timestamps[index] for index in indexes],
+                      metadata=[batch.metadata[index] for index in indexes],
+                      values={key: [column[index] for index in indexes] for key, column in batch.values.items()},
+                      metadata_names=batch.metadata_names)
+
+
+# noinspection PyProtectedMember
+class ShardedMetricStore(MetricStore):
+    """
+    Data store spreading metrics across several others
+
+    :param stores: the stores of the shards, entered and exited along with this store
+    :param key: if specified, function of the name and metadata of a posted metric giving the key it is routed by,
+       so that metrics of one name can be spread across shards (e.g. by platform); by default metrics are routed by
+       name, so that all metrics of a name are held, and queried, in a single shard
+    """
+
+    def __init__(self, stores: Sequence[MetricStore], key: Optional[Callable[[str, Optional[Metadata]], str]] = None):
+        if not stores:
+            raise ValueError("At least one store is required")
+        self._stores = list(stores)
+        self._key = key
+        self._workers: List[ThreadPoolExecutor] = []
+
+    @property
+    def stores(self) -> List[MetricStore]:
+        return list(self._stores)
+
+    def shard(self, metric_name: str, metadata: Optional[Metadata] = None) -> int:
+        """
+        :param metric_name: name of a metric
+        :param metadata: metadata of the metric, if any
+        :return: index of the store holding a metric of the given name and metadata
+        """
+        key = metric_name if self._key is None else self._key(metric_name, metadata)
+        # a stable hash (rather than `hash`, which varies between processes) so that routing survives restarts
+        digest = hashlib.sha256(key.encode('utf-8')).digest()
+        return int.from_bytes(digest[:8], 'big') % len(self._stores)
+
+    def _shards(self, metric_name: str) -> List[int]:
+        """
+        :return: indexes of the stores that may hold metrics of the given name
+        """
+        if self._key is None:
+            return [self.shard(metric_name)]
+        return list(range(len(self._stores)))
+
+    def _submit(self, index: int, function: Callable[[MetricStore], R]) -> "Future[R]":
+        """
+        :return: future result of calling the given function with the store of the given index, in its worker thread
+        """
+        if not self._workers:
+            raise RuntimeError("Not in context of data store.  please use 'with' statement")
+        return self._workers[index].submit(function, self._stores[index])
+
+    @staticmethod
+    def _wait(futures: Iterable["Future[R]"]) -> List[R]:
+        """
+        :return: the results of the given futures, once all are done; the first exception raised by any is raised
+        """
+        futures = list(futures)
+        for future in futures:
+            future.exception()
+        return [future.result() for future in futures]
+
+    def _call(self, index: int, function: Callable[[MetricStore], R]) -> R:
+        """
+        :return: the result of calling the given function with the store of the given index
+        """
+        return self._submit(index, function).result()
+
+    def _fan_out(self, indexes: Iterable[int], function: Callable[[MetricStore], R]) -> List[R]:
+        """
+        :return: the results of calling the given function with each of the stores of the given indexes, in parallel
+        """
+        return self._wait([self._submit(index, function) for index in indexes])
+
+    class _Query(Query[MDC]):
+        """
+        Query recording its filters, executed as an equivalent query on each shard that may hold the metric,
+        in parallel
+
+        :param store: the sharded store
+        :param factory: creates the equivalent query on the store of a shard
+        :param metric_name: name of metric to query
+        :param max_count: max number of entries to query
+        """
+
+        def __init__(self, store: "ShardedMetricStore", factory: Callable[[MetricStore], Query],
+                     metric_name: str, max_count: Optional[int] = None):
+            super().__init__(metric_name=metric_name, max_count=max_count)
+            self._store = store
+            self._factory = factory
+            self._filters: List[Callable[[Query], Query]] = []
+
+        def filter_on_date(self, oldest: datetime.datetime, newest: datetime.datetime) -> Query[MDC]:
+            self._filters.append(lambda query: query.filter_on_date(oldest=oldest, newest=newest))
+            return self
+
+        def filter_on_metadata(self, **kwds) -> Query[MDC]:
+            self._filters.append(lambda query: query.filter_on_metadata(**kwds))
+            return self
+
+        def filter_on_metadata_field(self, name: str, value: Union[str, int], op: MetricStore.Comparison) \
+                -> Query[MDC]:
+            self._filters.append(lambda query: query.filter_on_metadata_field(name, value, op))
+            return self
+
+        def _build(self, store: MetricStore) -> Query:
+            """
+            :return: the equivalent query on the given store of a shard
+            """
+            query = self._factory(store)
+            for apply in self._filters:
+                apply(query)
+            return query.collect_statistics(self._collect_statistics)
+
+        def _merge(self, results: List[QueryResult]) -> QueryResult[MDC]:
+            """
+            :return: the result of this query from those of the shards
+            """
+            return _merge(results, self._count)
+
+        def execute(self) -> QueryResult[MDC]:
+            shards = self._store._shards(self._metric_name)
+            return self._merge(self._store._fan_out(shards, lambda store: self._build(store).execute()))
+
+        def explain(self) -> str:
+            shards = self._store._shards(self._metric_name)
+            plans = self._store._fan_out(shards, lambda store: self._build(store).explain())
+            return "\n".join(f"shard {index}:\n{plan}" for index, plan in zip(shards, plans))
+
+    class _FieldQuery(_Query[Dict[str, List[float]]]):
+        """
+        Field query, executed on the shards as a query of composite metrics when the metric may be spread across
+        shards, as lists of values per field cannot be merged by timestamp (a metric need not have every field)
+        """
+
+        def __init__(self, store: "ShardedMetricStore", metric_name: str, fields: Optional[List[str]] = None,
+                     max_count: Optional[int] = None):
+            self._spread = len(store._shards(metric_name)) > 1
+            if self._spread:
+                super().__init__(store, lambda shard: shard.start_query(metric_name, max_count),
+                                 metric_name=metric_name, max_count=max_count)
+            else:
+                super().__init__(store, lambda shard: shard.start_field_query(metric_name, fields, max_count),
+                                 metric_name=metric_name, max_count=max_count)
+            self._matches = field_matcher(fields) if fields else None
+
+        def _merge(self, results: List[QueryResult]) -> QueryResult[Dict[str, List[float]]]:
+            if not self._spread:
+                return results[0]
+            merged = super()._merge(results)
+            result: QueryResult[Dict[str, List[float]]] = QueryResult(stats=merged.stats)
+            result.metric_data = {}  # correction on default type/value
+            for timestamp, metadata, metric in zip(merged.timestamps, merged.metadata, merged.metric_data):
+                values = {name: value for name, value in metric.flatten().items()
+                          if self._matches is None or self._matches(name)}
+                if not values:
+                    # as with other stores, metrics without any matching field are not reported
+                    continue
+                result.timestamps.append(timestamp)
+                result.metadata.append(metadata)
+                for name, value in values.items():
+                    result.metric_data.setdefault(name, []).append(value)
+            return result
+
+    class _MultiQuery(MultiQuery):
+        """
+        Query of several metric names, executed as a query of the names each shard may hold on every shard
+        concerned, in parallel
+        """
+
+        def execute(self) -> Dict[str, QueryResult[List[CompositeMetric]]]:
+            store: ShardedMetricStore = self._store
+            names: Dict[int, List[str]] = {}
+            for metric_name in self._metric_names:
+                for index in store._shards(metric_name):
+                    names.setdefault(index, []).append(metric_name)
+
+            def execute(shard: MetricStore, metric_names: List[str]) -> Dict[str, QueryResult]:
+                query = shard.start_multi_query(metric_names, self._count).collect_statistics(self._collect_statistics)
+                for apply in self._filters:
+                    apply(query)
+                return query.execute()
+
+            shard_results = dict(zip(names, store._wait(
+                store._submit(index, lambda shard, metric_names=metric_names: execute(shard, metric_names))
+                for index, metric_names in names.items())))
+            return {metric_name: _merge([shard_results[index][metric_name] for index in store._shards(metric_name)],
+                                        self._count)
+                    for metric_name in self._metric_names}
+
+    def start_query(self, metric_name: str, max_results: Optional[int] = None) -> Query[CompositeMetric]:
+        return ShardedMetricStore._Query(self, lambda shard: shard.start_query(metric_name, max_results),
+                                         metric_name=metric_name, max_count=max_results)
+
+    def start_dataclass_query(self, typ: Type[MetricDataClass], metric_name: str, max_results: Optional[int])\
+            -> Query[MetricDataClass]:
+        return ShardedMetricStore._Query(self, lambda shard: shard.start_dataclass_query(typ, metric_name,
+                                                                                         max_results),
+                                         metric_name=metric_name, max_count=max_results)
+
+    def start_field_query(self, metric_name: str, fields: Optional[List[str]], max_results: Optional[int] = None)\
+            -> Query[Dict[str, List[float]]]:
+        return ShardedMetricStore._FieldQuery(self, metric_name=metric_name, fields=fields, max_count=max_results)
+
+    def start_multi_query(self, metric_names: Iterable[str], max_results: Optional[int] = None) -> MultiQuery:
+        return ShardedMetricStore._MultiQuery(store=self, metric_names=metric_names, max_count=max_results)
+
+    def latest(self, metric_name: str, metadata_filter: Optional[Dict[str, Union[str, int]]] = None) \
+            -> QueryResult[List[CompositeMetric]]:
+        return _merge(self._fan_out(self._shards(metric_name),
+                                    lambda shard: shard.latest(metric_name, metadata_filter=metadata_filter)),
+                      count=1)
+
+    def __enter__(self) -> "ShardedMetricStore":
+        self._workers = [ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"daktylos-shard{index}")
+                         for index in range(len(self._stores))]
+        try:
+            self._fan_out(range(len(self._stores)), lambda shard: shard.__enter__())
+        except BaseException:
+            self._shutdown()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            self._fan_out(range(len(self._stores)), lambda shard: shard.__exit__(exc_type, exc_val, exc_tb))
+        finally:
+            self._shutdown()
+
+    def _shutdown(self) -> None:
+        for worker in self._workers:
+            worker.shutdown()
+        self._workers = []
+
+    def instrument(self, sink: Optional[OperationSink]) -> None:
+        super().instrument(sink)
+        for store in self._stores:
+            store.instrument(sink)
+
+    def post(self, metric: Union[Metric, CompositeMetric], timestamp: Optional[datetime.datetime] = None,
+             metadata: Optional[Metadata] = None,
+             project_name: Optional[str] = None,
+             uuid: Optional[str] = None):
+        timestamp = timestamp or datetime.datetime.utcnow()
+        self._call(self.shard(metric.name, metadata),
+                   lambda shard: shard.post(metric, timestamp=timestamp, metadata=metadata,
+                                            project_name=project_name, uuid=uuid))
+
+    def post_batch(self, metric_name: str, batch: FieldBatch, project_name: Optional[str] = None) -> None:
+        indexes: Dict[int, List[int]] = {}
+        for index, metadata in enumerate(batch.metadata):
+            indexes.setdefault(self.shard(metric_name, metadata), []).append(index)
+        if len(indexes) == 1:
+            self._call(next(iter(indexes)), lambda shard: shard.post_batch(metric_name, batch,
+                                                                           project_name=project_name))
+            return
+        self._wait(self._submit(shard_index, lambda shard, rows=rows: shard.post_batch(
+            metric_name, _select(batch, rows), project_name=project_name))
+            for shard_index, rows in indexes.items())
+
+    def field_batches(self, metric_name: str, fields: Optional[Iterable[str]] = None,
+                      oldest: Optional[datetime.datetime] = None, newest: Optional[datetime.datetime] = None,
+                      batch_size: int = 10000) -> Iterator[FieldBatch]:
+        shards = self._shards(metric_name)
+        if len(shards) > 1:
+            # batches of shards differ in key-paths and metadata names, so the metric is queried as a whole
+            yield from super().field_batches(metric_name, fields=fields, oldest=oldest, newest=newest,
+                                             batch_size=batch_size)
+            return
+        # the batches are streamed from the shard, each fetched in the worker thread of the shard
+        batches = self._call(shards[0], lambda shard: iter(shard.field_batches(
+            metric_name, fields=fields, oldest=oldest, newest=newest, batch_size=batch_size)))
+        while True:
+            batch = self._call(shards[0], lambda shard: next(batches, None))
+            if batch is None:
+                return
+            yield batch
+
+    def purge_by_date(self, before: datetime.datetime, name: Optional[str] = None) -> None:
+        shards = self._shards(name) if name is not None else range(len(self._stores))
+        self._fan_out(shards, lambda shard: shard.purge_by_date(before=before, name=name))
+
+    def purge_by_volume(self, count_: int, name: str) -> None:
+        shards = self._shards(name)
+        if len(shards) == 1:
+            self._call(shards[0], lambda shard: shard.purge_by_volume(count_, name=name))
+            return
+        # the oldest metrics across shards are those up to the timestamp of the last of them to purge, merged from
+        # the oldest timestamps of each shard
+        oldest = self._fan_out(shards, lambda shard: list(itertools.islice(
+            (timestamp for batch in shard.field_batches(name) for timestamp in batch.timestamps), count_)))
+        purged = list(itertools.islice(heapq.merge(*oldest), count_))
+        if not purged:
+            return
+        before = purged[-1] + datetime.timedelta(microseconds=1)
+        self._fan_out(shards, lambda shard: shard.purge_by_date(before=before, name=name))
+
+    def rolling_baseline(self, metric_name: str, metadata: Optional[Metadata] = None) -> Dict[str, RollingWindow]:
+        shards = self._shards(metric_name)
+        if len(shards) > 1:
+            raise NotImplementedError("Rolling baselines are maintained per shard, so are only available for metrics"
+                                      " routed by name")
+        return self._call(shards[0], lambda shard: shard.rolling_baseline(metric_name, metadata))
+
+    def commit(self) -> None:
+        self._fan_out(range(len(self._stores)), lambda shard: shard.commit())
+
+    def rollback(self) -> None:
+        self._fan_out(range(len(self._stores)), lambda shard: shard.rollback())
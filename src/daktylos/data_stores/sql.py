@@ -4,27 +4,39 @@ SQL implementation of `MetricStore` class
 
 import datetime
 import hashlib
+import json
 import logging
-from abc import ABC
+import math
+import operator
+import threading
+import time
+from abc import ABC, abstractmethod
 
 import sqlalchemy
 
 from collections import OrderedDict
 
-from sqlalchemy.orm.exc import NoResultFound
 
+from daktylos.instrumentation import OperationSink
 from daktylos.data import (
+    BaselineCache,
+    FieldBatch,
     MetricStore,
     Metadata,
     Metric,
     CompositeMetric,
     MDC,
     MetricDataClass,
+    MultiQuery,
     MetricDataClassT,
     QueryResult,
+    QueryStatistics,
     Query,
+    RollingWindow,
+    field_matcher,
 )
 from sqlalchemy import (
+    BigInteger,
     Column,
     desc,
     exists,
@@ -33,28 +45,59 @@ from sqlalchemy import (
     String,
     TIMESTAMP,
     Table,
-    UniqueConstraint, or_, Integer,
+    Text,
+    Index,
+    UniqueConstraint, and_, or_, Integer,
+    bindparam,
+    delete,
+    event,
+    func,
+    select,
 )
 from sqlalchemy.orm import (
     relationship,
     sessionmaker, aliased,
 )
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.sql.expression import ClauseElement, Executable
 from typing import (
+    Callable,
+    Iterable,
+    Iterator,
     List,
+    NamedTuple,
     Optional,
     Tuple,
-    Union, Dict, Type,
+    Union, Dict, Type, Set,
 )
-__all__ = ['SQLMetricStore']
+__all__ = ['MetricSummary', 'SQLMetricStore']
 
 Base = declarative_base()
 Session = sessionmaker(autoflush=False, autocommit=False)
 log = logging.getLogger("SQLMetricStore")
 log.setLevel(logging.WARNING)
 
+
+class MetricSummary(NamedTuple):
+    """
+    Summary of the history of a metric held in a store
+    """
+    count: int
+    oldest: datetime.datetime
+    newest: datetime.datetime
+
 MetadataEnumColumnType = sqlalchemy.Enum(Metadata.Types)
 
+_COMPARISONS = {
+    MetricStore.Comparison.EQUAL: operator.eq,
+    MetricStore.Comparison.NOT_EQUAL: operator.ne,
+    MetricStore.Comparison.LESS_THAN: operator.lt,
+    MetricStore.Comparison.GREATER_THAN: operator.gt,
+    MetricStore.Comparison.LESS_THAN_OR_EQUAL: operator.le,
+    MetricStore.Comparison.GREATER_THAN_OR_EQUAL: operator.ge,
+}
+
 
 class SQLMetadata(Base):
     """
@@ -90,7 +133,39 @@ class SQLMetadataSet(Base):
     """
     __tablename__ = "metadata_sets"
     uuid = Column(String(255), primary_key=True)
-    data = relationship("SQLMetadata", secondary=SQLMetadataAssociationTable, cascade="all, delete")
+    # name/value pairs are shared across sets, so are not deleted along with a set (see `_purge_orphaned_metadata`)
+    data = relationship("SQLMetadata", secondary=SQLMetadataAssociationTable)
+    postings = relationship("SQLMetadataPosting", cascade="all, delete-orphan")
+
+
+class SQLMetadataPosting(Base):
+    """
+    Class representing SQL table of the inverted index of metadata: one row per name/value pair of each metadata set,
+    denormalizing `SQLMetadata` and its associations, so that a metadata filter resolves to the uuids of the sets
+    matching it from a (covering) index on name and value, with no joins.  Integer values are also held in the
+    numeric *number* column (null for string values), so that range comparisons are numeric and index-backed
+    """
+    __tablename__ = "metadata_postings"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String(127), nullable=False)
+    value = Column(String(255), nullable=False)
+    number = Column(BigInteger, nullable=True)
+    set_uuid = Column(String(255), ForeignKey(SQLMetadataSet.uuid), nullable=False)
+    __table_args__ = (Index('metadata_postings_lookup', 'name', 'value', 'set_uuid'),
+                      Index('metadata_postings_numeric', 'name', 'number', 'set_uuid'),
+                      Index('metadata_postings_by_set', 'set_uuid'))
+
+    #: range of integers held in the numeric column (larger integers are only held as text)
+    NUMBER_RANGE = range(-2 ** 63, 2 ** 63)
+
+    @classmethod
+    def number_of(cls, value: Union[str, int]) -> Optional[int]:
+        """
+        :param value: value of metadata
+        :return: the value to hold in the numeric column for the given value of metadata
+        """
+        return value if type(value) == int and value in cls.NUMBER_RANGE else None
 
 
 class SQLMetric(Base):
@@ -103,7 +178,8 @@ class SQLMetric(Base):
     name = Column(String(255))
     value = Column(Float(precision=30))
     parent_id = Column(Integer, ForeignKey("composite_metrics.id"))
-    __table_args__ = (UniqueConstraint('name', 'value', name='unique_metric'),)
+    # values are always selected by the composite metric they belong to:
+    __table_args__ = (Index('metric_values_by_parent', 'parent_id'),)
 
 
 class SQLCompositeMetric(Base):
@@ -118,9 +194,337 @@ class SQLCompositeMetric(Base):
     timestamp = Column(TIMESTAMP)
     project = Column(String(127), nullable=True)
     uuid = Column(String(255), nullable=True)
-    children = relationship(SQLMetric, cascade="all, delete")
+    children = relationship(SQLMetric, cascade="all, delete-orphan")
     metadata_id = Column(String(255), ForeignKey(SQLMetadataSet.uuid))
     metrics_metadata = relationship("SQLMetadataSet", cascade="all, delete")
+    # metadata filters select on metadata sets within the metrics of one name:
+    __table_args__ = (Index('composite_metrics_by_metadata', 'name', 'metadata_id', 'timestamp'),)
+
+
+class SQLLatestComposite(Base):
+    """
+    Class representing SQL table of the latest composite metric of each name and metadata set, maintained as metrics
+    are posted, so that the current value of a metric is found by key rather than by ordering its history
+    """
+    __tablename__ = "latest_composites"
+
+    #: set uuid of the latest composite metrics without metadata
+    NO_METADATA = ""
+
+    metric_name = Column(String(127), primary_key=True)
+    set_uuid = Column(String(255), primary_key=True)
+    timestamp = Column(TIMESTAMP, nullable=False)
+    # (no foreign key, as the composite metric may be held in the table of a partition, see `SQLPartition`)
+    composite_id = Column(Integer, nullable=False)
+    # the latest across metadata sets is found from the newest entry of the name:
+    __table_args__ = (Index('latest_composites_by_time', 'metric_name', 'timestamp'),)
+
+
+class SQLRollingBaseline(Base):
+    """
+    Class representing SQL table holding the rolling window of latest values of each key of a composite metric
+    posted with a metadata set, as a json list of floats (oldest first)
+    """
+    __tablename__ = "rolling_baselines"
+
+    id = Column(Integer, primary_key=True)
+    metric_name = Column(String(127), index=True)
+    #: key of the metadata set of the metrics (see `BaselineCache.metadata_key`)
+    metadata_key = Column(String(64), nullable=False, default="")
+    name = Column(String(255))
+    window = Column(Text)
+    __table_args__ = (UniqueConstraint('metric_name', 'metadata_key', 'name', name='unique_baseline'),)
+
+
+class SQLPartition(Base):
+    """
+    Class representing SQL table of the partitions of a time-partitioned store (see `SQLMetricStore`): the period of
+    time of each pair of tables holding the composite metrics, and their values, posted with timestamps of that period
+    """
+    __tablename__ = "metric_partitions"
+
+    suffix = Column(String(32), primary_key=True)
+    start = Column(TIMESTAMP, nullable=False)
+    end = Column(TIMESTAMP, nullable=False)
+
+
+#: metadata of the tables of partitions, which are only created as periods of time are posted to
+_partition_metadata = sqlalchemy.MetaData()
+_partition_lock = threading.Lock()
+
+
+def _period(timestamp: datetime.datetime, period: str) -> Tuple[str, datetime.datetime, datetime.datetime]:
+    """
+    :param timestamp: timestamp of a composite metric
+    :param period: period of partitions, "month" or "day"
+    :return: suffix of the tables, start and (exclusive) end of the partition of the given timestamp
+    """
+    if period == "month":
+        start = timestamp.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        end = start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+        return start.strftime("p%Y%m"), start, end
+    start = timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    return start.strftime("p%Y%m%d"), start, start + datetime.timedelta(days=1)
+
+
+class _Partition:
+    """
+    Tables of the composite metrics, and of their values, of one period of time of a time-partitioned store, with
+    the columns and indexes of `SQLCompositeMetric` and `SQLMetric`
+
+    :param suffix: suffix of the names of the tables
+    :param start: start of the period
+    :param end: (exclusive) end of the period
+    """
+
+    def __init__(self, suffix: str, start: datetime.datetime, end: datetime.datetime):
+        self.suffix = suffix
+        self.start = start
+        self.end = end
+        composites = f"{SQLCompositeMetric.__tablename__}_{suffix}"
+        values = f"{SQLMetric.__tablename__}_{suffix}"
+        with _partition_lock:
+            if composites not in _partition_metadata.tables:
+                # index names are unique across tables in some databases, so are suffixed as well
+                Table(composites, _partition_metadata,
+                      Column('id', Integer, primary_key=True, autoincrement=False),
+                      Column('name', String(127)),
+                      Column('timestamp', TIMESTAMP),
+                      Column('project', String(127), nullable=True),
+                      Column('uuid', String(255), nullable=True),
+                      Column('metadata_id', String(255), ForeignKey(SQLMetadataSet.uuid)),
+                      Index(f'{composites}_by_metadata', 'name', 'metadata_id', 'timestamp'))
+                Table(values, _partition_metadata,
+                      Column('id', Integer, primary_key=True),
+                      Column('name', String(255)),
+                      Column('value', Float(precision=30)),
+                      Column('parent_id', Integer, ForeignKey(f"{composites}.id")),
+                      Index(f'{values}_by_parent', 'parent_id'))
+        self.composites: Table = _partition_metadata.tables[composites]
+        self.values: Table = _partition_metadata.tables[values]
+
+
+class _Explain(Executable, ClauseElement):
+    """
+    Statement requesting the plan of another statement from the backend
+    """
+
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(_Explain)
+def _compile_explain(element: _Explain, compiler, **kw) -> str:
+    prefix = "EXPLAIN QUERY PLAN " if compiler.dialect.name == 'sqlite' else "EXPLAIN "
+    return prefix + compiler.process(element.statement, **kw)
+
+
+def _plan(session, statement: Executable, parameters: Optional[Dict[str, object]] = None) -> List[str]:
+    """
+    :param session: session to execute the request on
+    :param statement: statement to request the plan of
+    :param parameters: values of the parameters bound to the statement
+    :return: lines of the plan of the statement, as reported by the backend
+    """
+    rows = session.execute(_Explain(statement), parameters or {}).fetchall()
+    if session.get_bind().dialect.name == 'sqlite':
+        # rows of (id, parent, notused, detail); indent detail to show the tree
+        depths = {0: -1}
+        lines = []
+        for node_id, parent_id, _, detail in rows:
+            depths[node_id] = depths.get(parent_id, -1) + 1
+            lines.append("  " * depths[node_id] + detail)
+        return lines
+    return ["\t".join(str(value) for value in row) for row in rows]
+
+
+class _StatisticsCollector:
+    """
+    Context manager collecting statistics of statements executed on an engine and of objects loaded into a session
+    within its context.  Statements executed on the engine from other threads in that time are also counted.
+
+    :param engine: engine to monitor
+    :param session: session to monitor
+    """
+
+    def __init__(self, engine: sqlalchemy.engine.base.Engine, session):
+        self._engine = engine
+        self._session = session
+        self._start = 0.0
+        self._statement_start = 0.0
+        self.statistics = QueryStatistics()
+
+    def _before_cursor_execute(self, *args) -> None:
+        self._statement_start = time.perf_counter()
+
+    def _after_cursor_execute(self, *args) -> None:
+        self.statistics.database_time += time.perf_counter() - self._statement_start
+        self.statistics.statements += 1
+
+    def _loaded(self, *args) -> None:
+        self.statistics.objects += 1
+
+    def __enter__(self) -> "_StatisticsCollector":
+        event.listen(self._engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(self._engine, "after_cursor_execute", self._after_cursor_execute)
+        event.listen(self._session, "loaded_as_persistent", self._loaded)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        elapsed = time.perf_counter() - self._start
+        event.remove(self._engine, "before_cursor_execute", self._before_cursor_execute)
+        event.remove(self._engine, "after_cursor_execute", self._after_cursor_execute)
+        event.remove(self._session, "loaded_as_persistent", self._loaded)
+        self.statistics.decode_time = max(0.0, elapsed - self.statistics.database_time)
+
+
+def _date_condition(oldest, newest, composites: Table):
+    """
+    :return: condition selecting composite metrics of the given table within the given dates
+    """
+    return and_(composites.c.timestamp >= oldest, composites.c.timestamp <= newest)
+
+
+def _matching_sets(name, value, op: MetricStore.Comparison, numeric: bool):
+    """
+    :param numeric: whether to compare against integer metadata, numerically, rather than against the text of values
+    :return: statement selecting the uuids of the metadata sets whose field of the given name compares as requested
+       against the given value, from the metadata index
+    """
+    column = SQLMetadataPosting.number if numeric else SQLMetadataPosting.value
+    return select(SQLMetadataPosting.set_uuid).where(SQLMetadataPosting.name == name, _COMPARISONS[op](column, value))
+
+
+def _metadata_condition(name, value, op: MetricStore.Comparison, numeric: bool, composites: Table):
+    """
+    :param numeric: whether to compare against integer metadata, numerically, rather than against the text of values
+    :param composites: table of composite metrics
+    :return: condition selecting composite metrics whose metadata field of the given name compares as requested
+       against the given value
+    """
+    # the filter resolves to the uuids of matching metadata sets through the metadata index, in an
+    # uncorrelated subquery that the database evaluates once, ahead of the scan of composite metrics
+    return composites.c.metadata_id.in_(_matching_sets(name, value, op, numeric))
+
+
+#: condition on the names of values for each kind of field pattern of a field query, given the pattern
+_FIELD_CONDITIONS = {
+    'equal': lambda name, pattern: name == pattern,
+    'like': lambda name, pattern: name.like(pattern),
+    'not like': lambda name, pattern: name.notlike(pattern),
+}
+
+#: maximum number of statement templates kept (see `_template`)
+_MAX_TEMPLATES = 256
+_templates: Dict[Tuple, Executable] = OrderedDict()
+#: guards the statement templates, shared by the stores of all threads
+_templates_lock = threading.Lock()
+
+
+def _template(shape: Tuple, build: Callable[[], Executable]) -> Executable:
+    """
+    Statements are built once per shape, with the values they differ by as bound parameters, so that repeated
+    queries of the same shape execute the same statement object: SQLAlchemy then finds its compiled form in its cache
+    without building the statement, nor generating its cache key, anew
+
+    :param shape: key identifying the structure of a statement, independent of the values bound to it
+    :param build: function building the statement of the given shape
+    :return: the statement of the given shape
+    """
+    with _templates_lock:
+        statement = _templates.get(shape)
+        if statement is not None:
+            # least recently used templates are evicted first
+            _templates.move_to_end(shape)
+            return statement
+    # built outside of the lock; should another thread build the same shape meanwhile, the first one built is kept
+    statement = build()
+    with _templates_lock:
+        statement = _templates.setdefault(shape, statement)
+        _templates.move_to_end(shape)
+        if len(_templates) > _MAX_TEMPLATES:
+            _templates.popitem(last=False)
+    return statement
+
+
+class _Filters:
+    """
+    Filters on the composite metrics of a query, recorded as the shape of the conditions they translate to and the
+    values of the parameters bound to those conditions
+    """
+
+    def __init__(self):
+        self.dates = 0
+        self.metadata: Tuple[Tuple[MetricStore.Comparison, bool], ...] = ()
+        self.parameters: Dict[str, object] = {}
+        #: bounds of the dates of all date filters, if any (selecting the partitions to query)
+        self.oldest: Optional[datetime.datetime] = None
+        self.newest: Optional[datetime.datetime] = None
+
+    @property
+    def shape(self) -> Tuple:
+        return self.dates, self.metadata
+
+    def on_date(self, oldest: datetime.datetime, newest: datetime.datetime) -> None:
+        self.parameters[f"oldest_{self.dates}"] = oldest
+        self.parameters[f"newest_{self.dates}"] = newest
+        self.dates += 1
+        self.oldest = oldest if self.oldest is None else max(self.oldest, oldest)
+        self.newest = newest if self.newest is None else min(self.newest, newest)
+
+    def on_metadata(self, name: str, value: Union[str, int], op: MetricStore.Comparison) -> None:
+        if op not in _COMPARISONS:
+            raise ValueError(f"Invalid operations: {op}")
+        # integers are ordered numerically, against integer metadata only, whereas (in)equality matches values of
+        # either type by text, as do comparisons against strings
+        numeric = type(value) == int and op not in (MetricStore.Comparison.EQUAL, MetricStore.Comparison.NOT_EQUAL)
+        index = len(self.metadata)
+        self.parameters[f"name_{index}"] = name
+        self.parameters[f"value_{index}"] = value if numeric else str(value)
+        self.metadata += ((op, numeric),)
+
+    @staticmethod
+    def conditions(shape: Tuple, composites: Table) -> List:
+        """
+        :param shape: shape of filters
+        :param composites: table of composite metrics
+        :return: the conditions on composite metrics of filters of the given shape, on bound parameters
+        """
+        dates, metadata = shape
+        conditions = [_date_condition(bindparam(f"oldest_{index}"), bindparam(f"newest_{index}"), composites)
+                      for index in range(dates)]
+        conditions += [_metadata_condition(bindparam(f"name_{index}"), bindparam(f"value_{index}"), op, numeric,
+                                           composites)
+                       for index, (op, numeric) in enumerate(metadata)]
+        return conditions
+
+
+def _index_latest(executor, names: Optional[Iterable[str]] = None) -> None:
+    """
+    Add the latest composite metric of each name and metadata set that has no entry in the table of latest composite
+    metrics, from the history of composite metrics
+
+    :param executor: connection or session to execute on
+    :param names: if specified, only add entries of these metric names
+    """
+    ranked = select(SQLCompositeMetric.id, SQLCompositeMetric.name,
+                    func.coalesce(SQLCompositeMetric.metadata_id, SQLLatestComposite.NO_METADATA).label('set_uuid'),
+                    SQLCompositeMetric.timestamp,
+                    func.row_number().over(partition_by=(SQLCompositeMetric.name, SQLCompositeMetric.metadata_id),
+                                           order_by=(desc(SQLCompositeMetric.timestamp),
+                                                     desc(SQLCompositeMetric.id))).label('position'))
+    if names is not None:
+        ranked = ranked.where(SQLCompositeMetric.name.in_(list(names)))
+    ranked = ranked.subquery()
+    executor.execute(SQLLatestComposite.__table__.insert().from_select(
+        ['metric_name', 'set_uuid', 'timestamp', 'composite_id'],
+        select(ranked.c.name, ranked.c.set_uuid, ranked.c.timestamp, ranked.c.id).where(
+            ranked.c.position == 1,
+            ~exists().where(SQLLatestComposite.metric_name == ranked.c.name,
+                            SQLLatestComposite.set_uuid == ranked.c.set_uuid))))
 
 
 # noinspection PyProtectedMember
@@ -130,114 +534,338 @@ class SQLMetricStore(MetricStore):
 
     :param engine: The *sqlalchemy* engine to use, as a uri
     :param create: whether to create tables if the do not exist in SQL database
+    :param baseline_window: if specified, maintain a rolling baseline of this many latest values per key
+       of each metric posted (see `MetricStore.rolling_baseline`)
+    :param partitions: if specified, the period of time ("month" or "day") by which to partition composite metrics
+       and their values into tables of their own (see `SQLPartition`), so that queries only read the tables of the
+       periods they select, and purges by date drop whole tables.  Ids of composite metrics are then allocated by the
+       store, so no other process may post metrics to the database at the same time
     """
 
-    singleton = None
+    #: maximum number of parameters bound to a single statement (in lists of values)
+    MAX_PARAMETERS = 500
+    #: periods of time by which a store can be partitioned
+    PARTITION_PERIODS = ("month", "day")
 
-    def __init__(self, engine: sqlalchemy.engine.base.Engine, create: bool = False):
-        if SQLMetricStore.singleton is not None:
-            raise RuntimeError("Can only instantiate one instance of SQLMetricStore")
-        SQLMetricStore.singleton = self
+    def __init__(self, engine: sqlalchemy.engine.base.Engine, create: bool = False,
+                 baseline_window: Optional[int] = None, partitions: Optional[str] = None):
+        if partitions is not None and partitions not in self.PARTITION_PERIODS:
+            raise ValueError(f"Invalid period of partitions: {partitions}")
         if create:
             Base.metadata.create_all(engine)
+            self._upgrade(engine)
+            with engine.connect() as connection:
+                # metrics held in one layout would not be found in the other
+                if partitions is not None and \
+                        connection.execute(select(SQLCompositeMetric.id).limit(1)).first() is not None:
+                    raise ValueError("Database holds metrics that are not partitioned by time")
+                if partitions is None and connection.execute(select(SQLPartition.suffix).limit(1)).first() is not None:
+                    raise ValueError("Database holds metrics partitioned by time; specify the period of partitions")
+        self._partitioning = partitions
+        # partitions of a time-partitioned store, from oldest to newest, loaded on entering the store:
+        self._partitions: List[_Partition] = []
+        # values (as rows of composite metrics and of their values) posted since last commit, per partition:
+        self._pending_rows: Dict[str, Tuple[List[Dict], List[Dict]]] = {}
+        self._next_id: Optional[int] = None
         self._session = None
         self._engine = engine
         self._filters: OrderedDict[str, Tuple[MetricStore.Comparison, str]] = OrderedDict()
+        self._baselines: Optional[BaselineCache] = BaselineCache(baseline_window) if baseline_window else None
+        # stored rows of the rolling baselines loaded, and keys of baselines changed since last commit, per metric name
+        # and metadata key:
+        self._baseline_rows: Dict[Tuple[str, str], Dict[str, SQLRollingBaseline]] = {}
+        self._dirty_baselines: Dict[Tuple[str, str], Tuple[Optional[Metadata], Set[str]]] = {}
+        # latest composite metric (or its id) posted since last commit, per name and metadata set:
+        self._pending_latest: Dict[Tuple[str, str], Tuple[datetime.datetime, Union[SQLCompositeMetric, int]]] = {}
+        self._statements = 0
+
+    @staticmethod
+    def _upgrade(engine: sqlalchemy.engine.base.Engine) -> None:
+        """
+        Add the indexes of tables, and populate the tables derived from the history of metrics, of a database
+        created before they were introduced
+        """
+        with engine.begin() as connection:
+            for table in Base.metadata.sorted_tables:
+                for index in table.indexes:
+                    index.create(connection, checkfirst=True)
+            if connection.execute(select(SQLLatestComposite.composite_id).limit(1)).first() is None:
+                _index_latest(connection)
+            if connection.execute(select(SQLMetadataPosting.id).limit(1)).first() is None:
+                SQLMetricStore._index_metadata(connection)
+
+    @staticmethod
+    def _index_metadata(connection: sqlalchemy.engine.Connection) -> None:
+        """
+        Populate the metadata index from the metadata sets
+        """
+        association = SQLMetadataAssociationTable.c
+        connection.execute(SQLMetadataPosting.__table__.insert().from_select(
+            ['set_uuid', 'name', 'value'],
+            select(association.matadata_set_uuid, SQLMetadata.name, SQLMetadata.value).
+            join(SQLMetadata, SQLMetadata.id == association.metadata_id)))
+        # the types of values were not recorded, so values holding the text of an integer are taken as integers
+        numbers = []
+        for name, value in connection.execute(select(SQLMetadataPosting.name, SQLMetadataPosting.value).distinct()):
+            try:
+                number = SQLMetadataPosting.number_of(int(value))
+            except ValueError:
+                continue
+            if number is not None and str(number) == value:
+                numbers.append({'match_name': name, 'match_value': value, 'number': number})
+        if numbers:
+            postings = SQLMetadataPosting.__table__
+            connection.execute(postings.update().
+                               where(postings.c.name == bindparam('match_name'),
+                                     postings.c.value == bindparam('match_value')).
+                               values(number=bindparam('number')), numbers)
+
+    def _count_statement(self, *args) -> None:
+        self._statements += 1
+
+    def _statement_count(self) -> Optional[int]:
+        return self._statements
+
+    def instrument(self, sink: Optional[OperationSink]) -> None:
+        # statements are only counted while a sink is attached, as the listener adds overhead to every statement
+        if sink is not None and self._sink is None:
+            event.listen(self._engine, "before_cursor_execute", self._count_statement)
+        elif sink is None and self._sink is not None:
+            event.remove(self._engine, "before_cursor_execute", self._count_statement)
+        super().instrument(sink)
 
     def __enter__(self):
         """
-        configure session (binding to engine) and start SQL session
+        start SQL session, bound to the engine of this store (several stores may be in use at once, each on
+        its own engine)
 
         :return: self
         """
-        Session.configure(bind=self._engine)
-        self._session = Session()
+        self._session = Session(bind=self._engine)
+        if self._partitioning is not None:
+            self._load_partitions()
         return self
 
+    def _load_partitions(self) -> None:
+        """
+        Load the partitions of a store partitioned by time, as stored in the database
+        """
+        self._partitions = [_Partition(row.suffix, row.start, row.end) for row in
+                            self._session.execute(select(SQLPartition).order_by(SQLPartition.start)).scalars()]
+        self._next_id = None
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            super().__exit__(exc_type, exc_val, exc_tb)
+        finally:
+            # the connection is released to the pool from the thread it was used in, as SQLite requires
+            self._session.close()
+
+    def _tables(self, oldest: Optional[datetime.datetime] = None, newest: Optional[datetime.datetime] = None) \
+            -> List[Tuple[Table, Table]]:
+        """
+        :param oldest: if specified, only select the tables that may hold composite metrics from this date
+        :param newest: if specified, only select the tables that may hold composite metrics up to this date
+        :return: the tables of composite metrics, and of their values, to query for metrics within the given dates,
+           from oldest to newest (more than one only if partitioned by time)
+        """
+        if self._partitioning is None:
+            return [(SQLCompositeMetric.__table__, SQLMetric.__table__)]
+        # as the session would flush pending objects ahead of a query, so are rows posted since last commit inserted
+        self._save_rows()
+        return [(partition.composites, partition.values) for partition in self._partitions
+                if (oldest is None or partition.end > oldest) and (newest is None or partition.start <= newest)]
+
+    def _partition(self, timestamp: datetime.datetime) -> _Partition:
+        """
+        :return: the partition of the given timestamp, created (along with its tables) if new
+        """
+        suffix, start, end = _period(timestamp, self._partitioning)
+        for partition in self._partitions:
+            if partition.suffix == suffix:
+                return partition
+        partition = _Partition(suffix, start, end)
+        connection = self._session.connection()
+        partition.composites.create(connection, checkfirst=True)
+        partition.values.create(connection, checkfirst=True)
+        self._session.execute(SQLPartition.__table__.insert(), {'suffix': suffix, 'start': start, 'end': end})
+        self._partitions.append(partition)
+        self._partitions.sort(key=lambda item: item.start)
+        return partition
+
+    def _allocate_ids(self, count: int) -> int:
+        """
+        :param count: number of ids of composite metrics to allocate
+        :return: the first of the given number of consecutive ids allocated
+        """
+        if self._next_id is None:
+            self._next_id = max([self._session.execute(select(func.max(composites.c.id))).scalar() or 0
+                                 for composites, _ in self._tables()] + [0]) + 1
+        first = self._next_id
+        self._next_id += count
+        return first
+
+    def _add_rows(self, composite: Dict, values: List[Dict]) -> None:
+        """
+        Add a composite metric, and its values, to those to insert into its partition on commit
+        """
+        suffix, _, _ = _period(composite['timestamp'], self._partitioning)
+        composites, rows = self._pending_rows.setdefault(suffix, ([], []))
+        composites.append(composite)
+        rows.extend(values)
+
+    def _save_rows(self) -> None:
+        """
+        Insert the composite metrics, and their values, posted since last commit into their partitions
+        """
+        for composites, values in self._pending_rows.values():
+            partition = self._partition(composites[0]['timestamp'])
+            self._session.execute(partition.composites.insert(), composites)
+            if values:
+                self._session.execute(partition.values.insert(), values)
+        self._pending_rows.clear()
+
     class _BaseQuery(Query[MDC], ABC):
         """
-        Concrtete implementation of a SQL query interface
+        Concrtete implementation of a SQL query interface, executing a statement template (see `_template`) selecting
+        the values of the composite metrics of the query, from oldest to newest
         """
 
         def __init__(self, store: "SQLMetricStore", metric_name: str, max_count: Optional[int] = None):
             super().__init__(metric_name=metric_name, max_count=max_count)
+            self._store = store
             self._session = store._session
-            self._statement = self._session.query(SQLCompositeMetric).filter(SQLCompositeMetric.name == metric_name)
+            self._filters = _Filters()
+            self._filters.parameters.update(metric_name=metric_name, count=max_count)
             self._max_count = max_count
-            self._joined = False
+            self._statistics: Optional[QueryStatistics] = None
+
+        #: name of the operation reported to any instrumentation sink of the store
+        operation = "query"
+
+        def execute(self) -> QueryResult[MDC]:
+            with self._store._measure(self.operation) as measurement:
+                if self._collect_statistics:
+                    with _StatisticsCollector(self._store._engine, self._session) as statistics:
+                        self._statistics = statistics.statistics
+                        try:
+                            result = self._execute()
+                        finally:
+                            self._statistics = None
+                    result.stats = statistics.statistics
+                else:
+                    result = self._execute()
+                measurement.rows = len(result.timestamps)
+            return result
+
+        def explain(self) -> str:
+            # the plan of the statement of each table queried (one, unless partitioned by time)
+            lines = []
+            for composites, values in self._store._tables(self._filters.oldest, self._filters.newest):
+                lines += _plan(self._session, self._prepared(composites, values), self._filters.parameters)
+            return "\n".join(lines)
+
+        #: shape of the conditions on the names of values selected (see `_FieldQuery`)
+        _fields: Tuple[str, ...] = ()
+
+        def _prepared(self, composites: Table, values: Table) -> Executable:
+            """
+            :param composites: table of composite metrics to query
+            :param values: table of their values
+            :return: the statement template of the query, selecting rows of (composite id, timestamp, metadata uuid,
+               value name, value) from oldest to newest
+            """
+            shape = self._filters.shape, bool(self._max_count), self._fields
+            return _template(("values", composites.name) + shape, lambda: self._build(composites, values, *shape))
+
+        @staticmethod
+        def _build(composites: Table, values: Table, filters: Tuple, counted: bool, fields: Tuple[str, ...]) \
+                -> Executable:
+            """
+            :return: the statement template of queries of the given shape on the given tables
+            """
+            selection = select(composites.c.id, composites.c.timestamp, composites.c.metadata_id).\
+                where(composites.c.name == bindparam('metric_name'), *_Filters.conditions(filters, composites))
+            if counted:
+                # the maximum count applies to composite metrics rather than to rows of values, so the latest
+                # composite metrics are selected in a derived table (rather than in a subquery of ids, which
+                # MySQL does not allow to be limited)
+                selection = selection.order_by(desc(composites.c.timestamp)).limit(bindparam('count'))
+            selected = selection.subquery()
+            statement = select(selected.c.id, selected.c.timestamp, selected.c.metadata_id, values.c.name,
+                               values.c.value).join(values, values.c.parent_id == selected.c.id)
+            if fields:
+                statement = statement.where(or_(*[_FIELD_CONDITIONS[kind](values.c.name, bindparam(f"field_{index}"))
+                                                  for index, kind in enumerate(fields)]))
+            return statement.order_by(selected.c.timestamp, selected.c.id)
+
+        def _composites(self) -> Iterator[Tuple[datetime.datetime, Optional[Metadata], Dict[str, float]]]:
+            """
+            :return: timestamp, metadata and flattened values of each composite metric selected, from oldest to newest
+            """
+            rows = []
+            parameters = dict(self._filters.parameters)
+            # partitions are queried from newest, until as many composite metrics are found as requested
+            for composites, values in reversed(self._store._tables(self._filters.oldest, self._filters.newest)):
+                found = self._session.execute(self._prepared(composites, values), parameters).all()
+                rows[:0] = found
+                if self._max_count:
+                    parameters['count'] -= len({row.id for row in found})
+                    if parameters['count'] <= 0:
+                        break
+            if self._statistics is not None:
+                self._statistics.rows += len(rows)
+            metadata_sets = self._metadata_sets(row.metadata_id for row in rows)
+            composites: Dict[int, Tuple[datetime.datetime, Optional[str], Dict[str, float]]] = OrderedDict()
+            for composite_id, timestamp, uuid, name, value in rows:
+                if composite_id not in composites:
+                    composites[composite_id] = timestamp, uuid, {}
+                composites[composite_id][2][name] = value
+            # metadata sets are loaded afresh by each query, so are shared by its metrics of the same set
+            for timestamp, uuid, flattened in composites.values():
+                yield timestamp, metadata_sets[uuid], flattened
+
+        def _metadata_sets(self, uuids: Iterable[Optional[str]]) -> Dict[Optional[str], Optional[Metadata]]:
+            """
+            :param uuids: uuids of metadata sets of the metrics of a result (None for metrics without metadata)
+            :return: metadata set of each of the given uuids, loaded in bulk
+            """
+            uuids = set(uuids)
+            metadata_sets = self._store._load_metadata_sets(uuid for uuid in uuids if uuid is not None)
+            if self._statistics is not None:
+                self._statistics.rows += sum(len(metadata.values) for metadata in metadata_sets.values())
+            # an empty set of metadata has no entries in the metadata index
+            return {uuid: metadata_sets.get(uuid, Metadata({})) if uuid is not None else None for uuid in uuids}
+
+        @abstractmethod
+        def _execute(self) -> QueryResult[MDC]:
+            """
+            Execute the query (see `execute`)
+            """
 
         def filter_on_date(self, oldest: datetime.datetime, newest: datetime.datetime) \
                 -> Query[MDC]:
-            self._statement = self._statement.filter(
-                SQLCompositeMetric.timestamp >= oldest,
-                SQLCompositeMetric.timestamp <= newest
-            )
+            self._filters.on_date(oldest, newest)
             return self
 
         def filter_on_metadata(self, **kwds) -> "Query":
-            alias = aliased(SQLMetadata, name="metadata_1")
-            alias_set = aliased(SQLMetadataSet, name="metadata_set_1")
-            alias_set2 = aliased(SQLMetadataSet, name="metadata_set_2")
-            if not self._joined:
-                self._statement = self._statement.join(alias_set,
-                                                       alias_set.uuid == SQLCompositeMetric.metadata_id)
-                self._joined = True
             for name, value in kwds.items():
-                self._statement = self._statement.filter(
-                    self._session.query(SQLMetadataAssociationTable).join(
-                        alias,
-                        alias_set2).filter(
-                        SQLMetadataAssociationTable.columns.matadata_set_uuid == alias_set2.uuid).filter(
-                        SQLMetadataAssociationTable.columns.metadata_id == alias.id).filter(
-                        alias.name == name).filter(
-                        alias.value == value).exists()
-                )
+                self.filter_on_metadata_field(name, value, MetricStore.Comparison.EQUAL)
             return self
 
         def filter_on_metadata_field(self, name: str, value: int, op: MetricStore.Comparison):
-            alias = aliased(SQLMetadata, name='metadata_field_' + name)
-            alias_set = aliased(SQLMetadataSet, name="metadata_set_1")
-            if not self._joined:
-                self._statement = self._statement.join(alias_set,
-                                                       alias_set.uuid == SQLCompositeMetric.metadata_id)
-                self._joined = True
-            query = self._session.query(SQLMetadataAssociationTable).join(
-                    alias,
-                    SQLMetadataAssociationTable.columns.matadata_set_uuid == alias_set.uuid).filter(
-                    SQLMetadataAssociationTable.columns.metadata_id == alias.id)
-            if op == MetricStore.Comparison.EQUAL:
-                query = query.filter(alias.name == name, alias.value == value)
-            elif op == MetricStore.Comparison.NOT_EQUAL:
-                query = query.filter(alias.name == name, alias.value != value)
-            elif op == MetricStore.Comparison.LESS_THAN:
-                query = query.filter(alias.name == name, alias.value < value)
-            elif op == MetricStore.Comparison.GREATER_THAN:
-                query = query.filter(alias.name == name, alias.value > value)
-            elif op == MetricStore.Comparison.LESS_THAN_OR_EQUAL:
-                query = query.filter(alias.name == name, alias.value <= value)
-            elif op == MetricStore.Comparison.GREATER_THAN_OR_EQUAL:
-                query = query.filter(alias.name == name, alias.value >= value)
-            else:
-                raise ValueError(f"Invalid operations: {op}")
-            self._statement = self._statement.filter(query.exists())
+            self._filters.on_metadata(name, value, op)
             return self
 
     class _CompositeQuery(_BaseQuery[CompositeMetric]):
-        def execute(self) -> QueryResult[List[CompositeMetric]]:
-            # we order timestamps for query in descending order to filter out "the top" which are the newest items
-            self._statement = self._statement.order_by(desc(SQLCompositeMetric.timestamp))
-            if self._max_count:
-                self._statement = self._statement.limit(self._max_count)
-            sql_result: List[SQLCompositeMetric] = self._statement.all()
+        operation = "query.composite"
+
+        def _execute(self) -> QueryResult[List[CompositeMetric]]:
             result: QueryResult[List[Union[CompositeMetric, Metric]]] =\
                 QueryResult()
-            for item in reversed(sql_result):  # order timestamps from oldest to newest when returning to client
-                flattened: Dict[str, float] = {}
-                for child in item.children:
-                    flattened[child.name] = child.value
-                metadata = Metadata({data.name: data.value for data in item.metrics_metadata.data})
+            for timestamp, metadata, flattened in self._composites():
                 result.metadata.append(metadata)
-                result.timestamps.append(item.timestamp)
+                result.timestamps.append(timestamp)
                 result.metric_data.append(CompositeMetric.from_flattened(flattened))
             return result
 
@@ -248,20 +876,13 @@ class SQLMetricStore(MetricStore):
             super().__init__(store=store, metric_name=metric_name, max_count=max_count)
             self._type = typ
 
-        def execute(self) -> QueryResult[MetricDataClassT]:
-            # we order timestamps for query in descending order to filter out "the top" which are the newest items
-            self._statement = self._statement.order_by(desc(SQLCompositeMetric.timestamp))
-            if self._max_count:
-                self._statement = self._statement.limit(self._max_count)
-            sql_result: List[SQLCompositeMetric] = self._statement.all()
+        operation = "query.dataclass"
+
+        def _execute(self) -> QueryResult[MetricDataClassT]:
             result: QueryResult[MetricDataClassT] = QueryResult()
-            for item in reversed(sql_result):  # order timestamps from oldest to newest when returning to client
-                flattened: Dict[str, float] = {}
-                for child in item.children:
-                    flattened[child.name] = child.value
-                metadata = Metadata({data.name: data.value for data in item.metrics_metadata.data})
+            for timestamp, metadata, flattened in self._composites():
                 result.metadata.append(metadata)
-                result.timestamps.append(item.timestamp)
+                result.timestamps.append(timestamp)
                 result.metric_data.append(CompositeMetric.from_flattened(flattened).to_dataclass(self._type))
             return result
 
@@ -273,66 +894,25 @@ class SQLMetricStore(MetricStore):
         def __init__(self, store: "SQLMetricStore", metric_name: str, fields: Optional[List[str]] = None,
                      max_count: Optional[int] = None):
             super().__init__(store=store, metric_name=metric_name, max_count=max_count)
-            # override:
-            self._statement = self._session.query(SQLMetric.name, SQLMetric.value, SQLCompositeMetric.timestamp,
-                                                  SQLCompositeMetric.metadata_id, SQLCompositeMetric.id,
-                                                  ).join(
-                    SQLCompositeMetric,
-                    SQLCompositeMetric.id == SQLMetric.parent_id
-                ).filter(SQLCompositeMetric.name == metric_name)
-            if fields:
-                def condition(f: str):
-                    if any(['*' in f, '_' in f, '%' in f, '[' in f and ']' in f,  '^' in f]):
-                        if f.startswith('!'):
-                            return SQLMetric.name.notlike(f[1:])
-                        else:
-                            return SQLMetric.name.like(f)
+            kinds = []
+            for index, f in enumerate(fields or []):
+                if any(['*' in f, '_' in f, '%' in f, '[' in f and ']' in f,  '^' in f]):
+                    if f.startswith('!'):
+                        kind, f = 'not like', f[1:]
                     else:
-                        return SQLMetric.name == f
-                queries = [condition(field) for field in fields]
-                self._statement = self._statement.filter(or_(*queries))
-            self._metadata_filter = {}
-
-        def execute(self) -> QueryResult[Dict[str, List[float]]]:
-            self._statement = self._statement.order_by(desc(SQLCompositeMetric.timestamp))
-            if self._max_count:
-                query = self._session.query(SQLCompositeMetric.id).order_by(desc(SQLCompositeMetric.timestamp)).\
-                    limit(self._max_count)
-                self._statement = self._statement.filter(SQLCompositeMetric.id.in_([r.id for r in query.all()]))  # MySQL forces the .all()
-            sql_result: List[SQLCompositeMetric] = self._statement.all()
+                        kind = 'like'
+                else:
+                    kind = 'equal'
+                kinds.append(kind)
+                self._filters.parameters[f"field_{index}"] = f
+            self._fields = tuple(kinds)
+
+        operation = "query.fields"
+
+        def _execute(self) -> QueryResult[Dict[str, List[float]]]:
             result: QueryResult[Dict[str, List[float]]] = QueryResult()
             result.metric_data = {}  # correction on default type/value
-            by_id = OrderedDict()
-            for name, value, timestamp, uuid, group_id in reversed(sql_result):
-                alias = aliased(SQLMetadata, name='metadata_field_' + name)
-                if group_id not in by_id:
-                    query = self._session.query(SQLMetadataSet).filter(SQLMetadataSet.uuid == uuid)
-                    for metadata_name, (metadata_value, op) in self._metadata_filter.items():
-                        if op == MetricStore.Comparison.EQUAL:
-                            query = query.filter(alias.name == metadata_name, alias.value == metadata_value)
-                        elif op == MetricStore.Comparison.NOT_EQUAL:
-                            query = query.filter(alias.name == metadata_name, alias.value != metadata_value)
-                        elif op == MetricStore.Comparison.LESS_THAN:
-                            query = query.filter(alias.name == metadata_name, alias.value < metadata_value)
-                        elif op == MetricStore.Comparison.GREATER_THAN:
-                            query = query.filter(alias.name == metadata_name, alias.value > metadata_value)
-                        elif op == MetricStore.Comparison.LESS_THAN_OR_EQUAL:
-                            query = query.filter(alias.name == metadata_name, alias.value <= metadata_value)
-                        elif op == MetricStore.Comparison.GREATER_THAN_OR_EQUAL:
-                            query = query.filter(alias.name == metadata_name, alias.value >= metadata_value)
-                        else:
-                            raise ValueError(f"Invalid operations: {op}")
-                    try:
-                        sql_metadata = query.one()
-                        metadata = Metadata({})
-                        for r in sql_metadata.data:
-                            metadata.values[r.name] = r.value
-                        by_id[group_id] = timestamp, metadata, {name: value}
-                    except NoResultFound:
-                        pass
-                else:
-                    by_id[group_id][2][name] = value
-            for (timestamp, metadata, metrics_table) in by_id.values():
+            for timestamp, metadata, metrics_table in self._composites():
                 result.timestamps.append(timestamp)
                 result.metadata.append(metadata)
                 for name, value in metrics_table.items():
@@ -341,14 +921,135 @@ class SQLMetricStore(MetricStore):
 
             return result
 
-        def filter_on_metadata(self, **kwds) -> "Query":
-            self._metadata_filter.update({name: (value, MetricStore.Comparison.EQUAL) for name, value in kwds.items()})
+    class _MultiQuery(MultiQuery):
+        """
+        SQL implementation of a query of several metric names, selecting the composite metrics of all names along
+        with their values in one statement, and loading their metadata in bulk
+        """
+
+        def __init__(self, store: "SQLMetricStore", metric_names: Iterable[str], max_count: Optional[int] = None):
+            super().__init__(store=store, metric_names=metric_names, max_count=max_count)
+            self._filters = _Filters()
+            self._filters.parameters.update(metric_names=self._metric_names, count=max_count)
+
+        def filter_on_date(self, oldest: datetime.datetime, newest: datetime.datetime) -> MultiQuery:
+            self._filters.on_date(oldest, newest)
             return self
 
-        def filter_on_metadata_field(self, name: str, value: int, op: MetricStore.Comparison):
-            self._metadata_filter.update({name: (value, op)})
+        def filter_on_metadata(self, **kwds) -> MultiQuery:
+            for name, value in kwds.items():
+                self.filter_on_metadata_field(name, value, MetricStore.Comparison.EQUAL)
             return self
 
+        def filter_on_metadata_field(self, name: str, value: Union[str, int], op: MetricStore.Comparison) \
+                -> MultiQuery:
+            self._filters.on_metadata(name, value, op)
+            return self
+
+        def _prepared(self, composites: Table, values: Table) -> Executable:
+            """
+            :param composites: table of composite metrics to query
+            :param values: table of their values
+            :return: the statement template selecting the values of the composite metrics of all names, from oldest
+               to newest
+            """
+            shape = self._filters.shape, bool(self._count)
+            return _template(("multi", composites.name) + shape, lambda: self._build(composites, values, *shape))
+
+        @staticmethod
+        def _build(composites: Table, values: Table, filters: Tuple, counted: bool) -> Executable:
+            """
+            :return: the statement template of multi queries of the given shape on the given tables
+            """
+            selection = select(composites.c.id, composites.c.name, composites.c.timestamp, composites.c.metadata_id).\
+                where(composites.c.name.in_(bindparam('metric_names', expanding=True)),
+                      *_Filters.conditions(filters, composites))
+            if counted:
+                # the maximum count applies per name, so composite metrics are ranked from newest within each name
+                selection = selection.add_columns(
+                    func.row_number().over(partition_by=composites.c.name,
+                                           order_by=desc(composites.c.timestamp)).label('position'))
+            selected = selection.subquery()
+            statement = select(selected.c.id, selected.c.name, selected.c.timestamp, selected.c.metadata_id,
+                               values.c.name, values.c.value).\
+                join(values, values.c.parent_id == selected.c.id)
+            if counted:
+                statement = statement.where(selected.c.position <= bindparam('count'))
+            return statement.order_by(selected.c.timestamp, selected.c.id)
+
+        def execute(self) -> Dict[str, QueryResult[List[CompositeMetric]]]:
+            store: SQLMetricStore = self._store
+            with store._measure("query.multi") as measurement:
+                if self._collect_statistics:
+                    with _StatisticsCollector(store._engine, store._session) as statistics:
+                        results = self._execute(statistics.statistics)
+                    for result in results.values():
+                        result.stats = statistics.statistics
+                else:
+                    results = self._execute(None)
+                measurement.rows = sum(len(result.timestamps) for result in results.values())
+            return results
+
+        def _execute(self, statistics: Optional[QueryStatistics]) -> Dict[str, QueryResult[List[CompositeMetric]]]:
+            results: Dict[str, QueryResult[List[CompositeMetric]]] = {name: QueryResult()
+                                                                      for name in self._metric_names}
+            if not self._metric_names:
+                return results
+            rows = []
+            parameters = dict(self._filters.parameters)
+            remaining = {metric_name: self._count for metric_name in self._metric_names}
+            # partitions are queried from newest, for the names of which fewer composite metrics are found than
+            # requested (up to the largest number remaining of any)
+            for composites, values in reversed(self._store._tables(self._filters.oldest, self._filters.newest)):
+                if self._count:
+                    metric_names = [metric_name for metric_name, count in remaining.items() if count > 0]
+                    if not metric_names:
+                        break
+                    parameters.update(metric_names=metric_names, count=max(remaining.values()))
+                found = self._store._session.execute(self._prepared(composites, values), parameters).all()
+                if self._count:
+                    found = self._trimmed(found, remaining)
+                rows[:0] = found
+            metadata_sets = self._store._load_metadata_sets({row[3] for row in rows if row[3] is not None})
+            if statistics is not None:
+                statistics.rows += len(rows) + sum(len(metadata.values) for metadata in metadata_sets.values())
+            composites: Dict[int, Tuple[str, datetime.datetime, Optional[str], Dict[str, float]]] = OrderedDict()
+            for composite_id, metric_name, timestamp, uuid, key, value in rows:
+                if composite_id not in composites:
+                    composites[composite_id] = metric_name, timestamp, uuid, {}
+                composites[composite_id][3][key] = value
+            for metric_name, timestamp, uuid, flattened in composites.values():
+                result = results[metric_name]
+                result.timestamps.append(timestamp)
+                if uuid is not None and uuid not in metadata_sets:
+                    # an empty set of metadata has no entries in the metadata index
+                    metadata_sets[uuid] = Metadata({})
+                result.metadata.append(metadata_sets.get(uuid))
+                result.metric_data.append(CompositeMetric.from_flattened(flattened))
+            return results
+
+        @staticmethod
+        def _trimmed(rows: List, remaining: Dict[str, int]) -> List:
+            """
+            :param rows: rows of values of composite metrics, from oldest to newest
+            :param remaining: number of composite metrics yet to be found per name, updated for those kept
+            :return: the rows of the latest composite metrics of each name, up to the number remaining
+            """
+            ids: Dict[str, List[int]] = {}
+            for row in rows:
+                composite_ids = ids.setdefault(row[1], [])
+                if not composite_ids or composite_ids[-1] != row[0]:
+                    composite_ids.append(row[0])
+            kept: Set[int] = set()
+            for metric_name, composite_ids in ids.items():
+                composite_ids = composite_ids[-remaining[metric_name]:]
+                remaining[metric_name] -= len(composite_ids)
+                kept.update(composite_ids)
+            return [row for row in rows if row[0] in kept]
+
+    def start_multi_query(self, metric_names: Iterable[str], max_results: Optional[int] = None) -> _MultiQuery:
+        return SQLMetricStore._MultiQuery(store=self, metric_names=metric_names, max_count=max_results)
+
     def start_query(self, metric_name: str, max_results: Optional[int] = None) -> _CompositeQuery:
         query = SQLMetricStore._CompositeQuery(store=self, metric_name=metric_name, max_count=max_results)
         return query
@@ -371,6 +1072,23 @@ class SQLMetricStore(MetricStore):
             m.update(f"{name} : {value}".encode('utf-8'))
         return m.digest().hex()
 
+    def _load_metadata_sets(self, uuids: Iterable[str]) -> Dict[str, Metadata]:
+        """
+        :param uuids: uuids of metadata sets
+        :return: the metadata sets of the given uuids, loaded from the metadata index in as few statements as
+           the database allows parameters for
+        """
+        uuids = list(uuids)
+        metadata_sets: Dict[str, Metadata] = {}
+        statement = _template(("metadata_sets",), lambda: select(
+            SQLMetadataPosting.set_uuid, SQLMetadataPosting.name, SQLMetadataPosting.value, SQLMetadataPosting.number).
+            where(SQLMetadataPosting.set_uuid.in_(bindparam('uuids', expanding=True))))
+        for start in range(0, len(uuids), self.MAX_PARAMETERS):
+            for uuid, name, value, number in self._session.execute(
+                    statement, {'uuids': uuids[start: start + self.MAX_PARAMETERS]}):
+                metadata_sets.setdefault(uuid, Metadata({})).values[name] = number if number is not None else value
+        return metadata_sets
+
     def _post_metadata(self, metadata_set: Metadata) -> SQLMetadataSet:
         """
         Private method to post a set of metadata
@@ -378,79 +1096,175 @@ class SQLMetricStore(MetricStore):
 
         :return: The SQLMetdataSet object created after successful entry into database
         """
-        # derive a unique hash value across all name/value pairs
-        uuid = self._uuid(metadata_set.values)
-        existing = self._session.query(SQLMetadataSet).filter(SQLMetadataSet.uuid == uuid).scalar()
-        if existing is not None:
-            # if uuid exists in database, we are done
-            # Todo: probably should query for key/value pairs on existing id o ensure no collisions(?)
-            return existing
-
-        names = list(metadata_set.values.keys())
-        existing = self._session.query(SQLMetadata).filter(SQLMetadata.name.in_(names)).all()
-        existing_name_values = [(item.name, item.value) for item in existing]
-        sql_metadata_set = SQLMetadataSet(uuid=uuid)
-        self._session.add(sql_metadata_set)
-        for name, value in metadata_set.values.items():
-            if type(value) not in [str, int]:
-                raise ValueError(f"Invalid type for metadata named {name} with type {type(value).__name__}")
-            type_enum = {str: Metadata.Types.STRING,
-                         int: Metadata.Types.INTEGER}[type(value)]
-            if (name, value) not in existing_name_values:
-                metadata = SQLMetadata(name=name, value=str(value), typ=type_enum)
+        with self._measure("post_metadata") as measurement:
+            measurement.rows = len(metadata_set.values)
+            # derive a unique hash value across all name/value pairs
+            uuid = self._uuid(metadata_set.values)
+            existing = self._session.query(SQLMetadataSet).filter(SQLMetadataSet.uuid == uuid).scalar()
+            if existing is not None:
+                # if uuid exists in database, we are done
+                # Todo: probably should query for key/value pairs on existing id o ensure no collisions(?)
+                return existing
+
+            # looked up by name and value (rather than by name alone, which matches every set of high-cardinality
+            # metadata such as build numbers)
+            existing = self._session.query(SQLMetadata).filter(or_(*[
+                and_(SQLMetadata.name == name, SQLMetadata.value == str(value))
+                for name, value in metadata_set.values.items()])).all()
+            # name/value pairs are unique across sets, so pairs already stored are shared with the new set
+            existing_name_values = {(item.name, item.value): item for item in existing}
+            sql_metadata_set = SQLMetadataSet(uuid=uuid)
+            self._session.add(sql_metadata_set)
+            for name, value in metadata_set.values.items():
+                if type(value) not in [str, int]:
+                    raise ValueError(f"Invalid type for metadata named {name} with type {type(value).__name__}")
+                type_enum = {str: Metadata.Types.STRING,
+                             int: Metadata.Types.INTEGER}[type(value)]
+                metadata = existing_name_values.get((name, str(value)))
+                if metadata is None:
+                    metadata = SQLMetadata(name=name, value=str(value), typ=type_enum)
                 sql_metadata_set.data.append(metadata)
-        self._session.commit()
-        return sql_metadata_set
+                sql_metadata_set.postings.append(SQLMetadataPosting(name=name, value=str(value),
+                                                                    number=SQLMetadataPosting.number_of(value)))
+            # flushed for later lookups in the session, and committed along with the metrics referring to the set
+            self._session.flush()
+            return sql_metadata_set
 
     def _purge_orphaned_metadatsets(self) -> None:
         """
         purge any metadata sets not referenced by a composit metric
         """
-        orphaned = self._session.query(SQLMetadataSet).filter(~ exists().where(
-            SQLMetadataSet.uuid == SQLCompositeMetric.metadata_id
-        )).all()
+        orphaned = self._session.query(SQLMetadataSet).filter(*[~ exists().where(
+            SQLMetadataSet.uuid == composites.c.metadata_id
+        ) for composites, _ in self._tables()]).all()
         for orphan in orphaned:
             self._session.delete(orphan)
+        self._purge_orphaned_metadata()
+
+    def _purge_orphaned_metadata(self) -> None:
+        """
+        purge any name/value pairs of metadata no longer part of a metadata set, once orphaned sets are deleted
+        """
+        # the associations of the sets deleted are deleted on flush
+        self._session.flush()
+        self._session.query(SQLMetadata).filter(~ exists().where(
+            SQLMetadataAssociationTable.c.metadata_id == SQLMetadata.id
+        )).delete(synchronize_session=False)
+
+    def _purge(self, statement: sqlalchemy.orm.Query) -> None:
+        """
+        Delete the composite metrics selected by the given statement, along with their entries in the table of
+        latest composite metrics.  As purges delete the oldest metrics, a latest composite metric is only deleted
+        along with all others of its name and metadata set, so none needs replacing
+
+        :param statement: statement selecting composite metrics to delete
+        """
+        self._session.query(SQLLatestComposite).filter(
+            SQLLatestComposite.composite_id.in_(statement.with_entities(SQLCompositeMetric.id))).\
+            delete(synchronize_session=False)
+        statement.delete()
+
+    def _purge_partitions(self, before: datetime.datetime, name: Optional[str], inclusive: bool = False) -> int:
+        """
+        Purge the composite metrics of a time-partitioned store older than the given date: whole partitions are
+        dropped where they only hold metrics to purge, and rows are deleted from the others.  As with `_purge`, the
+        entries of the latest composite metrics purged are deleted
+
+        :param before: date before which to purge metrics
+        :param name: if specified, only purge the metrics of this name
+        :param inclusive: whether to also purge metrics of the given date
+        :return: number of composite metrics deleted row by row (those of partitions dropped are not counted)
+        """
+        rows = 0
+        for partition in [partition for partition in self._partitions if partition.start <= before]:
+            if name is None and partition.end <= before:
+                partition.values.drop(self._session.connection())
+                partition.composites.drop(self._session.connection())
+                self._session.execute(delete(SQLPartition).where(SQLPartition.suffix == partition.suffix))
+                self._partitions.remove(partition)
+                continue
+            composites = partition.composites
+            conditions = [composites.c.timestamp <= before if inclusive else composites.c.timestamp < before]
+            if name is not None:
+                conditions.append(composites.c.name == name)
+            selected = select(composites.c.id).where(*conditions)
+            self._session.execute(delete(partition.values).where(partition.values.c.parent_id.in_(selected)))
+            rows += self._session.execute(delete(composites).where(*conditions)).rowcount
+        conditions = [SQLLatestComposite.timestamp <= before if inclusive else SQLLatestComposite.timestamp < before]
+        if name is not None:
+            conditions.append(SQLLatestComposite.metric_name == name)
+        self._session.execute(delete(SQLLatestComposite).where(*conditions))
+        return rows
 
     def purge_by_date(self, before: datetime.datetime, name: Optional[str] = None) -> None:
+        """
+        Purge metrics older than the given date (see `MetricStore.purge_by_date`).  If partitioned by time, the
+        partitions of periods ending by that date are dropped whole when purging metrics of all names
+        """
         if not self._session:
             raise RuntimeError("Not in context of data store.  please use 'with' statement")
-        statement = self._session.query(SQLCompositeMetric)
-        if self._filters:
-            statement.join(SQLCompositeMetric.metadata_id).join(SQLMetadata.parent_id)
-        if name is None:
-            statement.filter(SQLCompositeMetric.timestamp < before)
-        else:
-            statement = self._session.query(SQLCompositeMetric).filter(SQLCompositeMetric.timestamp < before,
-                                                                       SQLCompositeMetric.name == name)
-        for item in statement.all():
-            item.children.clear()
-            item.metrics_metadata = None
-        self._session.commit()
-        statement.delete()
-        self._purge_orphaned_metadatsets()
-        self._session.commit()
+        # metrics posted since last commit are committed along with the purge:
+        self._save_rows()
+        self._save_latest()
+        with self._measure("purge_by_date") as measurement:
+            if self._partitioning is not None:
+                measurement.rows = self._purge_partitions(before, name)
+                self._purge_orphaned_metadatsets()
+                self._session.commit()
+                return
+            statement = self._session.query(SQLCompositeMetric).filter(SQLCompositeMetric.timestamp < before)
+            if name is not None:
+                statement = statement.filter(SQLCompositeMetric.name == name)
+            items = statement.all()
+            for item in items:
+                item.children.clear()
+                item.metrics_metadata = None
+            measurement.rows = len(items)
+            self._session.commit()
+            self._purge(statement)
+            self._purge_orphaned_metadatsets()
+            self._session.commit()
 
     def purge_by_volume(self, count_: int, name: str) -> None:
         if not self._session:
             raise RuntimeError("Not in context of data store.  please use 'with' statement")
-        try:
-            purge_date = self._session.query(SQLCompositeMetric.timestamp).filter(SQLCompositeMetric.name == name).\
-                order_by(SQLCompositeMetric.timestamp).limit(count_).all()[-1]
-        except IndexError:
-            return
-        statement = self._session.query(SQLCompositeMetric)
-        if self._filters:
-            statement = statement.join(SQLCompositeMetric.metadata_id)
-        statement = statement.filter(SQLCompositeMetric.name == name,
-                                     SQLCompositeMetric.timestamp <= purge_date[0])
-        for item in statement.all():
-            item.children.clear()
-            item.metrics_metadata = None
-        self._session.commit()
-        statement.delete()
-        self._purge_orphaned_metadatsets()
-        self._session.commit()
+        self._save_rows()
+        self._save_latest()
+        with self._measure("purge_by_volume") as measurement:
+            if self._partitioning is not None:
+                # the date of the oldest metrics to keep is found from the oldest partition
+                timestamps = []
+                for composites, _ in self._tables():
+                    timestamps += self._session.execute(
+                        select(composites.c.timestamp).where(composites.c.name == name).
+                        order_by(composites.c.timestamp).limit(count_ - len(timestamps))).scalars().all()
+                    if len(timestamps) == count_:
+                        break
+                if not timestamps:
+                    return
+                measurement.rows = self._purge_partitions(timestamps[-1], name, inclusive=True)
+                self._purge_orphaned_metadatsets()
+                self._session.commit()
+                return
+            try:
+                purge_date = self._session.query(SQLCompositeMetric.timestamp).filter(SQLCompositeMetric.name == name).\
+                    order_by(SQLCompositeMetric.timestamp).limit(count_).all()[-1]
+            except IndexError:
+                return
+            statement = self._session.query(SQLCompositeMetric)
+            if self._filters:
+                statement = statement.join(SQLCompositeMetric.metadata_id)
+            statement = statement.filter(SQLCompositeMetric.name == name,
+                                         SQLCompositeMetric.timestamp <= purge_date[0])
+            items = statement.all()
+            for item in items:
+                item.children.clear()
+                item.metrics_metadata = None
+            measurement.rows = len(items)
+            self._session.commit()
+            self._purge(statement)
+            self._purge_orphaned_metadatsets()
+            self._session.commit()
 
     def post(self,
              metric: Union[Metric, CompositeMetric],
@@ -461,27 +1275,360 @@ class SQLMetricStore(MetricStore):
         timestamp = timestamp or datetime.datetime.utcnow()
         if not self._session:
             raise RuntimeError("Not in context of data store.  please use 'with' statement")
-        metadata_set: Optional[SQLMetadataSet] = None
-        if metadata:
-            metadata_set = self._post_metadata(metadata)
-        key_values = metric.flatten()
-        metrics = []
-        for key, value in key_values.items():
-            metrics.append(SQLMetric(name=key, value=str(value)))
-        metric_item = SQLCompositeMetric(name=metric.name,
-                                         children=metrics,
-                                         timestamp=timestamp,
-                                         project=project_name,
-                                         uuid=uuid,
-                                         metrics_metadata=metadata_set,
-                                         metadata_id=metadata_set.uuid if metadata_set.uuid else None)
-        self._session.add(metric_item)
+        with self._measure("post") as measurement:
+            metadata_set: Optional[SQLMetadataSet] = None
+            if metadata:
+                metadata_set = self._post_metadata(metadata)
+            key_values = metric.flatten()
+            if self._partitioning is not None:
+                # inserted into the table of its partition on commit
+                composite_id = self._allocate_ids(1)
+                self._add_rows({'id': composite_id, 'name': metric.name, 'timestamp': timestamp,
+                                'project': project_name, 'uuid': uuid,
+                                'metadata_id': metadata_set.uuid if metadata_set else None},
+                               [{'name': key, 'value': value, 'parent_id': composite_id}
+                                for key, value in key_values.items()])
+                self._track_latest(metric.name, metadata_set.uuid if metadata_set else None, timestamp, composite_id)
+            else:
+                metrics = []
+                for key, value in key_values.items():
+                    metrics.append(SQLMetric(name=key, value=str(value)))
+                metric_item = SQLCompositeMetric(name=metric.name,
+                                                 children=metrics,
+                                                 timestamp=timestamp,
+                                                 project=project_name,
+                                                 uuid=uuid,
+                                                 metrics_metadata=metadata_set,
+                                                 metadata_id=metadata_set.uuid if metadata_set else None)
+                self._session.add(metric_item)
+                self._track_latest(metric.name, metric_item.metadata_id, timestamp, metric_item)
+            measurement.rows = len(key_values)
+            if self._baselines is not None:
+                self._update_baseline(metric, metadata)
 
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        try:
-            super().__exit__(exc_type, exc_val, exc_tb)
-        finally:
-            self.__class__.singleton = None
+    def post_batch(self, metric_name: str, batch: FieldBatch, project_name: Optional[str] = None) -> None:
+        """
+        Post a batch of metrics through bulk inserts of composite metrics and their values, rather than through
+        ORM objects (into the tables of their partitions on commit, if partitioned by time).  Ids of the composite
+        metrics are generated by the database, except in a store partitioned by time, where they are allocated from
+        the largest id across partitions, so that no other process may post metrics to it at the same time.  With
+        rolling baselines maintained, metrics are posted one by one
+        """
+        if not self._session:
+            raise RuntimeError("Not in context of data store.  please use 'with' statement")
+        if self._baselines is not None:
+            super().post_batch(metric_name, batch, project_name=project_name)
+            return
+        with self._measure("post_batch") as measurement:
+            # metrics without any value are skipped, as they could not be restored on query:
+            present: Set[int] = set()
+            for key, column in batch.values.items():
+                if not key.startswith(f"/{metric_name}#") and not key.startswith(f"/{metric_name}/") \
+                        and key != metric_name:
+                    raise ValueError(f"Key-path {key} of batch is not of metric {metric_name}")
+                present.update(index for index, value in enumerate(column) if not math.isnan(value))
+            uuids: Dict[Tuple, str] = {}
+            for index in present:
+                metadata = batch.metadata[index]
+                if metadata:
+                    identity = tuple(sorted(metadata.values.items()))
+                    if identity not in uuids:
+                        uuids[identity] = self._post_metadata(metadata).uuid
+            rows = sorted(present)
+            composites = []
+            for index in rows:
+                metadata = batch.metadata[index]
+                composites.append({'name': metric_name, 'timestamp': batch.timestamps[index],
+                                   'project': project_name, 'uuid': None,
+                                   'metadata_id': uuids[tuple(sorted(metadata.values.items()))] if metadata else None})
+            if not composites:
+                measurement.rows = 0
+                return
+            if self._partitioning is not None:
+                next_id = self._allocate_ids(len(composites))
+                for offset, composite in enumerate(composites):
+                    composite['id'] = next_id + offset
+            else:
+                for composite, composite_id in zip(composites, self._insert_composites(composites)):
+                    composite['id'] = composite_id
+            ids: Dict[int, int] = {}
+            for index, composite in zip(rows, composites):
+                ids[index] = composite['id']
+                self._track_latest(metric_name, composite['metadata_id'], composite['timestamp'], composite['id'])
+            values = [{'name': key, 'value': value, 'parent_id': ids[index]}
+                      for key, column in batch.values.items()
+                      for index, value in enumerate(column) if not math.isnan(value)]
+            measurement.rows = len(values)
+            if self._partitioning is not None:
+                by_parent: Dict[int, List[Dict]] = {}
+                for row in values:
+                    by_parent.setdefault(row['parent_id'], []).append(row)
+                for composite in composites:
+                    self._add_rows(composite, by_parent[composite['id']])
+                return
+            self._session.execute(SQLMetric.__table__.insert(), values)
+
+    def _insert_composites(self, composites: List[Dict]) -> List[int]:
+        """
+        Insert rows of composite metrics into the (unpartitioned) table of composite metrics, with ids generated by
+        the database so that other writers may post at the same time
+
+        :param composites: rows to insert, without ids
+        :return: the ids of the rows inserted, in order
+        """
+        table = SQLCompositeMetric.__table__
+        if getattr(self._engine.dialect, 'insert_executemany_returning', False):
+            return [row.id for row in self._session.execute(table.insert().returning(table.c.id), composites)]
+        # the keys generated by an insert of many rows are not reported by other databases, so rows are inserted one
+        # by one (through the connection, avoiding the overhead of the session on each)
+        connection = self._session.connection()
+        statement = table.insert()
+        return [connection.execute(statement, composite).inserted_primary_key[0] for composite in composites]
+
+    def field_batches(self, metric_name: str, fields: Optional[Iterable[str]] = None,
+                      oldest: Optional[datetime.datetime] = None, newest: Optional[datetime.datetime] = None,
+                      batch_size: int = 10000) -> Iterator[FieldBatch]:
+        """
+        Stream the history of a metric in columnar batches (see `MetricStore.field_batches`), fetching rows of
+        values from the database incrementally, without materializing ORM objects
+        """
+        if not self._session:
+            raise RuntimeError("Not in context of data store.  please use 'with' statement")
+        if batch_size <= 0:
+            raise ValueError("Batch size must be positive")
+        tables = self._tables(oldest, newest)
+
+        def conditions(composites: Table) -> List:
+            selected = [composites.c.name == metric_name]
+            if oldest is not None:
+                selected.append(composites.c.timestamp >= oldest)
+            if newest is not None:
+                selected.append(composites.c.timestamp <= newest)
+            return selected
+
+        matches = field_matcher(fields) if fields else None
+        keys = sorted({key for composites, values in tables for key in self._session.execute(
+            select(values.c.name).distinct().join(composites, composites.c.id == values.c.parent_id).
+            where(*conditions(composites))).scalars() if matches is None or matches(key)})
+        if not keys:
+            return
+        # metadata sets are few compared to metrics, so are all loaded up front:
+        metadata_sets: Dict[str, Metadata] = {}
+        for composites, _ in tables:
+            statement = select(SQLMetadataPosting.set_uuid, SQLMetadataPosting.name, SQLMetadataPosting.value,
+                               SQLMetadataPosting.number).\
+                where(SQLMetadataPosting.set_uuid.in_(select(composites.c.metadata_id).distinct().
+                                                      where(*conditions(composites))))
+            for uuid, name, value, number in self._session.execute(statement):
+                metadata_sets.setdefault(uuid, Metadata({})).values[name] = number if number is not None else value
+        metadata_names = sorted({name for metadata in metadata_sets.values() for name in metadata.values})
+
+        def rows() -> Iterator[Tuple]:
+            # partitions hold consecutive periods of time, so are read one after the other from oldest
+            for composites, values in tables:
+                statement = select(composites.c.id, composites.c.timestamp, composites.c.metadata_id, values.c.name,
+                                   values.c.value).\
+                    join(values, values.c.parent_id == composites.c.id).where(*conditions(composites)).\
+                    order_by(composites.c.timestamp, composites.c.id)
+                if matches is not None:
+                    statement = statement.where(values.c.name.in_(keys))
+                yield from self._session.execute(statement.execution_options(yield_per=batch_size))
+
+        nan = math.nan
+        batch = FieldBatch(values={key: [] for key in keys}, metadata_names=metadata_names)
+        current_id = None
+        row: Dict[str, float] = {}
+        for composite_id, timestamp, metadata_id, key, value in rows():
+            if composite_id != current_id:
+                if current_id is not None:
+                    for name, column in batch.values.items():
+                        column.append(row.get(name, nan))
+                    if len(batch) == batch_size:
+                        yield batch
+                        batch = FieldBatch(values={key: [] for key in keys}, metadata_names=metadata_names)
+                current_id = composite_id
+                row = {}
+                batch.timestamps.append(timestamp)
+                batch.metadata.append(metadata_sets[metadata_id] if metadata_id is not None else None)
+            row[key] = value
+        if current_id is not None:
+            for name, column in batch.values.items():
+                column.append(row.get(name, nan))
+            yield batch
+
+    def _load_baseline(self, metric_name: str, metadata: Optional[Metadata]) -> Dict[str, RollingWindow]:
+        """
+        Load the rolling baseline of the given metric and metadata into the cache if not already there.  If never
+        stored, the baseline is seeded (once) from the latest values in the store.
+
+        :param metric_name: name of metric
+        :param metadata: metadata of the metrics of the baseline
+        :return: the baseline of the metric
+        """
+        if self._baselines.cached(metric_name, metadata):
+            return self._baselines.baseline(metric_name, metadata)
+        metadata_key = BaselineCache.metadata_key(metadata)
+        rows = self._session.query(SQLRollingBaseline).filter(SQLRollingBaseline.metric_name == metric_name,
+                                                              SQLRollingBaseline.metadata_key == metadata_key).all()
+        self._baseline_rows[(metric_name, metadata_key)] = {row.name: row for row in rows}
+        if rows:
+            return self._baselines.load(metric_name, {row.name: json.loads(row.window) for row in rows}, metadata)
+        history = self._baseline_history(metric_name, metadata, self._baselines.window)
+        self._dirty_baselines.setdefault((metric_name, metadata_key), (metadata, set()))[1].update(history)
+        return self._baselines.load(metric_name, history, metadata)
+
+    def _update_baseline(self, metric: Union[Metric, CompositeMetric], metadata: Optional[Metadata]) -> None:
+        """
+        Add the values of a posted metric to the rolling baseline of its name and metadata
+        """
+        self._load_baseline(metric.name, metadata)
+        keys = self._baselines.update(metric, metadata)
+        self._dirty_baselines.setdefault((metric.name, BaselineCache.metadata_key(metadata)),
+                                         (metadata, set()))[1].update(keys)
+
+    def _save_baselines(self) -> None:
+        """
+        Add any changes to the rolling baselines since last commit to the session
+        """
+        for (metric_name, metadata_key), (metadata, keys) in self._dirty_baselines.items():
+            rows = self._baseline_rows[(metric_name, metadata_key)]
+            baseline = self._baselines.baseline(metric_name, metadata)
+            for key in keys:
+                row = rows.get(key)
+                if row is None:
+                    row = rows[key] = SQLRollingBaseline(metric_name=metric_name, metadata_key=metadata_key, name=key)
+                    self._session.add(row)
+                row.window = json.dumps(baseline[key].values)
+        self._dirty_baselines.clear()
+
+    def _track_latest(self, metric_name: str, set_uuid: Optional[str], timestamp: datetime.datetime,
+                      composite: Union[SQLCompositeMetric, int]) -> None:
+        """
+        Record a posted composite metric as the latest of its name and metadata set if newer than any other posted
+        since last commit (the table of latest composite metrics is updated on commit)
+
+        :param metric_name: name of the composite metric
+        :param set_uuid: uuid of its metadata set, if any
+        :param timestamp: timestamp of the composite metric
+        :param composite: the composite metric, or its id
+        """
+        key = (metric_name, set_uuid or SQLLatestComposite.NO_METADATA)
+        pending = self._pending_latest.get(key)
+        if pending is None or pending[0] <= timestamp:
+            self._pending_latest[key] = timestamp, composite
+
+    def _save_latest(self) -> None:
+        """
+        Add any changes to the latest composite metrics since last commit to the session
+        """
+        if not self._pending_latest:
+            return
+        # composite metrics posted individually are assigned their ids on flush
+        self._session.flush()
+        by_name: Dict[str, List[str]] = {}
+        for metric_name, set_uuid in self._pending_latest:
+            by_name.setdefault(metric_name, []).append(set_uuid)
+        rows: Dict[Tuple[str, str], SQLLatestComposite] = {}
+        for metric_name, set_uuids in by_name.items():
+            for start in range(0, len(set_uuids), self.MAX_PARAMETERS):
+                for row in self._session.query(SQLLatestComposite).filter(
+                        SQLLatestComposite.metric_name == metric_name,
+                        SQLLatestComposite.set_uuid.in_(set_uuids[start: start + self.MAX_PARAMETERS])):
+                    rows[(row.metric_name, row.set_uuid)] = row
+        for (metric_name, set_uuid), (timestamp, composite) in self._pending_latest.items():
+            composite_id = composite if isinstance(composite, int) else composite.id
+            row = rows.get((metric_name, set_uuid))
+            if row is None:
+                self._session.add(SQLLatestComposite(metric_name=metric_name, set_uuid=set_uuid, timestamp=timestamp,
+                                                     composite_id=composite_id))
+            elif row.timestamp <= timestamp:
+                row.timestamp = timestamp
+                row.composite_id = composite_id
+        self._pending_latest.clear()
+
+    @staticmethod
+    def _build_latest(filters: int) -> Executable:
+        """
+        :param filters: number of metadata fields filtered on
+        :return: the statement template looking up the id and timestamp of the latest composite metric of a name,
+           among those of the metadata sets matching the given number of metadata fields
+        """
+        latest = select(SQLLatestComposite.composite_id, SQLLatestComposite.timestamp).\
+            where(SQLLatestComposite.metric_name == bindparam('metric_name'))
+        for index in range(filters):
+            # joined from the metadata sets matching the filter, so that the latest entries looked up (by key)
+            # are only those of these sets
+            posting = aliased(SQLMetadataPosting)
+            latest = latest.join(posting, posting.set_uuid == SQLLatestComposite.set_uuid).\
+                where(posting.name == bindparam(f"name_{index}"), posting.value == bindparam(f"value_{index}"))
+        return latest.order_by(desc(SQLLatestComposite.timestamp)).limit(1)
+
+    def latest(self, metric_name: str, metadata_filter: Optional[Dict[str, Union[str, int]]] = None) \
+            -> QueryResult[List[CompositeMetric]]:
+        """
+        Return the latest composite metric (see `MetricStore.latest`), looked up in the table of latest composite
+        metrics by name and matching metadata sets, with its values selected in the same statement
+        """
+        if not self._session:
+            raise RuntimeError("Not in context of data store.  please use 'with' statement")
+        with self._measure("latest") as measurement:
+            metadata_filter = metadata_filter or {}
+            parameters = {'metric_name': metric_name}
+            for index, (name, value) in enumerate(metadata_filter.items()):
+                parameters[f"name_{index}"] = name
+                parameters[f"value_{index}"] = str(value)
+            # looked up on its own rather than as a subquery, which SQLite would rather resolve by scanning the
+            # entries of the name from newest
+            latest = self._session.execute(
+                _template(("latest", len(metadata_filter)), lambda: self._build_latest(len(metadata_filter))),
+                parameters).first()
+            rows = []
+            if latest is not None:
+                composite_id, timestamp = latest
+                # (the table of the partition of its timestamp, if partitioned by time)
+                for composites, values in self._tables(timestamp, timestamp):
+                    rows += self._session.execute(_template(("latest.values", composites.name), lambda: select(
+                        composites.c.timestamp, composites.c.metadata_id, values.c.name, values.c.value).
+                        join(values, values.c.parent_id == composites.c.id).
+                        where(composites.c.id == bindparam('composite_id'))),
+                        {'composite_id': composite_id}).all()
+            result: QueryResult[List[CompositeMetric]] = QueryResult()
+            if rows:
+                timestamp, set_uuid = rows[0][:2]
+                result.timestamps.append(timestamp)
+                # an empty set of metadata has no entries in the metadata index
+                result.metadata.append(self._load_metadata_sets([set_uuid]).get(set_uuid, Metadata({}))
+                                       if set_uuid is not None else None)
+                result.metric_data.append(CompositeMetric.from_flattened({name: value for _, _, name, value in rows}))
+            measurement.rows = len(result.timestamps)
+        return result
+
+    def rolling_baseline(self, metric_name: str, metadata: Optional[Metadata] = None) -> Dict[str, RollingWindow]:
+        if not self._session:
+            raise RuntimeError("Not in context of data store.  please use 'with' statement")
+        if self._baselines is None:
+            raise RuntimeError("Rolling baselines are not maintained by this store; specify a baseline_window"
+                               " on creation")
+        return self._load_baseline(metric_name, metadata)
+
+    def summary(self) -> Dict[str, MetricSummary]:
+        """
+        :return: the number of composite metrics of each name held in this store, and the dates of the oldest and
+           newest of them, by name
+        """
+        if not self._session:
+            raise RuntimeError("Not in context of data store.  please use 'with' statement")
+        summaries: Dict[str, MetricSummary] = {}
+        for composites, _ in self._tables():
+            for name, count, oldest, newest in self._session.execute(
+                    select(composites.c.name, func.count(), func.min(composites.c.timestamp),
+                           func.max(composites.c.timestamp)).group_by(composites.c.name)):
+                if name in summaries:
+                    summary = summaries[name]
+                    count, oldest, newest = summary.count + count, min(summary.oldest, oldest), \
+                        max(summary.newest, newest)
+                summaries[name] = MetricSummary(count, oldest, newest)
+        return dict(sorted(summaries.items()))
 
     def commit(self) -> None:
         """
@@ -489,4 +1636,35 @@ class SQLMetricStore(MetricStore):
         """
         if not self._session:
             raise RuntimeError("Not in context of data store.  please use 'with' statement")
-        self._session.commit()
+        with self._measure("commit"):
+            if self._baselines is not None:
+                self._save_baselines()
+            self._save_rows()
+            self._save_latest()
+            self._session.commit()
+
+    def rollback(self) -> None:
+        """
+        Roll back the transaction of the store, discarding all changes accumulated since last commit (as after a
+        failed commit, following which the session refuses any statement until rolled back)
+        """
+        if not self._session:
+            raise RuntimeError("Not in context of data store.  please use 'with' statement")
+        with self._measure("rollback"):
+            self._session.rollback()
+            self._discard_pending()
+
+    def _discard_pending(self) -> None:
+        """
+        Discard the changes held by the store itself since last commit, once its transaction is rolled back
+        """
+        self._pending_rows.clear()
+        self._pending_latest.clear()
+        self._dirty_baselines.clear()
+        if self._baselines is not None:
+            # baselines cached may hold values discarded, so are loaded anew
+            self._baselines = BaselineCache(self._baselines.window)
+            self._baseline_rows.clear()
+        if self._partitioning is not None:
+            # as may be partitions created, and ids allocated
+            self._load_partitions()
@@ -0,0 +1,151 @@
+"""
+The *daktylos.frames* module converts metrics to wide pandas DataFrames, with one row per metric:
+
+* the index, named *timestamp*, holds the timestamps of the metrics
+* one categorical column per metadata field, named by the field (missing where a metric has no such field)
+* one float64 column per (flattened) key-path, named by the key-path (NaN where a metric has no value for it)
+
+`metric_frame` builds the frame of the history of a metric from the columnar batches of
+`MetricStore.field_batches`, and `QueryResult.to_frame` (see `result_frame`) that of the result of a query.  Columns
+are built from whole lists of values, and metadata columns from the codes of the distinct metadata sets rather than
+from the metadata of each metric, so that no Python-level work is done per metric (beyond flattening composite
+metrics of query results).
+
+This module requires the optional *pandas* package (``pip install daktylos[pandas]``)::
+
+    with store:
+        frame = metric_frame(store, "TestMetric", oldest=datetime.datetime(2024, 1, 1))
+        frame = store.start_field_query("TestMetric", fields=None, max_results=100).execute().to_frame()
+"""
+import datetime
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from daktylos.data import BasicMetric, FieldBatch, Metadata, MetricStore, QueryResult
+
+__all__ = ["batch_frame", "metric_frame", "result_frame"]
+
+TIMESTAMP_INDEX = "timestamp"
+
+
+def _pandas():
+    """
+    :return: the pandas module, imported on first use only as it is an optional dependency
+    """
+    try:
+        import pandas
+    except ImportError as e:
+        raise ImportError("Conversion of metrics to DataFrames requires pandas; "
+                          "install with 'pip install daktylos[pandas]'") from e
+    return pandas
+
+
+def _metadata_names(metadata: Sequence[Optional[Metadata]]) -> List[str]:
+    """
+    :return: names of the fields of the given (distinct) metadata, in order of first appearance
+    """
+    names: Dict[str, None] = {}
+    for item in metadata:
+        if item is not None:
+            names.update(dict.fromkeys(item.values))
+    return list(names)
+
+
+def _frame(timestamps: Sequence[datetime.datetime], metadata: Sequence[Optional[Metadata]], values,
+           metadata_names: Optional[Iterable[str]] = None):
+    """
+    :param timestamps: timestamp of each metric
+    :param metadata: metadata of each metric; metrics of the same metadata set may or may not share the object,
+       although the work done is per distinct object (one per set in results and batches of the stores)
+    :param values: DataFrame of the values of each key-path, with a row per metric
+    :param metadata_names: if specified, the metadata fields to give a column, by default those of the metadata
+    :return: the wide frame of the given metrics
+    """
+    pd = _pandas()
+    import numpy as np
+    # the metadata of each metric is coded by the distinct metadata object it refers to, so that each metadata column
+    # is built from the values of the distinct objects: categories are those values, so that equal metadata held by
+    # distinct objects is coded alike
+    set_codes, _ = pd.factorize(np.fromiter(map(id, metadata), dtype=np.uint64, count=len(metadata)))
+    _, first = np.unique(set_codes, return_index=True)
+    sets = [metadata[index] for index in first]
+    columns = {}
+    for name in (metadata_names if metadata_names is not None else _metadata_names(sets)):
+        codes, categories = pd.factorize(pd.Series([item.values.get(name) if item is not None else None
+                                                    for item in sets], dtype=object))
+        columns[name] = pd.Categorical.from_codes(codes[set_codes], categories=categories)
+    index = pd.DatetimeIndex(timestamps, name=TIMESTAMP_INDEX)
+    frame = pd.DataFrame(columns, index=index)
+    values = values.astype('float64', copy=False)
+    values.index = index
+    return pd.concat([frame, values], axis=1)
+
+
+def batch_frame(batch: FieldBatch):
+    """
+    :param batch: a batch of metrics, as from `MetricStore.field_batches`
+    :return: the wide frame of the metrics of the given batch
+    """
+    pd = _pandas()
+    import numpy as np
+    values = pd.DataFrame({key: np.asarray(column, dtype=np.float64) for key, column in batch.values.items()},
+                          index=pd.RangeIndex(len(batch)))
+    return _frame(batch.timestamps, batch.metadata, values, batch.metadata_names or None)
+
+
+def metric_frame(store: MetricStore, metric_name: str, fields: Optional[Iterable[str]] = None,
+                 oldest: Optional[datetime.datetime] = None, newest: Optional[datetime.datetime] = None,
+                 batch_size: int = 65536):
+    """
+    Build the wide frame of the history of a metric, from oldest to newest, from the batches streamed by the store
+
+    :param store: store to read from, in context
+    :param metric_name: name of the metric
+    :param fields: (wildcard) list of field names to include, or None for all
+    :param oldest: if specified, only include metrics from this date
+    :param newest: if specified, only include metrics up to this date
+    :param batch_size: number of metrics per batch read from the store
+    :return: the wide frame of the metrics
+    """
+    pd = _pandas()
+    import numpy as np
+    timestamps: List[datetime.datetime] = []
+    metadata: List[Optional[Metadata]] = []
+    columns: Dict[str, list] = {}
+    metadata_names: List[str] = []
+    # all batches of a stream share the same key-paths and metadata names
+    for batch in store.field_batches(metric_name, fields=fields, oldest=oldest, newest=newest,
+                                     batch_size=batch_size):
+        timestamps += batch.timestamps
+        metadata += batch.metadata
+        for key, column in batch.values.items():
+            columns.setdefault(key, []).extend(column)
+        metadata_names = batch.metadata_names
+    values = pd.DataFrame({key: np.asarray(column, dtype=np.float64) for key, column in columns.items()},
+                          index=pd.RangeIndex(len(timestamps)))
+    return _frame(timestamps, metadata, values, metadata_names or None)
+
+
+def result_frame(result: QueryResult):
+    """
+    :param result: result of a query of composite metrics, or of a field query with a value of each field for each
+       metric (such as of fields that all metrics have)
+    :return: the wide frame of the metrics of the result
+    :raises ValueError: if the fields of a field query do not all have a value for each metric, as their values can
+       then not be matched to the metrics; use `metric_frame` instead
+    :raises TypeError: if the result is of a query of dataclasses
+    """
+    pd = _pandas()
+    import numpy as np
+    count = len(result.timestamps)
+    if isinstance(result.metric_data, dict):
+        if any(len(column) != count for column in result.metric_data.values()):
+            raise ValueError("Fields of the result do not all have a value for each metric; build the frame with"
+                             " daktylos.frames.metric_frame instead")
+        values = pd.DataFrame({key: np.asarray(column, dtype=np.float64)
+                               for key, column in result.metric_data.items()}, index=pd.RangeIndex(count))
+    elif all(isinstance(metric, BasicMetric) for metric in result.metric_data):
+        values = pd.DataFrame.from_records([metric.flatten() for metric in result.metric_data],
+                                           index=pd.RangeIndex(count))
+    else:
+        raise TypeError("Only results of queries of composite metrics or fields can be converted to a frame")
+    return _frame(result.timestamps, result.metadata, values)
@@ -0,0 +1,230 @@
+"""
+The *daktylos.instrumentation* module provides the means to observe where time is spent inside a
+:class:`daktylos.data.MetricStore`.  A store with a sink attached (see `MetricStore.instrument`) reports the elapsed
+time, number of rows and, where the store can count them, the number of (SQL) statements of each operation it
+performs.  With no sink attached, instrumented operations cost no more than entering an empty context manager.
+
+A built-in :class:`HistogramSink` accumulates the samples in memory, from which latency percentiles can be exported
+periodically by long-running collectors::
+
+    sink = HistogramSink()
+    store.instrument(sink)
+    ...
+    print(sink.snapshot()['post']['p99'])
+"""
+import bisect
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional
+
+__all__ = ["OperationSink", "HistogramSink", "Histogram", "Measurement"]
+
+
+class OperationSink(ABC):
+    """
+    Interface for receiving measurements of data store operations
+    """
+
+    @abstractmethod
+    def record(self, operation: str, elapsed: float, rows: Optional[int] = None,
+               statements: Optional[int] = None) -> None:
+        """
+        Record one measurement of an operation.  Called synchronously by the store, so implementations should
+        be quick and must be thread safe if the store is used from multiple threads
+
+        :param operation: name of the operation (e.g. "post", "commit", "query.fields")
+        :param elapsed: elapsed (wall-clock) time of the operation in seconds
+        :param rows: number of rows (values or composite metrics) processed, if known
+        :param statements: number of statements issued to the database, if known
+        """
+
+
+class Measurement:
+    """
+    Context manager measuring a single operation and reporting it to a sink on successful exit.  The number of rows
+    processed can be set through the `rows` attribute within the context
+
+    :param sink: sink to report to
+    :param operation: name of the operation
+    :param statement_counter: if specified, callable returning a running count of statements issued by the store
+    """
+
+    __slots__ = ("rows", "_sink", "_operation", "_statement_counter", "_start", "_statements")
+
+    def __init__(self, sink: OperationSink, operation: str, statement_counter: Optional[Callable[[], int]] = None):
+        self.rows: Optional[int] = None
+        self._sink = sink
+        self._operation = operation
+        self._statement_counter = statement_counter
+        self._start = 0.0
+        self._statements = 0
+
+    def __enter__(self) -> "Measurement":
+        if self._statement_counter is not None:
+            self._statements = self._statement_counter()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        elapsed = time.perf_counter() - self._start
+        if exc_type is not None:
+            return
+        statements = self._statement_counter() - self._statements if self._statement_counter is not None else None
+        self._sink.record(self._operation, elapsed, rows=self.rows, statements=statements)
+
+
+class _NullMeasurement:
+    """
+    Stand-in for a `Measurement` when no sink is attached; does nothing
+    """
+
+    __slots__ = ("rows",)
+
+    def __enter__(self) -> "_NullMeasurement":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return None
+
+
+NULL_MEASUREMENT = _NullMeasurement()
+
+
+class Histogram:
+    """
+    Histogram of latencies with logarithmically spaced buckets, so that percentiles are reported to within a fixed
+    relative error regardless of scale, in constant memory
+
+    :param lowest: upper bound of the lowest bucket, in seconds
+    :param highest: upper bound of the highest (finite) bucket, in seconds
+    :param buckets_per_doubling: number of buckets for each doubling of latency; 4 buckets gives a relative error
+       of less than 19%
+    """
+
+    def __init__(self, lowest: float = 1.0e-6, highest: float = 100.0, buckets_per_doubling: int = 4):
+        if lowest <= 0.0 or highest <= lowest:
+            raise ValueError("Bucket bounds must be positive and increasing")
+        factor = 2.0 ** (1.0 / buckets_per_doubling)
+        count = int(math.ceil(math.log(highest / lowest, factor))) + 1
+        self._bounds: List[float] = [lowest * factor ** index for index in range(count)]
+        self._counts: List[int] = [0] * (count + 1)  # last bucket counts anything beyond highest bound
+        self._count = 0
+        self._total = 0.0
+        self._min = math.inf
+        self._max = 0.0
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def total(self) -> float:
+        return self._total
+
+    @property
+    def min(self) -> Optional[float]:
+        return self._min if self._count else None
+
+    @property
+    def max(self) -> Optional[float]:
+        return self._max if self._count else None
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self._total / self._count if self._count else None
+
+    def add(self, value: float) -> None:
+        """
+        :param value: latency to add, in seconds
+        """
+        self._counts[bisect.bisect_left(self._bounds, value)] += 1
+        self._count += 1
+        self._total += value
+        if value < self._min:
+            self._min = value
+        if value > self._max:
+            self._max = value
+
+    def percentile(self, percent: float) -> Optional[float]:
+        """
+        :param percent: percentile to compute, from 0 to 100
+        :return: upper bound of the bucket holding the given percentile (capped by the largest latency seen),
+           the smallest latency seen for the 0th percentile, or None if empty
+        """
+        if not 0.0 <= percent <= 100.0:
+            raise ValueError(f"Percentile must be between 0 and 100, got {percent}")
+        if not self._count:
+            return None
+        if percent == 0.0:
+            return self._min
+        rank = max(1, int(math.ceil(self._count * percent / 100.0)))
+        cumulative = 0
+        for index, count in enumerate(self._counts):
+            cumulative += count
+            if cumulative >= rank:
+                bound = self._bounds[index] if index < len(self._bounds) else self._max
+                return min(max(bound, self._min), self._max)
+        return self._max
+
+
+class HistogramSink(OperationSink):
+    """
+    In-memory sink accumulating a latency histogram and row/statement totals per operation
+
+    :param percentiles: percentiles to report in `snapshot`
+    """
+
+    def __init__(self, percentiles: List[float] = (50.0, 90.0, 99.0)):
+        self._percentiles = list(percentiles)
+        self._lock = threading.Lock()
+        self._histograms: Dict[str, Histogram] = {}
+        self._rows: Dict[str, int] = {}
+        self._statements: Dict[str, int] = {}
+
+    def record(self, operation: str, elapsed: float, rows: Optional[int] = None,
+               statements: Optional[int] = None) -> None:
+        with self._lock:
+            histogram = self._histograms.get(operation)
+            if histogram is None:
+                histogram = self._histograms[operation] = Histogram()
+                self._rows[operation] = 0
+                self._statements[operation] = 0
+            histogram.add(elapsed)
+            if rows is not None:
+                self._rows[operation] += rows
+            if statements is not None:
+                self._statements[operation] += statements
+
+    def histogram(self, operation: str) -> Optional[Histogram]:
+        """
+        :param operation: name of operation
+        :return: the latency histogram of the operation, or None if never recorded
+        """
+        return self._histograms.get(operation)
+
+    def snapshot(self, reset: bool = False) -> Dict[str, Dict[str, Optional[float]]]:
+        """
+        :param reset: whether to clear all accumulated measurements after taking the snapshot
+        :return: per operation: count, total/mean/min/max latency, requested percentiles (as "p50", ...) in seconds,
+           and total rows and statements
+        """
+        with self._lock:
+            result = {}
+            for operation, histogram in self._histograms.items():
+                summary = {'count': histogram.count,
+                           'total': histogram.total,
+                           'mean': histogram.mean,
+                           'min': histogram.min,
+                           'max': histogram.max,
+                           'rows': self._rows[operation],
+                           'statements': self._statements[operation]}
+                for percent in self._percentiles:
+                    summary[f"p{percent:g}"] = histogram.percentile(percent)
+                result[operation] = summary
+            if reset:
+                self._histograms.clear()
+                self._rows.clear()
+                self._statements.clear()
+            return result
@@ -4,14 +4,49 @@ the values contained in a `CompositeMetric`.
 """
 
 import fnmatch
+import operator
+import os
+import re
+import time
 from enum import Enum
 from pathlib import Path
-from typing import List, Optional, Iterable, Set
+from typing import Any, Dict, List, Optional, Iterable, Set, Sequence, Tuple, Mapping, Pattern, TYPE_CHECKING
 
-import yaml
+from daktylos.data import CompositeMetric, RollingWindow
+from daktylos.rules.status import ValidationStatus, Violation, ViolationReport
 
-from daktylos.data import CompositeMetric
-from daktylos.rules.status import ValidationStatus
+if TYPE_CHECKING:
+    # (imported where used, as it imports logging)
+    from concurrent.futures import Executor
+
+# loader of rules files, resolved (along with the import of yaml) on first load of a rules file
+_YamlLoader = None
+
+# (current, previous) pair of metrics to be processed by a `RulesEngine`
+MetricPair = Tuple[CompositeMetric, Optional[CompositeMetric]]
+
+# rules engine installed in a worker process of a pool by `RulesEngine.process_many`, so that the rules
+# are shipped to each worker once rather than with every task
+_worker_engine: Optional["RulesEngine"] = None
+
+
+def _initialize_worker(engine: "RulesEngine") -> None:
+    global _worker_engine
+    _worker_engine = engine
+
+
+def _process_chunk(chunk: Sequence[MetricPair], engine: Optional["RulesEngine"] = None,
+                   options: Optional[Dict[str, Any]] = None) -> List[List[ValidationStatus]]:
+    """
+    Process a chunk of metric pairs in a worker
+
+    :param chunk: the (current, previous) pairs to process
+    :param engine: engine to process with, or None to use the one installed when the worker was initialized
+    :param options: keyword options to `RulesEngine.process`
+    :return: list of statuses for each pair, in order
+    """
+    engine = engine or _worker_engine
+    return [list(engine.process(*pair, **(options or {}))) for pair in chunk]
 
 
 class Rule:
@@ -25,6 +60,9 @@ class Rule:
     :param limiting_value: the float value representing a therhold/limiting value for the metric
     :param is_relative: whether the rule applies to a comparison (difference with) the previous metric
         value or is absolute, evaluating only against the latest value
+    :param baseline: if specified, the rule applies to the difference with this statistic of the rolling
+        baseline of latest values (see `MetricStore.rolling_baseline`) instead of the previous value
+    :param baseline_count: the number of latest values of the baseline to consider, or all if None
     """
     class Evaluation(Enum):
         LESS_THAN = "<"
@@ -39,35 +77,94 @@ class Rule:
                     '<=': cls.LESS_THAN_OR_EQUAL,
                     '>=': cls.GREATER_THAN_OR_EQUAL}[op]
 
-    class ThresholdViolation(ValueError):
+    class Baseline(Enum):
+        """
+        Statistic of a rolling baseline to compare against
         """
-        Exception raised on failure to validate a composite metric's children against this rule
+        MEAN = "mean"
+        MEDIAN = "median"
 
-        :param msg: exception message
+    class ThresholdViolation(ValueError, ViolationReport):
+        """
+        Exception raised on failure to validate a composite metric's children against this rule.  The message
+        listing the violations is only rendered when requested.
+
+        :param msg: exception message, or None to render it from the violations
         :param parent: The parent composite metric that contains violations of this rule
-        :param offending_elements: the key-paths to the core `Metric` (containing the values) that violated thresholds
+        :param offending_elements: the key-paths to the core `Metric` (containing the values) that violated
+           thresholds, if violations are not given
+        :param violations: records of each core metric that violated thresholds
         """
 
-        def __init__(self, msg: str, parent: CompositeMetric, offending_elements: Iterable[str]):
-            super().__init__(msg)
-            self._parent_metric = parent
-            self._offending_elements = offending_elements
+        def __init__(self, msg: Optional[str] = None, parent: Optional[CompositeMetric] = None,
+                     offending_elements: Optional[Iterable[str]] = None,
+                     violations: Optional[List[Violation]] = None):
+            ValueError.__init__(self)
+            ViolationReport.__init__(self, parent=parent, violations=violations, msg=msg,
+                                     offending_elements=offending_elements)
 
-        @property
-        def parent_metric(self):
-            return self._parent_metric
+        def __str__(self):
+            return self.render()
 
-        @property
-        def offending_elements(self):
-            return self._offending_elements
+        def __repr__(self):
+            return f"{self.__class__.__name__}({self.render()!r})"
 
     def __init__(self, pattern: str, operation: "Rule.Evaluation", limiting_value: float,
-                 description: Optional[str] = None, is_relative: bool = False):
+                 description: Optional[str] = None, is_relative: bool = False,
+                 baseline: Optional["Rule.Baseline"] = None, baseline_count: Optional[int] = None):
         self._pattern = pattern
         self._operation = operation
         self._limit = limiting_value
         self._description = description or f"{self._pattern} {self._operation.value} {self._limit}"
-        self._is_relative = is_relative
+        self._is_relative = is_relative or baseline is not None
+        self._baseline = baseline
+        self._baseline_count = baseline_count
+        self._regex: Optional[Pattern] = None  # compiled on first use
+
+    def __getstate__(self):
+        # the compiled pattern is cheaper to compile again on first use than to unpickle
+        state = self.__dict__.copy()
+        state['_regex'] = None
+        return state
+
+    @classmethod
+    def from_string(cls, rule: str) -> "Rule":
+        """
+        :param rule: text of the rule, in the form "pattern op value" where op is one of <, >, <= or >=, and
+           the pattern may be wrapped as delta(pattern), delta_mean(pattern[, count]) or
+           delta_median(pattern[, count]) for relative rules
+        :return: the Rule parsed from the text
+        :raises ValueError: if the text is not a valid rule
+        """
+        try:
+            pattern, operation, value = rule.rsplit(None, 2)
+            value = float(value)
+            operation = Rule.Evaluation.from_string(operation)
+        except (ValueError, KeyError):
+            raise ValueError("Must be in format 'pattern [<, >, <=, >=] float-value: " + rule)
+        pattern = pattern.strip()
+        is_relative = False
+        baseline = None
+        baseline_count = None
+        if pattern.startswith("delta("):
+            if not pattern.endswith(')'):
+                raise ValueError("Invalid construct in delta() clause: missing end parenthesis")
+            pattern = pattern[6:-1]
+            is_relative = True
+        elif pattern.startswith("delta_mean(") or pattern.startswith("delta_median("):
+            if not pattern.endswith(')'):
+                raise ValueError("Invalid construct in delta_mean()/delta_median() clause: missing end parenthesis")
+            statistic, pattern = pattern[:-1].split('(', 1)
+            baseline = Rule.Baseline(statistic[len("delta_"):])
+            if ',' in pattern:
+                pattern, count = pattern.rsplit(',', 1)
+                try:
+                    baseline_count = int(count)
+                except ValueError:
+                    raise ValueError(f"Invalid count of values in {statistic}() clause: {count}")
+            pattern = pattern.strip()
+        return Rule(pattern, operation, value, is_relative=is_relative, baseline=baseline,
+                    baseline_count=baseline_count)
 
     @property
     def description(self):
@@ -95,52 +192,64 @@ class Rule:
                 return True
         return False
 
+    def _baseline_value(self, window: RollingWindow) -> Optional[float]:
+        if self._baseline == Rule.Baseline.MEAN:
+            return window.mean(self._baseline_count)
+        return window.median(self._baseline_count)
+
     def validate(self, composite_metric: CompositeMetric, previous_metric: Optional[CompositeMetric] = None,
-                 exclusions: Optional[Iterable[str]] = None) -> None:
+                 exclusions: Optional[Iterable[str]] = None,
+                 baseline: Optional[Mapping[str, RollingWindow]] = None,
+                 max_violations: Optional[int] = None) -> None:
         """
         Valide a composite metric for any and all matching key-names for each of its components
 
         :param composite_metric: the `CompositMetric` to validate
         :param previous_metric: previous value of the metric (for relative rule) or None if N/A or non-existent
+        :param baseline: rolling baseline of the metric, keyed by flattened key-path (for rules relative to a
+           baseline) or None if N/A or non-existent
+        :param max_violations: if specified, stop evaluating at this many violating keys
         :raises: ValueError with a message containing the rules violated if the metric fails to validate
            against this rule
         """
-        failed_elements: List[str] = []
-        msg = ""
-
-        for key in [k for k in composite_metric.keys(core_metrics_only=True) if
-                    not self._excluded(self._prepend_root(k, composite_metric), exclusions) and
-                    (self._pattern == '*'
-                     or fnmatch.fnmatchcase(self._prepend_root(k, composite_metric), self._pattern))]:
-            if self._is_relative:
+        violations: List[Violation] = []
+        violated, symbol = _VIOLATIONS[self._operation]
+        if self._regex is None:
+            self._regex = re.compile(fnmatch.translate(self._pattern))
+        for key, metric in composite_metric.leaves():
+            path = self._prepend_root(key, composite_metric)
+            if (self._pattern != '*' and not self._regex.match(path)) or self._excluded(path, exclusions):
+                continue
+            if self._baseline is not None:
+                window = (baseline or {}).get(path)
+                reference = self._baseline_value(window) if window is not None else None
+                if reference is None:
+                    continue  # no baseline for this key, so nothing to compare to
+                value = metric.value - reference
+            elif self._is_relative:
                 if not previous_metric:
                     continue
                 try:
-                    value = composite_metric[key].value - previous_metric[key].value
+                    value = metric.value - previous_metric[key].value
                 except KeyError:
                     continue  # prev metric does not contain this key, so nothing to compare to
             else:
-                value = composite_metric[key].value
-            if self._operation == Rule.Evaluation.LESS_THAN:
-                if value >= self._limit:
-                    msg += f"\n   {self._prepend_root(key, composite_metric)} >= {self._limit}"
-                    failed_elements.append(key)
-            elif self._operation == Rule.Evaluation.GREATER_THAN:
-                if value <= self._limit:
-                    msg += f"\n   {self._prepend_root(key, composite_metric)} <= {self._limit}"
-                    failed_elements.append(key)
-            elif self._operation == Rule.Evaluation.LESS_THAN_OR_EQUAL:
-                if value > self._limit:
-                    failed_elements.append(key)
-                    msg += f"\n  {self._prepend_root(key, composite_metric)} > {self._limit}"
-            elif self._operation == Rule.Evaluation.GREATER_THAN_OR_EQUAL:
-                if value < self._limit:
-                    failed_elements.append(key)
-                    msg += f"\n  {self._prepend_root(key, composite_metric)} < {self._limit}"
-        if failed_elements:
-            raise Rule.ThresholdViolation(msg=msg,
-                                          parent=composite_metric,
-                                          offending_elements=failed_elements)
+                value = metric.value
+            if violated(value, self._limit):
+                violations.append(Violation(key, value, self._limit, symbol, metric))
+                if max_violations is not None and len(violations) >= max_violations:
+                    break
+        if violations:
+            raise Rule.ThresholdViolation(parent=composite_metric, violations=violations)
+
+
+# for each type of rule evaluation, the comparison of value to limit that violates it and its operator
+_VIOLATIONS = {
+    Rule.Evaluation.LESS_THAN: (operator.ge, ">="),
+    Rule.Evaluation.GREATER_THAN: (operator.le, "<="),
+    Rule.Evaluation.LESS_THAN_OR_EQUAL: (operator.gt, ">"),
+    Rule.Evaluation.GREATER_THAN_OR_EQUAL: (operator.lt, "<"),
+}
 
 
 class RulesEngine:
@@ -149,10 +258,14 @@ class RulesEngine:
     """
 
     class RuleSet:
+        """
+        A set of alert and validation rules, sharing common exclusions.  Rules are evaluated in the order added.
+        """
 
         def __init__(self):
-            self._alerts: Set[Rule] = set()
-            self._validations: Set[Rule] = set()
+            # dicts serve as insertion-ordered sets, so that evaluation order (and so early exits) is reproducible
+            self._alerts: Dict[Rule, None] = {}
+            self._validations: Dict[Rule, None] = {}
             self._exclusions: Set[str] = set()
 
         def add_validation(self, rule: Rule):
@@ -161,7 +274,7 @@ class RulesEngine:
 
             :param rule: rule to add
             """
-            self._validations.add(rule)
+            self._validations[rule] = None
 
         def add_alert(self, rule: Rule):
             """
@@ -169,7 +282,7 @@ class RulesEngine:
 
             :param rule: rule to add
             """
-            self._alerts.add(rule)
+            self._alerts[rule] = None
 
         def add_exclusion(self, exclusion: str):
             """
@@ -178,115 +291,237 @@ class RulesEngine:
             """
             self._exclusions.add(exclusion)
 
-        def process(self, composite_metric: CompositeMetric, previous_metric: Optional[CompositeMetric] = None):
+        def process(self, composite_metric: CompositeMetric, previous_metric: Optional[CompositeMetric] = None,
+                    baseline: Optional[Mapping[str, RollingWindow]] = None, fail_fast: bool = False,
+                    failures_only: bool = False, max_violations: Optional[int] = None,
+                    deadline: Optional[float] = None):
             """
             Validate the composite metric aginst this rules engine
 
             :param composite_metric: metric to validate
+            :param previous_metric: if not None, previous value for evaluating comparison rules if any
+            :param baseline: if not None, rolling baseline for evaluating rules relative to a baseline if any
+            :param fail_fast: whether to stop at the first violating key of the first failing validation rule
+            :param failures_only: whether to skip alert rules
+            :param max_violations: if specified, stop once this many violating keys are reported
+            :param deadline: if specified, the `time.monotonic()` value after which no further rule is evaluated
             :returns: generator yielding alerts and validation failures as a list of `Status`
             """
-            for rule in self._alerts:
-
-                try:
-                    rule.validate(composite_metric, previous_metric, self._exclusions)
-                except Rule.ThresholdViolation as e:
-                    failure = f"\n--------------------------------\nALERT: For rule '{rule.description}':\n{e}"
-                    yield ValidationStatus(level=ValidationStatus.Level.ALERT,
-                                           text=failure,
-                                           metric=composite_metric,
-                                           offending_elements=e.offending_elements)
-            for rule in self._validations:
-                try:
-                    rule.validate(composite_metric, previous_metric, self._exclusions)
-                except Rule.ThresholdViolation as e:
-                    failure = \
-                        f"\n--------------------------------\nVALIDATION FAILURE: For rule '{rule.description}':\n {e}"
-                    yield ValidationStatus(level=ValidationStatus.Level.FAILURE,
-                                           text=failure,
-                                           metric=composite_metric,
-                                           offending_elements=e.offending_elements)
+            levels = [(ValidationStatus.Level.FAILURE, self._validations)]
+            if not failures_only:
+                levels.insert(0, (ValidationStatus.Level.ALERT, self._alerts))
+            for level, rules in levels:
+                for rule in rules:
+                    if max_violations is not None and max_violations <= 0:
+                        return
+                    if deadline is not None and time.monotonic() >= deadline:
+                        return
+                    limit = 1 if fail_fast and level == ValidationStatus.Level.FAILURE else max_violations
+                    try:
+                        rule.validate(composite_metric, previous_metric, self._exclusions, baseline,
+                                      max_violations=limit)
+                    except Rule.ThresholdViolation as e:
+                        if max_violations is not None:
+                            max_violations -= len(e.offending_elements)
+                        yield ValidationStatus(level=level,
+                                               metric=composite_metric,
+                                               rule_description=rule.description,
+                                               report=e.with_traceback(None))
+                        if fail_fast and level == ValidationStatus.Level.FAILURE:
+                            return
+
+    # below this number of (current, previous) pairs, `process_many` uses a thread pool, as the cost of
+    # spawning worker processes outweighs the gain
+    PROCESS_POOL_THRESHOLD = 64
+    # version of the format of compiled rules written by `from_yaml_file`;  to be incremented on any change
+    # to the (pickled) classes of the rules engine
+    COMPILED_FORMAT_VERSION = 1
 
     def __init__(self):
-        self._rulesets: Set["RulesEngine.RuleSet"] = set()
+        self._rulesets: List["RulesEngine.RuleSet"] = []
+
+    def add_ruleset(self, ruleset: "RulesEngine.RuleSet") -> None:
+        """
+        Add the given set of rules to this engine;  rule sets are evaluated in the order added
+
+        :param ruleset: rule set to add
+        """
+        self._rulesets.append(ruleset)
 
     @classmethod
-    def from_yaml_file(cls, path: Path) -> "RulesEngine":
+    def from_yaml_file(cls, path: Path, cache_dir: Optional[Path] = None) -> "RulesEngine":
         """
         :param path: a path to a yaml file to process for rules
+        :param cache_dir: if specified, a directory in which to keep the compiled rules, keyed by the hash of the
+           file's content;  when the file is unchanged since a previous load, the compiled rules are loaded from
+           there directly instead of being parsed again.  The directory should only be writable by trusted users,
+           as compiled rules are pickled.
         :return: a RulesEngine instance based on the content of the yaml file
         """
+        # yaml, and the modules for the cache of compiled rules, are only imported when rules files are loaded
+        global _YamlLoader
+        import hashlib
+        import pickle
+        import tempfile
+        import yaml
+        if _YamlLoader is None:
+            # use the libyaml-based loader when available, which is much faster than the pure-Python one
+            _YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
         if not path.exists() or path.is_dir():
             raise FileNotFoundError(f"Provided path '{path}' does not exit or is a directory")
+        content = path.read_bytes()
+        compiled_path: Optional[Path] = None
+        if cache_dir is not None:
+            digest = hashlib.sha256(content).hexdigest()
+            compiled_path = Path(cache_dir) / f"{digest}.v{cls.COMPILED_FORMAT_VERSION}.rules"
+            try:
+                with open(compiled_path, 'rb') as stream:
+                    compiled = pickle.load(stream)
+                if isinstance(compiled, RulesEngine):
+                    return compiled
+            except Exception:
+                # not yet compiled, unreadable or corrupt (unpickling damaged data may raise about any error), so
+                # (re)compile below
+                pass
+        rules_engine = cls._from_document(yaml.load(content, Loader=_YamlLoader), path)
+        if compiled_path is not None:
+            # the cache is best-effort: rules are returned even if they cannot be kept in it
+            temporary: Optional[str] = None
+            try:
+                compiled_path.parent.mkdir(parents=True, exist_ok=True)
+                # write to a temporary file first, so that concurrent loaders never see a partial file
+                with tempfile.NamedTemporaryFile(dir=compiled_path.parent, delete=False) as stream:
+                    temporary = stream.name
+                    pickle.dump(rules_engine, stream, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(temporary, compiled_path)
+            except Exception:
+                if temporary is not None and os.path.exists(temporary):
+                    os.unlink(temporary)
+        return rules_engine
 
-        with open(path) as stream:
-            document = yaml.load(stream)
-            rules_engine = RulesEngine()
+    @classmethod
+    def _from_document(cls, document: dict, path: Path) -> "RulesEngine":
+        """
+        :param document: the parsed content of a rules file
+        :param path: path of the rules file, for error reporting
+        :return: a RulesEngine instance based on the content
+        """
+        rules_engine = RulesEngine()
 
-            def process_rule(ruleset: cls.RuleSet, action: str, rule: str):
-                if action not in ['confirm', 'validate']:
-                    raise ValueError(f"Invalid action specified: '{action}'")
-                try:
-                    pattern, operation, value = rule.split()
-                    value = float(value)
-                    operation = Rule.Evaluation.from_string(operation)
-                except (ValueError, KeyError):
-                    raise ValueError(
-                        f"Invalid rule specified in {path}.  Must be in format 'pattern [<, >, <=, >=] float-value:" +
-                        rule)
-                pattern = pattern.strip()
-                is_relative = False
-                if pattern.startswith("delta("):
-                    if not pattern.endswith(')'):
-                        raise ValueError("Invalid construct in delta() clause: missing end parenthesis")
-                    pattern = pattern[6:-1]
-                    is_relative = True
-                rule_to_add = Rule(pattern, operation, value, is_relative=is_relative)
-                if action == 'confirm':
-                    ruleset.add_alert(rule_to_add)
-                else:
-                    ruleset.add_validation(rule_to_add)
-
-            content = document.get('content', None)
-            if not content:
-                raise LookupError(f"Rules file {path} does not contain any top-level content element")
+        def process_rule(ruleset: cls.RuleSet, action: str, rule: str):
+            if action not in ['confirm', 'validate']:
+                raise ValueError(f"Invalid action specified: '{action}'")
             try:
-                for item in content:
-                    if len(item) == 0:
-                        raise LookupError(f"Rules file {path} contains content devoid of ruleset elements")
-                    elif len(item) != 1:
-                        raise LookupError(f"Rules file {path} contains more elements then expected: {list(item.keys())}")
-                    ruleset_defn = item.get('ruleset')
-                    if not ruleset_defn:
-                        raise LookupError(f"Rules file {path} contains content devoid of ruleset elements")
-                    description = ruleset_defn.get('description', "<<none>>")
-                    exclusions = ruleset_defn.get('exclusions', [])
-                    ruleset = cls.RuleSet()
-                    rules_engine._rulesets.add(ruleset)
-                    for exclusion in exclusions:
-                        ruleset.add_exclusion(exclusion['exclusion'])
-                    rules = ruleset_defn.get('rules', [])
-                    if not rules:
-                        raise LookupError(
-                            f"Rules file {path} contains empty set of rules for set with description: {description}")
-                    for rule in rules:
-                        action = rule['action']
-                        validation_rule = rule['rule']
-                        process_rule(ruleset, action, validation_rule)
-            except KeyError:
-                raise ValueError(f"Invalid rule in file {path}; it can only contain 'action' and 'rule' elements, but"
-                                 f" got keys of {list(rule.keys())}")
-            return rules_engine
-
-    def process(self, composite_metric: CompositeMetric, previous_metric: Optional[CompositeMetric] = None):
+                rule_to_add = Rule.from_string(rule)
+            except ValueError as e:
+                raise ValueError(f"Invalid rule specified in {path}: {e}")
+            if action == 'confirm':
+                ruleset.add_alert(rule_to_add)
+            else:
+                ruleset.add_validation(rule_to_add)
+
+        content = document.get('content', None)
+        if not content:
+            raise LookupError(f"Rules file {path} does not contain any top-level content element")
+        try:
+            for item in content:
+                if len(item) == 0:
+                    raise LookupError(f"Rules file {path} contains content devoid of ruleset elements")
+                elif len(item) != 1:
+                    raise LookupError(f"Rules file {path} contains more elements then expected: {list(item.keys())}")
+                ruleset_defn = item.get('ruleset')
+                if not ruleset_defn:
+                    raise LookupError(f"Rules file {path} contains content devoid of ruleset elements")
+                description = ruleset_defn.get('description', "<<none>>")
+                exclusions = ruleset_defn.get('exclusions', [])
+                ruleset = cls.RuleSet()
+                rules_engine.add_ruleset(ruleset)
+                for exclusion in exclusions:
+                    ruleset.add_exclusion(exclusion['exclusion'])
+                rules = ruleset_defn.get('rules', [])
+                if not rules:
+                    raise LookupError(
+                        f"Rules file {path} contains empty set of rules for set with description: {description}")
+                for rule in rules:
+                    action = rule['action']
+                    validation_rule = rule['rule']
+                    process_rule(ruleset, action, validation_rule)
+        except KeyError:
+            raise ValueError(f"Invalid rule in file {path}; it can only contain 'action' and 'rule' elements, but"
+                             f" got keys of {list(rule.keys())}")
+        return rules_engine
+
+    def process(self, composite_metric: CompositeMetric, previous_metric: Optional[CompositeMetric] = None,
+                baseline: Optional[Mapping[str, RollingWindow]] = None, fail_fast: bool = False,
+                failures_only: bool = False, max_violations: Optional[int] = None,
+                time_budget: Optional[float] = None):
         """
         process the given composite metric (against previous metric if provided) and generate all failures against
-        the rules
+        the rules.  Rule sets, and the rules within them, are evaluated in the order they were added (the order
+        in a rules file), alerts before validations in each rule set, so that early exits are reproducible.
 
         :param composite_metric: the metric to test
         :param previous_metric: if not None, previous value for evaluating comparison rules if any
+        :param baseline: if not None, the rolling baseline of the metric (e.g. from
+           `MetricStore.rolling_baseline`) for evaluating rules relative to a baseline, if any
+        :param fail_fast: if True, stop at the first validation failure, which then reports only the first
+           violating key
+        :param failures_only: if True, skip alert ("confirm") rules
+        :param max_violations: if specified, stop once this many violating keys have been reported
+        :param time_budget: if specified, the number of seconds after which no further rule is evaluated
 
         :return: a generator of any alerts against  or violations of the rules
         """
+        deadline = time.monotonic() + time_budget if time_budget is not None else None
         for ruleset in self._rulesets:
-            for failure in ruleset.process(composite_metric, previous_metric):
+            for failure in ruleset.process(composite_metric, previous_metric, baseline, fail_fast=fail_fast,
+                                           failures_only=failures_only, max_violations=max_violations,
+                                           deadline=deadline):
+                if max_violations is not None:
+                    max_violations -= len(failure.offending_elements)
                 yield failure
+                if fail_fast and failure.level == ValidationStatus.Level.FAILURE:
+                    return
+            if max_violations is not None and max_violations <= 0:
+                return
+
+    def process_many(self, pairs: Iterable[MetricPair], executor: Optional["Executor"] = None,
+                     max_workers: Optional[int] = None, **options) -> List[List[ValidationStatus]]:
+        """
+        process many composite metrics (each against its previous metric if provided) in parallel.  The pairs
+        are split into one contiguous chunk per worker, so the rules are shipped to each worker once rather than
+        per metric.
+
+        :param pairs: iterable of (current, previous) metric pairs, previous being None if N/A;  a third element,
+           the rolling baseline of the metric, may be included when needed
+        :param executor: executor to run on;  if None, a process pool is created (or a thread pool if the number
+           of pairs is below `PROCESS_POOL_THRESHOLD`) and shut down on completion
+        :param max_workers: number of workers when creating the executor, defaulting to the cpu count
+        :param options: evaluation options (fail_fast, failures_only, max_violations, time_budget) applied to
+           each pair, as for `process`
+
+        :return: the list of alerts and violations for each pair, in the order of the input pairs.  Note that
+           when processed in another process, the parent metric of each status is a copy of the input metric
+        """
+        from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+        pairs = list(pairs)
+        if not pairs:
+            return []
+        max_workers = max_workers or os.cpu_count() or 1
+        owned = executor is None
+        if owned:
+            if len(pairs) < self.PROCESS_POOL_THRESHOLD:
+                executor = ThreadPoolExecutor(max_workers=max_workers)
+            else:
+                executor = ProcessPoolExecutor(max_workers=max_workers, initializer=_initialize_worker,
+                                               initargs=(self,))
+        # an engine given to a pool we did not initialize must travel with each chunk
+        engine = None if owned and isinstance(executor, ProcessPoolExecutor) else self
+        chunk_size = -(-len(pairs) // max_workers)
+        try:
+            futures = [executor.submit(_process_chunk, pairs[index:index + chunk_size], engine, options)
+                       for index in range(0, len(pairs), chunk_size)]
+            return [statuses for future in futures for statuses in future.result()]
+        finally:
+            if owned:
+                executor.shutdown()
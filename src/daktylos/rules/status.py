@@ -8,18 +8,112 @@ acceptable criteria.
 """
 
 from enum import Enum
-from typing import Iterable, Dict
+from typing import Iterable, Dict, List, NamedTuple, Optional
 
 from daktylos.data import CompositeMetric, Metric
 
 
+class Violation(NamedTuple):
+    """
+    Record of a single core metric of a composite that violated a rule
+    """
+    key: str
+    """key-path of the core metric, relative to the root composite metric"""
+    value: float
+    """the value evaluated (for relative rules, the difference with the reference value)"""
+    limit: float
+    """the limiting value of the rule"""
+    operator: str
+    """the comparison of value to limit that violated the rule (e.g. ">=" for a rule that the value be "<")"""
+    metric: Metric
+    """the core metric itself"""
+
+    def render(self, root_name: str) -> str:
+        """
+        :param root_name: name of the root composite metric containing the violating metric
+        :return: text describing the violation
+        """
+        separator = '' if self.key.startswith('#') else '/'
+        return f"/{root_name}{separator}{self.key} {self.operator} {self.limit}"
+
+
+class ViolationReport:
+    """
+    Mixin for holding a list of violations of a rule, and rendering text describing them only on demand
+
+    :param parent: the root composite metric that violated the rule
+    :param violations: records of the violations
+    :param msg: text to use in lieu of rendering the violations, if provided
+    :param offending_elements: key-paths of the violating core metrics, if violations not provided
+    """
+
+    def __init__(self, parent: CompositeMetric, violations: Optional[List[Violation]] = None,
+                 msg: Optional[str] = None, offending_elements: Optional[Iterable[str]] = None):
+        self._parent_metric = parent
+        self._violations = violations or []
+        self._text = msg
+        self._offending_elements = offending_elements
+
+    @property
+    def parent_metric(self) -> CompositeMetric:
+        """
+        :return: The root composite metric that violated the rule
+        """
+        return self._parent_metric
+
+    @property
+    def violations(self) -> List[Violation]:
+        """
+        :return: records of each core metric that violated the rule
+        """
+        return self._violations
+
+    @property
+    def offending_elements(self) -> List[str]:
+        """
+        :return: key-paths to the core metrics that violated the rule
+        """
+        if self._offending_elements is None:
+            self._offending_elements = [violation.key for violation in self._violations]
+        return self._offending_elements
+
+    def offending_metrics(self) -> Dict[str, Optional[Metric]]:
+        """
+        :return: dictionary of key-path, `Metric` pairs that are the core metrics that failed validation
+         (or showed improvement), the metric being None if it cannot be located in the parent metric
+        """
+        if self._violations:
+            return {violation.key: violation.metric for violation in self._violations}
+        result: Dict[str, Optional[Metric]] = {}
+        for key in self.offending_elements:
+            try:
+                result[key] = self._parent_metric.element(key)
+            except (KeyError, AttributeError):
+                result[key] = None
+        return result
+
+    def render(self) -> str:
+        """
+        :return: text listing each violation, one per line
+        """
+        if self._text is None:
+            self._text = "".join(f"\n  {violation.render(self._parent_metric.name)}"
+                                 for violation in self._violations)
+        return self._text
+
+
 class ValidationStatus:
     """
-    A status provided to the client, as an alert or failure on a metric.
+    A status provided to the client, as an alert or failure on a metric.  Unless given explicitly, the text message
+    of the status is only rendered when requested.
 
     :param level: The level of the status provided (Level.ALERT or Level.FAILURE)
-    :param text: A message to provide to the client on the nature of the alert or failure
+    :param text: A message to provide to the client on the nature of the alert or failure, or None to render
+       it from the rule description and report
     :param metric:  The associated root composite metric that failed
+    :param offending_elements: key-paths of the core metrics that failed, if no report is given
+    :param rule_description: description of the rule that failed
+    :param report: report of the violations of the rule
     """
 
     class Level(Enum):
@@ -30,19 +124,26 @@ class ValidationStatus:
         FAILURE = "failure"
 
     def __init__(self, level: "ValidationStatus.Level",
-                 text: str,
-                 metric: CompositeMetric,
-                 offending_elements: Iterable[str]):
+                 text: Optional[str] = None,
+                 metric: Optional[CompositeMetric] = None,
+                 offending_elements: Optional[Iterable[str]] = None,
+                 rule_description: Optional[str] = None,
+                 report: Optional[ViolationReport] = None):
         self._level = level
         self._text = text
-        self._parent_metric = metric
-        self._offending_elements = offending_elements
+        self._rule_description = rule_description
+        self._report = report or ViolationReport(parent=metric, offending_elements=offending_elements)
+        self._parent_metric = metric if metric is not None else self._report.parent_metric
 
     @property
     def text(self):
         """
         :return: The text message indicating the details of this alert or failure
         """
+        if self._text is None:
+            label = "ALERT" if self._level == ValidationStatus.Level.ALERT else "VALIDATION FAILURE"
+            self._text = f"\n--------------------------------\n{label}: For rule '{self._rule_description}':\n" \
+                         f"{self._report.render()}"
         return self._text
 
     @property
@@ -53,15 +154,36 @@ class ValidationStatus:
         return self._level
 
     @property
-    def parent_metric(self)-> CompositeMetric:
+    def rule_description(self) -> Optional[str]:
+        """
+        :return: description of the rule that failed
+        """
+        return self._rule_description
+
+    @property
+    def parent_metric(self) -> CompositeMetric:
         """
         :return: The metric associated with this status
         """
         return self._parent_metric
 
-    def offending_metrics(self) -> Dict[str, Metric]:
+    @property
+    def violations(self) -> List[Violation]:
+        """
+        :return: records of each core metric that failed
+        """
+        return self._report.violations
+
+    @property
+    def offending_elements(self) -> List[str]:
+        """
+        :return: key-paths of the core metrics that failed
+        """
+        return self._report.offending_elements
+
+    def offending_metrics(self) -> Dict[str, Optional[Metric]]:
         """
         :return: dictionary of key-path, `Metric` pairs that are the core metrics that failed validation
          (or showed improvement)
         """
-        return {key: self._parent_metric for key in self._offending_elements}
+        return self._report.offending_metrics()
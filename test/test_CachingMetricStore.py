@@ -0,0 +1,75 @@
+import datetime
+
+import pytest
+
+from daktylos.data_stores.caching import CachingMetricStore
+from daktylos.data_stores.memory import InMemoryMetricStore
+from daktylos.data_stores.sql import SQLMetricStore
+
+from conftest import composite, metadata
+
+
+class TestCachingMetricStore:
+
+    def test_hits_and_copies(self, preloaded_memory_datastore: InMemoryMetricStore):
+        store = CachingMetricStore(preloaded_memory_datastore)
+        first = store.composite_metrics_by_volume("TestMetric", count=5)
+        first.metric_data.clear()
+        first.metadata[0].values.clear()
+        second = store.composite_metrics_by_volume("TestMetric", count=5)
+        assert len(second.metric_data) == 5
+        assert second.metadata[0] == metadata
+        assert (store.stats.hits, store.stats.misses) == (1, 1)
+        # different count, fields, filter or range are different entries:
+        store.composite_metrics_by_volume("TestMetric", count=6)
+        store.metric_fields_by_volume("TestMetric", count=5, fields=['%grandchild%'])
+        store.metric_fields_by_volume("TestMetric", count=5, fields=['%grandchild%'],
+                                      metadata_filter={'platform': metadata.values['platform']})
+        oldest = preloaded_memory_datastore.base_timestamp - datetime.timedelta(seconds=10)
+        fields = store.metric_fields_by_date("TestMetric", oldest=oldest)
+        assert store.metric_fields_by_date("TestMetric", oldest=oldest) == fields
+        assert (store.stats.hits, store.stats.misses) == (2, 5)
+        assert store.stats.hit_ratio == pytest.approx(2 / 7)
+
+    def test_invalidation(self):
+        with CachingMetricStore(InMemoryMetricStore()) as store:
+            store.post(composite("A", value=1.0), metadata=metadata)
+            store.post(composite("B", value=1.0), metadata=metadata)
+            store.commit()
+            assert len(store.metric_fields_by_volume("A", count=10).timestamps) == 1
+            assert len(store.metric_fields_by_volume("B", count=10).timestamps) == 1
+            store.post(composite("A", value=2.0), metadata=metadata)
+            assert store.metric_fields_by_volume("A", count=10).metric_data == {'/A#value': [1.0, 2.0]}
+            store.metric_fields_by_volume("B", count=10)
+            assert store.stats.hits == 1
+            store.purge_by_volume(1, name="A")
+            assert store.metric_fields_by_volume("A", count=10).metric_data == {'/A#value': [2.0]}
+            store.purge_by_date(before=datetime.datetime.utcnow() + datetime.timedelta(days=1))
+            assert store.metric_fields_by_volume("B", count=10).metric_data == {}
+
+    def test_eviction(self, preloaded_memory_datastore: InMemoryMetricStore):
+        store = CachingMetricStore(preloaded_memory_datastore, max_entries=2)
+        for count in [1, 2, 3, 1]:
+            store.metric_fields_by_volume("TestMetric", count=count)
+        assert len(store) == 2
+        assert store.stats.evictions == 2
+        assert store.stats.hits == 0
+        store = CachingMetricStore(preloaded_memory_datastore, max_rows=10)
+        store.metric_fields_by_volume("TestMetric", count=6)
+        store.metric_fields_by_volume("TestMetric", count=4)
+        store.metric_fields_by_volume("TestMetric", count=20)  # too large to cache at all
+        assert len(store) == 2
+        store.metric_fields_by_volume("TestMetric", count=2)
+        assert len(store) == 2
+        assert store.stats.evictions == 1
+
+    def test_sql_commit(self, engine):
+        with CachingMetricStore(SQLMetricStore(engine, create=True)) as store:
+            store.post(composite("A", value=1.0), metadata=metadata)
+            # not yet visible to queries of the SQL session until committed:
+            assert store.metric_fields_by_volume("A", count=10).metric_data == {}
+            store.commit()
+            assert store.metric_fields_by_volume("A", count=10).metric_data == {'/A#value': [1.0]}
+            result = store.start_field_query("A", fields=None).collect_statistics().execute()
+            assert result.stats.statements > 0
+            assert "composite_metrics" in store.start_query("A", 1).explain()
@@ -0,0 +1,130 @@
+import datetime
+import math
+import os
+
+import pytest
+
+from daktylos.data import Metadata, MetricStore
+from daktylos.data_stores.file import FileMetricStore
+
+from conftest import composite, metadata
+
+
+class TestFileMetricStore:
+
+    def test_not_in_context(self, tmp_path):
+        with pytest.raises(RuntimeError):
+            FileMetricStore(str(tmp_path)).post(composite("A", value=1.0))
+
+    def test_segments(self, preloaded_file_datastore: FileMetricStore):
+        assert len(preloaded_file_datastore._series["TestMetric"].segments) == 3
+        # results span segments
+        items = preloaded_file_datastore.composite_metrics_by_volume(metric_name="TestMetric", count=45)
+        all_items = preloaded_file_datastore.composite_metrics_by_volume(metric_name="TestMetric", count=200)
+        assert items.metric_data == all_items.metric_data[-45:]
+
+    def test_missing_values_and_out_of_order(self, tmp_path):
+        timestamp = datetime.datetime.utcnow()
+        with FileMetricStore(str(tmp_path)) as store:
+            store.post(composite("A", x=1.0, y=10.0), timestamp=timestamp)
+            store.post(composite("A", x=3.0), timestamp=timestamp + datetime.timedelta(seconds=2))
+            store.commit()
+            store.post(composite("A", y=20.0, z=5.0), timestamp=timestamp + datetime.timedelta(seconds=1))
+            store.commit()
+            items = store.metric_fields_by_volume("A", count=10)
+            assert items.metric_data == {'/A#x': [1.0, 3.0], '/A#y': [10.0, 20.0], '/A#z': [5.0]}
+            assert items.timestamps == [timestamp + datetime.timedelta(seconds=offset) for offset in range(3)]
+            assert items.metadata == [None, None, None]
+            items = store.metric_fields_by_volume("A", count=10, fields=['/A#z'])
+            assert items.timestamps == [timestamp + datetime.timedelta(seconds=1)]
+            assert store.composite_metrics_by_volume("A", count=1).metric_data == [composite("A", x=3.0)]
+            series = store.field_series("A", "/A#y")
+            assert [list(values) for _, values in series][1] == [20.0]
+            assert math.isnan(series[0][1][1])
+
+    def test_reopen_and_compact(self, tmp_path):
+        with FileMetricStore(str(tmp_path), max_segments=3) as store:
+            for index in range(5):
+                store.post(composite("A", x=float(index)), metadata=Metadata({'run': index % 2}))
+                store.commit()
+            assert len(os.listdir(os.path.join(str(tmp_path), "A"))) <= 4
+        store.close()
+        with FileMetricStore(str(tmp_path)) as store:
+            assert store.metric_fields_by_volume("A", count=10).metric_data == {'/A#x': [0.0, 1.0, 2.0, 3.0, 4.0]}
+            query = store.start_field_query("A", fields=None)
+            query.filter_on_metadata_field('run', 1, MetricStore.Comparison.EQUAL)
+            assert query.execute().metric_data == {'/A#x': [1.0, 3.0]}
+            store.compact()
+            assert len(store._series["A"].segments) == 1
+            assert store.metric_fields_by_volume("A", count=2).metric_data == {'/A#x': [3.0, 4.0]}
+        store.close()
+
+    def test_rollback(self, tmp_path, monkeypatch):
+        from daktylos.data_stores import file
+        write = file._ColumnBuffer.write
+
+        def fail_on_b(buffer, path):
+            if os.path.basename(os.path.dirname(path)) == "B":
+                raise OSError("disk full")
+            write(buffer, path)
+
+        timestamp = datetime.datetime(2020, 1, 1)
+        with FileMetricStore(str(tmp_path)) as store:
+            store.post(composite("A", x=1.0), timestamp=timestamp, metadata=Metadata({'run': 1}))
+            store.post(composite("B", x=1.0), timestamp=timestamp, metadata=Metadata({'run': 1}))
+            monkeypatch.setattr(file._ColumnBuffer, "write", fail_on_b)
+            with pytest.raises(OSError):
+                store.commit()
+            monkeypatch.setattr(file._ColumnBuffer, "write", write)
+            # metrics already written are not written again
+            store.commit()
+            assert store.metric_fields_by_volume("A", count=10).metric_data == {'/A#x': [1.0]}
+            assert store.metric_fields_by_volume("B", count=10).metric_data == {'/B#x': [1.0]}
+            # metrics and metadata sets not written are discarded
+            store.post(composite("A", x=2.0), timestamp=timestamp, metadata=Metadata({'run': 2}))
+            store.rollback()
+            store.post(composite("A", x=3.0), timestamp=timestamp, metadata=Metadata({'run': 3}))
+            store.commit()
+        store.close()
+        with FileMetricStore(str(tmp_path)) as store:
+            result = store.metric_fields_by_volume("A", count=10)
+            assert result.metric_data == {'/A#x': [1.0, 3.0]}
+            assert result.metadata == [Metadata({'run': 1}), Metadata({'run': 3})]
+        store.close()
+
+    def test_interrupted_compaction(self, tmp_path):
+        directory = os.path.join(str(tmp_path), "A")
+        with FileMetricStore(str(tmp_path)) as store:
+            for index in range(3):
+                store.post(composite("A", x=float(index)))
+                store.commit()
+            segments = {name: open(os.path.join(directory, name), 'rb').read() for name in os.listdir(directory)
+                        if name.endswith(".seg")}
+            store.compact("A")
+            # as if the compaction stopped before removing the segments it replaces
+            for name, content in segments.items():
+                with open(os.path.join(directory, name), 'wb') as stream:
+                    stream.write(content)
+            store.post(composite("A", x=3.0))
+            store.commit()
+        store.close()
+        with FileMetricStore(str(tmp_path)) as store:
+            assert store.metric_fields_by_volume("A", count=10).metric_data == {'/A#x': [0.0, 1.0, 2.0, 3.0]}
+            assert sorted(name for name in os.listdir(directory) if name.endswith(".seg")) == \
+                ["0000000004c.seg", "0000000005.seg"]
+            store.compact("A")
+            assert store.metric_fields_by_volume("A", count=10).metric_data == {'/A#x': [0.0, 1.0, 2.0, 3.0]}
+        store.close()
+
+    def test_purge(self, preloaded_file_datastore: FileMetricStore):
+        timestamp = preloaded_file_datastore.base_timestamp
+        preloaded_file_datastore.purge_by_date(before=timestamp - datetime.timedelta(days=1))
+        assert len(preloaded_file_datastore.composite_metrics_by_volume("TestMetric", count=200).timestamps) == 100
+        preloaded_file_datastore.purge_by_volume(count_=50, name="TestMetric")
+        items = preloaded_file_datastore.composite_metrics_by_volume("TestMetric", count=200)
+        assert len(items.timestamps) == 50
+        assert all(int(item['#child1'].value) < 51 for item in items.metric_data)
+        preloaded_file_datastore.purge_by_date(before=timestamp - datetime.timedelta(seconds=9), name="TestMetric")
+        assert len(preloaded_file_datastore.metric_fields_by_volume("TestMetric", count=200).timestamps) == 10
+        preloaded_file_datastore.purge_by_date(before=timestamp + datetime.timedelta(days=1))
+        assert preloaded_file_datastore._series["TestMetric"].segments == {}
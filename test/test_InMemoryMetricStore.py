@@ -0,0 +1,96 @@
+import datetime
+
+import pytest
+
+from daktylos.data import CompositeMetric, Metric, Metadata, MetricStore, like_to_regex
+from daktylos.data_stores.memory import InMemoryMetricStore
+from daktylos.instrumentation import HistogramSink
+
+metadata = Metadata.system_info()
+
+
+def test_like_to_regex():
+    assert like_to_regex('%grandchild%').match('/TestMetric/child2#Grandchild1')
+    assert like_to_regex('/TestMetric#child_').match('/TestMetric#child1')
+    assert not like_to_regex('/TestMetric#child_').match('/TestMetric#child12')
+    assert like_to_regex('a.b*').match('a.b*')
+    assert not like_to_regex('a.b*').match('axb*')
+
+
+class TestInMemoryMetricStore:
+    # the scenarios common to all stores run against this store through the `datastore` and `preloaded_datastore`
+    # fixtures of test_SQLMetricStore; those below are specific to it
+
+    def test_not_in_context(self):
+        store = InMemoryMetricStore()
+        with pytest.raises(RuntimeError):
+            store.post(CompositeMetric(name="TestMetric"))
+
+    def test_purge_releases_metadata(self, preloaded_memory_datastore: InMemoryMetricStore):
+        timestamp = preloaded_memory_datastore.base_timestamp
+        preloaded_memory_datastore.purge_by_date(before=timestamp - datetime.timedelta(days=1))
+        assert preloaded_memory_datastore.count() == 100
+        preloaded_memory_datastore.purge_by_date(before=timestamp - datetime.timedelta(seconds=89), name="TestMetric")
+        assert preloaded_memory_datastore.count("TestMetric") == 90
+        preloaded_memory_datastore.purge_by_date(before=timestamp + datetime.timedelta(days=1))
+        assert preloaded_memory_datastore.count() == 0
+        assert len(preloaded_memory_datastore._metadata) == 0
+        assert preloaded_memory_datastore._metadata._index == {}
+
+    def test_post_out_of_order(self, memory_datastore: InMemoryMetricStore):
+        timestamp = datetime.datetime.utcnow()
+        for offset in [3, 1, 2, 0]:
+            metric = CompositeMetric(name="TestMetric")
+            metric.add(Metric("value", float(offset)))
+            memory_datastore.post(metric, timestamp=timestamp - datetime.timedelta(seconds=offset))
+        items = memory_datastore.composite_metrics_by_volume("TestMetric", count=3)
+        assert [item['#value'].value for item in items.metric_data] == [2.0, 1.0, 0.0]
+        assert items.metadata == [None, None, None]
+
+    def test_filter_on_metadata_field(self, memory_datastore: InMemoryMetricStore):
+        for index, platform in enumerate(["linux", "darwin", "linux"]):
+            metric = CompositeMetric(name="TestMetric")
+            metric.add(Metric("value", float(index)))
+            memory_datastore.post(metric, metadata=Metadata({'platform': platform, 'num_cores': 4 * (index + 1)}),
+                                  timestamp=datetime.datetime.utcnow() - datetime.timedelta(seconds=10 - index))
+        query = memory_datastore.start_query("TestMetric")
+        query.filter_on_metadata_field('num_cores', 8, MetricStore.Comparison.GREATER_THAN_OR_EQUAL)
+        assert [item['#value'].value for item in query.execute().metric_data] == [1.0, 2.0]
+        query.filter_on_metadata(platform="linux")
+        assert [item['#value'].value for item in query.execute().metric_data] == [2.0]
+        with pytest.raises(ValueError):
+            query.filter_on_metadata_field('num_cores', 8, None)
+        # integers compare against integer metadata only, strings compare as text
+        query = memory_datastore.start_query("TestMetric")
+        query.filter_on_metadata_field('platform', 4, MetricStore.Comparison.GREATER_THAN)
+        assert query.execute().metric_data == []
+        query = memory_datastore.start_query("TestMetric")
+        query.filter_on_metadata_field('num_cores', '5', MetricStore.Comparison.LESS_THAN)
+        assert [item['#value'].value for item in query.execute().metric_data] == [0.0, 2.0]
+
+    def test_statistics_and_instrumentation(self, preloaded_memory_datastore: InMemoryMetricStore):
+        sink = HistogramSink()
+        preloaded_memory_datastore.instrument(sink)
+        result = preloaded_memory_datastore.start_query("TestMetric", 10).collect_statistics().execute()
+        assert result.stats.rows == result.stats.objects == 10
+        assert result.stats.statements == 0
+        with pytest.raises(NotImplementedError):
+            preloaded_memory_datastore.start_query("TestMetric").explain()
+        assert sink.snapshot()["query.composite"]["rows"] == 10
+
+    def test_rolling_baseline(self):
+        with InMemoryMetricStore(baseline_window=2) as store:
+            for value in [1.0, 2.0, 3.0]:
+                metric = CompositeMetric(name="BaselineMetric")
+                metric.add(Metric("value", value))
+                store.post(metric, metadata=metadata)
+            other = CompositeMetric(name="BaselineMetric")
+            other.add(Metric("value", 10.0))
+            store.post(other, metadata=Metadata({'platform': "other"}))
+            assert store.rolling_baseline("BaselineMetric", metadata)["/BaselineMetric#value"].values == [2.0, 3.0]
+            assert store.rolling_baseline("BaselineMetric",
+                                          Metadata({'platform': "other"}))["/BaselineMetric#value"].values == [10.0]
+            assert store.rolling_baseline("BaselineMetric") == {}
+        with InMemoryMetricStore() as store:
+            with pytest.raises(RuntimeError):
+                store.rolling_baseline("BaselineMetric")
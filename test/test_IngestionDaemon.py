@@ -0,0 +1,201 @@
+import datetime
+import socket
+import struct
+import threading
+import time
+
+import pytest
+import sqlalchemy
+
+from daktylos.data import CompositeMetric, Metric, Metadata
+from daktylos.data_stores.ingest import IngestionClient, IngestionDaemon, _Decoder, _Encoder
+from daktylos.data_stores.memory import InMemoryMetricStore
+from daktylos.data_stores.sql import SQLMetricStore
+
+from conftest import composite
+
+base = datetime.datetime(2020, 1, 1)
+
+
+class Recording(InMemoryMetricStore):
+    """
+    In-memory store counting its commits, and failing to post metrics named "Bad"
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.commits = 0
+
+    def post(self, metric, *args, **kwds):
+        if metric.name == "Bad":
+            raise ValueError("bad metric")
+        super().post(metric, *args, **kwds)
+
+    def commit(self):
+        self.commits += 1
+        super().commit()
+
+
+class TestIngestionDaemon:
+
+    def test_coding(self):
+        encoder = _Encoder()
+        decoder = _Decoder()
+        posts = [(composite("Métric", value=2.5, child={'square': 6.25}), base,
+                  Metadata({'platform': "Linux", 'build': -12345678901234}),
+                  "project", "uuid-1"),
+                 (composite("Métric", value=-1.0, child={'square': 1.0}),
+                  base - datetime.timedelta(days=20000, microseconds=1), None, None, None),
+                 (CompositeMetric("Empty"), base, Metadata({}), None, "uuid-2")]
+        sizes = []
+        for post in posts + posts[:1]:
+            out = bytearray()
+            encoder.post(out, *post)
+            sizes.append(len(out))
+            assert struct.unpack('>I', out[:4])[0] == len(out) - 4
+            assert decoder.post(bytes(out[4:])) == post
+        # strings are sent once per connection
+        assert sizes[-1] < sizes[0] / 2
+        with pytest.raises(ValueError):
+            encoder.post(bytearray(), composite("A", value=1.0), base, Metadata({'ratio': 0.5}), None, None)
+        out = bytearray()
+        encoder.post(out, *posts[0])
+        assert decoder.post(bytes(out[4:])) == posts[0]
+
+    def test_many_producers(self, tmp_path):
+        engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'metrics.db'}")
+        SQLMetricStore(engine, create=True)
+
+        def produce(index: int):
+            with IngestionClient(address) as client:
+                for count in range(25):
+                    value = float(index * 25 + count)
+                    client.post(composite("Ingested", value=value, child={'square': value * value}),
+                                timestamp=base + datetime.timedelta(minutes=index * 25 + count),
+                                metadata=Metadata({'worker': index, 'platform': "Linux"}))
+                    if count % 10 == 9:
+                        client.commit()
+
+        with IngestionDaemon(SQLMetricStore(engine), str(tmp_path / 'daktylos.sock'), batch_size=40) as daemon:
+            address = daemon.address
+            producers = [threading.Thread(target=produce, args=(index,)) for index in range(4)]
+            for producer in producers:
+                producer.start()
+            for producer in producers:
+                producer.join()
+            # committed by the daemon once the clients have committed
+            with SQLMetricStore(engine) as store:
+                result = store.composite_metrics_by_volume("Ingested", count=200)
+                assert [metric['#value'].value for metric in result.metric_data] == [float(i) for i in range(100)]
+                assert result.metric_data[-1]['child#square'].value == 99.0 ** 2
+                assert result.metadata[-1] == Metadata({'worker': 3, 'platform': "Linux"})
+        assert not (tmp_path / 'daktylos.sock').exists()
+
+    def test_batches(self):
+        store = Recording()
+        with IngestionDaemon(store, ("127.0.0.1", 0), batch_size=10, interval=0.05) as daemon:
+            assert daemon.address[1] != 0
+            with IngestionClient(daemon.address, buffer_size=1) as client:
+                for index in range(25):
+                    client.post(composite("Batched", value=float(index)),
+                                timestamp=base + datetime.timedelta(seconds=index))
+                # the last metrics are committed once held for the interval
+                deadline = time.monotonic() + 5.0
+                while store.commits < 3 and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                assert 3 <= store.commits < 25
+            with IngestionClient(daemon.address) as client:
+                client.post(composite("Batched", value=25.0), timestamp=base + datetime.timedelta(seconds=25))
+        result = store.metric_fields_by_volume("Batched", count=100)
+        assert result.metric_data['/Batched#value'] == [float(index) for index in range(26)]
+
+    def test_errors(self):
+        store = Recording()
+        with IngestionDaemon(store, ("127.0.0.1", 0)) as daemon:
+            with IngestionClient(daemon.address) as client:
+                client.post(composite("Good", value=1.0, child={'square': 1.0}))
+                client.post(composite("Bad", value=1.0))
+                with pytest.raises(RuntimeError, match="bad metric"):
+                    client.commit()
+                client.post(composite("Good", value=2.0, child={'square': 4.0}))
+                client.commit()
+                with pytest.raises(NotImplementedError):
+                    client.start_query("Good")
+                with pytest.raises(NotImplementedError):
+                    client.purge_by_volume(1, "Good")
+            with socket.create_connection(daemon.address) as connection:
+                connection.sendall(struct.pack('>I', 2) + b'P\x05')
+                reply = connection.makefile('rb').read()
+                assert reply[4:5] == b'E'
+        assert store.metric_fields_by_volume("Good", count=10).metric_data == {'/Good#value': [1.0, 2.0],
+                                                                              '/Good/child#square': [1.0, 4.0]}
+        with pytest.raises(RuntimeError):
+            IngestionClient(daemon.address).post(composite("Good", value=3.0))
+        with pytest.raises(ValueError):
+            IngestionDaemon(store, ("127.0.0.1", 0), batch_size=0)
+
+    def test_failed_commit(self, tmp_path):
+        url = f"sqlite:///{tmp_path / 'metrics.db'}"
+        engine = sqlalchemy.create_engine(url, connect_args={'timeout': 0.1})
+        SQLMetricStore(engine, create=True)
+        blocker = sqlalchemy.create_engine(url).connect()
+        with IngestionDaemon(SQLMetricStore(engine), ("127.0.0.1", 0)) as daemon:
+            with IngestionClient(daemon.address, timeout=10.0) as client:
+                # another writer holds the lock of the database
+                transaction = blocker.begin()
+                blocker.execute(sqlalchemy.text("DELETE FROM metadata_sets"))
+                client.post(composite("Locked", value=1.0))
+                with pytest.raises(RuntimeError, match="Failed to commit"):
+                    client.commit()
+                transaction.rollback()
+                # metrics are committed again once the failed commit is rolled back
+                client.post(composite("Locked", value=2.0))
+                client.commit()
+        blocker.close()
+        with SQLMetricStore(engine) as store:
+            assert store.metric_fields_by_volume("Locked", count=10).metric_data['/Locked#value'] == [2.0]
+
+    def test_writer_failure(self):
+        class Broken(Recording):
+            def __enter__(self):
+                raise OSError("no such database")
+
+        with pytest.raises(RuntimeError, match="no such database"):
+            IngestionDaemon(Broken(), ("127.0.0.1", 0)).start()
+
+        class Failing(Recording):
+            def commit(self):
+                raise OSError("disk full")
+
+            def rollback(self):
+                raise OSError("disk gone")
+
+        # once the writer has stopped, commits are answered with the reason rather than waited on forever
+        with IngestionDaemon(Failing(), ("127.0.0.1", 0)) as daemon:
+            # as is the commit of the client on leaving its context
+            with pytest.raises(RuntimeError, match="Writer failed: disk"):
+                with IngestionClient(daemon.address, timeout=10.0) as client:
+                    client.post(composite("Lost", value=1.0))
+                    with pytest.raises(RuntimeError, match="Writer failed: disk"):
+                        client.commit()
+                    client.post(composite("Lost", value=2.0))
+
+    def test_failed_encoding(self):
+        store = Recording()
+        with IngestionDaemon(store, ("127.0.0.1", 0)) as daemon:
+            with IngestionClient(daemon.address, timeout=10.0) as client:
+                # fails once its new strings and part of its frame are encoded
+                bad = CompositeMetric(name="Good")
+                bad.add(Metric("unsent", 1.0))
+                bad.add(Metric("huge", 10 ** 400))
+                with pytest.raises(struct.error):
+                    client.post(bad, metadata=Metadata({'platform': "Linux"}))
+                # aware timestamps are taken as UTC
+                client.post(composite("Good", value=1.0), metadata=Metadata({'platform': "Linux"}),
+                            timestamp=datetime.datetime(2020, 1, 1, 2, tzinfo=datetime.timezone(
+                                datetime.timedelta(hours=2))))
+                client.commit()
+        result = store.composite_metrics_by_volume("Good", count=10)
+        assert result.timestamps == [base]
+        assert result.metadata == [Metadata({'platform': "Linux"})]
+        assert result.metric_data == [composite("Good", value=1.0)]
@@ -0,0 +1,137 @@
+import datetime
+import math
+import random
+
+import pytest
+import sqlalchemy
+
+from daktylos.data import CompositeMetric, FieldBatch, Metadata, MetricStore
+from daktylos.data_stores.blocks import (
+    SQLBlockMetricStore,
+    SQLSeriesBlock,
+    _decode_timestamps,
+    _decode_values,
+    _encode_timestamps,
+    _encode_values,
+)
+from daktylos.data_stores.sql import SQLMetadataSet
+
+from conftest import composite
+
+
+class TestSQLBlockMetricStore:
+
+    def test_coding(self):
+        rand = random.Random(0)
+        values = [rand.uniform(0.0, 100.0) for _ in range(50)] + [1.5] * 10 + [math.nan, -0.0, math.inf, 2.0 ** -1074]
+        decoded = _decode_values(_encode_values(values), len(values))
+        assert [value if not math.isnan(value) else None for value in decoded] == \
+            [value if not math.isnan(value) else None for value in values]
+        # repeated values take a bit each after the first
+        assert len(_encode_values([1.5] * 800)) == 8 + 100
+        timestamps = [-1, 0, 60_000_000, 120_000_000, 180_000_001, 180_000_001, 2 ** 62]
+        assert _decode_timestamps(_encode_timestamps(timestamps), len(timestamps)) == timestamps
+        # regular timestamps take a bit each after the first two
+        assert len(_encode_timestamps([index * 60_000_000 for index in range(801)])) == (64 + 37 + 799 + 7) // 8
+
+    def test_not_in_context(self, engine):
+        with pytest.raises(RuntimeError):
+            SQLBlockMetricStore(engine, create=True).post(composite("A", value=1.0))
+        with pytest.raises(ValueError):
+            SQLBlockMetricStore(engine, create=True, block_size=0)
+
+    def test_blocks(self, preloaded_block_datastore: SQLBlockMetricStore):
+        blocks = preloaded_block_datastore._session.query(SQLSeriesBlock).all()
+        # each commit starts new blocks, as its metrics are older than those of the latest block
+        assert sorted(block.count for block in blocks) == [4, 8, 8, 16, 16, 16, 16, 16]
+        # results span blocks
+        items = preloaded_block_datastore.composite_metrics_by_volume(metric_name="TestMetric", count=45)
+        all_items = preloaded_block_datastore.composite_metrics_by_volume(metric_name="TestMetric", count=200)
+        assert items.metric_data == all_items.metric_data[-45:]
+        # only the newest blocks are read for the latest metrics
+        result = preloaded_block_datastore.start_query("TestMetric", max_results=10).collect_statistics().execute()
+        all_result = preloaded_block_datastore.start_query("TestMetric").collect_statistics().execute()
+        assert len(result.timestamps) == 10
+        assert result.stats.rows * 3 < all_result.stats.rows
+        query = preloaded_block_datastore.start_query("TestMetric")
+        query.filter_on_date(oldest=preloaded_block_datastore.base_timestamp - datetime.timedelta(seconds=10),
+                             newest=preloaded_block_datastore.base_timestamp)
+        assert "series_blocks" in query.explain()
+        batches = list(preloaded_block_datastore.field_batches("TestMetric", fields=['%child1'], batch_size=30))
+        assert [len(batch) for batch in batches] == [30, 30, 30, 10]
+        assert [value for batch in batches for value in batch.values['/TestMetric#child1']] == \
+            [float(value) for value in range(100, 0, -1)]
+
+    def test_missing_values_and_out_of_order(self, engine):
+        timestamp = datetime.datetime(2020, 1, 1)
+        with SQLBlockMetricStore(engine, create=True) as store:
+            store.post(composite("A", x=1.0, y=10.0), timestamp=timestamp)
+            store.post(composite("A", x=3.0), timestamp=timestamp + datetime.timedelta(seconds=2))
+            store.commit()
+            store.post(composite("A", y=20.0, z=5.0), timestamp=timestamp + datetime.timedelta(seconds=1))
+            store.post_batch("A", FieldBatch(timestamps=[timestamp + datetime.timedelta(seconds=3)] * 2,
+                                             metadata=[Metadata({'run': 1}), None],
+                                             values={'/A#x': [4.0, math.nan], '/A#z': [math.nan, math.nan]}))
+            store.commit()
+            items = store.metric_fields_by_volume("A", count=10)
+            assert items.metric_data == {'/A#x': [1.0, 3.0, 4.0], '/A#y': [10.0, 20.0], '/A#z': [5.0]}
+            assert items.timestamps == [timestamp + datetime.timedelta(seconds=offset) for offset in range(4)]
+            assert items.metadata == [None, None, None, Metadata({'run': 1})]
+            items = store.metric_fields_by_volume("A", count=10, fields=['/A#z'])
+            assert items.timestamps == [timestamp + datetime.timedelta(seconds=1)]
+            # blocks overlapping in time are merged by timestamp
+            assert store.composite_metrics_by_volume("A", count=2).metric_data == \
+                [composite("A", x=3.0), composite("A", x=4.0)]
+            query = store.start_field_query("A", fields=None)
+            query.filter_on_metadata_field('run', 0, MetricStore.Comparison.GREATER_THAN)
+            assert query.execute().metric_data == {'/A#x': [4.0]}
+
+    def test_append_to_latest_block(self, engine):
+        start = datetime.datetime(2020, 1, 1)
+        with SQLBlockMetricStore(engine, create=True, block_size=4) as store:
+            for index in range(10):
+                store.post(composite("A", x=float(index)), timestamp=start + datetime.timedelta(minutes=index))
+                store.commit()
+            assert [block.count for block in store._session.query(SQLSeriesBlock).order_by(SQLSeriesBlock.oldest)] \
+                == [4, 4, 2]
+            assert store.metric_fields_by_volume("A", count=100).metric_data == \
+                {'/A#x': [float(index) for index in range(10)]}
+
+    def test_empty_metric(self, engine):
+        start = datetime.datetime(2020, 1, 1)
+        with SQLBlockMetricStore(engine, create=True) as store:
+            store.post(CompositeMetric('Empty'), timestamp=start)
+            store.post(CompositeMetric('Empty'), timestamp=start + datetime.timedelta(minutes=1))
+            store.commit()
+            # as in the SQL store, metrics without values are kept but not found by queries
+            assert [block.count for block in store._session.query(SQLSeriesBlock)] == [2]
+            assert store.composite_metrics_by_volume("Empty", count=10).timestamps == []
+            # blocks of such metrics are rewritten by a purge as well
+            store.purge_by_date(before=start + datetime.timedelta(seconds=30))
+            assert [block.count for block in store._session.query(SQLSeriesBlock)] == [1]
+            store.post(composite("A", x=1.0), timestamp=start)
+            store.commit()
+            assert store.metric_fields_by_volume("A", count=10).metric_data == {'/A#x': [1.0]}
+
+    def test_purge(self, preloaded_block_datastore: SQLBlockMetricStore):
+        timestamp = preloaded_block_datastore.base_timestamp
+        preloaded_block_datastore.purge_by_date(before=timestamp - datetime.timedelta(days=1))
+        assert len(preloaded_block_datastore.composite_metrics_by_volume("TestMetric", count=200).timestamps) == 100
+        preloaded_block_datastore.purge_by_volume(count_=50, name="TestMetric")
+        items = preloaded_block_datastore.composite_metrics_by_volume("TestMetric", count=200)
+        assert len(items.timestamps) == 50
+        assert all(int(item['#child1'].value) < 51 for item in items.metric_data)
+        preloaded_block_datastore.purge_by_date(before=timestamp - datetime.timedelta(seconds=9), name="TestMetric")
+        assert len(preloaded_block_datastore.metric_fields_by_volume("TestMetric", count=200).timestamps) == 10
+        assert preloaded_block_datastore._session.query(SQLMetadataSet).count() == 1
+        preloaded_block_datastore.purge_by_date(before=timestamp + datetime.timedelta(days=1))
+        assert preloaded_block_datastore._session.query(SQLSeriesBlock).count() == 0
+        assert preloaded_block_datastore._session.query(SQLMetadataSet).count() == 0
+
+    def test_rolling_baseline(self, engine):
+        with SQLBlockMetricStore(engine, create=True, baseline_window=3) as store:
+            for index in range(5):
+                store.post(composite("A", x=float(index)), timestamp=datetime.datetime(2020, 1, 1, minute=index))
+            store.commit()
+        with SQLBlockMetricStore(engine, baseline_window=3) as store:
+            assert store.rolling_baseline("A")['/A#x'].values == [2.0, 3.0, 4.0]
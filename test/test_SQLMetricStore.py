@@ -1,15 +1,26 @@
 import datetime
+import time
 from dataclasses import dataclass
-from typing import Optional
+from typing import List, Optional
 
 import pytest
+import sqlalchemy
 
-from daktylos.data import CompositeMetric, Metric, Metadata, MetricDataClass
-from daktylos.data_stores.sql import SQLMetricStore
+from daktylos.data import CompositeMetric, FieldBatch, Metric, Metadata, MetricDataClass
+from daktylos.data_stores.sql import SQLMetricStore, SQLCompositeMetric, SQLMetric
+from daktylos.instrumentation import HistogramSink
 
 metadata = Metadata.system_info()
 
 
+def sql(store) -> bool:
+    """
+    :return: whether the given store of the (parametrized) store fixtures is a SQL store, whose tables a scenario
+       may inspect
+    """
+    return hasattr(store, "SQLCompositeMetric")
+
+
 @dataclass
 class SubMetricData:
     grandchild1: float
@@ -26,33 +37,63 @@ class TestMetricData:
 class TestSQLMetricStore:
 
     def test_purge_by_date(self, preloaded_datastore: SQLMetricStore):
-        SQLCompositeMetric = preloaded_datastore.SQLCompositeMetric
-        SQLMetadataSet = preloaded_datastore.SQLMetadataSet
-        SQLMetadata = preloaded_datastore.SQLMetadata
-        preloaded_datastore.purge_by_date(before=datetime.datetime.utcnow() - datetime.timedelta(days=1))
-        assert preloaded_datastore._session.query(SQLCompositeMetric).all() == []
-        assert preloaded_datastore._session.query(SQLMetadataSet).all() == []
-        assert preloaded_datastore._session.query(SQLMetadata).all() == []
+        # metrics newer than the date are kept
+        preloaded_datastore.purge_by_date(before=preloaded_datastore.base_timestamp - datetime.timedelta(seconds=49.5))
+        assert len(preloaded_datastore.composite_metrics_by_volume("TestMetric", count=200).metric_data) == 50
+        if sql(preloaded_datastore):
+            assert preloaded_datastore._session.query(preloaded_datastore.SQLCompositeMetric).count() == 50
+        preloaded_datastore.purge_by_date(before=preloaded_datastore.base_timestamp + datetime.timedelta(days=1))
+        assert preloaded_datastore.composite_metrics_by_volume("TestMetric", count=200).metric_data == []
+        if sql(preloaded_datastore):
+            assert preloaded_datastore._session.query(preloaded_datastore.SQLCompositeMetric).all() == []
+            assert preloaded_datastore._session.query(preloaded_datastore.SQLMetadataSet).all() == []
+            assert preloaded_datastore._session.query(preloaded_datastore.SQLMetadata).all() == []
+
+    @pytest.mark.parametrize("store_type", ["sql", "blocks"])
+    def test_purge_shared_metadata(self, store_type):
+        from daktylos.data_stores.blocks import SQLBlockMetricStore
+        from daktylos.data_stores.sql import SQLMetadata, SQLMetadataAssociationTable
+        engine = sqlalchemy.create_engine("sqlite:///:memory:")
+
+        @sqlalchemy.event.listens_for(engine, "connect")
+        def enforce_foreign_keys(connection, _):
+            connection.execute("PRAGMA foreign_keys=ON")
+
+        start = datetime.datetime(2020, 1, 1)
+        with (SQLMetricStore if store_type == "sql" else SQLBlockMetricStore)(engine, create=True) as store:
+            for index, build in enumerate(["old", "new"]):
+                store.post(CompositeMetric.from_flattened({'/TestMetric#value': float(index)}),
+                           timestamp=start + datetime.timedelta(days=index),
+                           metadata=Metadata({'platform': "linux", 'build': build}))
+            store.commit()
+            # the pair of the platform, shared by both sets, is kept along with the set still referenced
+            store.purge_by_date(before=start + datetime.timedelta(hours=12))
+            assert sorted((item.name, item.value) for item in store._session.query(SQLMetadata)) == \
+                [('build', "new"), ('platform', "linux")]
+            assert store._session.query(SQLMetadataAssociationTable).count() == 2
+            result = store.composite_metrics_by_volume("TestMetric", count=10, metadata_filter={'platform': "linux"})
+            assert result.metadata == [Metadata({'platform': "linux", 'build': "new"})]
 
     def test_purge_by_volume(self, preloaded_datastore: SQLMetricStore):
-        SQLCompositeMetric = preloaded_datastore.SQLCompositeMetric
-        SQLMetadataSet = preloaded_datastore.SQLMetadataSet
-        SQLMetadata = preloaded_datastore.SQLMetadata
-        assert preloaded_datastore._session.query(SQLCompositeMetric).count() == 100
         preloaded_datastore.purge_by_volume(count_=50, name="TestMetric")
-        assert preloaded_datastore._session.query(SQLCompositeMetric).count() == 50
-        assert preloaded_datastore._session.query(SQLMetadataSet).count() == 1
-        assert preloaded_datastore._session.query(SQLMetadata).count() == 6
-        for item in preloaded_datastore._session.query(SQLCompositeMetric).all():
-            for child in item.children + [None]:
-                if child is None:
-                    assert False, "Expected child but found none"
-                if child.name == '/TestMetric#child1':
-                    assert int(child.value) < 51
-                    break
+        items = preloaded_datastore.composite_metrics_by_volume("TestMetric", count=200)
+        assert len(items.metric_data) == 50
+        # the oldest metrics, of the largest values of child1, are purged
+        assert all(int(item['#child1'].value) < 51 for item in items.metric_data)
+        if sql(preloaded_datastore):
+            SQLCompositeMetric = preloaded_datastore.SQLCompositeMetric
+            assert preloaded_datastore._session.query(SQLCompositeMetric).count() == 50
+            assert preloaded_datastore._session.query(preloaded_datastore.SQLMetadataSet).count() == 1
+            assert preloaded_datastore._session.query(preloaded_datastore.SQLMetadata).count() == 6
+            for item in preloaded_datastore._session.query(SQLCompositeMetric).all():
+                for child in item.children + [None]:
+                    if child is None:
+                        assert False, "Expected child but found none"
+                    if child.name == '/TestMetric#child1':
+                        assert int(child.value) < 51
+                        break
 
     def test_post_data(self, datastore: SQLMetricStore):
-        SQLCompositeMetric = datastore.SQLCompositeMetric
         @dataclass
         class ChildMetric(MetricDataClass):
             grandchlid1: float
@@ -81,16 +122,18 @@ class TestSQLMetricStore:
                                 metadata=metadata,
                                 timestamp=datetime.datetime.utcnow(), project_name="TestProject", uuid="test_uuid")
         datastore.commit()
-        assert datastore._session.query(SQLCompositeMetric).count() == 100
-        for item in datastore._session.query(SQLCompositeMetric).all():
-            children = {child.name: child.value for child in item.children}
+        if sql(datastore):
+            assert datastore._session.query(datastore.SQLCompositeMetric).count() == 100
+        items = datastore.composite_metrics_by_volume("TestMetric", count=200)
+        assert len(items.metric_data) == 100
+        for item in items.metric_data:
+            children = item.flatten()
             index = int(children['/TestMetric#child1'])
             assert children['/TestMetric/child2#grandchlid1'] == pytest.approx(compare[index].child2.grandchlid1, 0.000001)
             assert children['/TestMetric/child2#grandchild2'] == pytest.approx(compare[index].child2.grandchild2, 0.000001)
             assert children['/TestMetric#child3'] == pytest.approx(compare[index].child3, 0.000001)
 
     def test_post(self, datastore: SQLMetricStore):
-        SQLCompositeMetric = datastore.SQLCompositeMetric
         def data_generator():
             seed = [1, 28832.12993, 0.00081238, 291]
             for index in range(100):
@@ -119,9 +162,12 @@ class TestSQLMetricStore:
             datastore.post(item, datetime.datetime.utcnow(), metadata=metadata,
                            project_name="TestProject", uuid="test_uuid")
         datastore.commit()
-        assert datastore._session.query(SQLCompositeMetric).count() == 100
-        for item in datastore._session.query(SQLCompositeMetric).all():
-            children = {child.name: child.value for child in item.children}
+        if sql(datastore):
+            assert datastore._session.query(datastore.SQLCompositeMetric).count() == 100
+        items = datastore.composite_metrics_by_volume("TestMetric", count=200)
+        assert len(items.metric_data) == 100
+        for item in items.metric_data:
+            children = item.flatten()
             index = int(children['/TestMetric#child1'])
             assert children['/TestMetric/child2#grandchild2.1'] == pytest.approx(compare[index]['child2']['grandchild2.1'].value, 0.000001)
             assert children['/TestMetric/child2#grandchild2.2'] == pytest.approx(compare[index]['child2']['#grandchild2.2'].value, 0.000001)
@@ -315,3 +361,507 @@ class TestSQLMetricStore:
                                                           metadata_filter={'platform': 'no_such_platform'})
         assert items.timestamps == items.metadata
         assert items.metric_data == {}
+
+    def test_rolling_baseline(self, engine):
+        def composite(value: float) -> CompositeMetric:
+            metric = CompositeMetric(name="BaselineMetric")
+            metric.add(Metric("value", value))
+            return metric
+
+        with SQLMetricStore(engine=engine, create=True) as store:
+            # seeded from history when not yet stored:
+            for value in [1.0, 2.0]:
+                store.post(composite(value), metadata=metadata,
+                           timestamp=datetime.datetime.utcnow() - datetime.timedelta(days=10 - value))
+            store.commit()
+        with SQLMetricStore(engine=engine, baseline_window=3) as store:
+            for value in [3.0, 4.0]:
+                store.post(composite(value), metadata=metadata)
+            store.commit()
+            store.post(composite(10.0), metadata=Metadata({'platform': "other"}))
+            store.commit()
+            assert store.rolling_baseline("BaselineMetric", metadata)["/BaselineMetric#value"].values == \
+                [2.0, 3.0, 4.0]
+            # baseline is persisted rather than recomputed from history:
+            store._session.query(SQLMetric).delete()
+            store._session.query(SQLCompositeMetric).delete()
+            store.commit()
+        with SQLMetricStore(engine=engine, baseline_window=3) as store:
+            baseline = store.rolling_baseline("BaselineMetric", metadata)
+            assert baseline["/BaselineMetric#value"].values == [2.0, 3.0, 4.0]
+            assert baseline["/BaselineMetric#value"].mean() == pytest.approx(3.0)
+            # metrics posted with other metadata, e.g. from another platform, have a baseline of their own
+            assert store.rolling_baseline("BaselineMetric", Metadata({'platform': "other"}))[
+                "/BaselineMetric#value"].values == [10.0]
+            assert store.rolling_baseline("BaselineMetric") == {}
+            assert store.rolling_baseline("NoSuchMetric") == {}
+        with SQLMetricStore(engine=engine) as store:
+            with pytest.raises(RuntimeError):
+                store.rolling_baseline("BaselineMetric")
+
+    def test_instrument(self, engine):
+        sink = HistogramSink()
+        with SQLMetricStore(engine=engine, create=True) as store:
+            store.instrument(sink)
+            for index in range(3):
+                metric = CompositeMetric(name="InstrumentedMetric")
+                metric.add(Metric("value", float(index)))
+                metric.add(Metric("other", 1.0))
+                store.post(metric, metadata=metadata)
+            store.commit()
+            store.metric_fields_by_volume("InstrumentedMetric", count=2)
+            store.composite_metrics_by_volume("InstrumentedMetric", count=2)
+            store.purge_by_volume(count_=1, name="InstrumentedMetric")
+            store.instrument(None)
+            store.commit()
+        snapshot = sink.snapshot()
+        assert set(snapshot) == {"post", "post_metadata", "commit", "query.fields", "query.composite",
+                                 "purge_by_volume"}
+        assert snapshot["post"]["count"] == 3
+        assert snapshot["post"]["rows"] == 6
+        assert snapshot["post_metadata"]["rows"] == 3 * len(metadata.values)
+        assert snapshot["commit"]["count"] == 1
+        assert snapshot["commit"]["statements"] > 0
+        assert snapshot["query.composite"]["rows"] == 2
+        assert snapshot["purge_by_volume"]["rows"] == 1
+        assert all(summary["p99"] >= summary["p50"] > 0.0 for summary in snapshot.values())
+
+    @pytest.mark.sql
+    def test_query_statistics(self, preloaded_datastore: SQLMetricStore):
+        query = preloaded_datastore.start_query("TestMetric", max_results=10)
+        assert query.execute().stats is None
+        result = preloaded_datastore.start_query("TestMetric", max_results=10).collect_statistics().execute()
+        assert len(result.metric_data) == 10
+        # the composites are selected along with their (4) values, and their metadata (all of the same set) in bulk:
+        assert result.stats.rows == 40 + len(metadata.values)
+        assert result.stats.statements == 2
+        assert result.stats.objects == 0
+        assert result.stats.database_time > 0.0
+        assert result.stats.decode_time > 0.0
+        result = preloaded_datastore.start_field_query("TestMetric", fields=None, max_results=10)\
+            .collect_statistics().execute()
+        assert result.stats.statements == 2
+        assert result.stats.rows == 40 + len(metadata.values)
+
+    @pytest.mark.sql
+    def test_explain(self, preloaded_datastore: SQLMetricStore):
+        query = preloaded_datastore.start_query("TestMetric", max_results=10)
+        plan = query.explain()
+        assert "composite_metrics" in plan
+        # explaining does not alter the query:
+        assert len(query.execute().metric_data) == 10
+        plan = preloaded_datastore.start_field_query("TestMetric", fields=["/TestMetric#*"]).explain()
+        assert "metric_values" in plan
+
+    @pytest.mark.sql
+    def test_statement_templates(self, preloaded_datastore: SQLMetricStore):
+        def query(count: int, system: str, fields: List[str]):
+            return preloaded_datastore.start_field_query("TestMetric", fields=fields, max_results=count).\
+                filter_on_metadata(system=system)
+
+        # queries of the same shape execute the same statement, with different values bound to it
+        first = query(3, metadata.values['system'], ["%child1"])
+        second = query(5, metadata.values['system'], ["%grandchild2"])
+        tables = preloaded_datastore._tables()[0]
+        assert first._prepared(*tables) is second._prepared(*tables)
+        result = first.execute()
+        assert sorted(result.metric_data) == ['/TestMetric#child1', '/TestMetric/child2#grandchild1',
+                                              '/TestMetric/child3#grandchild1']
+        assert result.metric_data['/TestMetric#child1'] == [3.0, 2.0, 1.0]
+        assert result.metric_data['/TestMetric/child3#grandchild1'] == [287.0, 289.0, 291.0]
+        result = second.execute()
+        assert list(result.metric_data) == ['/TestMetric/child2#grandchild2']
+        assert len(result.timestamps) == 5
+        assert len(query(5, "NoSuchSystem", ["%child1"]).execute().timestamps) == 0
+        # whereas queries of another shape do not
+        assert query(3, metadata.values['system'], ["child1"])._prepared(*tables) is not first._prepared(*tables)
+        assert preloaded_datastore.start_field_query("TestMetric", fields=["%child1"], max_results=3).\
+            _prepared(*tables) is not first._prepared(*tables)
+
+    def test_template_cache(self, monkeypatch):
+        from collections import OrderedDict
+        from concurrent.futures import ThreadPoolExecutor
+        from daktylos.data_stores import sql as sql_module
+        monkeypatch.setattr(sql_module, "_templates", OrderedDict())
+        monkeypatch.setattr(sql_module, "_MAX_TEMPLATES", 2)
+        first, second = sql_module._template(("first",), object), sql_module._template(("second",), object)
+        # a hit makes a template the most recently used
+        assert sql_module._template(("first",), object) is first
+        sql_module._template(("third",), object)
+        assert list(sql_module._templates) == [("first",), ("third",)]
+        assert sql_module._template(("second",), object) is not second
+        # threads sharing the cache are all given the same template of a shape
+        monkeypatch.setattr(sql_module, "_MAX_TEMPLATES", 256)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            templates = list(executor.map(lambda index: sql_module._template(("shape", index % 4), object),
+                                          range(400)))
+        assert all(template is templates[index % 4] for index, template in enumerate(templates))
+
+    def test_post_overlapping_metadata(self, datastore: SQLMetricStore):
+        for index, platform in enumerate(["linux", "darwin", "linux"]):
+            metric = CompositeMetric(name="TestMetric")
+            metric.add(Metric("value", float(index)))
+            metric.add(Metric("constant", 1.0))
+            datastore.post(metric, metadata=Metadata({'platform': platform, 'num_cores': 8}),
+                           timestamp=datetime.datetime.utcnow() - datetime.timedelta(seconds=10 - index))
+        datastore.commit()
+        if sql(datastore):
+            assert datastore._session.query(datastore.SQLMetadataSet).count() == 2
+            assert datastore._session.query(datastore.SQLMetadata).count() == 3
+        items = datastore.composite_metrics_by_volume(metric_name="TestMetric", count=10,
+                                                      metadata_filter={'num_cores': 8})
+        assert [metadata.values['platform'] for metadata in items.metadata] == ["linux", "darwin", "linux"]
+        assert [metric['constant'].value for metric in items.metric_data] == [1.0, 1.0, 1.0]
+        datastore.purge_by_volume(count_=2, name="TestMetric")
+        assert len(datastore.composite_metrics_by_volume(metric_name="TestMetric", count=10).metric_data) == 1
+        if sql(datastore):
+            assert datastore._session.query(datastore.SQLMetric).count() == 2
+
+    def test_filter_on_metadata(self, datastore: SQLMetricStore):
+        platforms = ["linux", "darwin", "linux", "windows", "linux"]
+        for index, platform in enumerate(platforms):
+            metric = CompositeMetric(name="TestMetric")
+            metric.add(Metric("value", float(index)))
+            datastore.post(metric, metadata=Metadata({'platform': platform, 'build': index}),
+                           timestamp=datetime.datetime.utcnow() - datetime.timedelta(seconds=10 - index))
+        datastore.commit()
+        items = datastore.composite_metrics_by_volume("TestMetric", count=10, metadata_filter={'platform': 'linux'})
+        assert [metric['value'].value for metric in items.metric_data] == [0.0, 2.0, 4.0]
+        items = datastore.composite_metrics_by_volume("TestMetric", count=10,
+                                                      metadata_filter={'platform': 'linux', 'build': 2})
+        assert [metric['value'].value for metric in items.metric_data] == [2.0]
+        assert datastore.composite_metrics_by_volume("TestMetric", count=10,
+                                                     metadata_filter={'platform': 'solaris'}).metric_data == []
+        # the count of a field query applies to the metrics matching the filter
+        items = datastore.metric_fields_by_volume("TestMetric", count=2, metadata_filter={'platform': 'linux'})
+        assert items.metric_data == {'/TestMetric#value': [2.0, 4.0]}
+        assert [metadata.values['build'] for metadata in items.metadata] == [2, 4]
+        query = datastore.start_field_query("TestMetric", fields=None)
+        query.filter_on_metadata_field('platform', 'linux', SQLMetricStore.Comparison.NOT_EQUAL)
+        assert query.execute().metric_data == {'/TestMetric#value': [1.0, 3.0]}
+        if sql(datastore):
+            assert "metadata_postings_lookup" in query.explain()
+
+    def test_metadata_index_backfill(self, engine):
+        from daktylos.data_stores.sql import SQLMetadataPosting
+        with SQLMetricStore(engine, create=True) as store:
+            for platform in ["linux", "darwin"]:
+                metric = CompositeMetric(name="TestMetric")
+                metric.add(Metric("value", 1.0))
+                store.post(metric, metadata=Metadata({'platform': platform, 'num_cores': 8}))
+            store.commit()
+            # as in a database created before the metadata index was introduced:
+            store._session.query(SQLMetadataPosting).delete()
+            store._session.execute(sqlalchemy.text("DROP INDEX metric_values_by_parent"))
+            store.commit()
+        with SQLMetricStore(engine, create=True) as store:
+            assert store._session.query(SQLMetadataPosting).count() == 4
+            assert 'metric_values_by_parent' in {index['name']
+                                                 for index in sqlalchemy.inspect(engine).get_indexes('metric_values')}
+            items = store.composite_metrics_by_volume("TestMetric", count=10, metadata_filter={'platform': 'darwin'})
+            assert len(items.metric_data) == 1
+            # values holding the text of an integer are indexed as integers
+            assert items.metadata[0].values == {'platform': 'darwin', 'num_cores': 8}
+            query = store.start_query("TestMetric")
+            query.filter_on_metadata_field('num_cores', 4, SQLMetricStore.Comparison.GREATER_THAN)
+            assert len(query.execute().metric_data) == 2
+
+    def test_numeric_metadata_comparisons(self, datastore: SQLMetricStore):
+        builds = [9, 10, 99, 100, 1000]
+        for index, build in enumerate(builds):
+            metric = CompositeMetric(name="TestMetric")
+            metric.add(Metric("value", float(build)))
+            datastore.post(metric, metadata=Metadata({'build': build, 'branch': f"v{build}"}),
+                           timestamp=datetime.datetime(2020, 1, 1) + datetime.timedelta(minutes=index))
+        datastore.commit()
+
+        def values(name, value, op):
+            query = datastore.start_field_query("TestMetric", fields=None)
+            query.filter_on_metadata_field(name, value, op)
+            return query.execute().metric_data.get('/TestMetric#value', [])
+
+        Comparison = SQLMetricStore.Comparison
+        # integers compare numerically (where text compares "100" < "99")
+        assert values('build', 99, Comparison.GREATER_THAN) == [100.0, 1000.0]
+        assert values('build', 10, Comparison.LESS_THAN_OR_EQUAL) == [9.0, 10.0]
+        assert values('build', 100, Comparison.GREATER_THAN_OR_EQUAL) == [100.0, 1000.0]
+        assert values('build', 99, Comparison.EQUAL) == [99.0]
+        assert values('build', '99', Comparison.EQUAL) == [99.0]
+        assert values('build', 99, Comparison.NOT_EQUAL) == [9.0, 10.0, 100.0, 1000.0]
+        # strings still compare as text, and integers do not compare against string metadata
+        assert values('branch', 'v100', Comparison.LESS_THAN) == [10.0]
+        assert values('branch', 100, Comparison.LESS_THAN) == []
+        query = datastore.start_field_query("TestMetric", fields=None)
+        query.filter_on_metadata_field('build', 4000, Comparison.GREATER_THAN)
+        assert query.execute().metric_data == {}
+        if sql(datastore):
+            assert "metadata_postings_numeric" in query.explain()
+        # integers are returned as integers
+        result = datastore.composite_metrics_by_volume("TestMetric", count=10)
+        assert [metadata.values['build'] for metadata in result.metadata] == builds
+        assert all(metadata.values['branch'] == f"v{metadata.values['build']}" for metadata in result.metadata)
+
+    def test_filter_latency_at_high_cardinality(self, datastore: SQLMetricStore):
+        count = 1000
+        start = datetime.datetime(2020, 1, 1)
+        # every metric has its own metadata set, as when the metadata holds a build number
+        metadata_sets = [Metadata({'platform': f"platform{index % 4}", 'build': index}) for index in range(count)]
+        datastore.post_batch("TestMetric", FieldBatch(
+            timestamps=[start + datetime.timedelta(minutes=index) for index in range(count)],
+            metadata=metadata_sets,
+            values={'/TestMetric#value': [float(index) for index in range(count)]}))
+        datastore.commit()
+
+        def elapsed(metadata_filter):
+            best = None
+            for _ in range(3):
+                begin = time.perf_counter()
+                items = datastore.metric_fields_by_date("TestMetric", oldest=start, newest=start + datetime.timedelta(
+                    minutes=count), metadata_filter=metadata_filter)
+                duration = time.perf_counter() - begin
+                best = duration if best is None else min(best, duration)
+            return best, items
+
+        unfiltered, items = elapsed(None)
+        assert len(items.timestamps) == count
+        filtered, items = elapsed({'platform': 'platform1', 'build': 501})
+        assert items.metric_data == {'/TestMetric#value': [501.0]}
+        # a selective filter resolves through the index rather than scanning and checking every metric
+        assert filtered < unfiltered / 2
+
+    def test_multi_query(self, datastore: SQLMetricStore):
+        names = [f"Metric{index}" for index in range(5)]
+        start = datetime.datetime(2020, 1, 1)
+        for index in range(30):
+            for position, name in enumerate(names):
+                metric = CompositeMetric(name=name)
+                metric.add(Metric("value", float(index)))
+                child = CompositeMetric(name="child")
+                child.add(Metric("position", float(position)))
+                metric.add(child)
+                datastore.post(metric, metadata=Metadata({'build': index, 'platform': ["linux", "darwin"][index % 2]}),
+                               timestamp=start + datetime.timedelta(minutes=index))
+        datastore.commit()
+        results = datastore.start_multi_query(names + ["NoSuchMetric", names[0]], max_results=10).\
+            collect_statistics().execute()
+        assert list(results) == names + ["NoSuchMetric"]
+        for name in names:
+            expected = datastore.composite_metrics_by_volume(name, count=10)
+            assert results[name].metric_data == expected.metric_data
+            assert results[name].timestamps == expected.timestamps
+            assert results[name].metadata == expected.metadata
+        assert results["NoSuchMetric"].metric_data == []
+        if sql(datastore):
+            # one statement selects all names with their values, another their metadata
+            assert results[names[0]].stats.statements == 2
+            assert results[names[0]].stats is results[names[1]].stats
+
+        query = datastore.start_multi_query(names[:2])
+        query.filter_on_date(oldest=start + datetime.timedelta(minutes=10),
+                             newest=start + datetime.timedelta(minutes=20))
+        query.filter_on_metadata(platform="linux")
+        query.filter_on_metadata_field('build', 15, SQLMetricStore.Comparison.GREATER_THAN)
+        results = query.execute()
+        for name in names[:2]:
+            assert [metric['value'].value for metric in results[name].metric_data] == [16.0, 18.0, 20.0]
+        assert results[names[1]].metric_data[0]['child']['position'].value == 1.0
+        assert datastore.start_multi_query([]).execute() == {}
+        with pytest.raises(ValueError):
+            datastore.start_multi_query(names).filter_on_metadata_field('build', 15, None)
+
+    def test_latest(self, datastore: SQLMetricStore):
+        start = datetime.datetime(2020, 1, 1)
+
+        def post(value: float, minutes: int, platform: Optional[str]):
+            metric = CompositeMetric(name="TestMetric")
+            metric.add(Metric("value", value))
+            datastore.post(metric, timestamp=start + datetime.timedelta(minutes=minutes),
+                           metadata=Metadata({'platform': platform, 'build': minutes}) if platform else None)
+
+        assert datastore.latest("TestMetric").metric_data == []
+        post(1.0, 10, "linux")
+        post(2.0, 20, "darwin")
+        post(3.0, 5, "linux")  # posted late, but not the latest
+        post(4.0, 0, None)
+        datastore.commit()
+        result = datastore.latest("TestMetric")
+        assert [metric['value'].value for metric in result.metric_data] == [2.0]
+        assert result.timestamps == [start + datetime.timedelta(minutes=20)]
+        assert result.metadata == [Metadata({'platform': 'darwin', 'build': 20})]
+        result = datastore.latest("TestMetric", metadata_filter={'platform': 'linux'})
+        assert [metric['value'].value for metric in result.metric_data] == [1.0]
+        assert result.metric_data == datastore.composite_metrics_by_volume(
+            "TestMetric", count=1, metadata_filter={'platform': 'linux'}).metric_data
+        assert datastore.latest("TestMetric", metadata_filter={'platform': 'linux', 'build': 5}).metric_data[0][
+            'value'].value == 3.0
+        assert datastore.latest("TestMetric", metadata_filter={'platform': 'solaris'}).metric_data == []
+        assert datastore.latest("OtherMetric").metric_data == []
+
+        # newer metrics replace the latest, from individual posts and batches
+        post(5.0, 30, "linux")
+        datastore.post_batch("TestMetric", FieldBatch(timestamps=[start + datetime.timedelta(minutes=40)],
+                                                      metadata=[None], values={'/TestMetric#value': [6.0]}))
+        datastore.commit()
+        assert datastore.latest("TestMetric").metric_data[0]['value'].value == 6.0
+        assert datastore.latest("TestMetric").metadata == [None]
+        assert datastore.latest("TestMetric", metadata_filter={'platform': 'linux'}).metric_data[0][
+            'value'].value == 5.0
+
+        # purging all metrics of a set of metadata purges its latest
+        datastore.purge_by_volume(count_=4, name="TestMetric")
+        assert datastore.latest("TestMetric").metric_data[0]['value'].value == 6.0
+        assert datastore.latest("TestMetric", metadata_filter={'platform': 'darwin'}).metric_data == []
+        assert datastore.latest("TestMetric", metadata_filter={'platform': 'linux'}).metric_data[0][
+            'value'].value == 5.0
+        datastore.purge_by_date(before=start + datetime.timedelta(days=1), name="TestMetric")
+        assert datastore.latest("TestMetric").metric_data == []
+
+    def test_post_batch_concurrent_writers(self, tmp_path):
+        url = f"sqlite:///{tmp_path / 'metrics.db'}"
+        engine, other_engine = sqlalchemy.create_engine(url), sqlalchemy.create_engine(url)
+
+        def batch(*values: float) -> FieldBatch:
+            return FieldBatch(timestamps=[datetime.datetime(2020, 1, 1, minute=int(value)) for value in values],
+                              metadata=[None] * len(values), values={'/TestMetric#value': list(values)})
+
+        with SQLMetricStore(engine, create=True) as store, SQLMetricStore(other_engine, create=True) as other:
+            posted = []
+
+            # another process posts between the store reading the state of the table and inserting its batch
+            def before_insert(conn, cursor, statement, parameters, context, executemany):
+                if statement.startswith("INSERT INTO composite_metrics") and not posted:
+                    posted.append(True)
+                    other.post_batch("TestMetric", batch(1.0, 2.0))
+                    other.commit()
+
+            sqlalchemy.event.listen(engine, "before_cursor_execute", before_insert)
+            store.post_batch("TestMetric", batch(3.0, 4.0))
+            store.commit()
+            sqlalchemy.event.remove(engine, "before_cursor_execute", before_insert)
+            assert posted
+            result = store.composite_metrics_by_volume("TestMetric", count=10)
+            assert [metric['value'].value for metric in result.metric_data] == [1.0, 2.0, 3.0, 4.0]
+
+    def test_rollback(self, tmp_path):
+        url = f"sqlite:///{tmp_path / 'metrics.db'}"
+        engine = sqlalchemy.create_engine(url, connect_args={'timeout': 0.1})
+        with SQLMetricStore(engine, create=True) as store, sqlalchemy.create_engine(url).connect() as blocker:
+            # another writer holds the lock of the database
+            transaction = blocker.begin()
+            blocker.execute(sqlalchemy.text("DELETE FROM metadata_sets"))
+            store.post(CompositeMetric.from_flattened({'/TestMetric#value': 1.0}))
+            with pytest.raises(sqlalchemy.exc.OperationalError):
+                store.commit()
+            transaction.rollback()
+            store.rollback()
+            store.post(CompositeMetric.from_flattened({'/TestMetric#value': 2.0}))
+            store.commit()
+            assert store.metric_fields_by_volume("TestMetric", count=10).metric_data == {'/TestMetric#value': [2.0]}
+            assert store.latest("TestMetric").metric_data[0]['value'].value == 2.0
+
+    def test_latest_backfill(self, engine):
+        from daktylos.data_stores.sql import SQLLatestComposite
+        with SQLMetricStore(engine, create=True) as store:
+            for index, platform in enumerate(["linux", "darwin", "linux"]):
+                metric = CompositeMetric(name="TestMetric")
+                metric.add(Metric("value", float(index)))
+                store.post(metric, metadata=Metadata({'platform': platform}),
+                           timestamp=datetime.datetime(2020, 1, 1, minute=index))
+            store.commit()
+            # as in a database created before the table of latest metrics was introduced:
+            store._session.query(SQLLatestComposite).delete()
+            store.commit()
+        with SQLMetricStore(engine, create=True) as store:
+            assert store._session.query(SQLLatestComposite).count() == 2
+            assert store.latest("TestMetric", metadata_filter={'platform': 'linux'}).metric_data[0][
+                'value'].value == 2.0
+
+
+class TestPartitionedSQLMetricStore:
+
+    @staticmethod
+    def post_history(store: SQLMetricStore) -> None:
+        # ten metrics a month, from January to April
+        for month in range(1, 5):
+            for index in range(10):
+                metric = CompositeMetric(name="TestMetric")
+                metric.add(Metric("value", float(month * 100 + index)))
+                metric.add(Metric("square", float(index * index)))
+                store.post(metric, timestamp=datetime.datetime(2020, month, 1 + index),
+                           metadata=Metadata({'platform': "linux" if index % 2 else "darwin", 'build': index}))
+        store.commit()
+
+    def test_queries(self, engine):
+        with SQLMetricStore(engine, create=True, partitions="month") as store:
+            self.post_history(store)
+            tables = sqlalchemy.inspect(engine).get_table_names()
+            assert [f"composite_metrics_p20200{month}" in tables for month in range(1, 6)] == [True] * 4 + [False]
+            assert store._session.query(SQLCompositeMetric).count() == 0
+            # spanning partitions
+            result = store.composite_metrics_by_volume("TestMetric", count=12)
+            assert [metric['value'].value for metric in result.metric_data] == \
+                [308.0, 309.0] + [400.0 + index for index in range(10)]
+            assert result.timestamps == sorted(result.timestamps)
+            result = store.metric_fields_by_volume("TestMetric", count=3, fields=["%value"],
+                                                   metadata_filter={'platform': "linux"})
+            assert result.metric_data == {'/TestMetric#value': [405.0, 407.0, 409.0]}
+            result = store.composite_metrics_by_date("TestMetric", oldest=datetime.datetime(2020, 2, 9),
+                                                     newest=datetime.datetime(2020, 3, 2))
+            assert [metric['value'].value for metric in result.metric_data] == [208.0, 209.0, 300.0, 301.0]
+            # only the partitions of the dates selected are read
+            query = store.start_query("TestMetric")
+            query.filter_on_date(oldest=datetime.datetime(2020, 2, 9), newest=datetime.datetime(2020, 3, 2))
+            plan = query.explain()
+            assert "p202002" in plan and "p202003" in plan
+            assert "p202001" not in plan and "p202004" not in plan
+            results = store.start_multi_query(["TestMetric", "Other"], max_results=11).execute()
+            assert [metric['value'].value for metric in results["TestMetric"].metric_data] == \
+                [309.0] + [400.0 + index for index in range(10)]
+            assert results["Other"].metric_data == []
+            assert store.latest("TestMetric", metadata_filter={'platform': "darwin"}).metric_data[0][
+                'value'].value == 408.0
+            batches = list(store.field_batches("TestMetric", fields=["%square"], batch_size=15))
+            assert [len(batch) for batch in batches] == [15, 15, 10]
+            assert batches[0].values['/TestMetric#square'][10:] == [0.0, 1.0, 4.0, 9.0, 16.0]
+            # batches posted are inserted into their partitions on commit, and seen by queries before
+            store.post_batch("TestMetric", FieldBatch(timestamps=[datetime.datetime(2020, 5, 1)], metadata=[None],
+                                                      values={'/TestMetric#value': [500.0]}))
+            assert store.composite_metrics_by_volume("TestMetric", count=1).metric_data[0]['value'].value == 500.0
+            store.commit()
+        # partitions are found by a store created anew
+        with SQLMetricStore(engine, create=True, partitions="month") as store:
+            assert len(store.composite_metrics_by_volume("TestMetric", count=100).timestamps) == 41
+            assert store.latest("TestMetric").metric_data[0]['value'].value == 500.0
+
+    def test_purge(self, engine):
+        with SQLMetricStore(engine, create=True, partitions="month") as store:
+            self.post_history(store)
+            # partitions ending by the date are dropped, and rows deleted from the one holding it
+            store.purge_by_date(before=datetime.datetime(2020, 3, 5))
+            tables = sqlalchemy.inspect(engine).get_table_names()
+            assert "composite_metrics_p202001" not in tables and "metric_values_p202002" not in tables
+            assert [partition.suffix for partition in store._partitions] == ["p202003", "p202004"]
+            result = store.composite_metrics_by_volume("TestMetric", count=100)
+            assert [metric['value'].value for metric in result.metric_data] == \
+                [300.0 + index for index in range(4, 10)] + [400.0 + index for index in range(10)]
+            store.purge_by_volume(count_=8, name="TestMetric")
+            result = store.composite_metrics_by_volume("TestMetric", count=100)
+            assert [metric['value'].value for metric in result.metric_data] == [400.0 + index for index in range(2, 10)]
+            # metrics of a name are deleted row by row, keeping the partitions of other names
+            store.purge_by_date(before=datetime.datetime(2020, 5, 1), name="TestMetric")
+            assert store.composite_metrics_by_volume("TestMetric", count=100).timestamps == []
+            assert store.latest("TestMetric").metric_data == []
+            assert [partition.suffix for partition in store._partitions] == ["p202003", "p202004"]
+
+    def test_invalid(self, engine):
+        with pytest.raises(ValueError):
+            SQLMetricStore(engine, create=True, partitions="week")
+        with SQLMetricStore(engine, create=True, partitions="day") as store:
+            metric = CompositeMetric(name="TestMetric")
+            metric.add(Metric("value", 1.0))
+            store.post(metric, timestamp=datetime.datetime(2020, 1, 1, 12))
+            store.commit()
+            assert [partition.suffix for partition in store._partitions] == ["p20200101"]
+        # metrics partitioned by time would not be found by a store that is not
+        with pytest.raises(ValueError):
+            SQLMetricStore(engine, create=True)
@@ -0,0 +1,152 @@
+import datetime
+import math
+import threading
+from dataclasses import dataclass
+
+import pytest
+import sqlalchemy
+
+from daktylos.data import FieldBatch, Metadata, MetricDataClass, MetricStore
+from daktylos.data_stores.memory import InMemoryMetricStore
+from daktylos.data_stores.sharded import ShardedMetricStore
+from daktylos.data_stores.sql import SQLMetricStore
+
+from conftest import composite
+
+base = datetime.datetime(2020, 1, 1)
+platforms = ["Linux", "Darwin", "Windows"]
+
+
+@dataclass
+class Values(MetricDataClass):
+    value: float
+    square: float
+
+
+@pytest.fixture
+def sql_stores(tmp_path):
+    return [SQLMetricStore(sqlalchemy.create_engine(f"sqlite:///{tmp_path / f'shard{index}.db'}"), create=True)
+            for index in range(3)]
+
+
+def post_history(store: MetricStore, names, count: int = 30) -> None:
+    # metrics of each platform posted in turn, so that the latest of a name are spread across platforms
+    for name in names:
+        for index in range(count):
+            store.post(composite(name, value=float(index), square=float(index * index)),
+                       timestamp=base + datetime.timedelta(minutes=index),
+                       metadata=Metadata({'platform': platforms[index % 3], 'build': index}))
+    store.commit()
+
+
+def count(store: ShardedMetricStore, index: int, metric_name: str) -> int:
+    # shards are only used from their own worker threads
+    return store._call(index, lambda shard: len(shard.start_query(metric_name).execute().timestamps))
+
+
+class TestShardedMetricStore:
+
+    def test_routing_by_name(self, sql_stores):
+        names = [f"Metric{index}" for index in range(12)]
+        with ShardedMetricStore(sql_stores) as store:
+            post_history(store, names, count=5)
+            assert {store.shard(name) for name in names} == {0, 1, 2}
+            for name in names:
+                assert [count(store, index, name) for index in range(3)] == \
+                    [5 if index == store.shard(name) else 0 for index in range(3)]
+                result = store.composite_metrics_by_volume(name, count=3)
+                assert [metric['#value'].value for metric in result.metric_data] == [2.0, 3.0, 4.0]
+                assert [metadata.values['build'] for metadata in result.metadata] == [2, 3, 4]
+                assert store.metric_fields_by_volume(name, count=2, fields=['%value']).metric_data == \
+                    {f'/{name}#value': [3.0, 4.0]}
+            # routing is stable across instances (and processes)
+            assert [ShardedMetricStore(sql_stores).shard(name) for name in names] == \
+                [store.shard(name) for name in names]
+
+    def test_spread_queries(self, sql_stores):
+        with ShardedMetricStore(sql_stores, key=lambda name, metadata: metadata.values['platform']) as store:
+            post_history(store, ["Spread"])
+            assert [count(store, index, "Spread") for index in range(3)] == [10, 10, 10]
+            # the latest across shards, merged from oldest to newest
+            result = store.composite_metrics_by_volume("Spread", count=7)
+            assert [metric['#value'].value for metric in result.metric_data] == [float(i) for i in range(23, 30)]
+            assert result.timestamps == sorted(result.timestamps)
+            assert len(store.composite_metrics_by_volume("Spread", count=100).timestamps) == 30
+            result = store.composite_metrics_by_date("Spread", oldest=base + datetime.timedelta(minutes=25),
+                                                     newest=base + datetime.timedelta(minutes=27))
+            assert [metric['#value'].value for metric in result.metric_data] == [25.0, 26.0, 27.0]
+            result = store.composite_metrics_by_volume("Spread", count=2, metadata_filter={'platform': 'Linux'})
+            assert [metric['#value'].value for metric in result.metric_data] == [24.0, 27.0]
+            query = store.start_query("Spread", max_results=3)
+            query.filter_on_metadata_field("build", 10, MetricStore.Comparison.LESS_THAN)
+            assert [metric['#value'].value for metric in query.execute().metric_data] == [7.0, 8.0, 9.0]
+            result = store.dataclass_metrics_by_volume("Spread", Values, count=2)
+            assert result.metric_data == [Values(28.0, 784.0), Values(29.0, 841.0)]
+            result = store.metric_fields_by_volume("Spread", count=3, fields=['%square'])
+            assert result.metric_data == {'/Spread#square': [729.0, 784.0, 841.0]}
+            assert [metadata.values['platform'] for metadata in result.metadata] == ['Linux', 'Darwin', 'Windows']
+            result = store.start_query("Spread", max_results=4).collect_statistics().execute()
+            assert result.stats.statements == 6
+            assert "shard 2:" in store.start_query("Spread").explain()
+            latest = store.latest("Spread", metadata_filter={'platform': 'Darwin'})
+            assert latest.metric_data[0]['#value'].value == 28.0
+
+    def test_multi_query(self):
+        for key in [None, lambda name, metadata: metadata.values['platform']]:
+            with ShardedMetricStore([InMemoryMetricStore() for _ in range(3)], key=key) as store:
+                post_history(store, ["A", "B", "C"], count=10)
+                results = store.start_multi_query(["A", "C", "D"], max_results=4).\
+                    filter_on_metadata_field("build", 8, MetricStore.Comparison.LESS_THAN).execute()
+                assert list(results) == ["A", "C", "D"]
+                assert [metric['#value'].value for metric in results["C"].metric_data] == [4.0, 5.0, 6.0, 7.0]
+                assert results["D"].timestamps == []
+
+    def test_purge(self):
+        with ShardedMetricStore([InMemoryMetricStore() for _ in range(3)],
+                                key=lambda name, metadata: metadata.values['platform']) as store:
+            post_history(store, ["Spread", "Other"])
+            # the oldest across shards
+            store.purge_by_volume(20, name="Spread")
+            result = store.composite_metrics_by_volume("Spread", count=100)
+            assert [metric['#value'].value for metric in result.metric_data] == [float(i) for i in range(20, 30)]
+            store.purge_by_date(before=base + datetime.timedelta(minutes=25))
+            assert len(store.composite_metrics_by_volume("Spread", count=100).timestamps) == 5
+            assert len(store.composite_metrics_by_volume("Other", count=100).timestamps) == 5
+
+    def test_batches(self):
+        batch = FieldBatch(timestamps=[base + datetime.timedelta(minutes=index) for index in range(6)],
+                           metadata=[Metadata({'platform': platforms[index % 3]}) for index in range(6)],
+                           values={'/Batch#a': [float(index) for index in range(6)],
+                                   '/Batch#b': [math.nan, 1.0, math.nan, 3.0, math.nan, 5.0]})
+        for key in [None, lambda name, metadata: metadata.values['platform']]:
+            with ShardedMetricStore([InMemoryMetricStore() for _ in range(3)], key=key) as store:
+                store.post_batch("Batch", batch)
+                store.commit()
+                batches = list(store.field_batches("Batch", batch_size=4))
+                assert [len(item) for item in batches] == [4, 2]
+                assert [timestamp for item in batches for timestamp in item.timestamps] == batch.timestamps
+                assert [value for item in batches for value in item.values['/Batch#a']] == batch.values['/Batch#a']
+
+    def test_shards_served_by_own_threads(self):
+        threads = []
+
+        class Recording(InMemoryMetricStore):
+            def post(self, *args, **kwds):
+                threads.append(threading.current_thread())
+                super().post(*args, **kwds)
+
+        shards = [Recording(), Recording()]
+        with ShardedMetricStore(shards) as store:
+            for name in ["A", "B", "C", "D", "E"]:
+                store.post(composite(name, value=1.0, square=1.0))
+        assert threading.current_thread() not in threads
+        assert len(set(threads)) == len({store.shard(name) for name in ["A", "B", "C", "D", "E"]})
+        with pytest.raises(RuntimeError):
+            store.post(composite("A", value=1.0, square=1.0))
+
+    def test_invalid(self, sql_stores):
+        with pytest.raises(ValueError):
+            ShardedMetricStore([])
+        with ShardedMetricStore(sql_stores, key=lambda name, metadata: metadata.values['platform']) as store:
+            with pytest.raises(NotImplementedError):
+                store.rolling_baseline("Spread")
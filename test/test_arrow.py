@@ -0,0 +1,184 @@
+import datetime
+import math
+
+import pytest
+
+from daktylos.data import CompositeMetric, FieldBatch, Metadata, Metric, MetricStore
+from daktylos.data_stores.file import FileMetricStore
+from daktylos.data_stores.memory import InMemoryMetricStore
+
+pyarrow = pytest.importorskip("pyarrow")
+
+from daktylos.arrow import export_metric, import_metric  # noqa: E402
+
+metadata = Metadata.system_info()
+
+
+def check_batches(batches, count: int, batch_size: int):
+    assert [len(batch) for batch in batches[:-1]] == [batch_size] * (len(batches) - 1)
+    assert sum(len(batch) for batch in batches) == count
+    keys = list(batches[0].values)
+    assert keys == sorted(['/TestMetric#child1', '/TestMetric/child2#grandchild1', '/TestMetric/child2#grandchild2',
+                           '/TestMetric/child3#grandchild1'])
+    timestamps = [timestamp for batch in batches for timestamp in batch.timestamps]
+    assert timestamps == sorted(timestamps)
+    assert [value for batch in batches for value in batch.values['/TestMetric#child1']] == \
+        [float(value) for value in range(100, 100 - count, -1)]
+    for batch in batches:
+        assert list(batch.values) == keys
+        assert batch.metadata_names == sorted(metadata.values)
+        assert all(len(column) == len(batch) for column in batch.values.values())
+
+
+class TestFieldBatches:
+
+    def test_sql(self, preloaded_datastore):
+        check_batches(list(preloaded_datastore.field_batches("TestMetric", batch_size=30)), count=100, batch_size=30)
+
+    def test_memory(self, preloaded_memory_datastore):
+        check_batches(list(preloaded_memory_datastore.field_batches("TestMetric", batch_size=30)),
+                      count=100, batch_size=30)
+
+    def test_file(self, preloaded_file_datastore):
+        # batches span the segments of the store
+        check_batches(list(preloaded_file_datastore.field_batches("TestMetric", batch_size=30)),
+                      count=100, batch_size=30)
+
+    def test_fields_and_dates(self, preloaded_file_datastore):
+        oldest = preloaded_file_datastore.base_timestamp - datetime.timedelta(seconds=9)
+        batches = list(preloaded_file_datastore.field_batches("TestMetric", fields=['%child2%'], oldest=oldest))
+        assert len(batches) == 1
+        assert list(batches[0].values) == ['/TestMetric/child2#grandchild1', '/TestMetric/child2#grandchild2']
+        assert len(batches[0]) == 10
+        assert batches[0].metadata[0] == metadata
+
+    def test_unknown_metric(self, preloaded_file_datastore, preloaded_datastore):
+        assert list(preloaded_file_datastore.field_batches("NoSuchMetric")) == []
+        assert list(preloaded_datastore.field_batches("NoSuchMetric")) == []
+
+    def test_invalid_batch_size(self, preloaded_memory_datastore):
+        with pytest.raises(ValueError):
+            next(preloaded_memory_datastore.field_batches("TestMetric", batch_size=0))
+
+
+class TestPostBatch:
+
+    @staticmethod
+    def batch() -> FieldBatch:
+        timestamp = datetime.datetime(2020, 1, 1)
+        return FieldBatch(timestamps=[timestamp + datetime.timedelta(seconds=index) for index in range(4)],
+                          metadata=[metadata, None, metadata, metadata],
+                          values={'/Batch#a': [1.0, 2.0, math.nan, 4.0],
+                                  '/Batch/sub#b': [10.0, math.nan, math.nan, 40.0]})
+
+    def check(self, store):
+        store.post_batch("Batch", self.batch())
+        store.commit()
+        result = store.composite_metrics_by_volume("Batch", count=10)
+        # the metric without any value is skipped
+        assert len(result.timestamps) == 3
+        expected = CompositeMetric("Batch")
+        expected.add(Metric("a", 4.0))
+        sub = CompositeMetric("sub")
+        sub.add(Metric("b", 40.0))
+        expected.add(sub)
+        assert result.metric_data[-1] == expected
+        expected = CompositeMetric("Batch")
+        expected.add(Metric("a", 2.0))
+        assert result.metric_data[-2] == expected
+        assert result.metadata[-2] is None
+        assert result.metadata[-1].values['system'] == metadata.values['system']
+        with pytest.raises(ValueError):
+            store.post_batch("Other", self.batch())
+
+    def test_sql(self, datastore):
+        self.check(datastore)
+        # ids allocated in bulk follow those of metrics posted individually
+        metric = CompositeMetric("Batch")
+        metric.add(Metric("a", 5.0))
+        datastore.post(metric, timestamp=datetime.datetime(2021, 1, 1))
+        datastore.post_batch("Batch", self.batch())
+        datastore.commit()
+        assert len(datastore.composite_metrics_by_volume("Batch", count=10).timestamps) == 7
+
+    def test_memory(self, memory_datastore):
+        self.check(memory_datastore)
+
+    def test_file(self, tmp_path):
+        with FileMetricStore(str(tmp_path)) as store:
+            self.check(store)
+
+
+class TestArrow:
+
+    @pytest.mark.parametrize("format_", ["parquet", "ipc"])
+    def test_round_trip(self, preloaded_datastore, tmp_path, format_):
+        path = str(tmp_path / "history")
+        assert export_metric(preloaded_datastore, "TestMetric", path, format=format_, batch_size=30) == 100
+        original = preloaded_datastore.composite_metrics_by_volume("TestMetric", count=100)
+        for store in [InMemoryMetricStore(), FileMetricStore(str(tmp_path / "store"))]:
+            with store:
+                assert import_metric(store, path, format=format_, batch_size=25) == 100
+                restored = store.composite_metrics_by_volume("TestMetric", count=100)
+                assert restored.metric_data == original.metric_data
+                assert restored.timestamps == original.timestamps
+                assert restored.metadata == [metadata] * 100
+
+    def test_schema(self, preloaded_file_datastore, tmp_path):
+        import pyarrow.parquet
+        path = str(tmp_path / "history.parquet")
+        export_metric(preloaded_file_datastore, "TestMetric", path, fields=['/TestMetric#child1'], batch_size=40)
+        parquet_file = pyarrow.parquet.ParquetFile(path)
+        assert parquet_file.num_row_groups == 3
+        schema = parquet_file.schema_arrow
+        assert schema.names == ['timestamp'] + [f"metadata.{name}" for name in sorted(metadata.values)] + \
+            ['/TestMetric#child1']
+        assert schema.metadata[b'daktylos.metric'] == b'TestMetric'
+        assert schema.field('metadata.num_cores').type == pyarrow.int64()
+        assert schema.field('metadata.system').type == pyarrow.dictionary(pyarrow.int32(), pyarrow.string())
+        table = parquet_file.read()
+        assert table.column('/TestMetric#child1').to_pylist() == [float(value) for value in range(100, 0, -1)]
+
+    def test_missing_values(self, memory_datastore, tmp_path):
+        memory_datastore.post_batch("Batch", TestPostBatch.batch())
+        path = str(tmp_path / "batch.arrow")
+        assert export_metric(memory_datastore, "Batch", path, format="ipc") == 3
+        with pyarrow.ipc.open_file(path) as reader:
+            table = reader.read_all()
+        assert table.column('/Batch/sub#b').to_pylist() == [10.0, None, 40.0]
+        assert table.column('metadata.system').to_pylist() == [metadata.values['system'], None,
+                                                               metadata.values['system']]
+
+    def test_integer_metadata(self, memory_datastore, tmp_path):
+        start = datetime.datetime(2020, 1, 1)
+        for run in range(10):
+            metric = CompositeMetric("Runs")
+            metric.add(Metric("value", float(run)))
+            memory_datastore.post(metric, timestamp=start + datetime.timedelta(minutes=run),
+                                  metadata=Metadata({'run': run, 'branch': str(run % 2)}))
+        path = str(tmp_path / "runs.parquet")
+        assert export_metric(memory_datastore, "Runs", path) == 10
+        with InMemoryMetricStore() as store:
+            assert import_metric(store, path) == 10
+            assert store.composite_metrics_by_volume("Runs", count=1).metadata == \
+                [Metadata({'run': 9, 'branch': '1'})]
+            query = store.start_query("Runs")
+            query.filter_on_metadata_field('run', 5, MetricStore.Comparison.GREATER_THAN)
+            assert len(query.execute().timestamps) == 4
+
+    def test_empty(self, memory_datastore, tmp_path):
+        path = str(tmp_path / "empty.parquet")
+        assert export_metric(memory_datastore, "NoSuchMetric", path) == 0
+        with InMemoryMetricStore() as store:
+            assert import_metric(store, path) == 0
+
+    def test_invalid(self, memory_datastore, tmp_path):
+        with pytest.raises(ValueError):
+            export_metric(memory_datastore, "TestMetric", str(tmp_path / "history.csv"), format="csv")
+        path = str(tmp_path / "other.parquet")
+        import pyarrow.parquet
+        pyarrow.parquet.write_table(pyarrow.table({'value': [1.0]}), path)
+        with pytest.raises(ValueError):
+            import_metric(memory_datastore, path)
+        with pytest.raises(ValueError):
+            import_metric(memory_datastore, path, metric_name="Other")
@@ -0,0 +1,151 @@
+import csv
+import datetime
+import io
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+import sqlalchemy
+
+import daktylos
+from daktylos.cli import main
+from daktylos.data import CompositeMetric, Metadata, Metric
+from daktylos.data_stores.blocks import SQLBlockMetricStore
+from daktylos.data_stores.sql import SQLMetricStore
+
+base = datetime.datetime(2020, 1, 1)
+
+RULES = """
+decription: rules of the command-line tests
+content:
+  - ruleset:
+      description: coverage rules
+      rules:
+        - action: validate
+          rule: /Coverage#overall >= {minimum}
+        - action: confirm
+          rule: delta(/Coverage#overall) >= 0.0
+"""
+
+BASELINE_RULES = """
+decription: rules of the command-line tests
+content:
+  - ruleset:
+      description: coverage baseline rules
+      rules:
+        - action: validate
+          rule: delta_mean(/Coverage#overall, 3) >= -7.0
+"""
+
+
+def post_history(store) -> None:
+    with store:
+        for index in range(10):
+            metric = CompositeMetric("Coverage")
+            metric.add(Metric("overall", 80.0 + index))
+            if index % 2:
+                metric.add(Metric("lines", float(index * 100)))
+            store.post(metric, timestamp=base + datetime.timedelta(days=index),
+                       metadata=Metadata({'platform': "Linux" if index % 2 else "Darwin", 'build': index}))
+        other = CompositeMetric("Other")
+        other.add(Metric("value", 1.0))
+        store.post(other, timestamp=base)
+
+
+@pytest.fixture
+def database(tmp_path) -> str:
+    url = f"sqlite:///{tmp_path / 'metrics.db'}"
+    post_history(SQLMetricStore(sqlalchemy.create_engine(url), create=True))
+    return url
+
+
+class TestCommandLine:
+
+    def test_query(self, database, capsys):
+        assert main(["query", database, "Coverage", "--count", "3"]) == 0
+        rows = list(csv.reader(io.StringIO(capsys.readouterr().out)))
+        assert rows[0] == ["timestamp", "/Coverage#lines", "/Coverage#overall"]
+        assert rows[1:] == [["2020-01-08T00:00:00", "700.0", "87.0"], ["2020-01-09T00:00:00", "", "88.0"],
+                            ["2020-01-10T00:00:00", "900.0", "89.0"]]
+        assert main(["query", database, "Coverage", "--format", "json", "--filter", "platform=Linux",
+                     "--filter", "build=3", "--fields", "%overall"]) == 0
+        assert json.loads(capsys.readouterr().out) == [
+            {'timestamp': "2020-01-04T00:00:00", 'metadata': {'platform': "Linux", 'build': 3},
+             'values': {'/Coverage#overall': 83.0}}]
+        assert main(["query", database, "Coverage", "--oldest", "2020-01-05", "--newest", "2020-01-06T12:00"]) == 0
+        assert len(capsys.readouterr().out.splitlines()) == 3
+        with pytest.raises(SystemExit):
+            main(["query", database, "Coverage", "--filter", "platform"])
+
+    def test_stats_and_purge(self, database, capsys):
+        assert main(["stats", database]) == 0
+        lines = capsys.readouterr().out.splitlines()
+        assert lines[0].split() == ["metric", "count", "oldest", "newest"]
+        assert lines[1].split() == ["Coverage", "10", "2020-01-01T00:00:00", "2020-01-10T00:00:00"]
+        assert lines[2].split() == ["Other", "1", "2020-01-01T00:00:00", "2020-01-01T00:00:00"]
+        assert main(["purge", database, "--before", "2020-01-03"]) == 0
+        assert main(["purge", database, "--name", "Coverage", "--oldest", "2"]) == 0
+        capsys.readouterr()
+        assert main(["stats", database, "Coverage", "Missing"]) == 0
+        lines = capsys.readouterr().out.splitlines()
+        assert lines[1].split() == ["Coverage", "6", "2020-01-05T00:00:00", "2020-01-10T00:00:00"]
+        assert lines[2].split() == ["Missing", "0"]
+        with pytest.raises(SystemExit):
+            main(["purge", database, "--oldest", "2"])
+
+    def test_blocks(self, tmp_path, capsys):
+        url = f"sqlite:///{tmp_path / 'blocks.db'}"
+        post_history(SQLBlockMetricStore(sqlalchemy.create_engine(url), create=True))
+        assert main(["stats", "--blocks", url, "Coverage"]) == 0
+        assert capsys.readouterr().out.splitlines()[1].split() == \
+            ["Coverage", "10", "2020-01-01T00:00:00", "2020-01-10T00:00:00"]
+
+    def test_validate(self, database, tmp_path, capsys):
+        rules = tmp_path / "rules.yaml"
+        rules.write_text(RULES.format(minimum=85.0))
+        assert main(["validate", database, "Coverage", str(rules)]) == 0
+        assert capsys.readouterr().out == ""
+        assert main(["validate", database, "Coverage", str(rules), "--filter", "platform=Darwin",
+                     "--filter", "build=2"]) == 1
+        assert "VALIDATION FAILURE" in capsys.readouterr().out
+        rules.write_text(RULES.format(minimum=95.0))
+        assert main(["validate", database, "Coverage", str(rules)]) == 1
+        assert main(["validate", database, "Missing", str(rules)]) == 2
+
+    def test_validate_baseline(self, tmp_path, capsys):
+        url = f"sqlite:///{tmp_path / 'baseline.db'}"
+        with SQLMetricStore(sqlalchemy.create_engine(url), create=True) as store:
+            for index, value in enumerate([90.0, 90.0, 90.0, 80.0]):
+                metric = CompositeMetric("Coverage")
+                metric.add(Metric("overall", value))
+                store.post(metric, timestamp=base + datetime.timedelta(days=index), metadata=Metadata({'build': 1}))
+        rules = tmp_path / "rules.yaml"
+        rules.write_text(BASELINE_RULES)
+        # the metric validated is left out of its baseline, so is compared against the mean of those before it only
+        assert main(["validate", url, "Coverage", str(rules), "--baseline", "3"]) == 1
+        assert "VALIDATION FAILURE" in capsys.readouterr().out
+        with pytest.raises(SystemExit):
+            main(["validate", url, "Coverage", str(rules), "--baseline", "0"])
+
+    def test_export(self, database, tmp_path, capsys):
+        pytest.importorskip("pyarrow")
+        from daktylos.arrow import import_metric
+        output = tmp_path / "coverage.arrow"
+        assert main(["export", database, "Coverage", str(output), "--format", "ipc", "--oldest", "2020-01-06"]) == 0
+        assert "Exported 5 metrics" in capsys.readouterr().err
+        with SQLMetricStore(sqlalchemy.create_engine("sqlite:///:memory:"), create=True) as store:
+            assert import_metric(store, str(output), format="ipc") == 5
+
+    def test_lazy_imports(self):
+        # the command starts without importing the modules of any subcommand
+        path = os.path.dirname(os.path.dirname(daktylos.__file__))
+        output = subprocess.run(
+            [sys.executable, "-c", "import sys; from daktylos.cli import main\n"
+                                   "try:\n    main(['--help'])\nexcept SystemExit:\n    pass\n"
+                                   "print(sorted(name for name in ('sqlalchemy', 'yaml', 'daktylos.data') "
+                                   "if name in sys.modules), file=sys.stderr)"],
+            env=dict(os.environ, PYTHONPATH=path), capture_output=True, text=True, check=True)
+        assert "query" in output.stdout
+        assert output.stderr.strip() == "[]"
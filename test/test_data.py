@@ -1,7 +1,13 @@
+import socket
+import threading
+import time
 from dataclasses import dataclass, field
 from typing import Dict, Optional
 
-from daktylos.data import BasicMetric, Metric, CompositeMetric, MetricDataClass
+import pytest
+
+import daktylos.data
+from daktylos.data import BasicMetric, Metric, CompositeMetric, Metadata, MetricDataClass, RollingWindow, BaselineCache
 
 
 class TestBasicMetricConversions:
@@ -173,3 +179,76 @@ class TestBasicMetricConversions:
         assert data.values["comp_two"].in_one == inner.value["comp_two"].value["in_one"].value
         assert data.values["comp_two"].in_two == None
 
+
+class TestRollingWindow:
+
+    def test_mean_and_median(self):
+        window = RollingWindow(4)
+        assert window.mean() is None
+        assert window.median() is None
+        for value in [1.0, 5.0, 2.0]:
+            window.add(value)
+        assert window.mean() == pytest.approx(8.0 / 3)
+        assert window.median() == 2.0
+        assert window.mean(count=2) == pytest.approx(3.5)
+        assert window.median(count=2) == pytest.approx(3.5)
+        window.add(10.0)
+        window.add(4.0)  # evicts 1.0
+        assert window.values == [5.0, 2.0, 10.0, 4.0]
+        assert window.mean() == pytest.approx(5.25)
+        assert window.median() == pytest.approx(4.5)
+        assert window.median(count=3) == 4.0
+
+    def test_baseline_cache_update(self):
+        cache = BaselineCache(window=2)
+        for value in [1.0, 2.0, 3.0]:
+            metric = CompositeMetric("TestMetric")
+            metric.add_key_value("one", value)
+            assert cache.update(metric) == {"/TestMetric#one"}
+        assert "TestMetric" in cache
+        assert cache.baseline("TestMetric")["/TestMetric#one"].values == [2.0, 3.0]
+        assert cache.baseline("OtherMetric") == {}
+        # baselines are kept per metadata set, whatever the order of its fields
+        cache.update(metric, Metadata({'platform': "Linux", 'build': 1}))
+        assert cache.cached("TestMetric", Metadata({'build': 1, 'platform': "Linux"}))
+        assert cache.baseline("TestMetric", Metadata({'build': 1, 'platform': "Linux"}))["/TestMetric#one"].values \
+            == [3.0]
+        assert not cache.cached("TestMetric", Metadata({'build': "1", 'platform': "Linux"}))
+        assert cache.baseline("TestMetric")["/TestMetric#one"].values == [2.0, 3.0]
+
+
+class TestSystemInfo:
+
+    def test_cached(self):
+        info = Metadata.system_info()
+        assert list(info.values) == list(Metadata.SYSTEM_INFO_FIELDS)
+        assert Metadata.system_info() == info
+        # each call returns metadata of its own
+        Metadata.system_info().values['system'] = "changed"
+        assert Metadata.system_info() == info
+        assert Metadata.system_info(fields=['num_cores', 'system']) == \
+            Metadata({'num_cores': info.values['num_cores'], 'system': info.values['system']})
+        with pytest.raises(ValueError):
+            Metadata.system_info(fields=['hostname'])
+
+    def test_slow_lookup(self, monkeypatch):
+        release = threading.Event()
+
+        def getfqdn():
+            release.wait(10.0)
+            return "localhost"
+
+        monkeypatch.setattr(daktylos.data, "_system_info", daktylos.data._SystemInfo())
+        monkeypatch.setattr(socket, "getfqdn", getfqdn)
+        try:
+            # the host name is not looked up unless the IP address is asked for
+            assert Metadata.system_info(fields=['system', 'machine']).values['system']
+            assert daktylos.data._system_info._resolver is None
+            start = time.monotonic()
+            assert Metadata.system_info(timeout=0.05).values['ip_address'] == "<<indeterminate>>"
+            assert time.monotonic() - start < 1.0
+        finally:
+            release.set()
+        daktylos.data._system_info._resolver.join()
+        # fixed once returned
+        assert Metadata.system_info(timeout=0.05).values['ip_address'] == "<<indeterminate>>"
@@ -0,0 +1,108 @@
+import datetime
+import importlib.util
+import math
+
+import pytest
+import sqlalchemy
+
+from daktylos.data import CompositeMetric, FieldBatch, Metadata, Metric, QueryResult
+from daktylos.data_stores.memory import InMemoryMetricStore
+from daktylos.data_stores.sql import SQLMetricStore
+
+base = datetime.datetime(2020, 1, 1)
+
+
+@pytest.fixture
+def pandas():
+    return pytest.importorskip("pandas")
+
+
+def post_history(store) -> None:
+    linux = Metadata({'platform': "Linux", 'build': 7})
+    darwin = Metadata({'platform': "Darwin"})
+    for index in range(10):
+        metric = CompositeMetric("Coverage")
+        metric.add(Metric("overall", 80.0 + index))
+        if index % 2:
+            metric.add(CompositeMetric("module")).add(Metric("lines", float(index * 100)))
+        store.post(metric, timestamp=base + datetime.timedelta(days=index),
+                   metadata=(linux, darwin, None)[index % 3])
+    store.commit()
+
+
+def check_frame(pandas, frame, count: int = 10) -> None:
+    assert frame.index.name == "timestamp"
+    assert list(frame.index) == [pandas.Timestamp(base + datetime.timedelta(days=index)) for index in range(count)]
+    assert sorted(frame.columns) == ['/Coverage#overall', '/Coverage/module#lines', 'build', 'platform']
+    assert str(frame['platform'].dtype) == "category"
+    assert str(frame['/Coverage#overall'].dtype) == "float64"
+    assert list(frame['/Coverage#overall']) == [80.0 + index for index in range(count)]
+    lines = list(frame['/Coverage/module#lines'])
+    assert [value for value in lines[1::2]] == [float(index * 100) for index in range(1, count, 2)]
+    assert all(math.isnan(value) for value in lines[::2])
+    platforms = list(frame['platform'])
+    assert platforms[:3] == ["Linux", "Darwin", platforms[2]] and pandas.isna(platforms[2])
+    assert sorted(frame['platform'].cat.categories) == ["Darwin", "Linux"]
+    assert list(frame['build'])[0] == 7 and pandas.isna(list(frame['build'])[1])
+
+
+class TestFrames:
+
+    @pytest.mark.parametrize("batch_size", [3, 100])
+    def test_metric_frame(self, pandas, batch_size):
+        from daktylos.frames import metric_frame
+        with SQLMetricStore(sqlalchemy.create_engine("sqlite:///:memory:"), create=True) as store:
+            post_history(store)
+            check_frame(pandas, metric_frame(store, "Coverage", batch_size=batch_size))
+            frame = metric_frame(store, "Coverage", fields=["%overall"], oldest=base + datetime.timedelta(days=5))
+            assert list(frame.columns) == ['build', 'platform', '/Coverage#overall']
+            assert len(frame) == 5
+            assert len(metric_frame(store, "Missing").columns) == 0
+
+    def test_query_result(self, pandas):
+        with InMemoryMetricStore() as store:
+            post_history(store)
+            check_frame(pandas, store.composite_metrics_by_volume("Coverage", count=10).to_frame())
+            fields = store.metric_fields_by_volume("Coverage", count=10, fields=["%overall"])
+            assert list(fields.to_frame()['/Coverage#overall']) == [80.0 + index for index in range(10)]
+            with pytest.raises(ValueError):
+                store.metric_fields_by_volume("Coverage", count=10).to_frame()
+        with pytest.raises(TypeError):
+            QueryResult(metadata=[None], timestamps=[base], metric_data=[object()]).to_frame()
+
+    def test_shared_metadata(self, datastore):
+        post_history(datastore)
+        # metrics of the same metadata set share its metadata, so that frames are built per set rather than per metric
+        for metadata in [datastore.composite_metrics_by_volume("Coverage", count=10).metadata,
+                         datastore.metric_fields_by_volume("Coverage", count=10).metadata,
+                         [item for batch in datastore.field_batches("Coverage", batch_size=4)
+                          for item in batch.metadata]]:
+            assert len(metadata) == 10
+            assert len({id(item) for item in metadata if item is not None}) == 2
+
+    def test_metadata_identity(self, pandas):
+        timestamps = [base + datetime.timedelta(days=index) for index in range(4)]
+        values = {'/A#value': [1.0, 2.0, 3.0, 4.0]}
+        linux = Metadata({'platform': "Linux"})
+        shared = FieldBatch(timestamps=timestamps, metadata=[linux, None, linux, Metadata({'platform': "Darwin"})],
+                            values=values)
+        # equal metadata held by distinct objects is coded alike
+        copied = FieldBatch(timestamps=timestamps, metadata=[Metadata(dict(item.values)) if item else None
+                                                             for item in shared.metadata], values=values)
+        frame = copied.to_frame()
+        pandas.testing.assert_frame_equal(frame, shared.to_frame())
+        assert list(frame['platform'].cat.codes) == [0, -1, 0, 1]
+
+    def test_batch(self, pandas):
+        batch = FieldBatch(timestamps=[base, base + datetime.timedelta(days=1)],
+                           metadata=[Metadata({'platform': "Linux"}), None],
+                           values={'/A#value': [1.0, math.nan]}, metadata_names=['platform'])
+        frame = batch.to_frame()
+        assert list(frame.columns) == ['platform', '/A#value']
+        assert list(frame['platform'].cat.categories) == ["Linux"]
+        assert frame['/A#value'].iloc[0] == 1.0 and math.isnan(frame['/A#value'].iloc[1])
+
+    @pytest.mark.skipif(importlib.util.find_spec("pandas") is not None, reason="pandas is installed")
+    def test_missing_pandas(self):
+        with pytest.raises(ImportError, match=r"daktylos\[pandas\]"):
+            QueryResult().to_frame()
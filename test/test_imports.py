@@ -0,0 +1,67 @@
+import os
+import subprocess
+import sys
+from typing import Dict
+
+import pytest
+
+import daktylos
+
+# budgets of the (cumulative) import time of modules, as multiples of that of the baseline module (imported by all of
+# them) measured in the same run, so that they hold on slow or loaded hosts; heavy modules are checked for by name
+BASELINE = 'dataclasses'
+BUDGETS = {
+    'daktylos.data': 4.0,
+    'daktylos.data_stores': 4.0,
+    'daktylos.rules.engine': 5.0,
+    'daktylos.cli': 3.0,
+}
+
+# modules only to be imported by the stores, rules files and system info that use them
+HEAVY = {'sqlalchemy', 'yaml', 'pyarrow', 'multiprocessing', 'concurrent.futures', 'socket', 'platform'}
+
+
+def import_times(module: str, cache_dir: str) -> Dict[str, int]:
+    """
+    :return: the cumulative import time in microseconds, as reported by `-X importtime`, of each module imported
+       along with the given one (in a fresh interpreter), from the fastest of several imports
+    """
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(daktylos.__file__)),
+               PYTHONPYCACHEPREFIX=cache_dir)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    command = [sys.executable, "-X", "importtime", "-c", f"import {module}"]
+    # compiled once, as when installed
+    subprocess.run(command, env=env, capture_output=True, check=True)
+    fastest: Dict[str, int] = {}
+    for _ in range(3):
+        times = {}
+        for line in subprocess.run(command, env=env, capture_output=True, text=True, check=True).stderr.splitlines():
+            if line.startswith("import time:") and "cumulative" not in line:
+                _, cumulative, name = line[len("import time:"):].split("|")
+                times[name.strip()] = int(cumulative)
+        if not fastest or times[module] < fastest[module]:
+            fastest = times
+    return fastest
+
+
+@pytest.fixture(scope='module')
+def baseline_time(tmp_path_factory) -> int:
+    return import_times(BASELINE, str(tmp_path_factory.mktemp("baseline")))[BASELINE]
+
+
+class TestImports:
+
+    @pytest.mark.parametrize("module", sorted(BUDGETS))
+    def test_import_budget(self, module, tmp_path, baseline_time):
+        times = import_times(module, str(tmp_path))
+        assert sorted(HEAVY & set(times)) == []
+        assert times[module] <= BUDGETS[module] * baseline_time
+
+    def test_lazy_stores(self):
+        import daktylos.data_stores
+        from daktylos.data_stores import InMemoryMetricStore
+        from daktylos.data_stores.memory import InMemoryMetricStore as ImportedStore
+        assert InMemoryMetricStore is ImportedStore
+        assert "SQLMetricStore" in dir(daktylos.data_stores)
+        with pytest.raises(AttributeError):
+            daktylos.data_stores.NoSuchStore
@@ -0,0 +1,45 @@
+import pytest
+
+from daktylos.instrumentation import Histogram, HistogramSink
+
+
+class TestHistogram:
+
+    def test_percentile(self):
+        histogram = Histogram()
+        assert histogram.percentile(50.0) is None
+        for value in range(1, 101):
+            histogram.add(value * 1.0e-3)
+        assert histogram.count == 100
+        assert histogram.mean == pytest.approx(50.5e-3)
+        assert histogram.min == pytest.approx(1.0e-3)
+        # within the relative error of a bucket:
+        assert histogram.percentile(50.0) == pytest.approx(50.0e-3, rel=0.19)
+        assert histogram.percentile(99.0) == pytest.approx(99.0e-3, rel=0.19)
+        assert histogram.percentile(100.0) == pytest.approx(100.0e-3)
+        with pytest.raises(ValueError):
+            histogram.percentile(101.0)
+
+    def test_out_of_range(self):
+        histogram = Histogram(lowest=1.0e-3, highest=1.0)
+        histogram.add(1.0e-6)
+        histogram.add(10.0)
+        assert histogram.percentile(0.0) == pytest.approx(1.0e-6)
+        assert histogram.percentile(100.0) == pytest.approx(10.0)
+
+
+class TestHistogramSink:
+
+    def test_snapshot(self):
+        sink = HistogramSink(percentiles=[50.0, 99.9])
+        sink.record("post", 0.002, rows=10, statements=3)
+        sink.record("post", 0.004, rows=5)
+        sink.record("commit", 0.010)
+        snapshot = sink.snapshot(reset=True)
+        assert set(snapshot) == {"post", "commit"}
+        assert snapshot["post"]["count"] == 2
+        assert snapshot["post"]["rows"] == 15
+        assert snapshot["post"]["statements"] == 3
+        assert snapshot["post"]["max"] == pytest.approx(0.004)
+        assert set(snapshot["commit"]) >= {"p50", "p99.9", "mean", "total"}
+        assert sink.snapshot() == {}
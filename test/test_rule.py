@@ -1,6 +1,6 @@
 import pytest
 
-from daktylos.data import CompositeMetric, Metric
+from daktylos.data import CompositeMetric, Metric, RollingWindow
 from daktylos.rules.engine import Rule, RulesEngine
 
 
@@ -126,3 +126,38 @@ class TestRule:
         rule.validate(composite_metric, exclusions={"/TestMetric*fail1"})
         # does not throw exception
 
+    def test_validate_baseline(self):
+        composite_metric = CompositeMetric(name="TestMetric")
+        composite_metric.add(Metric(name="fail", value=96.0))
+        composite_metric.add(Metric(name="pass", value=99.0))
+        composite_metric.add(Metric(name="new", value=0.0))
+        baseline = {"/TestMetric#fail": RollingWindow(5, [100.0, 120.0, 98.0, 97.0]),
+                    "/TestMetric#pass": RollingWindow(5, [100.0, 101.0, 98.0])}
+        rule = Rule("/TestMetric#*", operation=Rule.Evaluation.GREATER_THAN_OR_EQUAL, limiting_value=-2.0,
+                    baseline=Rule.Baseline.MEDIAN)
+        with pytest.raises(Rule.ThresholdViolation) as e:
+            rule.validate(composite_metric, baseline=baseline)
+        assert list(e.value.offending_elements) == ["#fail"]
+        # mean of latest 2 values of fail (97.5) and pass (99.5) are within limit:
+        rule = Rule("/TestMetric#*", operation=Rule.Evaluation.GREATER_THAN_OR_EQUAL, limiting_value=-2.0,
+                    baseline=Rule.Baseline.MEAN, baseline_count=2)
+        rule.validate(composite_metric, baseline=baseline)
+        # no baseline, nothing to compare to:
+        rule.validate(composite_metric)
+
+    def test_violation_records(self):
+        composite_metric = CompositeMetric(name="TestMetric")
+        child = CompositeMetric(name="child")
+        composite_metric.add(child)
+        failing = child.add(Metric(name="fail", value=110.0))
+        child.add(Metric(name="pass", value=90.0))
+        rule = Rule("/TestMetric/child#*", operation=Rule.Evaluation.LESS_THAN, limiting_value=100.0)
+        with pytest.raises(Rule.ThresholdViolation) as e:
+            rule.validate(composite_metric)
+        violation, = e.value.violations
+        assert (violation.key, violation.value, violation.limit, violation.operator) == \
+            ("child#fail", 110.0, 100.0, ">=")
+        assert violation.metric is failing
+        assert e.value.offending_elements == ["child#fail"]
+        assert e.value.offending_metrics() == {"child#fail": failing}
+        assert str(e.value) == "\n  /TestMetric/child#fail >= 100.0"
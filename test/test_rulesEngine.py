@@ -1,9 +1,12 @@
 import fnmatch
 import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 
 import pytest
 
+from daktylos.data import CompositeMetric, Metric
 from daktylos.rules.engine import Rule, RulesEngine
 from daktylos.rules.status import ValidationStatus
 
@@ -30,7 +33,8 @@ class TestRulesEngine:
     def test_process(self, monkeypatch):
         validations = []
 
-        def mock_validate(self, composite_metric, previous_metric=None, exclusions=None):
+        def mock_validate(self, composite_metric, previous_metric=None, exclusions=None, baseline=None,
+                          max_violations=None):
             nonlocal validations
             assert exclusions == {"/CodeCoverage/by_file*test_excluded.py"} or len(exclusions) == 0
             if fnmatch.fnmatchcase(self._pattern, "/CodeCoverage/by_file*test_excluded.py"):
@@ -84,10 +88,10 @@ class TestRulesEngine:
                                               }
                     if alert._pattern == "/CodeCoverage#overall":
                         assert alert._operation == Rule.Evaluation.GREATER_THAN
-                        assert pytest.approx(alert._limit, 80.0)
+                        assert alert._limit == pytest.approx(80.0)
                     elif alert._pattern == "/Performance#overall_cpu":
                         assert alert._operation == Rule.Evaluation.LESS_THAN
-                        assert pytest.approx(alert._limit, 70.0)
+                        assert alert._limit == pytest.approx(70.0)
                     else:
                         assert False  # should never get here based on logic
             elif len(ruleset._alerts) == 2:
@@ -102,18 +106,21 @@ class TestRulesEngine:
                         "/Performance/by_test#test_SQLMetricsStore.test_metrics_by_date_with_filter",
                         "/Performance/by_test#test_SQLMetricsStore.test_metrics_by_volume_with_filter"
                     }
-                    if validation._pattern == "/CodeCoverage#overall":
+                    if validation._pattern == "/CodeCoverage#overall" and validation._is_relative:
                         assert validation._operation == Rule.Evaluation.GREATER_THAN_OR_EQUAL
-                        assert pytest.approx(validation._limit, 85.0)
+                        assert validation._limit == pytest.approx(-2.0)
+                    elif validation._pattern == "/CodeCoverage#overall":
+                        assert validation._operation == Rule.Evaluation.GREATER_THAN_OR_EQUAL
+                        assert validation._limit == pytest.approx(85.0)
                     elif validation._pattern == "/CodeCoverage/by_file#test/test_composite_metric.py":
                         assert validation._operation == Rule.Evaluation.GREATER_THAN
-                        assert pytest.approx(validation._limit, 90.0)
+                        assert validation._limit == pytest.approx(90.0)
                     elif validation._pattern == "/Performance/by_test#test_SQLMetricsStore.test_metrics_by_date_with_filter":
                         assert validation._operation == Rule.Evaluation.LESS_THAN
-                        assert pytest.approx(validation._limit, 10.0)
+                        assert validation._limit == pytest.approx(10.0)
                     elif validation._pattern == "/Performance/by_test#test_SQLMetricsStore.test_metrics_by_volume_with_filter":
                         assert validation._operation == Rule.Evaluation.LESS_THAN_OR_EQUAL
-                        assert pytest.approx(validation._limit, 11.0)
+                        assert validation._limit == pytest.approx(11.0)
                     elif validation._pattern == "/CodeCoverage/by_file#test/test_excluded.py":
                         pass
                     else:
@@ -121,3 +128,130 @@ class TestRulesEngine:
             else:
                 assert False, f"Unexpected ruleset with {len(ruleset._alerts)} alerts"
 
+
+    def test_process_many(self):
+        rules_engine = RulesEngine()
+        ruleset = RulesEngine.RuleSet()
+        ruleset.add_validation(Rule(pattern="/TestMetric#value", operation=Rule.Evaluation.LESS_THAN,
+                                    limiting_value=50.0))
+        ruleset.add_alert(Rule(pattern="/TestMetric#value", operation=Rule.Evaluation.LESS_THAN_OR_EQUAL,
+                               limiting_value=1.0, is_relative=True))
+        rules_engine.add_ruleset(ruleset)
+        pairs = []
+        for index in range(100):
+            current = CompositeMetric(name="TestMetric")
+            current.add(Metric("value", float(index)))
+            previous = CompositeMetric(name="TestMetric")
+            previous.add(Metric("value", float(index - (index % 3))))
+            pairs.append((current, previous))
+        expected = [list(rules_engine.process(current, previous)) for current, previous in pairs]
+        for executor in [None, ThreadPoolExecutor(max_workers=3), ProcessPoolExecutor(max_workers=2)]:
+            results = rules_engine.process_many(pairs, executor=executor, max_workers=2)
+            assert len(results) == len(pairs)
+            for index, statuses in enumerate(results):
+                assert [(s.level, s.text) for s in statuses] == [(s.level, s.text) for s in expected[index]]
+                for status in statuses:
+                    assert status.parent_metric == pairs[index][0]
+            if executor:
+                executor.shutdown()
+        assert rules_engine.process_many([]) == []
+
+    def test_from_yaml_file_compiled(self, tmp_path, monkeypatch):
+        resources_path = os.path.join(os.path.dirname(__file__), "resources")
+        rules_path = tmp_path / "rules.yaml"
+        rules_path.write_bytes(Path(os.path.join(resources_path, "test_rules.yaml")).read_bytes())
+        cache_dir = tmp_path / "compiled"
+        rules_engine = RulesEngine.from_yaml_file(rules_path, cache_dir=cache_dir)
+        assert len(list(cache_dir.iterdir())) == 1
+
+        def fail(*args, **kwds):
+            assert False, "Rules file should not be parsed again"
+
+        with monkeypatch.context() as context:
+            context.setattr("yaml.load", fail)
+            cached_engine = RulesEngine.from_yaml_file(rules_path, cache_dir=cache_dir)
+        assert len(cached_engine._rulesets) == len(rules_engine._rulesets)
+        assert sorted(rule.description for ruleset in cached_engine._rulesets for rule in ruleset._validations) ==\
+            sorted(rule.description for ruleset in rules_engine._rulesets for rule in ruleset._validations)
+        # a change of content means a new compilation:
+        rules_path.write_text(rules_path.read_text().replace("85.0", "86.0"))
+        RulesEngine.from_yaml_file(rules_path, cache_dir=cache_dir)
+        assert len(list(cache_dir.iterdir())) == 2
+
+    def test_from_yaml_file_cache_failures(self, tmp_path, monkeypatch):
+        resources_path = os.path.join(os.path.dirname(__file__), "resources")
+        rules_path = tmp_path / "rules.yaml"
+        rules_path.write_bytes(Path(os.path.join(resources_path, "test_rules.yaml")).read_bytes())
+        expected = len(RulesEngine.from_yaml_file(rules_path)._rulesets)
+        cache_dir = tmp_path / "compiled"
+        RulesEngine.from_yaml_file(rules_path, cache_dir=cache_dir)
+        compiled_path, = cache_dir.iterdir()
+        compiled = compiled_path.read_bytes()
+        # corrupt or foreign cache files are compiled again
+        for content in [compiled[:len(compiled) // 2] + bytes(byte ^ 0xff for byte in compiled[len(compiled) // 2:]),
+                        pickle.dumps({'not': "rules"}), b"\x80\x05garbage"]:
+            compiled_path.write_bytes(content)
+            assert len(RulesEngine.from_yaml_file(rules_path, cache_dir=cache_dir)._rulesets) == expected
+            assert compiled_path.read_bytes() == compiled
+        # a cache that cannot be written does not prevent loading, and leaves no temporary files
+        blocked = tmp_path / "blocked"
+        blocked.write_text("not a directory")
+        assert len(RulesEngine.from_yaml_file(rules_path, cache_dir=blocked / "compiled")._rulesets) == expected
+
+        def fail(*args, **kwds):
+            raise pickle.PicklingError("cannot pickle")
+
+        compiled_path.unlink()
+        with monkeypatch.context() as context:
+            context.setattr("pickle.dump", fail)
+            assert len(RulesEngine.from_yaml_file(rules_path, cache_dir=cache_dir)._rulesets) == expected
+        assert list(cache_dir.iterdir()) == []
+
+    def test_process_offending_metrics(self):
+        rules_engine = RulesEngine()
+        ruleset = RulesEngine.RuleSet()
+        ruleset.add_validation(Rule(pattern="*", operation=Rule.Evaluation.LESS_THAN, limiting_value=50.0))
+        rules_engine.add_ruleset(ruleset)
+        composite = CompositeMetric(name="TestMetric")
+        failures = [composite.add(Metric(f"fail{index}", 100.0 + index)) for index in range(1000)]
+        composite.add(Metric("pass", 1.0))
+        status, = rules_engine.process(composite)
+        assert status.level == ValidationStatus.Level.FAILURE
+        assert status.offending_metrics() == {f"#{metric.name}": metric for metric in failures}
+        assert len(status.violations) == 1000
+        assert "/TestMetric#fail999 >= 50.0" in status.text
+        assert "VALIDATION FAILURE: For rule '* < 50.0'" in status.text
+        assert "#pass" not in status.text
+
+    def test_process_modes(self):
+        rules_engine = RulesEngine()
+        for _ in range(2):
+            ruleset = RulesEngine.RuleSet()
+            ruleset.add_alert(Rule(pattern="*", operation=Rule.Evaluation.LESS_THAN, limiting_value=10.0))
+            ruleset.add_validation(Rule(pattern="*", operation=Rule.Evaluation.LESS_THAN, limiting_value=50.0))
+            ruleset.add_validation(Rule(pattern="*", operation=Rule.Evaluation.LESS_THAN, limiting_value=60.0))
+            rules_engine.add_ruleset(ruleset)
+        composite = CompositeMetric(name="TestMetric")
+        for index in range(10):
+            composite.add(Metric(f"value{index}", 10.0 * index))
+        statuses = list(rules_engine.process(composite))
+        assert [status.level for status in statuses] == [ValidationStatus.Level.ALERT,
+                                                         ValidationStatus.Level.FAILURE,
+                                                         ValidationStatus.Level.FAILURE] * 2
+        assert [len(status.violations) for status in statuses] == [9, 5, 4] * 2
+        # fail fast, reporting only the first failing key in order of the metric's keys:
+        statuses = list(rules_engine.process(composite, fail_fast=True))
+        assert [status.level for status in statuses] == [ValidationStatus.Level.ALERT,
+                                                         ValidationStatus.Level.FAILURE]
+        assert statuses[-1].offending_elements == ["#value5"]
+        statuses = list(rules_engine.process(composite, fail_fast=True, failures_only=True))
+        assert [status.level for status in statuses] == [ValidationStatus.Level.FAILURE]
+        # violation budget:
+        statuses = list(rules_engine.process(composite, max_violations=12))
+        assert [len(status.violations) for status in statuses] == [9, 3]
+        statuses = list(rules_engine.process(composite, failures_only=True, max_violations=14))
+        assert [len(status.violations) for status in statuses] == [5, 4, 5]
+        # time budget:
+        assert list(rules_engine.process(composite, time_budget=0.0)) == []
+        results = rules_engine.process_many([(composite, None)] * 3, failures_only=True, fail_fast=True)
+        assert [[status.offending_elements for status in statuses] for statuses in results] == [[["#value5"]]] * 3